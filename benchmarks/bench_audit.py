@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+审计延迟基准
+
+历史增长到百万级转移时，WorkflowEngine.audit() 的延迟应保持平稳。
+
+用法: python benchmarks/bench_audit.py [--max 1000000] [--repeat 200]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from thera.fsm import Event, StateMachine
+from thera.workflow import WorkflowEngine
+
+# DIRTY → CLEAN → SYNCED → COMMITTED → (PUSH_OK) CLEAN → (EDIT) DIRTY
+CYCLE = [
+    Event.DOC_CHECK_OK,
+    Event.SUBMODULE_SYNC,
+    Event.AUTO_COMMIT,
+    Event.PUSH_OK,
+    Event.EDIT,
+]
+
+
+def drive(machine: StateMachine, n: int) -> None:
+    """按合法循环执行 n 次转移"""
+    transition = machine.transition
+    for i in range(n):
+        transition(CYCLE[i % len(CYCLE)])
+
+
+def measure(engine: WorkflowEngine, repeat: int) -> float:
+    """audit() 的中位延迟（微秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine.audit()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="audit 延迟基准")
+    parser.add_argument("--max", type=int, default=1_000_000, help="最大转移数")
+    parser.add_argument("--repeat", type=int, default=200, help="每档测量次数")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = WorkflowEngine(Path(tmp))
+        engine.machine = StateMachine()
+
+        print(f"{'转移数':>10}  {'audit 中位延迟 (us)':>20}")
+        done = 0
+        size = 1_000
+        results = []
+        while size <= args.max:
+            drive(engine.machine, size - done)
+            done = size
+            latency = measure(engine, args.repeat)
+            results.append(latency)
+            print(f"{size:>12,}  {latency:>20.2f}")
+            size *= 10
+
+    ratio = max(results) / min(results)
+    print(f"\n最大/最小延迟比: {ratio:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
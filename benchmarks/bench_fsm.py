@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+状态机回放基准
+
+对比逐个 transition、transition_many 和 validate_sequence 处理长事件流的吞吐。
+
+用法: python benchmarks/bench_fsm.py [--events 1000000]
+"""
+
+import argparse
+import sys
+import time
+
+from thera.fsm import Event, StateMachine
+
+CYCLE = [
+    Event.DOC_CHECK_OK,
+    Event.SUBMODULE_SYNC,
+    Event.AUTO_COMMIT,
+    Event.PUSH_OK,
+    Event.EDIT,
+]
+
+
+def timed(label: str, func, n: int) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.3f}s  {n / elapsed:>14,.0f} events/s")
+    return elapsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="状态机回放基准")
+    parser.add_argument("--events", type=int, default=1_000_000, help="事件数")
+    args = parser.parse_args(argv)
+
+    events = (CYCLE * (args.events // len(CYCLE) + 1))[: args.events]
+
+    def sequential():
+        machine = StateMachine()
+        for event in events:
+            machine.transition(event)
+
+    base = timed("transition (loop)", sequential, len(events))
+    batch = timed("transition_many", lambda: StateMachine().transition_many(events), len(events))
+    check = timed("validate_sequence", lambda: StateMachine().validate_sequence(events), len(events))
+
+    print(f"\ntransition_many 加速比: {base / batch:.1f}x")
+    print(f"validate_sequence 加速比: {base / check:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
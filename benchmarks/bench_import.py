@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+冷启动导入基准
+
+在新进程中以 -X importtime 运行 CLI 命令，统计导入总耗时和加载的模块，
+与 benchmarks/import_budget.json 中的预算对比。
+
+用法: python benchmarks/bench_import.py [--runs 5] [--check] [--top 10]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BUDGET_FILE = Path(__file__).with_name("import_budget.json")
+
+# 在临时空目录中运行：refresh --dry-run 找不到子模块，只走完导入和状态检查
+RUNNER = "import sys; sys.argv = {argv!r}; from thera.cli import main; main()"
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """解析 -X importtime 输出，返回 {模块: 自身耗时(微秒)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表头
+        modules[fields[2].strip()] = int(fields[0])
+    return modules
+
+
+def measure(command: str, cwd: Path) -> dict[str, int]:
+    """运行一次命令，返回导入的模块及其自身耗时"""
+    argv = ["thera"] + command.split()[1:]
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUNNER.format(argv=argv)],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def check_budget(command: str, budget: dict, total_ms: float, modules: dict) -> list[str]:
+    """返回超出预算的项目"""
+    problems = []
+    if total_ms > budget["max_ms"]:
+        problems.append(f"{command}: 导入耗时 {total_ms:.1f}ms 超出预算 {budget['max_ms']}ms")
+    for name in budget.get("forbid", []):
+        if name in modules:
+            problems.append(f"{command}: 不应加载 {name}")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="冷启动导入基准")
+    parser.add_argument("--runs", type=int, default=5, help="每个命令运行次数（取中位数）")
+    parser.add_argument("--check", action="store_true", help="超出预算时退出码为 1")
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最多的模块数")
+    args = parser.parse_args(argv)
+
+    budgets = json.loads(BUDGET_FILE.read_text())
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for command, budget in budgets.items():
+            runs = [measure(command, Path(tmp)) for _ in range(max(1, args.runs))]
+            totals = [sum(modules.values()) / 1000 for modules in runs]
+            total_ms = statistics.median(totals)
+            modules = runs[-1]
+
+            print(f"{command}")
+            print(f"  导入耗时 {total_ms:7.1f}ms（预算 {budget['max_ms']}ms）  模块 {len(modules)}")
+            slowest = sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+            for name, us in slowest:
+                print(f"    {us / 1000:7.2f}ms  {name}")
+            problems += check_budget(command, budget, total_ms, modules)
+
+    for problem in problems:
+        print(f"[FAIL] {problem}")
+    return 1 if args.check and problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
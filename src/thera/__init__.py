@@ -1,5 +1,12 @@
-from thera.cli import main
-
 __all__ = [
     "main",
 ]
+
+
+def __getattr__(name):
+    # 延迟导入：import thera 不加载 CLI（Typer）及其依赖
+    if name == "main":
+        from thera.cli import main
+
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
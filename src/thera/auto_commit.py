@@ -11,16 +11,19 @@
 import argparse
 import subprocess
 import sys
-from datetime import datetime
 from pathlib import Path
 
+from thera import journal, metrics, tracing
 from thera.git_ops import GitOps
+from thera.journal import JournalEntry
+from thera.lease import LeaseTimeout, run_exclusive
 
 
 def run_git(args, repo_root, capture=True):
     """运行 git 命令（已废弃，内部使用 GitOps）"""
     cmd = ["git", "-C", str(repo_root)] + args
-    result = subprocess.run(cmd, capture_output=capture, text=True)
+    with tracing.span(f"git {metrics.git_subcommand(args)}", args=cmd):
+        result = subprocess.run(cmd, capture_output=capture, text=True)
     if capture:
         return result.stdout, result.stderr, result.returncode
     return None, None, result.returncode
@@ -47,7 +50,8 @@ def get_repo_status(repo_root):
         return []
     
     changes = []
-    for line in stdout.strip().split("\n"):
+    # 不能对整体 strip：首行 " M path" 的前导空格是状态列的一部分
+    for line in stdout.split("\n"):
         if not line:
             continue
         status = line[:2].strip()
@@ -99,11 +103,16 @@ def format_changes(changes):
     return ", ".join(parts)
 
 
-def detect_all_changes(repo_root):
-    """检测所有变更（子模块 + 主仓库）"""
+def detect_all_changes(repo_root, submodules=None):
+    """
+    检测所有变更（子模块 + 主仓库）
+
+    submodules 为已知的子模块路径列表时不再执行 git submodule status。
+    """
     all_changes = {}
     
-    submodules = get_submodule_status(repo_root)
+    if submodules is None:
+        submodules = get_submodule_status(repo_root)
     for submodule_path in submodules:
         submodule_full = repo_root / submodule_path
         changes = get_repo_status(submodule_full)
@@ -202,14 +211,34 @@ def commit_and_push(repo_root, path, changes, is_main=False):
         return False, log_label, []
 
 
-def append_journal(repo_root, results):
-    """追加日志到 meta/journal/YYYY-MM-DD.md"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    journal_path = repo_root / "meta" / "journal" / f"{today}.md"
+def commit_all_changes(repo_root, all_changes):
+    """先提交推送各子模块，再提交主仓库，返回 [(是否成功, 仓库, 变更)]"""
+    results = []
     
-    now = datetime.now().strftime("%H:%M")
+    submodule_paths = sorted([p for p in all_changes.keys() if p != "."])
+    for submodule_path in submodule_paths:
+        success, repo, changes = commit_and_push(
+            repo_root / submodule_path,
+            submodule_path,
+            all_changes[submodule_path]
+        )
+        results.append((success, repo, changes))
     
-    lines = []
+    if "." in all_changes:
+        success, repo, changes = commit_and_push(
+            repo_root,
+            ".",
+            all_changes["."],
+            is_main=True
+        )
+        results.append((success, repo, changes))
+    
+    return results
+
+
+def append_journal(repo_root, results):
+    """追加日志到 meta/journal/YYYY-MM-DD.md（结构化副本写入同名 .jsonl）"""
+    entries = []
     for success, repo, changes in results:
         if not success:
             status = "FAIL"
@@ -217,23 +246,45 @@ def append_journal(repo_root, results):
             status = "SKIP"
         else:
             status = "OK"
-        
-        by_type = {}
-        for c in changes:
-            t = c["type"]
-            if t not in by_type:
-                by_type[t] = []
-            by_type[t].append(c["path"])
-        
-        types_str = ", ".join(f"[{t}] {', '.join(files)}" for t, files in sorted(by_type.items()))
-        
-        repo_label = "main" if repo == "main" else repo
-        lines.append(f"- {now} {status} {repo_label}: {types_str}")
+        entries.append(JournalEntry.from_changes(status, repo, changes))
     
-    if lines:
-        with open(journal_path, "a") as f:
-            f.write("\n" + "\n".join(lines))
-        print(f"\n[JOURNAL] Updated {journal_path}")
+    if entries:
+        writer = journal.writer_for(repo_root)
+        writer.extend(entries)
+        for journal_path in writer.flush():
+            print(f"\n[JOURNAL] Updated {journal_path}")
+
+
+def commit_exclusive(repo_root, all_changes, log=None):
+    """
+    持有仓库租约提交推送并追加日志，返回 [(是否成功, 仓库, 变更)]
+
+    同样的变更正在被另一个 auto-commit 提交时不再重复提交，等待并返回它的结果。
+    获得租约后重新检测变更：排队期间之前的运行可能已提交或改动了文件。
+    只处理 all_changes 中已确认的仓库，log 接收等待租约时的提示。
+
+    Raises:
+        LeaseTimeout: 等待其他运行结束超时
+    """
+    def commit():
+        submodules = [path for path in all_changes if path != "."]
+        current = {
+            repo: changes
+            for repo, changes in detect_all_changes(repo_root, submodules=submodules).items()
+            if repo in all_changes
+        }
+        results = commit_all_changes(repo_root, current)
+        append_journal(repo_root, results)
+        return results
+
+    return run_exclusive(
+        repo_root,
+        "auto-commit",
+        commit,
+        params={"changes": all_changes},
+        load=lambda data: [tuple(result) for result in data],
+        log=log,
+    )
 
 
 def main(args=None):
@@ -258,27 +309,11 @@ def main(args=None):
     if not confirm_commit(all_changes):
         return 0
     
-    results = []
-    
-    submodule_paths = sorted([p for p in all_changes.keys() if p != "."])
-    for submodule_path in submodule_paths:
-        success, repo, changes = commit_and_push(
-            repo_root / submodule_path,
-            submodule_path,
-            all_changes[submodule_path]
-        )
-        results.append((success, repo, changes))
-    
-    if "." in all_changes:
-        success, repo, changes = commit_and_push(
-            repo_root,
-            ".",
-            all_changes["."],
-            is_main=True
-        )
-        results.append((success, repo, changes))
-    
-    append_journal(repo_root, results)
+    try:
+        results = commit_exclusive(repo_root, all_changes, log=print)
+    except LeaseTimeout as e:
+        print(f"[FAIL] {e}")
+        return 1
     
     failed = [r for r in results if not r[0]]
     if failed:
@@ -6,9 +6,21 @@ import typer
 from pathlib import Path
 from typing import Optional
 
-from thera.refresh import refresh as do_refresh
+# 不使用 rich 渲染帮助：rich 的导入开销占 --help 冷启动的大半
+app = typer.Typer(no_args_is_help=True, rich_markup_mode=None)
 
-app = typer.Typer(no_args_is_help=True)
+DEFAULT_CONFIG = "meta/profile/submodules.yaml"
+
+
+def _forward(command: str, **args) -> Optional[dict]:
+    """守护进程在运行时把请求转发给它；未运行时返回 None，由调用方在进程内执行"""
+    from thera.daemon import DaemonError, request
+
+    try:
+        return request(Path("."), command, **args)
+    except DaemonError as e:
+        typer.echo(f"[FAIL] {e}")
+        raise typer.Exit(1)
 
 
 @app.command()
@@ -21,12 +33,22 @@ def refresh(
     """
     同步子模块并提交推送主仓库。
 
+    \b
     用法:
         thera refresh              # 同步所有子模块
         thera refresh journal     # 只同步 docs/journal
         thera refresh --dry-run   # 预览所有
     """
-    result = do_refresh(Path("."), dry_run=dry_run, submodule=submodule)
+    response = _forward("refresh", dry_run=dry_run, submodule=submodule)
+    if response is not None:
+        from thera.refresh import RefreshResult
+
+        result = RefreshResult(**response["data"])
+    else:
+        # 延迟导入：thera --help 和 shell 补全不加载 git_ops 等模块
+        from thera.refresh import refresh as do_refresh
+
+        result = do_refresh(Path("."), dry_run=dry_run, submodule=submodule, log=typer.echo)
 
     if result.updated_submodules:
         for sm in result.updated_submodules:
@@ -45,5 +67,172 @@ def refresh(
         raise typer.Exit(1)
 
 
+@app.command("run")
+def run(
+    stages: str = typer.Argument(
+        ..., help="逗号分隔的阶段: doc-check, submodule-sync, refresh, auto-commit"
+    ),
+    dry_run: bool = typer.Option(False, "--dry-run", help="预览模式，不执行实际变更"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="auto-commit 不再交互确认"),
+    config: str = typer.Option(DEFAULT_CONFIG, "--config", help="YAML 事实源路径"),
+    links: bool = typer.Option(False, "--links", help="doc-check 同时检查 Markdown 链接"),
+    keep_going: bool = typer.Option(False, "--keep-going", help="某阶段失败后继续执行"),
+):
+    """
+    在一个进程内依次执行多个阶段，共享仓库扫描结果。
+
+    \b
+    用法:
+        thera run doc-check,refresh,auto-commit
+        thera run doc-check,submodule-sync --dry-run
+    """
+    from thera.pipeline import RepoSession, RunOptions, parse_stages, run_pipeline
+
+    try:
+        names = parse_stages(stages)
+    except ValueError as e:
+        typer.echo(f"[FAIL] {e}")
+        raise typer.Exit(2)
+
+    session = RepoSession(Path(".").resolve(), config_path=config)
+    result = run_pipeline(
+        session,
+        names,
+        RunOptions(dry_run=dry_run, yes=yes, links=links),
+        keep_going=keep_going,
+    )
+
+    for stage in result.stages:
+        symbol = "✓" if stage.success else "[FAIL]"
+        typer.echo(f"{symbol} {stage.name:15s} {stage.message} ({stage.duration:.2f}s)")
+    for name in result.skipped:
+        typer.echo(f"- {name:15s} 已跳过")
+    raise typer.Exit(0 if result.success else 1)
+
+
+@app.command()
+def status(
+    rescan: bool = typer.Option(False, "--refresh", help="丢弃守护进程的缓存，重新扫描"),
+):
+    """查看主仓库变更和需要处理的子模块（守护进程运行时直接返回缓存）"""
+    response = _forward("status", refresh=rescan)
+    if response is not None:
+        typer.echo(response["output"])
+        raise typer.Exit(0)
+
+    from thera.daemon import collect_status, format_status
+    from thera.pipeline import RepoSession
+
+    typer.echo(format_status(collect_status(RepoSession(Path(".").resolve()))))
+
+
+@app.command("doc-check")
+def doc_check(
+    config: str = typer.Option(DEFAULT_CONFIG, "--config", help="YAML 事实源路径"),
+    links: bool = typer.Option(False, "--links", help="同时检查 Markdown 链接"),
+):
+    """检查 YAML 事实源与 .gitmodules 的一致性"""
+    response = _forward("doc-check", config=config, links=links)
+    if response is not None:
+        typer.echo(response["output"], nl=False)
+        raise typer.Exit(response["exit_code"])
+
+    from thera.pipeline import RepoSession, RunOptions, run_doc_check
+
+    result = run_doc_check(RepoSession(Path(".").resolve(), config), RunOptions(links=links))
+    raise typer.Exit(0 if result.success else 1)
+
+
+@app.command()
+def serve(
+    interval: float = typer.Option(2.0, "--interval", help="文件轮询间隔（秒）"),
+    config: str = typer.Option(DEFAULT_CONFIG, "--config", help="YAML 事实源路径"),
+    stop: bool = typer.Option(False, "--stop", help="停止正在运行的守护进程"),
+):
+    """
+    启动守护进程，保持仓库状态常驻内存。
+
+    \b
+    用法:
+        thera serve &          # 后台运行
+        thera status           # 由守护进程直接返回
+        thera serve --stop     # 停止
+    """
+    from thera.daemon import TheraDaemon
+
+    if stop:
+        if _forward("shutdown") is None:
+            typer.echo("守护进程未运行")
+            raise typer.Exit(1)
+        typer.echo("守护进程已停止")
+        raise typer.Exit(0)
+
+    daemon = TheraDaemon(Path("."), config_path=config, interval=interval)
+    typer.echo(f"监听 {daemon.path}")
+    try:
+        daemon.serve_forever()
+    except RuntimeError as e:
+        typer.echo(f"[FAIL] {e}")
+        raise typer.Exit(1)
+
+
+journal_app = typer.Typer(no_args_is_help=True, rich_markup_mode=None, help="查询工作日志 meta/journal")
+app.add_typer(journal_app, name="journal")
+
+
+@journal_app.command("query")
+def journal_query(
+    since: Optional[str] = typer.Option(None, "--since", help="起始日期（YYYY-MM-DD 或 YYYY-MM，含）"),
+    until: Optional[str] = typer.Option(None, "--until", help="结束日期（YYYY-MM-DD 或 YYYY-MM，含）"),
+    repo: Optional[str] = typer.Option(None, "--repo", help="仓库（main 或子模块路径）"),
+    status: Optional[str] = typer.Option(None, "--status", help="OK / FAIL / SKIP"),
+    change_type: Optional[str] = typer.Option(None, "--type", help="变更类型（如 docs, config, sync）"),
+    group_by: Optional[str] = typer.Option(
+        None, "--group-by", help="逗号分隔的分组键: date, month, repo, status, type"
+    ),
+    count: bool = typer.Option(False, "--count", help="只输出记录数"),
+    limit: int = typer.Option(20, "--limit", help="最多输出的行数（0 表示不限）"),
+    as_json: bool = typer.Option(False, "--json", help="以 JSON 输出"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="丢弃索引重新解析所有日志"),
+):
+    """
+    查询工作日志（增量索引，只解析变化过的日志文件）。
+
+    \b
+    用法:
+        thera journal query --repo docs/paper --status OK --limit 1
+        thera journal query --status FAIL --since 2026-10 --count
+        thera journal query --since 2026-01 --group-by month,status
+    """
+    import json
+
+    from thera.journal_index import JournalIndex, format_result
+
+    filters = dict(since=since, until=until, repo=repo, status=status, change_type=change_type)
+    keys = [key.strip() for key in group_by.split(",") if key.strip()] if group_by else []
+    with JournalIndex.for_repo(Path(".").resolve()) as index:
+        if rebuild:
+            index.rebuild()
+        else:
+            index.update()
+        try:
+            if count:
+                total = index.count(**filters)
+                typer.echo(json.dumps({"count": total}) if as_json else str(total))
+                raise typer.Exit(0)
+            result = index.query(group_by=keys, limit=limit or None, **filters)
+        except ValueError as e:
+            typer.echo(f"[FAIL] {e}")
+            raise typer.Exit(2)
+
+    if as_json:
+        rows = [dict(zip(result.columns, row)) for row in result.rows]
+        typer.echo(json.dumps(rows, ensure_ascii=False, indent=2))
+    elif result.rows:
+        typer.echo(format_result(result))
+    else:
+        typer.echo("无匹配记录")
+
+
 def main():
     app()
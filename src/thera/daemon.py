@@ -0,0 +1,415 @@
+"""
+守护进程模块
+
+`thera serve` 在 Unix domain socket 上常驻，保持仓库状态（RepoSession、状态快照）为热数据；
+轮询文件变化或收到请求时才重新扫描。CLI 检测到守护进程时把 refresh / status / doc-check
+转发给它，否则回退到进程内执行。
+
+协议：每个连接一个请求，请求与响应都是一行 JSON。
+"""
+
+import io
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Optional
+
+from thera.git_ops import get_state_dir
+from thera.pipeline import DEFAULT_CONFIG, RepoSession, RunOptions, run_doc_check
+
+SOCKET_FILE = "daemon.sock"
+NO_DAEMON_ENV = "THERA_NO_DAEMON"
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_CONNECT_TIMEOUT = 0.5
+MAX_SOCKET_PATH = 100  # sockaddr_un.sun_path 上限为 104~108 字节
+GIT_WATCH_FILES = ("HEAD", "index", "logs/HEAD", "FETCH_HEAD", "packed-refs")
+SKIP_DIRS = {".git", ".thera", "__pycache__", "node_modules", ".venv"}
+
+
+class DaemonError(RuntimeError):
+    """已连接守护进程，但请求失败（不再回退到进程内执行，避免重复执行）"""
+
+
+def socket_path(repo_root: Path) -> Path:
+    """守护进程 socket 路径；状态目录过深时改用临时目录下按仓库路径哈希命名的文件"""
+    repo_root = Path(repo_root).resolve()
+    path = get_state_dir(repo_root) / SOCKET_FILE
+    if len(str(path)) <= MAX_SOCKET_PATH:
+        return path
+    import hashlib
+    import tempfile
+
+    digest = hashlib.sha1(str(repo_root).encode()).hexdigest()[:16]
+    return Path(tempfile.gettempdir()) / f"thera-{os.getuid()}-{digest}.sock"
+
+
+def request(
+    repo_root: Path,
+    command: str,
+    timeout: Optional[float] = None,
+    **args,
+) -> Optional[dict]:
+    """
+    向守护进程发送请求。
+
+    守护进程未运行（socket 不存在或拒绝连接）或设置了 THERA_NO_DAEMON 时返回 None，
+    由调用方回退到进程内执行。
+
+    Raises:
+        DaemonError: 已连接但请求失败或守护进程返回错误
+    """
+    if os.environ.get(NO_DAEMON_ENV):
+        return None
+    path = socket_path(repo_root)
+    if not path.exists():
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DEFAULT_CONNECT_TIMEOUT)
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return None
+        sock.settimeout(timeout)
+        try:
+            sock.sendall(json.dumps({"command": command, "args": args}).encode() + b"\n")
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+        except OSError as e:
+            raise DaemonError(f"守护进程通信失败: {e}") from e
+    finally:
+        sock.close()
+
+    if not line:
+        raise DaemonError("守护进程未返回结果")
+    try:
+        response = json.loads(line)
+    except ValueError as e:
+        raise DaemonError(f"守护进程返回的结果无法解析: {e}") from e
+    if not isinstance(response, dict):
+        raise DaemonError("守护进程返回的结果无法解析: 不是 JSON 对象")
+    if not response.get("ok"):
+        raise DaemonError(response.get("error") or "守护进程执行失败")
+    return response
+
+
+def collect_status(session: RepoSession) -> dict:
+    """主仓库变更与子模块快照"""
+    status = session.git_ops.get_status()
+    return {
+        "repo": str(session.repo_root),
+        "clean": status.is_clean,
+        "changes": [{"path": c.path, "type": c.type_prefix} for c in status.changes],
+        "submodules": [
+            {
+                "path": info.path,
+                "local": info.local_commit,
+                "behind": info.is_behind,
+                "detached": info.is_detached,
+            }
+            for info in session.submodules
+        ],
+    }
+
+
+def format_status(data: dict) -> str:
+    """状态的文本形式（守护进程和进程内执行输出一致）"""
+    lines = [f"仓库: {data['repo']}"]
+    if data["clean"]:
+        lines.append("工作区: 干净")
+    else:
+        lines.append(f"工作区: {len(data['changes'])} 个变更")
+        lines += [f"  [{c['type']}] {c['path']}" for c in data["changes"]]
+
+    submodules = data["submodules"]
+    flagged = [s for s in submodules if s["behind"] or s["detached"]]
+    lines.append(f"子模块: {len(submodules)} 个，{len(flagged)} 个需要处理")
+    for s in flagged:
+        flag = "[DETACHED]" if s["detached"] else "[UP]"
+        lines.append(f"  {flag} {s['path']} {s['local']}")
+    return "\n".join(lines)
+
+
+def _git_dir(path: Path) -> Optional[Path]:
+    """仓库的 git 目录（子模块的 .git 文件指向超级项目的 .git/modules/...）"""
+    state_dir = get_state_dir(path)
+    return None if state_dir == path / ".thera" else state_dir.parent
+
+
+def tree_fingerprint(repo_root: Path, submodule_paths: list[str], config_path: str) -> str:
+    """
+    工作区与 git 元数据的 stat 指纹（不读文件内容）。
+
+    覆盖工作区所有文件（跳过 .git 等目录）、事实源，以及主仓库和各子模块 git 目录中
+    提交、暂存、拉取时会变化的文件。
+    """
+    import hashlib
+
+    h = hashlib.sha1()
+
+    def add(path: Path) -> None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            h.update(f"{path}:missing\0".encode())
+            return
+        h.update(f"{path}:{st.st_size}:{st.st_mtime_ns}\0".encode())
+
+    stack = [str(repo_root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIP_DIRS:
+                    stack.append(entry.path)
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            h.update(f"{entry.path}:{st.st_size}:{st.st_mtime_ns}\0".encode())
+
+    add(repo_root / config_path)
+    for root in [repo_root] + [repo_root / p for p in submodule_paths]:
+        git_dir = _git_dir(root)
+        if git_dir is not None:
+            for name in GIT_WATCH_FILES:
+                add(git_dir / name)
+    return h.hexdigest()
+
+
+class FileWatcher:
+    """轮询式文件监视：指纹变化时调用 on_change"""
+
+    def __init__(
+        self,
+        fingerprint: Callable[[], str],
+        on_change: Callable[[], None],
+        interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.fingerprint = fingerprint
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last: Optional[str] = None
+
+    def start(self) -> None:
+        self._last = self.fingerprint()
+        self._thread = threading.Thread(target=self._run, name="thera-watch", daemon=True)
+        self._thread.start()
+
+    def reset(self) -> None:
+        """重设比较基准，守护进程自身的操作（如 git status 刷新索引）不触发失效"""
+        self._last = self.fingerprint()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                current = self.fingerprint()
+            except Exception:
+                continue
+            if current != self._last:
+                self._last = current
+                self.on_change()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class DaemonState:
+    """守护进程持有的热数据；文件变化或执行变更操作后整体失效"""
+
+    def __init__(self, repo_root: Path, config_path: str = DEFAULT_CONFIG):
+        self.repo_root = repo_root
+        self.config_path = config_path
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.session = RepoSession(repo_root, config_path)
+        self._status: Optional[dict] = None
+        self.updated_at = time.time()
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.session = RepoSession(self.repo_root, self.config_path)
+            self._status = None
+            self.generation += 1
+            self.updated_at = time.time()
+
+    @property
+    def cached(self) -> bool:
+        return self._status is not None
+
+    def status(self) -> dict:
+        with self.lock:
+            if self._status is None:
+                self._status = collect_status(self.session)
+            return self._status
+
+    def fingerprint(self) -> str:
+        with self.lock:
+            paths = self.session.submodule_paths
+        return tree_fingerprint(self.repo_root, paths, self.config_path)
+
+
+class TheraDaemon:
+    """
+    Unix socket 守护进程
+
+    请求串行执行（同一时间只有一个命令修改仓库或读取会话）；
+    status 命中缓存时只做一次 JSON 序列化。
+    """
+
+    def __init__(
+        self,
+        repo_root: Path,
+        config_path: str = DEFAULT_CONFIG,
+        interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.repo_root = Path(repo_root).resolve()
+        self.path = socket_path(self.repo_root)
+        self.state = DaemonState(self.repo_root, config_path)
+        self.watcher = FileWatcher(self.state.fingerprint, self.state.invalidate, interval)
+        self.server = None  # socketserver.ThreadingUnixStreamServer，_bind 时创建
+        self._thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    def _bind(self) -> None:
+        import socketserver  # 只有守护进程需要，CLI 客户端不加载
+
+        if self.path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.path))
+            except OSError:
+                self.path.unlink()  # 上次异常退出留下的 socket
+            else:
+                raise RuntimeError(f"守护进程已在运行: {self.path}")
+            finally:
+                probe.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    req = json.loads(line)
+                    response = daemon.handle(req.get("command", ""), req.get("args") or {})
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                if daemon.stopping.is_set():
+                    # 响应写出后再停止；在处理线程中直接 shutdown 会死锁（serve_forever 等待本请求结束）
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+        old_umask = os.umask(0o077)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(str(self.path), Handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+
+    def start(self) -> None:
+        """在后台线程中启动"""
+        self._bind()
+        self.watcher.start()
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="thera-daemon", daemon=True  # type: ignore
+        )
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        """前台运行，直到收到 shutdown 请求或 KeyboardInterrupt"""
+        self._bind()
+        self.watcher.start()
+        try:
+            self.server.serve_forever()  # type: ignore
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._cleanup()
+
+    def shutdown(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._cleanup()
+
+    def _cleanup(self) -> None:
+        self.watcher.stop()
+        if self.server is not None:
+            self.server.server_close()
+        self.path.unlink(missing_ok=True)
+
+    def handle(self, command: str, args: dict) -> dict:
+        """执行一个请求，返回响应"""
+        handler = getattr(self, f"_cmd_{command.replace('-', '_')}", None)
+        if handler is None:
+            return {"ok": False, "error": f"未知命令: {command}"}
+        return {"ok": True, **handler(**args)}
+
+    def _cmd_ping(self) -> dict:
+        return {"pid": os.getpid(), "generation": self.state.generation}
+
+    def _cmd_status(self, refresh: bool = False) -> dict:
+        with self.state.lock:
+            if refresh:
+                self.state.invalidate()
+            if self.state.cached:
+                data = self.state.status()
+            else:
+                # git status 会顺带刷新 .git/index，以扫描后的指纹为基准避免自我失效
+                data = self.state.status()
+                self.watcher.reset()
+        return {
+            "exit_code": 0,
+            "output": format_status(data),
+            "data": data,
+            "generation": self.state.generation,
+            "age": time.time() - self.state.updated_at,
+        }
+
+    def _cmd_doc_check(self, config: Optional[str] = None, links: bool = False) -> dict:
+        with self.state.lock:
+            session = self.state.session
+            if config is not None and config != session.config_path:
+                session = RepoSession(self.repo_root, config)
+            buffer = io.StringIO()
+            with redirect_stdout(buffer):
+                result = run_doc_check(session, RunOptions(links=links))
+        return {"exit_code": 0 if result.success else 1, "output": buffer.getvalue()}
+
+    def _cmd_refresh(self, dry_run: bool = False, submodule: Optional[str] = None) -> dict:
+        from thera.refresh import refresh
+
+        with self.state.lock:
+            result = refresh(
+                self.repo_root,
+                dry_run=dry_run,
+                submodule=submodule,
+                ops=self.state.session.git_ops,
+            )
+            if not dry_run:
+                self.state.invalidate()
+        return {"exit_code": 0 if result.success else 1, "data": asdict(result)}
+
+    def _cmd_shutdown(self) -> dict:
+        self.stopping.set()
+        return {"exit_code": 0}
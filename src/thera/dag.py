@@ -0,0 +1,203 @@
+"""
+DAG 工作流执行模块
+
+把工作流声明为带依赖的步骤图：互不依赖的步骤并发执行；
+无副作用的步骤（如 fetch 到远程跟踪分支）可标记为 speculative，
+不等依赖完成就提前启动，依赖失败时丢弃其结果。
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Any, Callable, Optional
+
+from thera import tracing
+
+DEFAULT_DAG_JOBS = 4
+
+
+class StepStatus(Enum):
+    """步骤执行状态"""
+    SUCCESS = auto()  # 执行成功
+    FAILED = auto()  # 执行失败
+    SKIPPED = auto()  # 依赖失败，未执行
+    DISCARDED = auto()  # 预执行完成，但依赖失败，结果被丢弃
+
+
+class StepFailed(Exception):
+    """步骤失败（门控不通过）"""
+
+    def __init__(self, message: str, result: Any = None):
+        self.result = result
+        super().__init__(message)
+
+
+@dataclass
+class WorkflowStep:
+    """
+    工作流步骤
+
+    func 无参数调用，抛出异常或返回 success 为 False 的结果即视为失败。
+    speculative 步骤必须没有副作用（不改变状态机和工作区）。
+    """
+    name: str
+    func: Callable[[], Any]
+    deps: tuple[str, ...] = ()
+    speculative: bool = False
+
+
+@dataclass
+class DagResult:
+    """DAG 执行结果"""
+    order: list[str] = field(default_factory=list)
+    status: dict[str, StepStatus] = field(default_factory=dict)
+    results: dict[str, Any] = field(default_factory=dict)
+    errors: dict[str, BaseException] = field(default_factory=dict)
+
+    @property
+    def success(self) -> bool:
+        return all(s == StepStatus.SUCCESS for s in self.status.values())
+
+    @property
+    def failed_step(self) -> Optional[str]:
+        """按完成顺序第一个失败的步骤"""
+        for name in self.order:
+            if self.status.get(name) == StepStatus.FAILED:
+                return name
+        return None
+
+
+def _is_success(result: Any) -> bool:
+    return getattr(result, "success", True) is not False
+
+
+class DagExecutor:
+    """DAG 执行器"""
+
+    def __init__(self, steps: list[WorkflowStep], jobs: int = DEFAULT_DAG_JOBS):
+        """
+        Args:
+            steps: 工作流步骤
+            jobs: 最大并发数
+
+        Raises:
+            ValueError: 步骤重名、依赖不存在或存在环
+        """
+        self.steps = {step.name: step for step in steps}
+        if len(self.steps) != len(steps):
+            raise ValueError("步骤名称重复")
+        for step in steps:
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError(f"步骤 {step.name} 依赖不存在的步骤: {dep}")
+        self._check_acyclic()
+        self.jobs = jobs
+
+    def _check_acyclic(self) -> None:
+        remaining = {name: set(step.deps) for name, step in self.steps.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"步骤依赖存在环: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _run_step(self, step: WorkflowStep) -> Any:
+        with tracing.span(f"step.{step.name}", speculative=step.speculative):
+            return step.func()
+
+    def run(self) -> DagResult:
+        """
+        执行所有步骤。
+
+        非 speculative 步骤在依赖全部成功后启动，任一依赖未成功则跳过；
+        speculative 步骤一开始就启动，结果在依赖全部成功后才生效。
+        某个门控失败后丢弃 speculative 步骤的结果，但返回前仍等待它们结束：
+        预执行的 fetch 等步骤会改动仓库，不能在调用方释放租约后还在运行。
+        尚未启动的步骤被取消。
+        """
+        result = DagResult()
+        status = result.status
+        steps = self.steps
+        done: dict[str, Any] = {}  # 已执行完但依赖尚未确定的 speculative 步骤
+        running: dict[Future, str] = {}
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.jobs, len(steps))),
+            thread_name_prefix="thera-dag",
+        )
+
+        def settle(name: str, st: StepStatus) -> None:
+            status[name] = st
+            result.order.append(name)
+
+        def deps_state(step: WorkflowStep) -> Optional[bool]:
+            """依赖全部成功返回 True，有依赖未成功返回 False，尚未确定返回 None"""
+            pending = False
+            for dep in step.deps:
+                st = status.get(dep)
+                if st is None:
+                    pending = True
+                elif st != StepStatus.SUCCESS:
+                    return False
+            return None if pending else True
+
+        def finish(name: str, outcome: Any, error: Optional[BaseException]) -> None:
+            if error is not None:
+                result.errors[name] = error
+                if isinstance(error, StepFailed) and error.result is not None:
+                    result.results[name] = error.result
+                settle(name, StepStatus.FAILED)
+            else:
+                result.results[name] = outcome
+                settle(name, StepStatus.SUCCESS if _is_success(outcome) else StepStatus.FAILED)
+
+        run_step = tracing.propagate(self._run_step)
+        started: set[str] = set()
+        for step in steps.values():
+            if step.speculative:
+                running[executor.submit(run_step, step)] = step.name
+                started.add(step.name)
+
+        try:
+            while len(status) < len(steps):
+                progressed = False
+                for name, step in steps.items():
+                    if name in status:
+                        continue
+                    ready = deps_state(step)
+                    if name in started:
+                        if ready is False:
+                            settle(name, StepStatus.DISCARDED)
+                            done.pop(name, None)
+                            progressed = True
+                        elif ready and name in done:
+                            finish(name, *done.pop(name))
+                            progressed = True
+                    elif ready is False:
+                        settle(name, StepStatus.SKIPPED)
+                        progressed = True
+                    elif ready:
+                        running[executor.submit(run_step, step)] = name
+                        started.add(name)
+                if progressed:
+                    continue
+
+                active = [f for f, n in running.items() if n not in status]
+                if not active:
+                    break
+                finished, _ = wait(active, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    outcome = None if error is not None else future.result()
+                    if steps[name].speculative:
+                        done[name] = (outcome, error)
+                    else:
+                        finish(name, outcome, error)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return result
@@ -25,11 +25,11 @@ def load_yaml_registry(config_path, repo_root):
     return data.get("submodules", []) if data else []
 
 
-def check_gitmodules_vs_yaml(repo_root, config_path):
-    """检查 .gitmodules 与 YAML 事实源的一致性"""
+def parse_gitmodules(repo_root):
+    """解析 .gitmodules，返回 {子模块名: 路径}；文件不存在时返回 None"""
     gitmodules_path = repo_root / ".gitmodules"
     if not gitmodules_path.exists():
-        return False, ".gitmodules 不存在"
+        return None
     
     with open(gitmodules_path) as f:
         git_content = f.read()
@@ -44,10 +44,24 @@ def check_gitmodules_vs_yaml(repo_root, config_path):
         if current_name and path_match:
             git_modules[current_name] = path_match.group(1).strip()
             current_name = None
+    return git_modules
+
+
+def check_gitmodules_vs_yaml(repo_root, config_path, yaml_modules=None, git_modules=None):
+    """
+    检查 .gitmodules 与 YAML 事实源的一致性
+
+    yaml_modules / git_modules 为已解析的结果时直接使用，为 None 时从文件读取。
+    """
+    if git_modules is None:
+        git_modules = parse_gitmodules(repo_root)
+        if git_modules is None:
+            return False, ".gitmodules 不存在"
     
-    yaml_modules = load_yaml_registry(config_path, repo_root)
     if yaml_modules is None:
-        return False, "YAML 事实源不存在"
+        yaml_modules = load_yaml_registry(config_path, repo_root)
+        if yaml_modules is None:
+            return False, "YAML 事实源不存在"
     
     yaml_paths = {m["name"]: m["path"] for m in yaml_modules}
     
@@ -77,11 +91,12 @@ def check_gitmodules_vs_yaml(repo_root, config_path):
     return all_exist, details
 
 
-def check_yaml_paths(repo_root, config_path):
+def check_yaml_paths(repo_root, config_path, yaml_modules=None):
     """检查 YAML 中声明的路径是否存在"""
-    yaml_modules = load_yaml_registry(config_path, repo_root)
     if yaml_modules is None:
-        return False, "YAML 事实源不存在"
+        yaml_modules = load_yaml_registry(config_path, repo_root)
+        if yaml_modules is None:
+            return False, "YAML 事实源不存在"
     
     missing = []
     for m in yaml_modules:
@@ -94,11 +109,53 @@ def check_yaml_paths(repo_root, config_path):
     return all_exist, details
 
 
+def check_markdown_links(repo_root):
+    """检查 docs 子模块中的 Markdown 相对链接与锚点"""
+    from thera.link_check import check_links
+
+    result = check_links(repo_root)
+    if result.success:
+        return True, result.message
+
+    samples = [f"{b.source}:{b.line} {b.target}" for b in result.broken_links[:3]]
+    more = len(result.broken_links) - len(samples)
+    details = f"{result.message}: {', '.join(samples)}"
+    if more > 0:
+        details += f" (+{more} more)"
+    return False, details
+
+
+def build_checks(repo_root, config_path, links=False, yaml_modules=None, git_modules=None):
+    """组装检查项 [(名称, 检查函数)]；已解析的注册表可通过参数传入复用"""
+    checks = [
+        (
+            "YAML vs .gitmodules",
+            lambda: check_gitmodules_vs_yaml(repo_root, config_path, yaml_modules, git_modules),
+        ),
+        ("YAML 路径存在性", lambda: check_yaml_paths(repo_root, config_path, yaml_modules)),
+    ]
+    if links:
+        checks.append(("Markdown 链接", lambda: check_markdown_links(repo_root)))
+    return checks
+
+
+def run_checks(checks):
+    """依次执行检查并打印结果，返回 [(名称, 是否通过, 详情)]"""
+    results = []
+    for name, check_func in checks:
+        status, details = check_func()
+        symbol = "[OK]" if status else "[WARN]"
+        results.append((name, status, details))
+        print(f"{symbol} {name:25s} {details}")
+    return results
+
+
 def main(args=None):
     if args is None:
         parser = argparse.ArgumentParser(description="文档一致性检查")
         parser.add_argument("--config", default="meta/profile/submodules.yaml", help="YAML 配置文件路径")
         parser.add_argument("--repo", default=".", help="仓库根目录")
+        parser.add_argument("--links", action="store_true", help="同时检查 Markdown 链接")
         args = parser.parse_args()
     
     repo_root = Path(args.repo).resolve()
@@ -111,17 +168,8 @@ def main(args=None):
     print(f"配置: {config_path}")
     print()
     
-    checks = [
-        ("YAML vs .gitmodules", lambda: check_gitmodules_vs_yaml(repo_root, config_path)),
-        ("YAML 路径存在性", lambda: check_yaml_paths(repo_root, config_path)),
-    ]
-    
-    results = []
-    for name, check_func in checks:
-        status, details = check_func()
-        symbol = "[OK]" if status else "[WARN]"
-        results.append((name, status, details))
-        print(f"{symbol} {name:25s} {details}")
+    checks = build_checks(repo_root, config_path, links=getattr(args, "links", False))
+    results = run_checks(checks)
     
     print()
     print("=" * 60)
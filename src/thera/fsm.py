@@ -4,9 +4,15 @@
 定义状态、事件、转移规则，验证状态转移的合法性。
 """
 
+import atexit
+import time
+from array import array
 from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import Optional
+from operator import attrgetter
+from typing import Iterable, Iterator, Optional
+
+from thera.hooks import BackgroundHook, HookDispatcher, HookError, HookMode
 
 
 class RepoState(Enum):
@@ -43,10 +49,19 @@ class Event(Enum):
     AUTO_COMMIT = auto()  # 自动提交
     PUSH_OK = auto()  # 推送成功
     PUSH_FAIL = auto()  # 推送失败
+    RETRY = auto()  # 重试推送（本地提交已存在）
+
+
+class SubmoduleEvent(Enum):
+    """子模块状态转移事件"""
+    SYNC_OK = auto()  # 同步成功
+    SYNC_FAIL = auto()  # 同步失败（冲突、网络等），需要人工处理
+    REMOTE_UPDATED = auto()  # 远程可能有新提交
+    REATTACH = auto()  # 重新检出分支
 
 
 # 状态转移表
-TRANSITIONS: dict[RepoState, dict[Event, RepoState | ErrorState]] = {
+TRANSITIONS: dict[RepoState | ErrorState, dict[Event, RepoState | ErrorState]] = {
     RepoState.DIRTY: {
         Event.DOC_CHECK_OK: RepoState.CLEAN_AND_CONSISTENT,
         Event.DOC_CHECK_FAIL: RepoState.INCONSISTENT,
@@ -65,18 +80,395 @@ TRANSITIONS: dict[RepoState, dict[Event, RepoState | ErrorState]] = {
         Event.PUSH_OK: RepoState.CLEAN_AND_CONSISTENT,
         Event.PUSH_FAIL: ErrorState.NETWORK_ERROR,
     },
+    ErrorState.NETWORK_ERROR: {
+        Event.RETRY: RepoState.COMMITTED,
+    },
 }
 
 # 允许的事件（用于提示用户）
-ALLOWED_EVENTS: dict[RepoState, list[Event]] = {
+ALLOWED_EVENTS: dict[RepoState | ErrorState, list[Event]] = {
     RepoState.DIRTY: [Event.DOC_CHECK_OK, Event.DOC_CHECK_FAIL],
     RepoState.CLEAN_AND_CONSISTENT: [Event.EDIT, Event.SUBMODULE_SYNC],
     RepoState.INCONSISTENT: [Event.FIX],
     RepoState.SYNCED: [Event.AUTO_COMMIT],
     RepoState.COMMITTED: [Event.PUSH_OK, Event.PUSH_FAIL],
+    ErrorState.NETWORK_ERROR: [Event.RETRY],
+}
+
+# 子模块状态转移表
+SUBMODULE_TRANSITIONS: dict[SubmoduleState, dict[SubmoduleEvent, SubmoduleState]] = {
+    SubmoduleState.BEHIND: {
+        SubmoduleEvent.SYNC_OK: SubmoduleState.UP_TO_DATE,
+        SubmoduleEvent.SYNC_FAIL: SubmoduleState.DETACHED,
+    },
+    SubmoduleState.UP_TO_DATE: {
+        SubmoduleEvent.REMOTE_UPDATED: SubmoduleState.BEHIND,
+    },
+    SubmoduleState.DETACHED: {
+        SubmoduleEvent.REATTACH: SubmoduleState.BEHIND,
+    },
 }
 
 
+# 状态/事件的紧凑整数编码（用于历史环形缓冲区）
+STATE_CODES: tuple = tuple(RepoState) + tuple(ErrorState)
+EVENT_CODES: tuple = tuple(Event)
+STATE_INDEX: dict = {s: i for i, s in enumerate(STATE_CODES)}
+EVENT_INDEX: dict = {e: i for i, e in enumerate(EVENT_CODES)}
+ERROR_STATE_CODES: tuple = tuple(STATE_INDEX[s] for s in ErrorState)
+
+N_EVENTS = len(EVENT_CODES)
+
+# 事件码同时存在成员的 _code 属性上：批量接口用 attrgetter 在 C 中完成映射，
+# 按 EVENT_INDEX 查找时每个事件都要调用 Python 实现的 Enum.__hash__
+for _event, _code in EVENT_INDEX.items():
+    _event._code = _code
+del _event, _code
+_event_code = attrgetter("_code")
+
+
+def _compile_transitions() -> array:
+    """把转移表编译为 状态码 × 事件码 的稠密矩阵，-1 表示非法转移"""
+    matrix = array("b", [-1]) * (len(STATE_CODES) * N_EVENTS)
+    for state, events in ALLOWED_EVENTS.items():
+        for event in events:
+            target = TRANSITIONS[state][event]
+            matrix[STATE_INDEX[state] * N_EVENTS + EVENT_INDEX[event]] = STATE_INDEX[target]
+    return matrix
+
+
+TRANSITION_MATRIX: array = _compile_transitions()
+_PUSH_FAIL_CODE = EVENT_INDEX[Event.PUSH_FAIL]
+_RETRY_CODE = EVENT_INDEX[Event.RETRY]
+
+_SCAN_CHUNK = 32
+_SCAN_CACHE_SIZE = 4096
+
+
+def _scan(code: int, codes: bytes) -> tuple[bytes, int, int]:
+    """
+    从状态码 code 开始依次应用事件码 codes
+
+    按 _SCAN_CHUNK 个事件分块，(起始状态, 事件块) 相同的块只查一次矩阵：事件流通常由
+    少数几种循环组成，命中后整块直接拼接。
+
+    Returns:
+        (各事件的起始状态码, 最终状态码, 第一个非法事件的下标；全部合法时为 -1)
+    """
+    matrix = TRANSITION_MATRIX
+    n_events = N_EVENTS
+    cache: dict[tuple[int, bytes], tuple[bytes, int]] = {}
+    states = bytearray()
+    for start in range(0, len(codes), _SCAN_CHUNK):
+        chunk = codes[start:start + _SCAN_CHUNK]
+        key = (code, chunk)
+        hit = cache.get(key)
+        if hit is None:
+            chunk_states = bytearray()
+            current = code
+            for offset, event_code in enumerate(chunk):
+                target = matrix[current * n_events + event_code]
+                if target < 0:
+                    states += chunk_states
+                    return bytes(states), current, start + offset
+                chunk_states.append(current)
+                current = target
+            if len(cache) >= _SCAN_CACHE_SIZE:
+                cache.clear()
+            hit = cache[key] = (bytes(chunk_states), current)
+        states += hit[0]
+        code = hit[1]
+    return bytes(states), code, -1
+
+DEFAULT_HISTORY_CAPACITY = 10_000
+HOOK_EXIT_TIMEOUT = 5.0  # 解释器退出时等待后台钩子的最长时间
+
+
+class TransitionHistory:
+    """
+    转移历史环形缓冲区
+
+    以 array 保存状态码、事件码和时间戳，超出容量后覆盖最旧的记录；
+    读取时才重建枚举对象。
+    """
+
+    __slots__ = ("capacity", "total", "_states", "_events", "_times", "_start")
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY_CAPACITY):
+        if capacity <= 0:
+            raise ValueError(f"capacity 必须为正数: {capacity}")
+        self.capacity = capacity
+        self.total = 0
+        self._states = array("B")
+        self._events = array("B")
+        self._times = array("d")
+        self._start = 0
+
+    @classmethod
+    def from_entries(
+        cls, entries, capacity: int = DEFAULT_HISTORY_CAPACITY
+    ) -> "TransitionHistory":
+        """从 (state, event) 序列构造"""
+        history = cls(capacity)
+        for entry in entries:
+            history.append(entry)
+        return history
+
+    def record(
+        self,
+        state: RepoState | ErrorState,
+        event: Event,
+        timestamp: Optional[float] = None,
+    ) -> None:
+        """记录一次转移"""
+        self.record_codes(
+            STATE_INDEX[state],
+            EVENT_INDEX[event],
+            time.time() if timestamp is None else timestamp,
+        )
+
+    def record_codes(self, state_code: int, event_code: int, timestamp: float) -> None:
+        """以整数编码记录一次转移"""
+        if len(self._states) < self.capacity:
+            self._states.append(state_code)
+            self._events.append(event_code)
+            self._times.append(timestamp)
+        else:
+            pos = self._start
+            self._states[pos] = state_code
+            self._events[pos] = event_code
+            self._times[pos] = timestamp
+            self._start = (pos + 1) % self.capacity
+        self.total += 1
+
+    def extend_codes(self, state_codes: array, event_codes: array, timestamp: float) -> None:
+        """批量记录转移（同一批共用一个时间戳）"""
+        n = len(state_codes)
+        if not n:
+            return
+        cap = self.capacity
+        if n >= cap:
+            self._states = array("B", state_codes[n - cap:])
+            self._events = array("B", event_codes[n - cap:])
+            self._times = array("d", [timestamp]) * cap
+            self._start = 0
+        else:
+            take = min(cap - len(self._states), n)
+            if take:
+                self._states.extend(state_codes[:take])
+                self._events.extend(event_codes[:take])
+                self._times.extend(array("d", [timestamp]) * take)
+            i = take
+            while i < n:
+                pos = self._start
+                chunk = min(n - i, cap - pos)
+                self._states[pos:pos + chunk] = state_codes[i:i + chunk]
+                self._events[pos:pos + chunk] = event_codes[i:i + chunk]
+                self._times[pos:pos + chunk] = array("d", [timestamp]) * chunk
+                self._start = (pos + chunk) % cap
+                i += chunk
+        self.total += n
+
+    def append(self, entry: tuple) -> None:
+        """兼容 list.append((state, event))"""
+        state, event = entry
+        self.record(state, event)
+
+    def clear(self) -> None:
+        """清空缓冲区"""
+        self.total = 0
+        self._states = array("B")
+        self._events = array("B")
+        self._times = array("d")
+        self._start = 0
+
+    @property
+    def dropped(self) -> int:
+        """已被覆盖的记录数（缓冲区首条记录的绝对序号）"""
+        return self.total - len(self._states)
+
+    def _physical(self, pos: int) -> int:
+        """逻辑位置 → 数组下标"""
+        size = len(self._states)
+        if pos < 0:
+            pos += size
+        if not 0 <= pos < size:
+            raise IndexError("history index out of range")
+        return (self._start + pos) % self.capacity
+
+    def _logical(self, physical: int) -> int:
+        """数组下标 → 逻辑位置"""
+        return (physical - self._start) % self.capacity
+
+    def state_at(self, pos: int) -> RepoState | ErrorState:
+        """第 pos 条记录的起始状态"""
+        return STATE_CODES[self._states[self._physical(pos)]]
+
+    def event_at(self, pos: int) -> Event:
+        """第 pos 条记录的事件"""
+        return EVENT_CODES[self._events[self._physical(pos)]]
+
+    def timestamp_at(self, pos: int) -> float:
+        """第 pos 条记录的时间戳（Unix 秒）"""
+        return self._times[self._physical(pos)]
+
+    def state_counts(self) -> list[int]:
+        """按状态码统计缓冲区内的记录数"""
+        return [self._states.count(code) for code in range(len(STATE_CODES))]
+
+    def positions_of(self, state_codes) -> list[int]:
+        """返回起始状态属于 state_codes 的记录位置（升序）"""
+        positions = []
+        for code in state_codes:
+            physical = -1
+            while True:
+                try:
+                    physical = self._states.index(code, physical + 1)
+                except ValueError:
+                    break
+                positions.append(self._logical(physical))
+        positions.sort()
+        return positions
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        physical = self._physical(key)
+        return (STATE_CODES[self._states[physical]], EVENT_CODES[self._events[physical]])
+
+    def __iter__(self) -> Iterator[tuple]:
+        for pos in range(len(self)):
+            yield self[pos]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TransitionHistory, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"TransitionHistory(len={len(self)}, capacity={self.capacity}, total={self.total})"
+
+
+class TransitionStats:
+    """
+    转移聚合计数
+
+    在每次转移时增量更新状态分布和错误索引，审计时无需扫描历史。
+    错误记录与转移历史一样是定长环形缓冲区，只保留最近 capacity 条，error_count 仍是总数；
+    更早的错误位置从转移日志查询。
+    """
+
+    __slots__ = (
+        "total", "offset", "state_counts", "capacity", "error_count",
+        "_error_positions", "_error_states", "_error_events", "_error_start",
+    )
+
+    def __init__(self, offset: int = 0, capacity: int = DEFAULT_HISTORY_CAPACITY):
+        """
+        Args:
+            offset: 计数开始前已发生、未计入的转移数；错误记录的绝对序号从这里起算
+            capacity: 保留的错误记录条数
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity 必须为正数: {capacity}")
+        self.total = 0
+        self.offset = offset
+        self.state_counts = [0] * len(STATE_CODES)
+        self.capacity = capacity
+        self.error_count = 0
+        self._error_positions = array("Q")
+        self._error_states = array("B")
+        self._error_events = array("B")
+        self._error_start = 0
+
+    @classmethod
+    def replay(
+        cls,
+        codes: Iterable[tuple[int, int]],
+        offset: int = 0,
+        capacity: int = DEFAULT_HISTORY_CAPACITY,
+    ) -> "TransitionStats":
+        """按顺序回放 (起始状态码, 事件码)，与实时转移走同一条更新路径"""
+        stats = cls(offset, capacity)
+        record = stats.record_codes
+        for state_code, event_code in codes:
+            record(state_code, event_code)
+        return stats
+
+    @classmethod
+    def from_history(cls, history: TransitionHistory) -> "TransitionStats":
+        """
+        从已有历史重建计数
+
+        已被覆盖的记录无法回放，只统计缓冲区内的记录（offset 为被覆盖的条数，错误序号仍是绝对序号）；
+        需要完整计数时从转移日志回放（TransitionLog.replay）。
+        """
+        return cls.replay(
+            (
+                (STATE_INDEX[history.state_at(pos)], EVENT_INDEX[history.event_at(pos)])
+                for pos in range(len(history))
+            ),
+            offset=history.dropped,
+            capacity=history.capacity,
+        )
+
+    def _record_error(self, position: int, state_code: int, event_code: int) -> None:
+        if len(self._error_positions) < self.capacity:
+            self._error_positions.append(position)
+            self._error_states.append(state_code)
+            self._error_events.append(event_code)
+        else:
+            i = self._error_start
+            self._error_positions[i] = position
+            self._error_states[i] = state_code
+            self._error_events[i] = event_code
+            self._error_start = (i + 1) % self.capacity
+        self.error_count += 1
+
+    def record_codes(self, state_code: int, event_code: int) -> None:
+        """记录一次转移的起始状态码和事件码"""
+        self.state_counts[state_code] += 1
+        if state_code in ERROR_STATE_CODES:
+            self._record_error(self.offset + self.total, state_code, event_code)
+        self.total += 1
+
+    def extend_codes(self, state_codes: bytes | array, event_codes: bytes | array) -> None:
+        """批量记录转移（状态码、事件码为 bytes 或 array("B")）"""
+        # 在 bytes 上计数和查找（C 循环）；array.count 会把每个元素装箱成 int 再比较
+        states = bytes(state_codes)
+        for code in range(len(self.state_counts)):
+            count = states.count(code)
+            if count:
+                self.state_counts[code] += count
+
+        errors = []
+        for code in ERROR_STATE_CODES:
+            pos = states.find(code)
+            while pos >= 0:
+                errors.append(pos)
+                pos = states.find(code, pos + 1)
+        for pos in sorted(errors):
+            self._record_error(self.offset + self.total + pos, state_codes[pos], event_codes[pos])
+
+        self.total += len(state_codes)
+
+    def iter_errors(self) -> Iterator[tuple]:
+        """按发生顺序返回保留的 (绝对序号, 错误状态, 事件)，最多 capacity 条"""
+        n = len(self._error_positions)
+        for k in range(n):
+            i = (self._error_start + k) % n
+            yield (
+                self._error_positions[i],
+                STATE_CODES[self._error_states[i]],
+                EVENT_CODES[self._error_events[i]],
+            )
+
+
 class StateMachineError(Exception):
     """状态机异常基类"""
     pass
@@ -96,48 +488,185 @@ class StateMachine:
     """Git 状态机"""
     state: RepoState | ErrorState = RepoState.DIRTY
     error: Optional[ErrorState] = None
-    history: list[tuple[RepoState, Event]] = field(default_factory=list)
+    history: Optional[TransitionHistory] = None
     on_enter_callbacks: dict = field(default_factory=dict)
     on_exit_callbacks: dict = field(default_factory=dict)
-
-    def add_enter_hook(self, state: RepoState | ErrorState, callback) -> None:
+    history_capacity: int = DEFAULT_HISTORY_CAPACITY
+    listeners: list = field(default_factory=list)
+    stats: TransitionStats = field(default_factory=TransitionStats)
+    hook_dispatcher: Optional[HookDispatcher] = None
+    _owns_dispatcher: bool = field(default=False, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.history is None:
+            self.history = TransitionHistory(self.history_capacity)
+            if not self.stats.total:
+                self.stats = TransitionStats(capacity=self.history_capacity)
+        elif len(self.history):
+            self.stats = TransitionStats.from_history(self.history)
+
+    def load_history(self, entries) -> None:
+        """以 (state, event) 序列替换转移历史，并重建聚合计数"""
+        self.history = TransitionHistory.from_entries(
+            entries, max(self.history_capacity, len(entries))
+        )
+        self.rebuild_stats()
+
+    def rebuild_stats(self) -> None:
+        """根据当前历史重建聚合计数"""
+        self.stats = TransitionStats.from_history(self.history)  # type: ignore
+
+    def add_enter_hook(
+        self,
+        state: RepoState | ErrorState,
+        callback,
+        mode: HookMode = HookMode.INLINE,
+    ) -> None:
         """添加进入状态时的钩子"""
         if state not in self.on_enter_callbacks:
             self.on_enter_callbacks[state] = []
-        self.on_enter_callbacks[state].append(callback)
-
-    def add_exit_hook(self, state: RepoState, callback) -> None:
+        self.on_enter_callbacks[state].append(self._wrap_hook(state, callback, mode))
+
+    def add_exit_hook(
+        self,
+        state: RepoState,
+        callback,
+        mode: HookMode = HookMode.INLINE,
+    ) -> None:
         """添加退出状态时的钩子"""
         if state not in self.on_exit_callbacks:
             self.on_exit_callbacks[state] = []
-        self.on_exit_callbacks[state].append(callback)
+        self.on_exit_callbacks[state].append(self._wrap_hook(state, callback, mode))
+
+    def _wrap_hook(self, state, callback, mode: HookMode):
+        """非 INLINE 钩子包装为后台执行，同一状态的钩子保持提交顺序"""
+        import inspect
+
+        is_coroutine = inspect.iscoroutinefunction(callback)
+        if mode == HookMode.INLINE:
+            if is_coroutine:
+                raise ValueError("协程钩子需要使用 HookMode.ASYNC")
+            return callback
+        if mode == HookMode.ASYNC and not is_coroutine:
+            raise ValueError("HookMode.ASYNC 需要协程函数")
+        if self.hook_dispatcher is None:
+            self.hook_dispatcher = HookDispatcher()
+            self._owns_dispatcher = True
+            # 未调用 close() 时，退出前仍执行完已提交的钩子（工作线程是守护线程）
+            atexit.register(self.hook_dispatcher.close, HOOK_EXIT_TIMEOUT)
+        return BackgroundHook(callback, self.hook_dispatcher, state)
+
+    def drain_hooks(self, timeout: Optional[float] = None) -> bool:
+        """等待后台钩子执行完；超时返回 False"""
+        if self.hook_dispatcher is None:
+            return True
+        return self.hook_dispatcher.drain(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        执行完已提交的后台钩子并停止自己创建的调度器；超时返回 False
+
+        外部传入的调度器只等待执行完，不关闭。关闭后仍可 pop_hook_errors()，
+        但不能再触发后台钩子。
+        """
+        dispatcher = self.hook_dispatcher
+        if dispatcher is None:
+            return True
+        if not self._owns_dispatcher:
+            return dispatcher.drain(timeout)
+        atexit.unregister(dispatcher.close)
+        return dispatcher.close(timeout)
+
+    def pop_hook_errors(self) -> list[HookError]:
+        """取出后台钩子抛出的异常"""
+        if self.hook_dispatcher is None:
+            return []
+        return self.hook_dispatcher.pop_errors()
+
+    def add_listener(self, callback) -> None:
+        """添加转移监听器，callback(old_state, event, new_state, timestamp)"""
+        self.listeners.append(callback)
 
     def can_transition(self, event: Event) -> bool:
         """检查是否可以转移"""
-        return event in ALLOWED_EVENTS.get(self.state, [])  # type: ignore
+        return TRANSITION_MATRIX[STATE_INDEX[self.state] * N_EVENTS + EVENT_INDEX[event]] >= 0
 
     def transition(self, event: Event) -> RepoState | ErrorState:
         """执行状态转移"""
-        if not self.can_transition(event):
+        state_code = STATE_INDEX[self.state]
+        event_code = EVENT_INDEX[event]
+        target = TRANSITION_MATRIX[state_code * N_EVENTS + event_code]
+        if target < 0:
             raise IllegalTransitionError(self.state, event)  # type: ignore
 
         old_state = self.state
-        new_state = TRANSITIONS[self.state][event]  # type: ignore
+        new_state = STATE_CODES[target]
 
         for callback in self.on_exit_callbacks.get(old_state, []):
             callback(old_state, event)
 
-        self.history.append((old_state, event))  # type: ignore
+        timestamp = time.time()
+        self.history.record_codes(state_code, event_code, timestamp)  # type: ignore
+        self.stats.record_codes(state_code, event_code)
         self.state = new_state
 
         if event == Event.PUSH_FAIL:
             self.error = ErrorState.NETWORK_ERROR
+        elif event == Event.RETRY:
+            self.error = None
+
+        for listener in self.listeners:
+            listener(old_state, event, new_state, timestamp)
 
         for callback in self.on_enter_callbacks.get(new_state, []):
             callback(old_state, event)
 
         return new_state
 
+    def transition_many(self, events) -> RepoState | ErrorState:
+        """
+        批量执行转移。
+
+        未注册钩子和监听器时事件先整体映射为事件码，再分块扫描矩阵（见 _scan），
+        最后一次性写入历史和聚合计数，逐事件不再有 Python 层的查找和分发；
+        否则逐个调用 transition。遇到非法事件时保留之前的转移并抛出 IllegalTransitionError。
+        """
+        if self.on_enter_callbacks or self.on_exit_callbacks or self.listeners:
+            for event in events:
+                self.transition(event)
+            return self.state
+
+        codes = bytes(map(_event_code, events))
+        states, code, illegal = _scan(STATE_INDEX[self.state], codes)
+        applied = codes[:len(states)]
+
+        self.history.extend_codes(array("B", states), array("B", applied), time.time())  # type: ignore
+        self.stats.extend_codes(states, applied)
+        self.state = STATE_CODES[code]
+        last_fail = applied.rfind(_PUSH_FAIL_CODE)
+        last_retry = applied.rfind(_RETRY_CODE)
+        if last_fail > last_retry:
+            self.error = ErrorState.NETWORK_ERROR
+        elif last_retry > last_fail:
+            self.error = None
+
+        if illegal >= 0:
+            raise IllegalTransitionError(self.state, EVENT_CODES[codes[illegal]])  # type: ignore
+        return self.state
+
+    def validate_sequence(
+        self, events, start: Optional[RepoState | ErrorState] = None
+    ) -> Optional[int]:
+        """
+        校验事件序列是否合法（不改变状态机）。
+
+        Returns:
+            第一个非法事件的下标；全部合法时返回 None
+        """
+        code = STATE_INDEX[self.state if start is None else start]
+        _, _, illegal = _scan(code, bytes(map(_event_code, events)))
+        return None if illegal < 0 else illegal
+
     def get_allowed_events(self) -> list[Event]:
         """获取当前状态允许的事件"""
         return ALLOWED_EVENTS.get(self.state, [])  # type: ignore
@@ -145,3 +674,44 @@ class StateMachine:
     def is_error_state(self) -> bool:
         """是否处于错误状态"""
         return self.error is not None
+
+
+class SubmoduleMachine:
+    """
+    单个子模块的轻量状态机
+
+    只记录当前状态和最近一次错误；状态变化通过 on_change(path, old, new) 通知调度器，
+    由调度器增量维护聚合计数。
+    """
+
+    __slots__ = ("path", "state", "error", "on_change")
+
+    def __init__(
+        self,
+        path: str,
+        state: SubmoduleState = SubmoduleState.BEHIND,
+        on_change=None,
+    ):
+        self.path = path
+        self.state = state
+        self.error: Optional[str] = None
+        self.on_change = on_change
+
+    def can_transition(self, event: SubmoduleEvent) -> bool:
+        """检查是否可以转移"""
+        return event in SUBMODULE_TRANSITIONS[self.state]
+
+    def transition(self, event: SubmoduleEvent, error: Optional[str] = None) -> SubmoduleState:
+        """执行状态转移"""
+        targets = SUBMODULE_TRANSITIONS[self.state]
+        if event not in targets:
+            raise IllegalTransitionError(self.state, event)  # type: ignore
+        old_state = self.state
+        self.state = targets[event]
+        self.error = error if event == SubmoduleEvent.SYNC_FAIL else None
+        if self.on_change is not None:
+            self.on_change(self.path, old_state, self.state)
+        return self.state
+
+    def __repr__(self) -> str:
+        return f"SubmoduleMachine({self.path!r}, {self.state.name})"
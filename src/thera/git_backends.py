@@ -0,0 +1,490 @@
+"""
+Git 后端
+
+GitOps 的只读查询（解析引用、读取配置、子模块状态）经由一串后端依次尝试：
+可选的 pygit2 / dulwich、纯 Python 读取器，最后是 git 子进程。
+后端不支持某个操作或当前仓库状态时抛出 BackendUnsupported，由下一个后端处理；
+子进程后端支持所有操作，结果以它为准。
+
+写操作（add / commit / push / submodule update）始终走子进程。
+"""
+
+import os
+import re
+from abc import ABC
+from pathlib import Path
+from typing import Callable, Optional
+
+BACKEND_ENV = "THERA_GIT_BACKEND"
+
+GITLINK_MODE = 0o160000
+NULL_SHA = "0" * 40
+MAX_SYMREF_DEPTH = 5
+PSEUDO_REFS = ("HEAD", "MERGE_HEAD", "FETCH_HEAD", "ORIG_HEAD", "CHERRY_PICK_HEAD", "REVERT_HEAD")
+_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+class BackendUnsupported(Exception):
+    """后端不支持该操作或当前仓库状态，交给下一个后端"""
+
+
+class GitBackend(ABC):
+    """
+    只读查询后端基类
+
+    每个操作的默认实现都抛出 BackendUnsupported，后端只需覆盖自己能可靠回答的操作。
+    返回值的格式与对应 git 命令的输出一致，GitOps 不区分结果来自哪个后端。
+    """
+
+    name = ""
+
+    def rev_parse(self, repo: Path, revs: list[str]) -> Optional[list[str]]:
+        """
+        `git rev-parse -q --verify` 的逐个结果：完整 SHA 列表；任一引用不存在时返回 None
+        """
+        raise BackendUnsupported(f"{self.name}: rev_parse")
+
+    def config_get_regexp(self, repo: Path, pattern: str) -> list[tuple[str, Optional[str]]]:
+        """`git config --get-regexp`：[(规范化键名, 值)]，无值的布尔键值为 None"""
+        raise BackendUnsupported(f"{self.name}: config_get_regexp")
+
+    def submodule_status(self, repo: Path) -> list[str]:
+        """`git submodule status` 的输出行，不含末尾的 describe 部分"""
+        raise BackendUnsupported(f"{self.name}: submodule_status")
+
+
+class SubprocessBackend(GitBackend):
+    """git 子进程后端，支持所有操作"""
+
+    name = "subprocess"
+
+    def __init__(self, run_git: Callable[[list[str]], tuple[str, str, int]], root: Path):
+        self.run_git = run_git
+        self.root = root
+
+    def _args(self, repo: Path, args: list[str]) -> list[str]:
+        if repo == self.root:
+            return args
+        return ["-C", os.path.relpath(repo, self.root)] + args
+
+    def rev_parse(self, repo: Path, revs: list[str]) -> Optional[list[str]]:
+        shas = []
+        for rev in revs:
+            stdout, _, code = self.run_git(self._args(repo, ["rev-parse", "-q", "--verify", rev]))
+            if code != 0:
+                return None
+            shas.append(stdout.strip())
+        return shas
+
+    def config_get_regexp(self, repo: Path, pattern: str) -> list[tuple[str, Optional[str]]]:
+        # --null：子节名可以包含空格，按空格切分键和值不可靠
+        stdout, _, _ = self.run_git(self._args(repo, ["config", "--null", "--get-regexp", pattern]))
+        entries = []
+        for record in stdout.split("\0"):
+            if not record:
+                continue
+            key, newline, value = record.partition("\n")
+            entries.append((key, value if newline else None))
+        return entries
+
+    def submodule_status(self, repo: Path) -> list[str]:
+        stdout, _, code = self.run_git(self._args(repo, ["submodule", "status"]))
+        if code != 0 or not stdout.strip():
+            return []
+        # 保留行首的状态列；去掉 describe 部分 " (v1.0-3-gabc)"
+        return [re.sub(r" \(.*\)$", "", line) for line in stdout.rstrip("\n").split("\n") if line]
+
+
+def find_git_dir(repo: Path) -> Path:
+    """
+    仓库的 git 目录；.git 为文件（子模块、工作树）时跟随 gitdir。
+
+    Raises:
+        BackendUnsupported: repo 不是仓库根目录（git 会向上查找，这里不处理）
+    """
+    if os.environ.get("GIT_DIR"):
+        raise BackendUnsupported("设置了 GIT_DIR")
+    dot_git = repo / ".git"
+    if dot_git.is_dir():
+        return dot_git
+    if dot_git.is_file():
+        content = dot_git.read_text().strip()
+        if content.startswith("gitdir:"):
+            git_dir = Path(content[len("gitdir:"):].strip())
+            return git_dir if git_dir.is_absolute() else repo / git_dir
+    raise BackendUnsupported(f"不是仓库根目录: {repo}")
+
+
+def common_dir(git_dir: Path) -> Path:
+    """引用与配置所在的公共目录（链接工作树的 commondir 指向主仓库的 .git）"""
+    commondir = git_dir / "commondir"
+    if commondir.is_file():
+        path = Path(commondir.read_text().strip())
+        return path if path.is_absolute() else git_dir / path
+    return git_dir
+
+
+_SECTION_RE = re.compile(r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*(?:[#;].*)?$')
+_KEY_RE = re.compile(r"^([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$")
+
+
+def _parse_value(raw: str) -> str:
+    """解析配置值：去掉行尾注释、引号和引号外的首尾空白，处理转义"""
+    escapes = {"n": "\n", "t": "\t", "b": "\b", "\\": "\\", '"': '"'}
+    out = []
+    keep = 0  # 引号内或转义得到的字符不参与末尾空白裁剪
+    quoted = False
+    i = 0
+    while i < len(raw):
+        c = raw[i]
+        if c == "\\":
+            if i + 1 >= len(raw):
+                raise BackendUnsupported("配置值跨行")
+            if raw[i + 1] not in escapes:
+                raise BackendUnsupported(f"无效的转义: \\{raw[i + 1]}")
+            out.append(escapes[raw[i + 1]])
+            keep = len(out)
+            i += 2
+            continue
+        if c == '"':
+            quoted = not quoted
+        elif c in "#;" and not quoted:
+            break
+        else:
+            out.append(c)
+            if quoted:
+                keep = len(out)
+        i += 1
+    if quoted:
+        raise BackendUnsupported("配置值引号不匹配")
+    value = "".join(out)
+    return value[:max(keep, len(value.rstrip()))]
+
+
+def parse_config(text: str) -> list[tuple[str, Optional[str]]]:
+    """
+    解析 git 配置文件，返回 [(规范化键名, 值)]（节名和键名小写，子节名保留大小写）
+
+    Raises:
+        BackendUnsupported: include / includeIf、跨行值或无法解析的行
+    """
+    entries = []
+    section = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped[0] in "#;":
+            continue
+        if stripped.startswith("["):
+            match = _SECTION_RE.match(stripped)
+            if not match:
+                raise BackendUnsupported(f"无法解析的节: {stripped}")
+            name, subsection = match.groups()
+            if name.lower() in ("include", "includeif"):
+                raise BackendUnsupported("配置包含 include")
+            if subsection is not None:
+                subsection = re.sub(r"\\(.)", r"\1", subsection)
+                section = f"{name.lower()}.{subsection}"
+            else:
+                # 包括旧式 [section.subsection]：子节名也按小写处理
+                section = name.lower()
+            continue
+        if section is None:
+            raise BackendUnsupported("键不在任何节内")
+        match = _KEY_RE.match(stripped)
+        if not match:
+            raise BackendUnsupported(f"无法解析的键: {stripped}")
+        key, raw = match.groups()
+        value = None if raw is None else _parse_value(raw)
+        entries.append((f"{section}.{key.lower()}", value))
+    return entries
+
+
+def _parse_bool(value: Optional[str]) -> bool:
+    """按 git 的规则解析布尔配置值：无值为 true，空字符串为 false"""
+    if value is None:
+        return True
+    lowered = value.strip().lower()
+    if lowered in ("true", "yes", "on"):
+        return True
+    if lowered in ("", "false", "no", "off"):
+        return False
+    try:
+        return int(lowered, 0) != 0
+    except ValueError:
+        raise BackendUnsupported(f"无法解析的布尔值: {value}") from None
+
+
+def _config_files(git_dir: Path) -> list[Path]:
+    """
+    按 git 的优先级列出配置文件：system、global（XDG 与 ~/.gitconfig）、local
+
+    system 配置按 /etc/gitconfig 处理（git 以其他 prefix 编译时位置不同，只影响该层）。
+    """
+    if any(key.startswith("GIT_CONFIG") and key != "GIT_CONFIG_NOSYSTEM" for key in os.environ):
+        raise BackendUnsupported("通过环境变量指定了配置")
+    files = []
+    if not os.environ.get("GIT_CONFIG_NOSYSTEM"):
+        files.append(Path("/etc/gitconfig"))
+    home = os.environ.get("HOME")
+    xdg = os.environ.get("XDG_CONFIG_HOME") or (f"{home}/.config" if home else None)
+    if xdg:
+        files.append(Path(xdg) / "git" / "config")
+    if home:
+        files.append(Path(home) / ".gitconfig")
+    files.append(common_dir(git_dir) / "config")
+    return files
+
+
+class PythonBackend(GitBackend):
+    """
+    纯 Python 读取器：直接读取 .git 下的引用、配置和索引，不启动进程
+
+    只处理常见的仓库形态（files 引用存储、SHA-1、索引 v2/v3、无 split index），
+    其余情况抛出 BackendUnsupported。
+    """
+
+    name = "python"
+
+    def _config(self, git_dir: Path) -> list[tuple[str, Optional[str]]]:
+        entries = []
+        for path in _config_files(git_dir):
+            try:
+                text = path.read_text()
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                raise BackendUnsupported(f"无法读取配置: {e}") from e
+            entries += parse_config(text)
+        for key, value in entries:
+            if key == "extensions.refstorage" and value != "files":
+                raise BackendUnsupported("引用存储不是 files 格式")
+            if key == "extensions.objectformat" and value != "sha1":
+                raise BackendUnsupported("对象格式不是 SHA-1")
+            if key == "extensions.worktreeconfig":
+                raise BackendUnsupported("启用了工作树配置")
+        return entries
+
+    def config_get_regexp(self, repo: Path, pattern: str) -> list[tuple[str, Optional[str]]]:
+        regex = re.compile(pattern)
+        return [(key, value) for key, value in self._config(find_git_dir(repo)) if regex.search(key)]
+
+    def _packed_refs(self, common: Path) -> dict[str, str]:
+        refs = {}
+        try:
+            text = (common / "packed-refs").read_text()
+        except FileNotFoundError:
+            return refs
+        for line in text.splitlines():
+            if not line or line[0] in "#^":
+                continue
+            sha, _, name = line.partition(" ")
+            refs[name] = sha
+        return refs
+
+    def _resolve(self, git_dir: Path, rev: str) -> Optional[str]:
+        """解析完整引用名、HEAD 类伪引用或完整 SHA；不存在时返回 None"""
+        if _SHA_RE.match(rev):
+            raise BackendUnsupported("需要确认对象存在")
+        if not (rev.startswith("refs/") or rev in PSEUDO_REFS):
+            raise BackendUnsupported(f"不支持的修订表达式: {rev}")
+
+        common = common_dir(git_dir)
+        name = rev
+        for _ in range(MAX_SYMREF_DEPTH):
+            # 伪引用（HEAD、MERGE_HEAD）属于每个工作树，refs/ 下的引用在公共目录
+            base = common if name.startswith("refs/") else git_dir
+            try:
+                content = (base / name).read_text().strip()
+            except FileNotFoundError:
+                return self._packed_refs(common).get(name) if name.startswith("refs/") else None
+            except (IsADirectoryError, NotADirectoryError):
+                return None
+            if content.startswith("ref:"):
+                name = content[len("ref:"):].strip()
+                continue
+            sha = content.split()[0] if content else ""
+            if not _SHA_RE.match(sha):
+                raise BackendUnsupported(f"无法解析引用 {name}")
+            return sha
+        raise BackendUnsupported(f"符号引用层级过深: {rev}")
+
+    def rev_parse(self, repo: Path, revs: list[str]) -> Optional[list[str]]:
+        git_dir = find_git_dir(repo)
+        self._config(git_dir)  # 检查引用存储格式
+        shas = []
+        for rev in revs:
+            sha = self._resolve(git_dir, rev)
+            if sha is None:
+                return None
+            shas.append(sha)
+        return shas
+
+    def submodule_status(self, repo: Path) -> list[str]:
+        git_dir = find_git_dir(repo)
+        config = self._config(git_dir)
+        pathspec = any(key == "submodule.active" for key, _ in config)
+        gitlinks = [e for e in read_index(git_dir / "index") if e[1] == GITLINK_MODE]
+        if not gitlinks:
+            return []
+
+        try:
+            gitmodules = parse_config((repo / ".gitmodules").read_text())
+        except FileNotFoundError:
+            raise BackendUnsupported(".gitmodules 不存在")
+        names = {
+            value: key[len("submodule."):-len(".path")]
+            for key, value in gitmodules
+            if key.startswith("submodule.") and key.endswith(".path")
+        }
+        urls = {key for key, value in config if key.startswith("submodule.") and key.endswith(".url")}
+        # 与 git 相同的判定顺序：submodule.<name>.active > submodule.active > 是否设置了 url
+        actives = {
+            key[len("submodule."):-len(".active")]: value
+            for key, value in config
+            if key.startswith("submodule.") and key.endswith(".active") and key != "submodule.active"
+        }
+
+        lines = []
+        seen = set()
+        for path, _, sha, stage in gitlinks:
+            if path in seen:
+                continue
+            seen.add(path)
+            if path not in names:
+                raise BackendUnsupported(f".gitmodules 中没有 {path}")
+            if stage:
+                lines.append(f"U{NULL_SHA} {path}")
+                continue
+            name = names[path]
+            if name in actives:
+                active = _parse_bool(actives[name])
+            elif pathspec:
+                raise BackendUnsupported("submodule.active 需要 pathspec 匹配")
+            else:
+                active = f"submodule.{name}.url" in urls
+            if not active or not (repo / path / ".git").exists():
+                lines.append(f"-{sha} {path}")
+                continue
+            head = self.rev_parse(repo / path, ["HEAD"])
+            if head is None:
+                raise BackendUnsupported(f"无法读取 {path} 的 HEAD")
+            flag = " " if head[0] == sha else "+"
+            lines.append(f"{flag}{head[0]} {path}")
+        return lines
+
+
+def read_index(path: Path) -> list[tuple[str, int, str, int]]:
+    """
+    读取索引条目 [(路径, mode, SHA, stage)]，按索引中的顺序
+
+    Raises:
+        BackendUnsupported: 索引不存在、版本不是 2/3、使用 split index 或格式损坏
+    """
+    from thera.index_stat import parse_index
+
+    return [(e.path, e.mode, e.sha, e.stage) for e in parse_index(path).entries]
+
+
+class Pygit2Backend(GitBackend):
+    """pygit2（libgit2）后端，已安装时使用"""
+
+    name = "pygit2"
+
+    def __init__(self):
+        import pygit2
+
+        self.pygit2 = pygit2
+
+    def _repo(self, repo: Path):
+        find_git_dir(repo)
+        try:
+            return self.pygit2.Repository(str(repo))
+        except Exception as e:
+            raise BackendUnsupported(f"pygit2: {e}") from e
+
+    def rev_parse(self, repo: Path, revs: list[str]) -> Optional[list[str]]:
+        handle = self._repo(repo)
+        shas = []
+        for rev in revs:
+            try:
+                shas.append(str(handle.revparse_single(rev).id))
+            except KeyError:
+                return None
+            except Exception as e:
+                raise BackendUnsupported(f"pygit2: {e}") from e
+        return shas
+
+    def config_get_regexp(self, repo: Path, pattern: str) -> list[tuple[str, Optional[str]]]:
+        handle = self._repo(repo)
+        regex = re.compile(pattern)
+        try:
+            return [(e.name, e.value) for e in handle.config if regex.search(e.name)]
+        except Exception as e:
+            raise BackendUnsupported(f"pygit2: {e}") from e
+
+
+class DulwichBackend(GitBackend):
+    """dulwich 后端，已安装时用于解析引用"""
+
+    name = "dulwich"
+
+    def __init__(self):
+        from dulwich.repo import Repo
+
+        self.repo_class = Repo
+
+    def rev_parse(self, repo: Path, revs: list[str]) -> Optional[list[str]]:
+        find_git_dir(repo)
+        try:
+            handle = self.repo_class(str(repo))
+        except Exception as e:
+            raise BackendUnsupported(f"dulwich: {e}") from e
+        shas = []
+        with handle:
+            for rev in revs:
+                if not (rev == "HEAD" or rev.startswith("refs/")):
+                    raise BackendUnsupported(f"dulwich: {rev}")
+                try:
+                    shas.append(handle.refs[rev.encode()].decode())
+                except KeyError:
+                    return None
+                except Exception as e:
+                    raise BackendUnsupported(f"dulwich: {e}") from e
+        return shas
+
+
+BACKENDS: dict[str, type[GitBackend]] = {
+    "pygit2": Pygit2Backend,
+    "dulwich": DulwichBackend,
+    "python": PythonBackend,
+}
+
+_available: Optional[list[GitBackend]] = None
+
+
+def available_backends() -> list[GitBackend]:
+    """已安装的进程内后端（按优先级），结果缓存"""
+    global _available
+    if _available is None:
+        backends = []
+        for backend_class in BACKENDS.values():
+            try:
+                backends.append(backend_class())
+            except ImportError:
+                continue
+        _available = backends
+    return _available
+
+
+def default_backends() -> list[GitBackend]:
+    """
+    自动选择的进程内后端
+
+    THERA_GIT_BACKEND 可指定逗号分隔的后端名（如 "python" 或 "subprocess"）；
+    "subprocess" 表示不使用进程内后端。
+    """
+    spec = os.environ.get(BACKEND_ENV)
+    if not spec:
+        return available_backends()
+    wanted = [name.strip() for name in spec.split(",") if name.strip()]
+    return [b for b in available_backends() if b.name in wanted]
@@ -4,13 +4,18 @@ Git 操作封装层
 统一封装所有 git 操作，消除重复代码，返回明确的结果类型。
 """
 
+import os
+import signal
 import subprocess
+import threading
+import time
 from dataclasses import dataclass
 from enum import Enum, auto
 from pathlib import Path
 from typing import Optional
 
-import yaml
+from thera import metrics, tracing
+from thera.git_backends import BackendUnsupported, GitBackend, SubprocessBackend, default_backends
 
 
 class ChangeType(Enum):
@@ -74,6 +79,14 @@ class SyncResult(OperationResult):
     """同步结果"""
 
     synced_paths: Optional[list[str]] = None
+    skipped_paths: Optional[list[str]] = None  # 策略未选中或推迟、本次未同步的子模块
+
+
+@dataclass
+class RollbackResult(OperationResult):
+    """回滚结果"""
+
+    restored_paths: Optional[list[str]] = None
 
 
 @dataclass
@@ -83,16 +96,106 @@ class PushResult(OperationResult):
     commit_sha: Optional[str] = None
 
 
+CHECKPOINT_REF_PREFIX = "refs/thera/checkpoint/"
+DEFAULT_GIT_JOBS = 8
+
+
+def get_state_dir(repo_root: Path) -> Path:
+    """
+    获取 thera 运行时状态目录（缓存、检查点等）。
+
+    优先放在 .git/thera 下，避免被 `git add -A` 收录；
+    非 git 目录则退回到 .thera。
+    """
+    git_dir = repo_root / ".git"
+    if git_dir.is_dir():
+        return git_dir / "thera"
+    if git_dir.is_file():
+        content = git_dir.read_text().strip()
+        if content.startswith("gitdir:"):
+            real_git_dir = Path(content[len("gitdir:"):].strip())
+            if not real_git_dir.is_absolute():
+                real_git_dir = repo_root / real_git_dir
+            return real_git_dir / "thera"
+    return repo_root / ".thera"
+
+
+def _run_with_timeout(cmd: list[str], capture: bool, timeout: float) -> subprocess.CompletedProcess:
+    """
+    在新的进程组中运行命令，超时后杀掉整个进程组
+
+    git submodule update 会派生 git fetch / git merge；只杀 git 本身会留下仍在修改子模块的子进程。
+    """
+    pipe = subprocess.PIPE if capture else None
+    with subprocess.Popen(
+        cmd, stdout=pipe, stderr=pipe, text=True, start_new_session=True
+    ) as proc:
+        try:
+            stdout, stderr = proc.communicate(timeout=max(timeout, 0))
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            stdout, stderr = proc.communicate()
+            stderr = (stderr or "") + f"超时（{timeout:g} 秒），已终止\n"
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
 class GitOps:
-    """Git 操作封装"""
+    """
+    Git 操作封装
 
-    def __init__(self, repo_root: Path):
-        self.repo_root = repo_root
+    只读查询（子模块状态、配置、引用解析）依次尝试进程内后端，不支持时回退到 git 子进程；
+    backends 为 None 时自动选择（见 git_backends.default_backends）。
+    """
 
-    def run_git(self, args: list[str], capture: bool = True) -> tuple[str, str, int]:
-        """执行 git 命令"""
+    def __init__(self, repo_root: Path, backends: Optional[list[GitBackend]] = None):
+        self.repo_root = repo_root
+        self._backends = backends
+        # 主仓库级的 git submodule update 会写 .git/config 和 .git/modules，同一时间只运行一个
+        self._update_lock = threading.Lock()
+
+    @property
+    def backends(self) -> list[GitBackend]:
+        """查询顺序：进程内后端，最后是子进程后端"""
+        in_process = default_backends() if self._backends is None else self._backends
+        # 经由 self.run_git 调用，保留指标、追踪，并允许测试替换 run_git
+        subprocess_backend = SubprocessBackend(lambda args: self.run_git(args), self.repo_root)
+        return [b for b in in_process if b.name != "subprocess"] + [subprocess_backend]
+
+    def query(self, operation: str, *args, repo: Optional[Path] = None):
+        """
+        按后端顺序执行只读查询，返回第一个支持该操作的后端的结果
+
+        repo 为被查询的仓库（默认主仓库，子模块传 repo_root / path）。
+        """
+        repo = repo or self.repo_root
+        for backend in self.backends:
+            try:
+                result = getattr(backend, operation)(repo, *args)
+            except BackendUnsupported:
+                continue
+            metrics.GIT_BACKEND_QUERIES.inc(backend=backend.name, operation=operation)
+            return result
+        raise AssertionError("子进程后端支持所有操作")
+
+    def run_git(
+        self, args: list[str], capture: bool = True, timeout: Optional[float] = None
+    ) -> tuple[str, str, int]:
+        """
+        执行 git 命令
+
+        设置 timeout 时，超时后终止 git 及其派生的子进程，返回码为 -SIGKILL。
+        """
         cmd = ["git", "-C", str(self.repo_root)] + args
-        result = subprocess.run(cmd, capture_output=capture, text=True)
+        start = time.perf_counter()
+        with tracing.span(f"git {metrics.git_subcommand(args)}", args=cmd):
+            if timeout is None:
+                result = subprocess.run(cmd, capture_output=capture, text=True)
+            else:
+                result = _run_with_timeout(cmd, capture, timeout)
+        metrics.observe_git(args, time.perf_counter() - start, result.returncode)
         stdout = result.stdout if capture else ""
         stderr = result.stderr if capture else ""
         return stdout, stderr, result.returncode
@@ -147,9 +250,9 @@ class GitOps:
 
     def get_submodule_status(self) -> list[SubmoduleInfo]:
         """获取子模块状态"""
-        stdout, _, code = self.run_git(["submodule", "status"])
+        stdout = "\n".join(self.query("submodule_status"))
 
-        if code != 0 or not stdout.strip():
+        if not stdout.strip():
             return []
 
         results = []
@@ -180,20 +283,11 @@ class GitOps:
 
     def _get_gitmodules_paths(self) -> dict[str, str]:
         """解析 .gitmodules 获取路径"""
-        paths = {}
-        stdout, _, _ = self.run_git(
-            ["config", "--get-regexp", r"^submodule\..*\.path$"]
-        )
-
-        for line in stdout.strip().split("\n"):
-            if not line:
-                continue
-            parts = line.split(maxsplit=1)
-            if len(parts) == 2:
-                key, path = parts
-                paths[key] = path
-
-        return paths
+        return {
+            key: path
+            for key, path in self.query("config_get_regexp", r"^submodule\..*\.path$")
+            if path is not None
+        }
 
     def check_consistency(self, yaml_path: Path) -> ConsistencyResult:
         """检查 YAML 与 .gitmodules 一致性"""
@@ -206,6 +300,9 @@ class GitOps:
                 error="file not found",
             )
 
+        # 延迟导入：只有一致性检查需要解析 YAML
+        import yaml
+
         try:
             with open(yaml_full) as f:
                 data = yaml.safe_load(f)
@@ -253,14 +350,98 @@ class GitOps:
             message=f"{len(yaml_paths)} 个路径",
         )
 
-    def sync_submodules(self, paths: Optional[list[str]] = None) -> SyncResult:
-        """同步子模块"""
-        if paths:
-            cmd = ["submodule", "update", "--remote", "--merge"] + paths
+    def fetch_submodules(self) -> SyncResult:
+        """
+        拉取所有子模块的远程对象到远程跟踪分支（不改变工作区）
+
+        拉取后由 git 增量更新 commit-graph，供只读的领先/落后计数使用。
+        """
+        _, stderr, code = self.run_git(
+            ["submodule", "foreach", "--quiet", "git -c fetch.writeCommitGraph=true fetch --quiet"]
+        )
+
+        if code != 0:
+            return SyncResult(
+                success=False,
+                message="拉取失败",
+                error=stderr,
+            )
+
+        return SyncResult(success=True, message="拉取完成")
+
+    def fetch_submodule(self, path: str, timeout: Optional[float] = None) -> SyncResult:
+        """
+        在子模块目录内拉取远程对象（不改变工作区）
+
+        只写子模块自己的 git 目录，多个子模块可以并发拉取；未初始化的子模块跳过。
+        """
+        # 未初始化的子模块目录为空，git -C 会落到主仓库上
+        if not (self.repo_root / path / ".git").exists():
+            return SyncResult(success=True, message="子模块未初始化，跳过拉取")
+        cmd = ["-C", path, "-c", "fetch.writeCommitGraph=true", "fetch", "--quiet"]
+        if timeout is None:
+            _, stderr, code = self.run_git(cmd)
         else:
-            cmd = ["submodule", "update", "--remote", "--merge"]
+            _, stderr, code = self.run_git(cmd, timeout=timeout)
+        if code != 0:
+            return SyncResult(success=False, message="拉取失败", error=stderr)
+        return SyncResult(success=True, message="拉取完成", synced_paths=[path])
+
+    def get_submodule_refs(self) -> Optional[str]:
+        """
+        各子模块的 HEAD 和 `submodule update --remote` 合并的远程分支 SHA（用于判断同步输入是否变化）
+
+        远程分支与 git 的取法相同：origin/<.gitmodules 中的 submodule.<name>.branch>，
+        未设置时为 origin/HEAD；子模块处于分离头指针时也不依赖 @{upstream}。
+        有子模块的远程分支无法解析（包括 branch = "."）时返回 None，调用方不应据此缓存。
+        """
+        stdout, _, code = self.run_git(
+            [
+                "submodule", "foreach", "--quiet",
+                'echo "$sm_path"; '
+                'b=$(git config -f "$toplevel/.gitmodules" "submodule.$name.branch"); '
+                'if [ "$b" = "." ]; then echo UNRESOLVED; exit 0; fi; '
+                'git rev-parse HEAD && '
+                'git rev-parse -q --verify "refs/remotes/origin/${b:-HEAD}^{commit}" || echo UNRESOLVED',
+            ]
+        )
+        if code != 0 or "UNRESOLVED" in stdout.split():
+            return None
+        return stdout
+
+    def sync_submodules(
+        self,
+        paths: Optional[list[str]] = None,
+        no_fetch: bool = False,
+        timeout: Optional[float] = None,
+    ) -> SyncResult:
+        """
+        同步子模块（no_fetch 为 True 时只合并已拉取的远程跟踪分支）
+
+        设置 timeout 时，超时后终止 git submodule update 及其派生的 fetch / merge。
+        同一 GitOps 上的调用串行执行（会写主仓库的 .git/config 和 .git/modules），
+        等待其他调用的时间也计入 timeout。
+        """
+        cmd = ["submodule", "update", "--remote", "--merge"]
+        if no_fetch:
+            cmd.append("--no-fetch")
+        if paths:
+            cmd += paths
 
-        _, stderr, code = self.run_git(cmd)
+        if timeout is None:
+            with self._update_lock:
+                _, stderr, code = self.run_git(cmd)
+        else:
+            deadline = time.monotonic() + timeout
+            if not self._update_lock.acquire(timeout=timeout):
+                return SyncResult(
+                    success=False, message="同步失败", error=f"等待其他子模块更新超时（{timeout:g} 秒）"
+                )
+            try:
+                remaining = max(0.0, deadline - time.monotonic())
+                _, stderr, code = self.run_git(cmd, timeout=remaining)
+            finally:
+                self._update_lock.release()
 
         if code != 0:
             return SyncResult(
@@ -318,3 +499,111 @@ class GitOps:
             message="推送成功",
             commit_sha=commit_sha,
         )
+
+    def push(self) -> PushResult:
+        """推送当前分支（重试已存在的本地提交）"""
+        stdout, _, _ = self.run_git(["rev-parse", "HEAD"])
+        commit_sha = stdout.strip()[:7]
+
+        _, stderr, code = self.run_git(["push"])
+
+        if code != 0:
+            return PushResult(
+                success=False,
+                message="git push 失败",
+                error=stderr,
+                commit_sha=commit_sha,
+            )
+
+        return PushResult(
+            success=True,
+            message="推送成功",
+            commit_sha=commit_sha,
+        )
+
+    def _map_submodules(self, func, paths: list[str], jobs: int) -> list:
+        """并发对每个子模块执行 func(path)，结果按输入顺序返回"""
+        if len(paths) <= 1 or jobs <= 1:
+            return [func(path) for path in paths]
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+            return list(executor.map(tracing.propagate(func), paths))
+
+    def snapshot_submodules(
+        self,
+        name: str = "sync",
+        paths: Optional[list[str]] = None,
+        jobs: int = DEFAULT_GIT_JOBS,
+    ) -> list[str]:
+        """
+        把每个子模块的 HEAD 记录到子模块内的轻量引用 refs/thera/checkpoint/<name>。
+
+        引用同时防止快照提交被 gc；同名快照会被覆盖。
+
+        Returns:
+            成功建立快照的子模块路径（未初始化的子模块被跳过）
+        """
+        if paths is None:
+            paths = [info.path for info in self.get_submodule_status()]
+        ref = CHECKPOINT_REF_PREFIX + name
+
+        def snapshot(path: str) -> bool:
+            # 未初始化的子模块目录为空，git -C 会落到主仓库上
+            if not (self.repo_root / path / ".git").exists():
+                return False
+            _, _, code = self.run_git(["-C", path, "update-ref", ref, "HEAD"])
+            return code == 0
+
+        ok = self._map_submodules(snapshot, paths, jobs)
+        return [path for path, success in zip(paths, ok) if success]
+
+    def restore_submodules(
+        self,
+        paths: list[str],
+        name: str = "sync",
+        jobs: int = DEFAULT_GIT_JOBS,
+    ) -> RollbackResult:
+        """
+        并发把子模块恢复到快照。
+
+        只处理 HEAD 已移动或处于合并中的子模块，其余子模块只花一次 rev-parse。
+        用 reset --merge 回滚（与 merge --abort 相同）：工作区中未提交的修改被保留；
+        修改的文件在快照之后也被改动、无法保留时该子模块回滚失败，不覆盖修改。
+        """
+        ref = CHECKPOINT_REF_PREFIX + name
+
+        def restore(path: str) -> tuple[str, Optional[str]]:
+            if not (self.repo_root / path / ".git").exists():
+                return "failed", "子模块未初始化"
+            shas = self.query("rev_parse", ["HEAD", ref], repo=self.repo_root / path)
+            if shas is None:
+                return "failed", "快照不存在"
+            head, snapshot = shas
+            if head == snapshot:
+                if self.query("rev_parse", ["MERGE_HEAD"], repo=self.repo_root / path) is None:
+                    return "unchanged", None
+            _, stderr, code = self.run_git(["-C", path, "reset", "--merge", "-q", ref])
+            if code != 0:
+                return "failed", stderr.strip()
+            return "restored", None
+
+        outcomes = self._map_submodules(restore, paths, jobs)
+        restored = [p for p, (status, _) in zip(paths, outcomes) if status == "restored"]
+        errors = [
+            f"{p}: {error}" for p, (status, error) in zip(paths, outcomes) if status == "failed"
+        ]
+
+        if errors:
+            return RollbackResult(
+                success=False,
+                message="回滚失败",
+                error="\n".join(errors),
+                restored_paths=restored,
+            )
+
+        return RollbackResult(
+            success=True,
+            message=f"已回滚 {len(restored)} 个子模块",
+            restored_paths=restored,
+        )
@@ -0,0 +1,170 @@
+"""
+状态机钩子调度模块
+
+把耗时的钩子（写日志、发通知等）放到后台线程执行，不阻塞状态转移。
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Any, Callable, Hashable, Optional
+
+
+class HookMode(Enum):
+    """钩子执行方式"""
+    INLINE = auto()  # 在 transition 中同步执行
+    EXECUTOR = auto()  # 提交到后台线程执行
+    ASYNC = auto()  # 协程钩子，在后台线程的事件循环中执行
+
+
+@dataclass
+class HookError:
+    """后台钩子异常记录"""
+    key: Hashable
+    callback: Callable
+    error: BaseException
+
+
+class HookQueueFull(Exception):
+    """钩子队列已满（非阻塞模式）"""
+    pass
+
+
+_STOP = object()
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 1024
+
+
+class HookDispatcher:
+    """
+    后台钩子调度器
+
+    按 key（状态）分片到固定数量的工作线程，每个分片一个有界队列，
+    因此同一状态的钩子严格按提交顺序执行。
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        block: bool = True,
+    ):
+        """
+        Args:
+            workers: 工作线程数
+            maxsize: 每个分片队列的容量
+            block: 队列满时是否阻塞等待；为 False 时抛出 HookQueueFull
+        """
+        self.block = block
+        self.errors: list[HookError] = []
+        self._errors_lock = threading.Lock()
+        self._queues: list[queue.Queue] = [queue.Queue(maxsize) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(
+                target=self._worker, args=(q,), name=f"thera-hook-{i}", daemon=True
+            )
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._closed = False
+        # close 超时前没能放入 _STOP 的分片：工作线程执行完队列中剩余的钩子后自行退出
+        self._unstopped: set[queue.Queue] = set()
+
+    def submit(self, key: Hashable, callback: Callable, *args: Any) -> None:
+        """提交钩子"""
+        if self._closed:
+            raise RuntimeError("HookDispatcher 已关闭")
+        q = self._queues[hash(key) % len(self._queues)]
+        try:
+            q.put((key, callback, args), block=self.block)
+        except queue.Full:
+            raise HookQueueFull(f"钩子队列已满: {key}") from None
+
+    def _worker(self, q: queue.Queue) -> None:
+        # 延迟导入：asyncio 加载较慢，只有启用后台钩子时才需要
+        import asyncio
+        import inspect
+
+        loop: Optional[asyncio.AbstractEventLoop] = None
+        while True:
+            item = q.get()
+            if item is _STOP:
+                q.task_done()
+                break
+            key, callback, args = item
+            try:
+                result = callback(*args)
+                if inspect.isawaitable(result):
+                    if loop is None:
+                        loop = asyncio.new_event_loop()
+                    loop.run_until_complete(result)
+            except Exception as e:
+                with self._errors_lock:
+                    self.errors.append(HookError(key, callback, e))
+            finally:
+                q.task_done()
+            if q in self._unstopped and q.empty():
+                break
+        if loop is not None:
+            loop.close()
+
+    def pending(self) -> int:
+        """尚未执行完的钩子数"""
+        return sum(q.unfinished_tasks for q in self._queues)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的钩子全部执行完；超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for q in self._queues:
+            with q.all_tasks_done:
+                while q.unfinished_tasks:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    q.all_tasks_done.wait(remaining)
+        return True
+
+    def pop_errors(self) -> list[HookError]:
+        """取出并清空已捕获的异常"""
+        with self._errors_lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        执行完剩余钩子后停止工作线程；超时返回 False
+
+        队列已满时放入停止标记同样受 timeout 限制，不会因慢钩子阻塞超过 timeout。
+        """
+        if self._closed:
+            return True
+        self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for q in self._queues:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                q.put(_STOP, timeout=remaining)
+            except queue.Full:
+                self._unstopped.add(q)
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+        return not any(thread.is_alive() for thread in self._threads)
+
+
+class BackgroundHook:
+    """把钩子调用转交给 HookDispatcher 的包装器"""
+
+    __slots__ = ("callback", "dispatcher", "key")
+
+    def __init__(self, callback: Callable, dispatcher: HookDispatcher, key: Hashable):
+        self.callback = callback
+        self.dispatcher = dispatcher
+        self.key = key
+
+    def __call__(self, old_state, event) -> None:
+        self.dispatcher.submit(self.key, self.callback, old_state, event)
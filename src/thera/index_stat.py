@@ -0,0 +1,606 @@
+"""
+索引 stat 脏检查
+
+回答「仓库里的已跟踪文件改了吗」而不启动 git：用 mmap 读取 .git/index，把每个条目
+记录的 stat 数据（mtime、ctime、大小、inode、uid/gid、mode）与 lstat 比较，不一致时
+按 git 的方式对文件内容求 blob 哈希确认。索引与 HEAD 的差异（已暂存）通过 cache-tree
+的根树与 HEAD 提交的树比较得出。
+
+以下情况交给 git status 回答，DirtyResult.fallback 记录原因：
+- racy 条目：条目 mtime 不早于索引文件 mtime，stat 一致也不能证明内容未变
+- 内容比较需要过滤（.gitattributes、core.autocrlf）
+- cache-tree 失效、HEAD 提交是 delta 或不在本地对象库、索引格式不受支持等
+
+未跟踪文件默认不检查；untracked=True 时按 .gitignore、info/exclude 和
+core.excludesFile 的规则在进程内遍历工作区。
+"""
+
+import mmap
+import os
+import re
+import signal
+import stat
+import struct
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from thera import metrics
+from thera.git_backends import (
+    GITLINK_MODE,
+    BackendUnsupported,
+    PythonBackend,
+    common_dir,
+    find_git_dir,
+)
+from thera.git_ops import GitOps
+
+SYMLINK_MODE = 0o120000
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+GIT_STATUS_TIMEOUT = 10  # 回退到 git status 时的超时（秒）
+
+_ENTRY = struct.Struct(">10I20sH")
+_NS = 1_000_000_000
+_MASK32 = 0xFFFFFFFF
+_ASSUME_VALID = 0x8000
+_EXTENDED = 0x4000
+_SKIP_WORKTREE = 0x4000  # 扩展标志
+_INTENT_TO_ADD = 0x2000  # 扩展标志
+_PACK_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+
+
+class IndexEntry(NamedTuple):
+    """索引条目；时间为纳秒，stat 字段是索引记录的 32 位截断值"""
+    path: str
+    ctime_ns: int
+    mtime_ns: int
+    ino: int
+    mode: int
+    uid: int
+    gid: int
+    size: int
+    sha: str
+    flags: int
+    extended: int = 0
+
+    @property
+    def stage(self) -> int:
+        return (self.flags >> 12) & 0x3
+
+
+@dataclass
+class IndexFile:
+    """解析后的索引"""
+    version: int
+    mtime_ns: int  # 索引文件自身的 mtime，racy 判定的基准
+    entries: list[IndexEntry]
+    tree: Optional[str] = None  # cache-tree 根树；缺失或失效时为 None
+
+
+@dataclass
+class DirtyResult:
+    """单个仓库的脏检查结果"""
+    repo: str
+    dirty: bool
+    modified: list[str] = field(default_factory=list)  # 工作区与索引不一致的已跟踪路径
+    staged: bool = False  # 索引与 HEAD 不一致
+    untracked: list[str] = field(default_factory=list)  # 仅 untracked=True 时检查
+    fallback: Optional[str] = None  # 交给 git status 的原因；None 表示进程内完成
+
+
+def parse_index(path: Path) -> IndexFile:
+    """
+    用 mmap 读取索引
+
+    Raises:
+        BackendUnsupported: 索引不存在、版本不是 2/3、使用 split index 或
+            sparse index 等必需扩展、格式损坏
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise BackendUnsupported("索引不存在")
+    with f:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise BackendUnsupported("索引格式无效")
+    with data:
+        return _parse(data, mtime_ns)
+
+
+def _parse(data: mmap.mmap, mtime_ns: int) -> IndexFile:
+    if len(data) < 12 or data[:4] != b"DIRC":
+        raise BackendUnsupported("索引格式无效")
+    version, count = struct.unpack_from(">II", data, 4)
+    if version not in (2, 3):
+        raise BackendUnsupported(f"不支持索引版本 {version}")
+
+    entries = []
+    offset = 12
+    try:
+        for _ in range(count):
+            (ctime_s, ctime_n, mtime_s, mtime_n, _dev, ino, mode, uid, gid, size,
+             sha, flags) = _ENTRY.unpack_from(data, offset)
+            name_start = offset + _ENTRY.size
+            extended = 0
+            if flags & _EXTENDED:
+                (extended,) = struct.unpack_from(">H", data, name_start)
+                name_start += 2
+            name_end = data.find(b"\0", name_start)
+            if name_end < 0:
+                raise ValueError("条目名未结束")
+            entries.append(IndexEntry(
+                data[name_start:name_end].decode("utf-8", "surrogateescape"),
+                ctime_s * _NS + ctime_n, mtime_s * _NS + mtime_n,
+                ino, mode, uid, gid, size, sha.hex(), flags, extended,
+            ))
+            offset += ((name_end - offset) + 8) & ~7
+    except (struct.error, ValueError):
+        raise BackendUnsupported("索引格式损坏")
+
+    # 扩展段：4 字节签名 + 4 字节长度，末尾 20 字节为校验和；签名首字母小写的扩展是必需的
+    tree = None
+    while offset + 8 <= len(data) - 20:
+        signature = data[offset:offset + 4]
+        (size,) = struct.unpack_from(">I", data, offset + 4)
+        if signature == b"link":
+            raise BackendUnsupported("split index")
+        if signature[:1].islower():
+            raise BackendUnsupported(f"不支持的索引扩展 {signature.decode('ascii', 'replace')}")
+        if signature == b"TREE":
+            tree = _root_tree(data[offset + 8:offset + 8 + size])
+        offset += 8 + size
+    return IndexFile(version, mtime_ns, entries, tree)
+
+
+def _root_tree(extension: bytes) -> Optional[str]:
+    """cache-tree 扩展的第一项是根目录：路径\\0条目数 子树数\\n[20 字节 SHA]；条目数为 -1 表示失效"""
+    nul = extension.find(b"\0")
+    newline = extension.find(b"\n", nul)
+    if nul != 0 or newline < 0:
+        return None
+    try:
+        count = int(extension[nul + 1:newline].split(b" ")[0])
+    except ValueError:
+        return None
+    if count < 0:
+        return None
+    return extension[newline + 1:newline + 21].hex()
+
+
+def _blob_sha(data: bytes) -> str:
+    import hashlib
+
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _read_object(objects: Path, sha: str) -> tuple[str, bytes]:
+    """
+    读取对象 (类型, 内容)：松散对象或 pack v2 中的非 delta 对象
+
+    Raises:
+        BackendUnsupported: 对象是 delta、不在本地对象库或格式不受支持
+    """
+    try:
+        data = zlib.decompress((objects / sha[:2] / sha[2:]).read_bytes())
+    except FileNotFoundError:
+        return _read_packed(objects, sha)
+    except zlib.error as e:
+        raise BackendUnsupported(f"对象损坏: {sha}") from e
+    header, _, body = data.partition(b"\0")
+    return header.split(b" ")[0].decode("ascii"), body
+
+
+def _read_packed(objects: Path, sha: str) -> tuple[str, bytes]:
+    target = bytes.fromhex(sha)
+    for idx_path in sorted((objects / "pack").glob("*.idx")):
+        with open(idx_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as idx:
+            if idx[:8] != b"\377tOc\0\0\0\2":
+                raise BackendUnsupported("pack 索引版本不是 2")
+            fanout = struct.unpack_from(">256I", idx, 8)
+            count = fanout[255]
+            lo = fanout[target[0] - 1] if target[0] else 0
+            hi = fanout[target[0]]
+            names = 8 + 256 * 4
+            while lo < hi:
+                mid = (lo + hi) // 2
+                name = idx[names + mid * 20:names + mid * 20 + 20]
+                if name == target:
+                    break
+                if name < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            else:
+                continue
+            offsets = names + count * 24
+            (offset,) = struct.unpack_from(">I", idx, offsets + mid * 4)
+            if offset & 0x80000000:
+                (offset,) = struct.unpack_from(">Q", idx, offsets + count * 4 + (offset & 0x7FFFFFFF) * 8)
+        return _unpack_entry(idx_path.with_suffix(".pack"), offset)
+    raise BackendUnsupported(f"对象不在本地对象库: {sha}")
+
+
+def _unpack_entry(pack_path: Path, offset: int) -> tuple[str, bytes]:
+    with open(pack_path, "rb") as f:
+        f.seek(offset)
+        byte = f.read(1)[0]
+        kind = (byte >> 4) & 0x7
+        while byte & 0x80:
+            byte = f.read(1)[0]
+        if kind not in _PACK_TYPES:
+            raise BackendUnsupported("pack 中的对象是 delta")
+        decompressor = zlib.decompressobj()
+        body = b""
+        while not decompressor.eof:
+            chunk = f.read(8192)
+            if not chunk:
+                raise BackendUnsupported("pack 对象不完整")
+            body += decompressor.decompress(chunk)
+    return _PACK_TYPES[kind], body
+
+
+def _head_tree(repo: Path, git_dir: Path) -> Optional[str]:
+    """HEAD 提交的树；HEAD 未出生时返回 None"""
+    head = PythonBackend().rev_parse(repo, ["HEAD"])
+    if head is None:
+        return None
+    kind, body = _read_object(common_dir(git_dir) / "objects", head[0])
+    if kind != "commit" or not body.startswith(b"tree "):
+        raise BackendUnsupported("HEAD 不是提交")
+    return body[5:45].decode("ascii")
+
+
+def _worktree_mode(st: os.stat_result, filemode: bool) -> int:
+    if stat.S_ISLNK(st.st_mode):
+        return SYMLINK_MODE
+    if stat.S_ISDIR(st.st_mode):
+        return GITLINK_MODE
+    if filemode and st.st_mode & 0o100:
+        return 0o100755
+    return 0o100644
+
+
+def _stat_ns(ns: int) -> int:
+    """按索引的存储方式截断时间戳：秒取低 32 位，纳秒保留"""
+    return (ns // _NS & _MASK32) * _NS + ns % _NS
+
+
+def _stat_matches(entry: IndexEntry, st: os.stat_result, trust_ctime: bool) -> bool:
+    """条目记录的 stat 数据与 lstat 一致（git 默认比较的字段，不比较 dev）"""
+    return (
+        entry.mtime_ns == _stat_ns(st.st_mtime_ns)
+        and (not trust_ctime or entry.ctime_ns == _stat_ns(st.st_ctime_ns))
+        and entry.size == st.st_size & _MASK32
+        and entry.ino == st.st_ino & _MASK32
+        and entry.uid == st.st_uid & _MASK32
+        and entry.gid == st.st_gid & _MASK32
+    )
+
+
+def _content_sha(path: Path, st: os.stat_result) -> str:
+    if stat.S_ISLNK(st.st_mode):
+        return _blob_sha(os.readlink(os.fsencode(path)))
+    return _blob_sha(path.read_bytes())
+
+
+def _config_bool(value: Optional[str], default: bool) -> bool:
+    if value is None:
+        return True  # 只有键名表示 true
+    value = value.strip().lower()
+    if value in ("true", "yes", "on", "1"):
+        return True
+    if value in ("false", "no", "off", "0", ""):
+        return False
+    return default
+
+
+def _repo_config(repo: Path) -> dict[str, Optional[str]]:
+    """影响比较方式的配置（同名键后者生效）"""
+    config = dict(PythonBackend().config_get_regexp(repo, r"^(core|diff|submodule)\."))
+    if any(key.startswith("submodule.") and key.endswith(".ignore") for key in config) \
+            or "diff.ignoresubmodules" in config:
+        raise BackendUnsupported("配置了子模块忽略规则")
+    if _config_bool(config.get("core.ignorecase", "false"), False):
+        raise BackendUnsupported("core.ignorecase")
+    if not _config_bool(config.get("core.symlinks", "true"), True):
+        raise BackendUnsupported("core.symlinks = false")
+    return config
+
+
+def _user_file(config: dict, key: str, default: str) -> Optional[Path]:
+    """core.excludesFile / core.attributesFile，未配置时取 XDG 默认位置"""
+    if config.get(key):
+        return Path(os.path.expanduser(config[key]))
+    home = os.environ.get("HOME")
+    xdg = os.environ.get("XDG_CONFIG_HOME") or (f"{home}/.config" if home else None)
+    return Path(xdg) / "git" / default if xdg else None
+
+
+def _needs_filters(repo: Path, git_dir: Path, config: dict, entries: list[IndexEntry]) -> bool:
+    """内容比较是否可能经过过滤（换行转换、filter 驱动等）"""
+    if _config_bool(config.get("core.autocrlf", "false"), True):
+        return True  # true 或 input
+    attributes = _user_file(config, "core.attributesfile", "attributes")
+    if (attributes and attributes.exists()) or (common_dir(git_dir) / "info" / "attributes").exists():
+        return True
+    return (repo / ".gitattributes").exists() or any(
+        e.path.endswith("/.gitattributes") for e in entries
+    )
+
+
+def _gitlink_modified(repo: Path, entry: IndexEntry, untracked: bool) -> bool:
+    """子模块：路径不存在、HEAD 与记录不同或内部有变更时视为已修改（git status 的默认行为）"""
+    sub = repo / entry.path
+    if not sub.is_dir():
+        return True
+    if not (sub / ".git").exists():
+        return False  # 未初始化
+    head = PythonBackend().rev_parse(sub, ["HEAD"])
+    if head is None or head[0] != entry.sha:
+        return True
+    return _check_in_process(sub, untracked).dirty
+
+
+def _check_in_process(repo: Path, untracked: bool) -> DirtyResult:
+    git_dir = find_git_dir(repo)
+    config = _repo_config(repo)
+    index = parse_index(git_dir / "index")
+    filemode = _config_bool(config.get("core.filemode", "true"), True)
+    trust_ctime = _config_bool(config.get("core.trustctime", "true"), True)
+    filters = None  # 只有需要比较内容时才检查
+
+    modified = []
+    staged = False
+    for entry in index.entries:
+        if entry.stage:
+            staged = True  # 未解决的冲突
+            if not modified or modified[-1] != entry.path:
+                modified.append(entry.path)
+            continue
+        if entry.flags & _ASSUME_VALID or entry.extended & _SKIP_WORKTREE:
+            continue
+        if entry.extended & _INTENT_TO_ADD:
+            modified.append(entry.path)
+            continue
+        if entry.mode == GITLINK_MODE:
+            if _gitlink_modified(repo, entry, untracked):
+                modified.append(entry.path)
+            continue
+
+        path = repo / entry.path
+        try:
+            st = os.lstat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            modified.append(entry.path)
+            continue
+        mode = _worktree_mode(st, filemode)
+        if stat.S_IFMT(mode) != stat.S_IFMT(entry.mode) or (filemode and mode != entry.mode):
+            modified.append(entry.path)
+            continue
+        if _stat_matches(entry, st, trust_ctime):
+            if entry.mtime_ns >= index.mtime_ns:
+                raise BackendUnsupported(f"racy 条目: {entry.path}")
+            continue
+
+        if filters is None:
+            filters = _needs_filters(repo, git_dir, config, index.entries)
+        if filters:
+            raise BackendUnsupported(f"需要内容过滤才能比较: {entry.path}")
+        # 大小为 0 的条目可能是被 git 抹掉大小的 racy 条目，必须比较内容
+        if entry.size and entry.size != st.st_size & _MASK32:
+            modified.append(entry.path)
+        elif _content_sha(path, st) != entry.sha:
+            modified.append(entry.path)
+
+    if not staged:
+        head_tree = _head_tree(repo, git_dir)
+        if head_tree is None:
+            staged = bool(index.entries)
+        elif index.tree is not None:
+            staged = index.tree != head_tree
+        elif not index.entries:
+            staged = head_tree != EMPTY_TREE
+        else:
+            raise BackendUnsupported("cache-tree 失效")
+
+    found = _untracked(repo, git_dir, index.entries, config) if untracked else []
+    return DirtyResult(
+        repo=str(repo),
+        dirty=bool(modified or staged or found),
+        modified=modified,
+        staged=staged,
+        untracked=found,
+    )
+
+
+Pattern = tuple[re.Pattern, bool, bool]  # (正则, 是否取反, 只匹配目录)
+
+
+def compile_pattern(line: str) -> Optional[Pattern]:
+    """把一行 gitignore 规则编译为正则；空行和注释返回 None"""
+    if not line or line.startswith("#"):
+        return None
+    end = len(line)
+    while end and line[end - 1] == " " and not (end > 1 and line[end - 2] == "\\"):
+        end -= 1  # 行尾未转义的空格
+    line = line[:end]
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    line = line.lstrip("/")
+
+    out = []
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if line.startswith("**", i) and (i == 0 or line[i - 1] == "/") \
+                and (i + 2 == n or line[i + 2] == "/"):
+            if i + 2 == n:
+                out.append(".*")  # 结尾的 /** 匹配其下所有内容
+                i += 2
+            else:
+                out.append("(?:.*/)?")  # 开头或中间的 **/ 匹配零或多层目录
+                i += 3
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            start = i + 2 if line[i + 1:i + 2] in ("!", "^") else i + 1
+            close = line.find("]", start + 1)
+            if close < 0:
+                out.append(re.escape(c))
+            else:
+                body = line[i + 1:close].replace("\\", "\\\\").replace("[", "\\[")
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = close
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(line[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(f"^{prefix}{''.join(out)}$", re.DOTALL), negate, dir_only
+
+
+def _load_patterns(path: Optional[Path]) -> list[Pattern]:
+    if path is None:
+        return []
+    try:
+        text = path.read_text(errors="surrogateescape")
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError, PermissionError):
+        return []
+    return [p for p in map(compile_pattern, text.splitlines()) if p]
+
+
+Groups = list[tuple[str, list[Pattern]]]  # (规则文件所在目录前缀, 规则)，后面的组优先
+
+
+def _ignored(groups: Groups, rel: str, is_dir: bool) -> bool:
+    """最具体的规则组中最后一条匹配的规则决定结果"""
+    for base, patterns in reversed(groups):
+        sub = rel[len(base):]
+        for regex, negate, dir_only in reversed(patterns):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(sub):
+                return not negate
+    return False
+
+
+def _untracked(repo: Path, git_dir: Path, entries: list[IndexEntry], config: dict) -> list[str]:
+    """
+    未跟踪路径，与 git status --untracked-files=normal 相同：
+    不含已跟踪文件的目录折叠为 "dir/"，只含被忽略文件的目录和空目录不列出
+    """
+    tracked = {e.path for e in entries}
+    tracked_dirs = set()
+    for path in tracked:
+        parts = path.split("/")[:-1]
+        for depth in range(1, len(parts) + 1):
+            tracked_dirs.add("/".join(parts[:depth]))
+    groups = [
+        ("", _load_patterns(_user_file(config, "core.excludesfile", "ignore"))),
+        ("", _load_patterns(common_dir(git_dir) / "info" / "exclude")),
+    ]
+    found = []
+    _walk(repo, "", groups, tracked, tracked_dirs, found)
+    return found
+
+
+def _walk(repo: Path, prefix: str, groups: Groups, tracked: set, tracked_dirs: set, found: list) -> None:
+    groups = groups + [(prefix, _load_patterns(repo / prefix / ".gitignore"))]
+    with os.scandir(repo / prefix) as it:
+        items = sorted(it, key=lambda item: item.name)
+    for item in items:
+        if item.name == ".git":
+            continue
+        rel = prefix + item.name
+        if item.is_dir(follow_symlinks=False):
+            if rel in tracked or _ignored(groups, rel, True):
+                continue
+            if rel in tracked_dirs:
+                _walk(repo, rel + "/", groups, tracked, tracked_dirs, found)
+            elif _has_untracked(repo, rel + "/", groups):
+                found.append(rel + "/")
+        elif rel not in tracked and not _ignored(groups, rel, False):
+            found.append(rel)
+
+
+def _has_untracked(repo: Path, prefix: str, groups: Groups) -> bool:
+    """目录（不含已跟踪文件）下是否有未被忽略的文件；嵌套仓库总是列出"""
+    if os.path.lexists(repo / prefix / ".git"):
+        return True
+    groups = groups + [(prefix, _load_patterns(repo / prefix / ".gitignore"))]
+    with os.scandir(repo / prefix) as it:
+        for item in it:
+            rel = prefix + item.name
+            is_dir = item.is_dir(follow_symlinks=False)
+            if _ignored(groups, rel, is_dir):
+                continue
+            if not is_dir or _has_untracked(repo, rel + "/", groups):
+                return True
+    return False
+
+
+def _check_with_git(repo: Path, untracked: bool, reason: str) -> DirtyResult:
+    mode = "normal" if untracked else "no"
+    stdout, _, code = GitOps(repo).run_git(
+        ["status", "--porcelain", f"--untracked-files={mode}"], timeout=GIT_STATUS_TIMEOUT
+    )
+    if code == -signal.SIGKILL:
+        # 与原先的子模块检查一致：git status 超时的仓库不视为脏，原因记入 fallback
+        return DirtyResult(repo=str(repo), dirty=False, fallback=f"{reason}; git status 超时")
+    result = DirtyResult(repo=str(repo), dirty=bool(stdout.strip()), fallback=reason)
+    for line in stdout.splitlines():
+        if len(line) < 4:
+            continue
+        code, path = line[:2], line[3:]
+        if code == "??":
+            result.untracked.append(path)
+            continue
+        if code[0] != " ":
+            result.staged = True
+        if code[1] != " ":
+            result.modified.append(path)
+    return result
+
+
+def check_repo(repo: Path, untracked: bool = False) -> DirtyResult:
+    """
+    检查仓库是否有未提交的变更，能在进程内确定时不启动 git
+
+    Args:
+        repo: 仓库根目录（子模块的 .git 为 gitdir 文件也可以）
+        untracked: 是否同时检查未跟踪文件（需要遍历工作区）
+    """
+    repo = Path(repo)
+    try:
+        result = _check_in_process(repo, untracked)
+    except (BackendUnsupported, OSError) as e:
+        result = _check_with_git(repo, untracked, str(e))
+    metrics.DIRTY_CHECKS.inc(method="git" if result.fallback else "index")
+    return result
+
+
+def check_repos(repo_root: Path, paths: list[str], untracked: bool = False) -> dict[str, DirtyResult]:
+    """在同一进程中依次检查多个仓库（通常是所有子模块），结果以相对路径为键"""
+    results = {}
+    for path in paths:
+        result = check_repo(Path(repo_root) / path, untracked)
+        result.repo = path
+        results[path] = result
+    return results
@@ -0,0 +1,227 @@
+"""
+工作日志
+
+meta/journal/YYYY-MM-DD.md 的统一写入器，auto_commit 和 WorkflowEngine 共用：
+
+- Markdown 每条记录一行，格式不变：`- HH:MM STATUS repo: types`
+- 同目录的 YYYY-MM-DD.jsonl 是结构化副本，每条记录一行 JSON，与 Markdown 同批写入
+- append() 只写入内存缓冲区，攒够 flush_batch 条或距上次写入超过 flush_interval 秒时
+  批量写入；flush() 立即写入；进程正常退出时（atexit）写入所有缓冲区
+- 批量写入期间在 .md 文件上持有 fcntl 排他锁，并发的进程和线程写入的批次不会交错
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Optional
+
+JOURNAL_DIR = Path("meta") / "journal"
+SIDECAR_SUFFIX = ".jsonl"
+DEFAULT_FLUSH_BATCH = 64
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+@dataclass
+class JournalEntry:
+    """一条日志记录"""
+    status: str  # OK / FAIL / SKIP
+    repo: str
+    types: str = ""  # Markdown 中冒号后的部分
+    changes: dict[str, list[str]] = field(default_factory=dict)  # 变更类型 -> 路径
+    timestamp: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_changes(
+        cls, status: str, repo: str, changes: list[dict], timestamp: Optional[float] = None
+    ) -> "JournalEntry":
+        """由 [{"path", "type"}] 变更列表生成记录，types 为 `[type] path, ...`"""
+        by_type: dict[str, list[str]] = {}
+        for change in changes:
+            by_type.setdefault(change["type"], []).append(change["path"])
+        by_type = dict(sorted(by_type.items()))
+        types = ", ".join(f"[{t}] {', '.join(files)}" for t, files in by_type.items())
+        return cls(status, repo, types, by_type, time.time() if timestamp is None else timestamp)
+
+    @property
+    def date(self) -> str:
+        return datetime.fromtimestamp(self.timestamp).strftime("%Y-%m-%d")
+
+    def line(self) -> str:
+        """Markdown 行"""
+        return f"- {datetime.fromtimestamp(self.timestamp):%H:%M} {self.status} {self.repo}: {self.types}"
+
+    def record(self) -> dict:
+        """JSONL 记录"""
+        return {
+            "time": datetime.fromtimestamp(self.timestamp).isoformat(timespec="seconds"),
+            "status": self.status,
+            "repo": self.repo,
+            "types": self.types,
+            "changes": self.changes,
+        }
+
+
+def _same_file(handle: IO, path: Path) -> bool:
+    """打开的文件仍是 path（没有被删除或替换，例如 git checkout 重写了日志文件）"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(handle.fileno())
+    return (st.st_ino, st.st_dev) == (opened.st_ino, opened.st_dev)
+
+
+class JournalWriter:
+    """
+    带缓冲的日志写入器
+
+    线程安全；同一日志目录在进程内应共用一个实例（见 writer_for）。
+    文件句柄按日期保持打开，每批写入前确认文件未被替换。
+    """
+
+    def __init__(
+        self,
+        journal_dir: Path,
+        flush_batch: int = DEFAULT_FLUSH_BATCH,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.journal_dir = Path(journal_dir)
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._buffer: list[JournalEntry] = []
+        self._files: dict[str, tuple[IO, IO]] = {}  # 日期 -> (Markdown, JSONL)
+        self._last_flush = time.monotonic()
+        _WRITERS.add(self)
+
+    @classmethod
+    def for_repo(cls, repo_root: Path, **kwargs) -> "JournalWriter":
+        """仓库 meta/journal 目录的写入器"""
+        return cls(Path(repo_root) / JOURNAL_DIR, **kwargs)
+
+    def path_for(self, date: str) -> Path:
+        return self.journal_dir / f"{date}.md"
+
+    def append(self, entry: JournalEntry) -> None:
+        """加入缓冲区，达到批量条件时写入"""
+        self.extend([entry])
+
+    def extend(self, entries: list[JournalEntry]) -> None:
+        with self._lock:
+            self._buffer.extend(entries)
+            if (
+                len(self._buffer) >= self.flush_batch
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush_locked()
+
+    def flush(self) -> list[Path]:
+        """立即写入缓冲区，返回写入的 Markdown 文件"""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> list[Path]:
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return []
+        by_date: dict[str, list[JournalEntry]] = {}
+        for entry in self._buffer:
+            by_date.setdefault(entry.date, []).append(entry)
+
+        written = []
+        for date, entries in by_date.items():
+            markdown, sidecar = self._open(date)
+            fcntl.flock(markdown.fileno(), fcntl.LOCK_EX)
+            try:
+                markdown.write("\n" + "\n".join(entry.line() for entry in entries))
+                markdown.flush()
+                sidecar.write("".join(
+                    json.dumps(entry.record(), ensure_ascii=False) + "\n" for entry in entries
+                ))
+                sidecar.flush()
+            finally:
+                fcntl.flock(markdown.fileno(), fcntl.LOCK_UN)
+            # 写入成功的日期才移出缓冲区，失败的留待下次重试
+            self._buffer = [entry for entry in self._buffer if entry.date != date]
+            written.append(self.path_for(date))
+        return written
+
+    def _open(self, date: str) -> tuple[IO, IO]:
+        path = self.path_for(date)
+        sidecar_path = path.with_suffix(SIDECAR_SUFFIX)
+        handles = self._files.get(date)
+        if handles and not (_same_file(handles[0], path) and _same_file(handles[1], sidecar_path)):
+            for handle in handles:
+                handle.close()
+            handles = None
+        if handles is None:
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            handles = (
+                open(path, "a", encoding="utf-8"),
+                open(sidecar_path, "a", encoding="utf-8"),
+            )
+            self._files[date] = handles
+        return handles
+
+    def close(self) -> None:
+        """写入缓冲区并关闭文件"""
+        with self._lock:
+            try:
+                self._flush_locked()
+            finally:
+                for handles in self._files.values():
+                    for handle in handles:
+                        handle.close()
+                self._files.clear()
+
+    def _after_fork(self) -> None:
+        # 子进程不继承父进程尚未写入的记录，否则两边退出时各写一次
+        self._lock = threading.Lock()
+        self._buffer = []
+
+    def __enter__(self) -> "JournalWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+_WRITERS: "weakref.WeakSet[JournalWriter]" = weakref.WeakSet()
+_SHARED: dict[Path, JournalWriter] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def writer_for(repo_root: Path) -> JournalWriter:
+    """进程内共享的仓库日志写入器"""
+    journal_dir = (Path(repo_root) / JOURNAL_DIR).resolve()
+    with _SHARED_LOCK:
+        writer = _SHARED.get(journal_dir)
+        if writer is None:
+            writer = _SHARED[journal_dir] = JournalWriter(journal_dir)
+        return writer
+
+
+def flush_all() -> None:
+    """写入所有写入器的缓冲区（进程退出时自动调用）"""
+    for writer in list(_WRITERS):
+        try:
+            writer.flush()
+        except OSError:
+            pass
+
+
+def _after_fork_in_child() -> None:
+    for writer in list(_WRITERS):
+        writer._after_fork()
+
+
+atexit.register(flush_all)
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,342 @@
+"""
+工作日志索引
+
+把 meta/journal/YYYY-MM-DD.md 解析进 SQLite（状态目录下的 journal.sqlite），按日期、仓库、
+状态和变更类型建索引，供 `thera journal query` 做范围查询和分组统计。
+
+索引是增量维护的：每个日志文件记录大小、mtime、末尾字节的哈希和已解析到的位置。
+大小和 mtime 都没变的文件直接跳过；文件只是被追加时从最后一行的开头继续解析；
+其余修改（编辑、截断、替换）重新解析整个文件；日志文件被删除时删除对应记录。
+"""
+
+import hashlib
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from thera.git_ops import get_state_dir
+from thera.journal import JOURNAL_DIR
+
+INDEX_FILE = "journal.sqlite"
+SCHEMA_VERSION = 1
+TAIL_BYTES = 64
+GROUP_KEYS = {
+    "date": "e.date",
+    "month": "substr(e.date, 1, 7)",
+    "repo": "e.repo",
+    "status": "e.status",
+    "type": "t.type",
+}
+
+_FILE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.md$")
+_LINE_RE = re.compile(r"^- (\d{2}:\d{2}) (\S+) (\S+): ?(.*)$")
+_TYPE_RE = re.compile(r"\[([^\]]+)\] ")
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    tail TEXT NOT NULL,
+    parsed_offset INTEGER NOT NULL,
+    parsed_lines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    status TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    types TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entry_types (
+    entry_id INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    files INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_date ON entries(date, time);
+CREATE INDEX IF NOT EXISTS entries_repo ON entries(repo, date);
+CREATE INDEX IF NOT EXISTS entries_status ON entries(status, date);
+CREATE INDEX IF NOT EXISTS entries_file ON entries(file, line);
+CREATE INDEX IF NOT EXISTS entry_types_type ON entry_types(type, entry_id);
+CREATE INDEX IF NOT EXISTS entry_types_entry ON entry_types(entry_id);
+"""
+
+
+def parse_types(types: str) -> dict[str, int]:
+    """
+    解析日志行冒号后的部分，返回 {变更类型: 文件数}
+
+    auto_commit 写 `[docs] a.md, b.md, [config] .gitmodules`；
+    工作流写不带方括号的标签（如 `sync`），整体作为类型，文件数为 0。
+    """
+    matches = list(_TYPE_RE.finditer(types))
+    if not matches:
+        label = types.strip()
+        return {label: 0} if label else {}
+    counts: dict[str, int] = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        body = types[match.end():following.start() if following else len(types)]
+        files = [f for f in body.rstrip().rstrip(",").split(", ") if f.strip()]
+        counts[match.group(1)] = counts.get(match.group(1), 0) + len(files)
+    return counts
+
+
+def _month_bounds(value: str, end: bool) -> str:
+    """YYYY-MM 展开为当月第一天或最后一天（按字符串比较，取 31 日即可）"""
+    if _MONTH_RE.match(value):
+        return f"{value}-31" if end else f"{value}-01"
+    if _DATE_RE.match(value):
+        return value
+    raise ValueError(f"日期格式应为 YYYY-MM-DD 或 YYYY-MM: {value}")
+
+
+@dataclass
+class UpdateStats:
+    """一次增量索引的统计"""
+    files: int = 0  # 日志文件总数
+    parsed: int = 0  # 本次解析的文件数（含追加解析）
+    entries: int = 0  # 本次写入的记录数（追加解析时含重新解析的最后一行）
+    removed: int = 0  # 已删除的日志文件数
+
+
+@dataclass
+class QueryResult:
+    """查询结果：未分组时每行一条记录，分组时每行为分组键加计数"""
+    columns: list[str]
+    rows: list[tuple] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+
+class JournalIndex:
+    """日志索引"""
+
+    def __init__(self, db_path: Path, journal_dir: Path):
+        self.db_path = Path(db_path)
+        self.journal_dir = Path(journal_dir)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.executescript(
+                "DROP TABLE IF EXISTS entry_types; DROP TABLE IF EXISTS entries; "
+                "DROP TABLE IF EXISTS files;"
+            )
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def for_repo(cls, repo_root: Path) -> "JournalIndex":
+        """仓库状态目录下的索引，索引 meta/journal"""
+        repo_root = Path(repo_root)
+        return cls(get_state_dir(repo_root) / INDEX_FILE, repo_root / JOURNAL_DIR)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "JournalIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def rebuild(self) -> UpdateStats:
+        """清空索引后重新解析所有日志文件"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM entry_types")
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return self.update()
+
+    def update(self) -> UpdateStats:
+        """增量索引：只解析新增或变化的日志文件"""
+        stats = UpdateStats()
+        on_disk = {}
+        if self.journal_dir.is_dir():
+            for path in self.journal_dir.iterdir():
+                match = _FILE_RE.match(path.name)
+                if match and path.is_file():
+                    on_disk[path.name] = (path, match.group(1))
+        stats.files = len(on_disk)
+
+        self.conn.execute("BEGIN IMMEDIATE")  # 并发索引时由 SQLite 串行化
+        try:
+            known = {
+                row[0]: row[1:]
+                for row in self.conn.execute(
+                    "SELECT name, size, mtime_ns, tail, parsed_offset, parsed_lines FROM files"
+                )
+            }
+            for name in sorted(set(known) - set(on_disk)):
+                self._delete_file(name)
+                stats.removed += 1
+            for name, (path, date) in sorted(on_disk.items()):
+                added = self._index_file(path, date, known.get(name))
+                if added is not None:
+                    stats.parsed += 1
+                    stats.entries += added
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return stats
+
+    def _delete_file(self, name: str, from_line: int = 0) -> None:
+        self.conn.execute("DELETE FROM entries WHERE file = ? AND line >= ?", (name, from_line))
+        if from_line == 0:
+            self.conn.execute("DELETE FROM files WHERE name = ?", (name,))
+
+    def _index_file(self, path: Path, date: str, known: Optional[tuple]) -> Optional[int]:
+        """解析一个文件的新增部分，返回新增记录数；文件未变化时返回 None"""
+        st = path.stat()
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return None
+        with open(path, "rb") as f:
+            offset, line_no = 0, 0
+            if known and st.st_size > known[0] and self._tail(f, known[0]) == known[2]:
+                offset, line_no = known[3], known[4]  # 只是追加：从上次最后一行的开头继续
+            self._delete_file(path.name, from_line=line_no)
+            f.seek(offset)
+            data = f.read(st.st_size - offset)
+            size = offset + len(data)
+            tail = self._tail(f, size)
+
+        lines = data.split(b"\n")
+        added = 0
+        for text in lines:
+            match = _LINE_RE.match(text.decode("utf-8", "replace").rstrip("\r"))
+            if match:
+                added += self._insert(path.name, line_no, date, *match.groups())
+            line_no += 1
+        # 最后一行（没有换行结尾）下次追加时可能被续写，从它的开头重新解析
+        last_start = size - len(lines[-1])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (path.name, size, st.st_mtime_ns, tail, last_start, line_no - 1),
+        )
+        return added
+
+    @staticmethod
+    def _tail(f, size: int) -> str:
+        """文件前 size 字节中最后 TAIL_BYTES 字节的哈希，用来判断文件是否只被追加"""
+        f.seek(max(0, size - TAIL_BYTES))
+        return hashlib.sha1(f.read(min(size, TAIL_BYTES))).hexdigest()
+
+    def _insert(self, name: str, line: int, date: str, hhmm: str, status: str, repo: str, types: str) -> int:
+        cursor = self.conn.execute(
+            "INSERT INTO entries (file, line, date, time, status, repo, types) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (name, line, date, hhmm, status, repo, types),
+        )
+        self.conn.executemany(
+            "INSERT INTO entry_types (entry_id, type, files) VALUES (?, ?, ?)",
+            [(cursor.lastrowid, t, n) for t, n in parse_types(types).items()],
+        )
+        return 1
+
+    def _filters(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        repo: Optional[str] = None,
+        status: Optional[str] = None,
+        change_type: Optional[str] = None,
+        join_types: bool = False,
+    ) -> tuple[str, list]:
+        """FROM ... WHERE ... 子句和参数"""
+        where, params = [], []
+        if since:
+            where.append("e.date >= ?")
+            params.append(_month_bounds(since, end=False))
+        if until:
+            where.append("e.date <= ?")
+            params.append(_month_bounds(until, end=True))
+        if repo:
+            where.append("e.repo = ?")
+            params.append(repo)
+        if status:
+            where.append("e.status = ?")
+            params.append(status.upper())
+        if change_type:
+            where.append("t.type = ?")
+            params.append(change_type)
+        clause = "entries e"
+        if join_types or change_type:
+            clause += " JOIN entry_types t ON t.entry_id = e.id"
+        if where:
+            clause += f" WHERE {' AND '.join(where)}"
+        return clause, params
+
+    def query(self, group_by: Optional[list[str]] = None, limit: Optional[int] = None, **filters) -> QueryResult:
+        """
+        按条件查询；group_by 为空时返回记录（新的在前），否则返回分组计数（计数多的在前）
+
+        Args:
+            group_by: GROUP_KEYS 中的键
+            limit: 最多返回的行数
+            filters: since / until（日期范围，含两端，YYYY-MM-DD 或 YYYY-MM）、repo、status、change_type
+
+        Raises:
+            ValueError: 日期格式或分组键无效
+        """
+        start = time.perf_counter()
+        group_by = group_by or []
+        unknown = [key for key in group_by if key not in GROUP_KEYS]
+        if unknown:
+            raise ValueError(f"未知分组键: {', '.join(unknown)}（可选: {', '.join(GROUP_KEYS)}）")
+
+        join_types = "type" in group_by or bool(filters.get("change_type"))
+        clause, params = self._filters(join_types=join_types, **filters)
+        if group_by:
+            keys = ", ".join(GROUP_KEYS[key] for key in group_by)
+            count = "COUNT(DISTINCT e.id)" if join_types else "COUNT(*)"
+            sql = f"SELECT {keys}, {count} AS n FROM {clause} GROUP BY {keys} ORDER BY n DESC, {keys}"
+            columns = group_by + ["count"]
+        else:
+            distinct = "DISTINCT " if join_types else ""
+            sql = (
+                f"SELECT {distinct}e.date, e.time, e.status, e.repo, e.types FROM {clause} "
+                "ORDER BY e.date DESC, e.time DESC, e.line DESC"
+            )
+            columns = ["date", "time", "status", "repo", "types"]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = [tuple(row) for row in self.conn.execute(sql, params)]
+        return QueryResult(columns, rows, (time.perf_counter() - start) * 1000)
+
+    def count(self, **filters) -> int:
+        """满足条件的记录数"""
+        clause, params = self._filters(**filters)
+        distinct = "DISTINCT " if filters.get("change_type") else ""
+        return self.conn.execute(f"SELECT COUNT({distinct}e.id) FROM {clause}", params).fetchone()[0]
+
+
+def format_result(result: QueryResult) -> str:
+    """文本输出：记录按日志行格式，分组结果按列对齐"""
+    if result.columns[-1] != "count":
+        return "\n".join(
+            f"{date} {hhmm} {status} {repo}: {types}" for date, hhmm, status, repo, types in result.rows
+        )
+    widths = [
+        max([len(column)] + [len(str(row[i])) for row in result.rows])
+        for i, column in enumerate(result.columns)
+    ]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(result.columns, widths)).rstrip()]
+    for row in result.rows:
+        lines.append("  ".join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+    return "\n".join(lines)
@@ -0,0 +1,264 @@
+"""
+仓库级运行租约
+
+refresh、auto-commit 和工作流运行期间持有状态目录下的租约，同一仓库同一时间只有一个运行：
+cron、git 钩子和手动执行同时触发时不再重复 fetch、争抢 index.lock。
+
+- lease/run.lease 记录持有者（运行 ID、操作、参数键、PID、主机）和心跳时间，
+  持有期间由后台线程定期刷新心跳
+- 获取、回收、释放租约时在 lease/run.lock 上持有 fcntl 排他锁，只在状态转换的瞬间持有
+- 操作和参数都相同的调用方不再自己执行，而是等待进行中的运行结束并返回它的结果
+  （结果以 JSON 写入 lease/results/<运行 ID>.json）；参数不同则排队等待租约
+- 持有者进程已不存在（同一主机）或心跳超过 stale_after 秒未刷新时，租约视为失效并被回收；
+  失效的运行没有结果，等待它的调用方改为自己执行
+- 排队、等待和回收的提示交给调用方传入的 log（命令行传 print），守护进程和流水线中不输出
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from thera import metrics
+from thera.git_ops import get_state_dir
+
+T = TypeVar("T")
+
+LEASE_DIR = "lease"
+LEASE_FILE = "run.lease"
+GUARD_FILE = "run.lock"
+RESULTS_DIR = "results"
+DEFAULT_STALE_AFTER = 60.0
+DEFAULT_HEARTBEAT_INTERVAL = 5.0
+DEFAULT_POLL_INTERVAL = 0.1
+DEFAULT_WAIT_TIMEOUT = 600.0
+RESULT_TTL = 300.0  # 结果文件保留时间，足够等待方在轮询间隔内读到
+
+
+class LeaseTimeout(RuntimeError):
+    """等待租约超时"""
+
+
+@dataclass
+class LeaseHolder:
+    """租约持有者（run.lease 的内容）"""
+    id: str
+    operation: str
+    key: str
+    pid: int
+    host: str
+    started: float
+    heartbeat: float
+
+    def describe(self) -> str:
+        return f"{self.operation}（pid {self.pid}@{self.host}）"
+
+
+def _key(operation: str, params: Optional[dict]) -> str:
+    """操作和参数的键：两者都相同的运行视为同一运行"""
+    import hashlib  # 只在获取租约时需要，refresh 的导入路径不加载 OpenSSL
+
+    payload = json.dumps([operation, params or {}], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 进程存在，只是属于其他用户
+    return True
+
+
+_local = threading.local()
+
+
+class RepoLease:
+    """
+    仓库租约
+
+    同一线程内重入（例如持有租约的运行内部再调用 refresh）直接执行，不再等待自己。
+    """
+
+    def __init__(
+        self,
+        repo_root: Path,
+        stale_after: float = DEFAULT_STALE_AFTER,
+        heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        timeout: Optional[float] = DEFAULT_WAIT_TIMEOUT,
+        log: Optional[Callable[[str], None]] = None,
+    ):
+        self.directory = get_state_dir(Path(repo_root).resolve()) / LEASE_DIR
+        self.path = self.directory / LEASE_FILE
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.host = os.uname().nodename
+        self.log = log
+
+    def _log(self, message: str) -> None:
+        if self.log is not None:
+            self.log(f"[LEASE] {message}")
+
+    @contextmanager
+    def _guard(self) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.directory / GUARD_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # 关闭即释放锁
+
+    def holder(self) -> Optional[LeaseHolder]:
+        """当前持有者；没有租约或租约文件损坏时返回 None"""
+        try:
+            return LeaseHolder(**json.loads(self.path.read_text()))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def is_stale(self, holder: LeaseHolder) -> bool:
+        if holder.host == self.host and not _pid_alive(holder.pid):
+            return True
+        return time.time() - holder.heartbeat > self.stale_after
+
+    def _write(self, path: Path, data: dict) -> None:
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_text(json.dumps(data, ensure_ascii=False))
+        os.replace(tmp, path)
+
+    def _result_path(self, run_id: str) -> Path:
+        return self.directory / RESULTS_DIR / f"{run_id}.json"
+
+    def _read_result(self, run_id: str) -> tuple[bool, Any]:
+        try:
+            return True, json.loads(self._result_path(run_id).read_text())["result"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return False, None
+
+    def _prune_results(self) -> None:
+        cutoff = time.time() - RESULT_TTL
+        for path in (self.directory / RESULTS_DIR).glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _heartbeat(self, run_id: str, stop: threading.Event) -> None:
+        while not stop.wait(self.heartbeat_interval):
+            with self._guard():
+                holder = self.holder()
+                if holder is None or holder.id != run_id:
+                    return  # 已被回收，不再覆盖新持有者
+                holder.heartbeat = time.time()
+                self._write(self.path, asdict(holder))
+
+    def run(
+        self,
+        operation: str,
+        func: Callable[[], T],
+        params: Optional[dict] = None,
+        dump: Optional[Callable[[T], Any]] = None,
+        load: Optional[Callable[[Any], T]] = None,
+    ) -> T:
+        """
+        持有租约执行 func
+
+        Args:
+            operation: 操作名（refresh / auto-commit / workflow）
+            params: 决定运行是否相同的参数，须可序列化为 JSON
+            dump: 把结果转换为 JSON 可序列化的值（默认原样写入）
+            load: 等待方把 JSON 值还原为结果（默认原样返回）
+
+        Raises:
+            LeaseTimeout: 超过 timeout 秒仍未获得租约
+        """
+        held = getattr(_local, "held", set())
+        if self.path in held:
+            return func()
+
+        key = _key(operation, params)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        following: Optional[LeaseHolder] = None  # 正在等待其结果的同键运行
+        queued = waited = False
+        while True:
+            with self._guard():
+                holder = self.holder()
+                if holder is not None and self.is_stale(holder):
+                    self._log(f"回收失效租约: {holder.describe()}")
+                    self.path.unlink(missing_ok=True)
+                    metrics.LEASE_RECLAIMS.inc(operation=holder.operation)
+                    holder = None
+
+                if following is not None and (holder is None or holder.id != following.id):
+                    found, value = self._read_result(following.id)
+                    if found:
+                        metrics.LEASE_RUNS.inc(operation=operation, outcome="coalesced")
+                        return load(value) if load else value
+                    following = None  # 该运行失败或被回收，没有留下结果
+
+                if holder is None:
+                    now = time.time()
+                    run_id = f"{os.getpid()}-{time.time_ns():x}"
+                    mine = LeaseHolder(run_id, operation, key, os.getpid(), self.host, now, now)
+                    self._write(self.path, asdict(mine))
+                    break
+
+                if holder.key == key and following is None:
+                    following = holder
+                    waited = True
+                    self._log(f"相同的 {holder.describe()} 正在运行，等待其结果")
+                elif holder.key != key and not queued:
+                    queued = waited = True
+                    self._log(f"{holder.describe()} 正在运行，排队等待")
+
+            if deadline is not None and time.monotonic() > deadline:
+                raise LeaseTimeout(f"等待 {holder.describe()} 超过 {self.timeout:g} 秒")
+            time.sleep(self.poll_interval)
+
+        metrics.LEASE_RUNS.inc(operation=operation, outcome="queued" if waited else "run")
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(run_id, stop), daemon=True)
+        beat.start()
+        _local.held = held | {self.path}
+        try:
+            result = func()
+            try:
+                value = dump(result) if dump else result
+                (self.directory / RESULTS_DIR).mkdir(exist_ok=True)
+                self._write(self._result_path(run_id), {"result": value})
+            except (TypeError, ValueError):
+                pass  # 结果无法序列化时等待方自己执行
+            return result
+        finally:
+            _local.held = held
+            stop.set()
+            beat.join()
+            with self._guard():
+                holder = self.holder()
+                if holder is not None and holder.id == run_id:
+                    self.path.unlink()
+                self._prune_results()
+
+
+def run_exclusive(
+    repo_root: Path,
+    operation: str,
+    func: Callable[[], T],
+    params: Optional[dict] = None,
+    dump: Optional[Callable[[T], Any]] = None,
+    load: Optional[Callable[[Any], T]] = None,
+    log: Optional[Callable[[str], None]] = None,
+) -> T:
+    """以默认设置持有仓库租约执行 func（见 RepoLease.run）；log 接收排队、等待和回收的提示"""
+    return RepoLease(repo_root, log=log).run(operation, func, params=params, dump=dump, load=load)
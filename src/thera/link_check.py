@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Markdown 链接检查脚本
+
+建立 docs 子模块的路径索引，检查相对链接和锚点是否有效。
+解析结果按文件内容哈希缓存，重复运行时只重新解析变更过的文件。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote
+
+from thera.git_ops import get_state_dir
+from thera.refresh import SUBMODULE_PATHS
+
+DOCS_ROOTS = [p for p in SUBMODULE_PATHS if p.startswith("docs/")]
+
+CACHE_VERSION = 1
+CACHE_FILE = "link_check_cache.json"
+
+# 待解析文件少于该数量时直接在当前进程解析，避免进程池启动开销
+PARALLEL_THRESHOLD = 64
+
+_FENCE_RE = re.compile(r"^\s{0,3}(```|~~~)")
+_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_INLINE_CODE_RE = re.compile(r"`[^`]*`")
+_INLINE_LINK_RE = re.compile(
+    r"!?\[[^\]]*\]\(\s*(<[^>]*>|[^)\s]+)(?:\s+[\"'(][^)]*)?\)"
+)
+_REF_DEF_RE = re.compile(r"^\s{0,3}\[[^\]]+\]:\s*(<[^>]*>|\S+)")
+_ANCHOR_TAG_RE = re.compile(r"<a\s+(?:name|id)=[\"']([^\"']+)[\"']")
+_SCHEME_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+_SLUG_STRIP_RE = re.compile(r"[^\w\- ]")
+
+
+@dataclass
+class BrokenLink:
+    """失效链接"""
+
+    source: str
+    line: int
+    target: str
+    reason: str
+
+
+@dataclass
+class LinkCheckResult:
+    """链接检查结果"""
+
+    success: bool
+    message: str
+    files_checked: int = 0
+    files_parsed: int = 0
+    broken_links: list[BrokenLink] = field(default_factory=list)
+
+
+def slugify(heading: str) -> str:
+    """按 GitHub 规则把标题转换为锚点"""
+    text = _INLINE_CODE_RE.sub(lambda m: m.group(0).strip("`"), heading)
+    text = _SLUG_STRIP_RE.sub("", text.strip().lower())
+    return text.replace(" ", "-")
+
+
+def parse_markdown(text: str) -> tuple[list[list], list[str]]:
+    """
+    解析 Markdown 文本。
+
+    Returns:
+        (links, anchors)，links 为 [行号, 目标] 列表，anchors 为文件内可用锚点
+    """
+    links: list[list] = []
+    anchors: list[str] = []
+    seen_slugs: dict[str, int] = {}
+    in_fence = False
+
+    for lineno, line in enumerate(text.split("\n"), 1):
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+            continue
+        if in_fence:
+            continue
+
+        heading = _HEADING_RE.match(line)
+        if heading:
+            slug = slugify(heading.group(2))
+            count = seen_slugs.get(slug, 0)
+            seen_slugs[slug] = count + 1
+            anchors.append(slug if count == 0 else f"{slug}-{count}")
+
+        anchors.extend(_ANCHOR_TAG_RE.findall(line))
+
+        stripped = _INLINE_CODE_RE.sub("", line)
+        targets = _INLINE_LINK_RE.findall(stripped)
+        ref_def = _REF_DEF_RE.match(stripped)
+        if ref_def:
+            targets.append(ref_def.group(1))
+
+        for target in targets:
+            target = target.strip("<>")
+            if not target or target.startswith("//") or _SCHEME_RE.match(target):
+                continue
+            links.append([lineno, target])
+
+    return links, anchors
+
+
+def _parse_bytes(data: bytes) -> tuple[list[list], list[str]]:
+    """解析文件内容（进程池任务入口）"""
+    return parse_markdown(data.decode("utf-8", errors="replace"))
+
+
+def build_path_index(
+    repo_root: Path, roots: list[str]
+) -> tuple[set[str], list[str]]:
+    """
+    建立路径索引。
+
+    Returns:
+        (所有文件和目录的相对路径集合, Markdown 文件列表)
+    """
+    index: set[str] = set()
+    md_files: list[str] = []
+
+    for root in roots:
+        full_root = repo_root / root
+        if not full_root.is_dir():
+            continue
+        index.add(root)
+        for dirpath, dirnames, filenames in os.walk(full_root):
+            dirnames[:] = [d for d in dirnames if d != ".git"]
+            rel_dir = Path(dirpath).relative_to(repo_root).as_posix()
+            for d in dirnames:
+                index.add(f"{rel_dir}/{d}")
+            for name in filenames:
+                rel = f"{rel_dir}/{name}"
+                index.add(rel)
+                if name.lower().endswith(".md"):
+                    md_files.append(rel)
+
+    md_files.sort()
+    return index, md_files
+
+
+def _load_cache(cache_path: Path) -> dict:
+    """读取解析缓存"""
+    try:
+        with open(cache_path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != CACHE_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def _save_cache(cache_path: Path, files: dict) -> None:
+    """写入解析缓存（先写临时文件再替换）"""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def _owning_root(path: str, roots: list[str]) -> Optional[str]:
+    """找到路径所属的文档根目录"""
+    for root in roots:
+        if path == root or path.startswith(root + "/"):
+            return root
+    return None
+
+
+def _check_file_links(
+    source: str,
+    links: list[list],
+    anchors_by_file: dict[str, set[str]],
+    index: set[str],
+    roots: list[str],
+    repo_root: Path,
+) -> list[BrokenLink]:
+    """校验单个文件中的所有链接"""
+    broken = []
+    source_dir = posixpath.dirname(source)
+
+    for lineno, target in links:
+        path_part, _, fragment = target.partition("#")
+        path_part = unquote(path_part.split("?", 1)[0])
+
+        if not path_part:
+            resolved = source
+        elif path_part.startswith("/"):
+            base = _owning_root(source, roots) or ""
+            resolved = posixpath.normpath(posixpath.join(base, path_part.lstrip("/")))
+        else:
+            resolved = posixpath.normpath(posixpath.join(source_dir, path_part))
+
+        if resolved not in index:
+            inside_index = _owning_root(resolved, roots) is not None
+            if inside_index or not (repo_root / resolved).exists():
+                broken.append(BrokenLink(source, lineno, target, "路径不存在"))
+                continue
+
+        if fragment and resolved in anchors_by_file:
+            if unquote(fragment).lower() not in anchors_by_file[resolved]:
+                broken.append(BrokenLink(source, lineno, target, "锚点不存在"))
+
+    return broken
+
+
+def check_links(
+    repo_root: Path,
+    roots: Optional[list[str]] = None,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    cache_path: Optional[Path] = None,
+) -> LinkCheckResult:
+    """
+    检查文档子模块中的 Markdown 链接。
+
+    Args:
+        repo_root: 仓库根目录
+        roots: 参与索引的目录，默认所有 docs 子模块
+        jobs: 并行解析的进程数，默认 CPU 核数
+        use_cache: 是否使用内容哈希缓存
+        cache_path: 缓存文件路径，默认位于 thera 状态目录
+    """
+    roots = roots if roots is not None else DOCS_ROOTS
+    if cache_path is None:
+        cache_path = get_state_dir(repo_root) / CACHE_FILE
+
+    index, md_files = build_path_index(repo_root, roots)
+    cache = _load_cache(cache_path) if use_cache else {}
+
+    entries: dict[str, dict] = {}
+    pending: list[tuple[str, str, bytes]] = []
+    for rel in md_files:
+        data = (repo_root / rel).read_bytes()
+        digest = hashlib.sha1(data).hexdigest()
+        cached = cache.get(rel)
+        if cached and cached.get("hash") == digest:
+            entries[rel] = cached
+        else:
+            pending.append((rel, digest, data))
+
+    jobs = jobs or os.cpu_count() or 1
+    contents = [data for _, _, data in pending]
+    if jobs > 1 and len(pending) >= PARALLEL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = list(pool.map(_parse_bytes, contents, chunksize=16))
+    else:
+        parsed = [_parse_bytes(data) for data in contents]
+
+    for (rel, digest, _), (links, anchors) in zip(pending, parsed):
+        entries[rel] = {"hash": digest, "links": links, "anchors": anchors}
+
+    if use_cache:
+        _save_cache(cache_path, entries)
+
+    anchors_by_file = {
+        rel: {a.lower() for a in entry["anchors"]} for rel, entry in entries.items()
+    }
+    broken: list[BrokenLink] = []
+    for rel in md_files:
+        broken.extend(
+            _check_file_links(
+                rel, entries[rel]["links"], anchors_by_file, index, roots, repo_root
+            )
+        )
+
+    if broken:
+        message = f"{len(broken)} 个失效链接"
+    else:
+        message = f"{len(md_files)} 个文件"
+
+    return LinkCheckResult(
+        success=not broken,
+        message=message,
+        files_checked=len(md_files),
+        files_parsed=len(pending),
+        broken_links=broken,
+    )
+
+
+def main(args=None):
+    if args is None:
+        parser = argparse.ArgumentParser(description="Markdown 链接检查")
+        parser.add_argument("--repo", default=".", help="仓库根目录")
+        parser.add_argument(
+            "--root", action="append", help="参与检查的目录（可重复，默认所有 docs 子模块）"
+        )
+        parser.add_argument("--jobs", type=int, default=None, help="并行进程数")
+        parser.add_argument("--no-cache", action="store_true", help="不使用解析缓存")
+        args = parser.parse_args()
+
+    repo_root = Path(args.repo).resolve()
+    result = check_links(
+        repo_root,
+        roots=args.root,
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
+    )
+
+    for link in result.broken_links:
+        print(f"[BROKEN] {link.source}:{link.line} {link.target} ({link.reason})")
+
+    symbol = "[OK]" if result.success else "[WARN]"
+    print(
+        f"{symbol} {result.message}"
+        f"（检查 {result.files_checked} 个文件，重新解析 {result.files_parsed} 个）"
+    )
+    return 0 if result.success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
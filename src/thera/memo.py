@@ -0,0 +1,136 @@
+"""
+步骤结果缓存模块
+
+按步骤保存上次成功执行的结果及其输入指纹，指纹不变时跳过该步骤。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from thera.git_ops import get_state_dir
+
+CACHE_FILE = "step_cache.json"
+
+
+def file_digest(path: Path) -> str:
+    """文件内容的 sha1；文件不存在时返回 "missing" """
+    try:
+        return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return "missing"
+
+
+def stat_key(path: Path) -> str:
+    """文件的 (大小, 修改时间, inode)；适合 .git/index 这类大文件，不读内容"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+
+def fingerprint(*parts: str) -> str:
+    """把若干输入组合成一个指纹"""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """命中统计"""
+    hits: int = 0
+    misses: int = 0
+
+
+class StepCache:
+    """
+    步骤结果缓存
+
+    每个步骤只保留最近一次成功的 (指纹, 结果)，结果以 dict 保存为 JSON。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Args:
+            path: 持久化文件；为 None 时只保存在内存
+        """
+        self.path = Path(path) if path is not None else None
+        self.entries: dict[str, dict] = {}
+        self.stats: dict[str, CacheStats] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_repo(cls, repo_root: Path) -> "StepCache":
+        """使用仓库状态目录下的缓存文件"""
+        return cls(get_state_dir(repo_root) / CACHE_FILE)
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self.entries = {k: v for k, v in data.items() if isinstance(v, dict)}
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.entries, ensure_ascii=False))
+        os.replace(tmp, self.path)
+
+    def get(self, step: str, key: str) -> Optional[dict]:
+        """指纹匹配时返回缓存的结果，并记录命中/未命中"""
+        with self._lock:
+            stats = self.stats.setdefault(step, CacheStats())
+            entry = self.entries.get(step)
+            if entry is not None and entry.get("fingerprint") == key:
+                stats.hits += 1
+                return entry.get("result")
+            stats.misses += 1
+            return None
+
+    def put(self, step: str, key: str, result: dict) -> None:
+        """保存步骤结果"""
+        with self._lock:
+            self.entries[step] = {"fingerprint": key, "result": result}
+            self._save()
+
+    def invalidate(self, step: Optional[str] = None) -> None:
+        """清除某个步骤（或全部步骤）的缓存"""
+        with self._lock:
+            if step is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(step, None)
+            self._save()
+
+    @property
+    def hits(self) -> int:
+        return sum(s.hits for s in self.stats.values())
+
+    @property
+    def misses(self) -> int:
+        return sum(s.misses for s in self.stats.values())
+
+    def summary(self) -> dict:
+        """命中统计汇总"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "steps": {
+                step: {"hits": s.hits, "misses": s.misses} for step, s in self.stats.items()
+            },
+        }
@@ -0,0 +1,260 @@
+"""
+指标模块
+
+进程内指标注册表（计数器 + 直方图），运行结束时以 OpenMetrics 文本格式
+写入 THERA_METRICS_PATH 指定的文件，供 node-exporter textfile collector 采集。
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+METRICS_ENV = "THERA_METRICS_PATH"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """增加计数"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """读取当前值"""
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """直方图"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., +Inf 计数, 总和]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        """记录一次观测"""
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            slots = self._values.get(key)
+            if slots is None:
+                slots = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            slots[index] += 1
+            slots[-1] += value
+
+    def count(self, **labels) -> int:
+        """观测次数"""
+        slots = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return sum(slots[:-1]) if slots else 0
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(slots)) for key, slots in self._values.items())
+        for key, slots in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), slots[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(slots[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help: str, labelnames: tuple[str, ...], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != labelnames:
+                raise ValueError(f"指标 {name} 已以不同类型或标签注册")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        """获取或注册计数器"""
+        return self._register(Counter, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """获取或注册直方图"""
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """输出 OpenMetrics 文本"""
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> Path:
+        """原子写入文本文件（先写临时文件再重命名，采集端不会读到半个文件）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+        return path
+
+
+REGISTRY = MetricsRegistry()
+
+TRANSITIONS = REGISTRY.counter(
+    "thera_fsm_transitions", "状态机转移次数", ("from_state", "event", "to_state")
+)
+ERRORS = REGISTRY.counter("thera_fsm_errors", "进入错误状态的次数", ("error",))
+GIT_DURATION = REGISTRY.histogram(
+    "thera_git_command_duration_seconds", "git 命令耗时", ("subcommand",)
+)
+GIT_FAILURES = REGISTRY.counter(
+    "thera_git_command_failures", "返回码非零的 git 命令次数", ("subcommand",)
+)
+SUBMODULE_DURATION = REGISTRY.histogram(
+    "thera_submodule_operation_duration_seconds",
+    "子模块 fetch / sync 耗时",
+    ("submodule", "operation"),
+)
+SUBMODULE_BYTES = REGISTRY.counter(
+    "thera_submodule_fetch_bytes", "子模块 fetch 新增的对象字节数", ("submodule",)
+)
+GIT_BACKEND_QUERIES = REGISTRY.counter(
+    "thera_git_backend_queries", "只读 git 查询按应答后端计数", ("backend", "operation")
+)
+DIRTY_CHECKS = REGISTRY.counter(
+    "thera_dirty_checks", "仓库脏检查按应答方式计数（index: 进程内，git: 回退到 git status）", ("method",)
+)
+REFRESH_RUNS = REGISTRY.counter("thera_refresh_runs", "refresh 运行结果", ("outcome",))
+REFRESH_DURATION = REGISTRY.histogram("thera_refresh_duration_seconds", "refresh 耗时")
+LEASE_RUNS = REGISTRY.counter(
+    "thera_lease_runs",
+    "租约内的运行按获得方式计数（run: 直接执行，queued: 排队后执行，coalesced: 复用相同运行的结果）",
+    ("operation", "outcome"),
+)
+LEASE_RECLAIMS = REGISTRY.counter("thera_lease_reclaims", "回收的失效租约", ("operation",))
+
+
+def enabled() -> bool:
+    """是否配置了指标输出文件"""
+    return bool(os.environ.get(METRICS_ENV))
+
+
+def write_textfile(path: Optional[Path] = None) -> Optional[Path]:
+    """写出全局注册表；未指定路径且未设置 THERA_METRICS_PATH 时不写"""
+    target = path or os.environ.get(METRICS_ENV)
+    if not target:
+        return None
+    return REGISTRY.write(Path(target))
+
+
+def git_subcommand(args: list[str]) -> str:
+    """从 git 参数中取出子命令（跳过 -C <path>、-c <k=v> 等全局选项）"""
+    i = 1 if args and args[0] == "git" else 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("-C", "-c"):
+            i += 2
+        elif arg.startswith("-"):
+            i += 1
+        else:
+            return arg
+    return "unknown"
+
+
+def observe_git(args: list[str], seconds: float, returncode: int = 0) -> None:
+    """记录一次 git 命令"""
+    subcommand = git_subcommand(args)
+    GIT_DURATION.observe(seconds, subcommand=subcommand)
+    if returncode != 0:
+        GIT_FAILURES.inc(subcommand=subcommand)
+
+
+@contextmanager
+def time_submodule(submodule: str, operation: str) -> Iterator[None]:
+    """记录子模块操作耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SUBMODULE_DURATION.observe(
+            time.perf_counter() - start, submodule=submodule, operation=operation
+        )
+
+
+def observe_transition(old_state, event, new_state, timestamp) -> None:
+    """StateMachine 转移监听器"""
+    from thera.fsm import ErrorState
+
+    TRANSITIONS.inc(from_state=old_state.name, event=event.name, to_state=new_state.name)
+    if isinstance(new_state, ErrorState):
+        ERRORS.inc(error=new_state.name)
@@ -0,0 +1,226 @@
+"""
+流水线模块
+
+在一个进程内依次执行多个阶段（doc-check、submodule-sync、refresh、auto-commit），
+各阶段共享同一个 RepoSession：GitOps 实例、事实源注册表和子模块快照只构建一次，
+不再由每个工具各自重新扫描仓库。
+"""
+
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Callable, Optional
+
+from thera import metrics, tracing
+from thera.git_ops import GitOps, SubmoduleInfo
+
+DEFAULT_CONFIG = "meta/profile/submodules.yaml"
+
+
+class RepoSession:
+    """
+    一次运行内共享的仓库视图
+
+    registry / gitmodules / submodules 在首次访问时构建并缓存；
+    阶段改变了子模块（同步、提交）后调用 invalidate() 丢弃子模块快照。
+    """
+
+    def __init__(self, repo_root: Path, config_path: str = DEFAULT_CONFIG):
+        self.repo_root = repo_root
+        self.config_path = config_path
+        self.git_ops = GitOps(repo_root)
+
+    @cached_property
+    def registry(self) -> Optional[list[dict]]:
+        """YAML 事实源中的子模块注册表；文件不存在时为 None"""
+        from thera.doc_check import load_yaml_registry
+
+        return load_yaml_registry(self.config_path, self.repo_root)
+
+    @cached_property
+    def gitmodules(self) -> Optional[dict[str, str]]:
+        """.gitmodules 中的 {子模块名: 路径}；文件不存在时为 None"""
+        from thera.doc_check import parse_gitmodules
+
+        return parse_gitmodules(self.repo_root)
+
+    @cached_property
+    def submodules(self) -> list[SubmoduleInfo]:
+        """git submodule status 快照"""
+        return self.git_ops.get_submodule_status()
+
+    @property
+    def submodule_paths(self) -> list[str]:
+        return [info.path for info in self.submodules]
+
+    def invalidate(self) -> None:
+        """丢弃子模块快照，下次访问时重新获取"""
+        self.__dict__.pop("submodules", None)
+
+
+@dataclass
+class RunOptions:
+    """各阶段共用的选项"""
+    dry_run: bool = False
+    yes: bool = False  # auto-commit 不再交互确认
+    links: bool = False  # doc-check 同时检查 Markdown 链接
+
+
+@dataclass
+class StageResult:
+    """单个阶段的结果"""
+    name: str
+    success: bool
+    message: str
+    duration: float = 0.0
+
+
+@dataclass
+class PipelineResult:
+    """流水线结果"""
+    stages: list[StageResult] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+
+    @property
+    def success(self) -> bool:
+        return all(stage.success for stage in self.stages)
+
+
+def run_doc_check(session: RepoSession, options: RunOptions) -> StageResult:
+    """一致性检查，复用会话中已解析的注册表和 .gitmodules"""
+    from thera.doc_check import build_checks, run_checks
+
+    checks = build_checks(
+        session.repo_root,
+        session.config_path,
+        links=options.links,
+        yaml_modules=session.registry,
+        git_modules=session.gitmodules,
+    )
+    failed = [name for name, ok, _ in run_checks(checks) if not ok]
+    if failed:
+        return StageResult("doc-check", False, f"未通过: {', '.join(failed)}")
+    return StageResult("doc-check", True, "所有检查通过")
+
+
+def run_submodule_check(session: RepoSession, options: RunOptions) -> StageResult:
+    """检测子模块远程更新（submodule-sync --check），复用会话的子模块快照"""
+    from thera.submodule_sync import collect_ahead_behind, format_check_table
+
+    submodules = [
+        {"path": info.path, "local": info.local_commit, "has_update": info.is_behind}
+        for info in session.submodules
+    ]
+    collect_ahead_behind(submodules, session.repo_root)
+    if submodules:
+        print(format_check_table(submodules))
+    behind = [s["path"] for s in submodules if s["has_update"] or (s.get("behind") or 0) > 0]
+    if behind:
+        return StageResult("submodule-sync", True, f"{len(behind)} 个子模块有更新")
+    return StageResult("submodule-sync", True, "所有子模块已是最新")
+
+
+def run_refresh(session: RepoSession, options: RunOptions) -> StageResult:
+    """同步子模块并提交推送主仓库，复用会话的子模块列表"""
+    from thera.refresh import refresh
+
+    result = refresh(
+        session.repo_root,
+        dry_run=options.dry_run,
+        ops=session.git_ops,
+        submodules=session.submodules,
+    )
+    for path in result.updated_submodules:
+        print(f"✓ {path}: 已更新")
+    if not options.dry_run:
+        session.invalidate()
+    message = result.message
+    if result.commit_sha:
+        message += f" ({result.commit_sha})"
+    if result.error:
+        message += f": {result.error}"
+    return StageResult("refresh", result.success, message)
+
+
+def run_auto_commit(session: RepoSession, options: RunOptions) -> StageResult:
+    """提交推送子模块和主仓库的变更，复用会话的子模块路径"""
+    from thera import auto_commit
+    from thera.lease import LeaseTimeout
+
+    all_changes = auto_commit.detect_all_changes(
+        session.repo_root, submodules=session.submodule_paths
+    )
+    if not auto_commit.display_changes(all_changes):
+        return StageResult("auto-commit", True, "无变更")
+    if options.dry_run:
+        print("\nDry run - no changes made.")
+        return StageResult("auto-commit", True, f"预览: {len(all_changes)} 个仓库有变更")
+    if not options.yes and not auto_commit.confirm_commit(all_changes):
+        return StageResult("auto-commit", True, "未提交")
+
+    try:
+        results = auto_commit.commit_exclusive(session.repo_root, all_changes)
+    except LeaseTimeout as e:
+        return StageResult("auto-commit", False, str(e))
+    session.invalidate()
+    failed = [repo for success, repo, _ in results if not success]
+    if failed:
+        return StageResult("auto-commit", False, f"{len(failed)} 个仓库提交推送失败: {', '.join(failed)}")
+    return StageResult("auto-commit", True, f"已提交推送 {len(results)} 个仓库")
+
+
+STAGES: dict[str, Callable[[RepoSession, RunOptions], StageResult]] = {
+    "doc-check": run_doc_check,
+    "submodule-sync": run_submodule_check,
+    "refresh": run_refresh,
+    "auto-commit": run_auto_commit,
+}
+
+
+def parse_stages(spec: str) -> list[str]:
+    """
+    解析逗号分隔的阶段列表
+
+    Raises:
+        ValueError: 阶段为空或不存在
+    """
+    stages = [name.strip() for name in spec.split(",") if name.strip()]
+    if not stages:
+        raise ValueError("未指定阶段")
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"未知阶段: {', '.join(unknown)}（可选: {', '.join(STAGES)}）")
+    return stages
+
+
+def run_pipeline(
+    session: RepoSession,
+    stages: list[str],
+    options: Optional[RunOptions] = None,
+    keep_going: bool = False,
+) -> PipelineResult:
+    """
+    依次执行各阶段；某个阶段失败后跳过其余阶段（keep_going 为 True 时继续）。
+
+    设置了 THERA_METRICS_PATH / THERA_TRACE 时，结束后写出指标和追踪文件。
+    """
+    options = options or RunOptions()
+    result = PipelineResult()
+    try:
+        with tracing.span("pipeline", stages=stages):
+            for i, name in enumerate(stages):
+                print(f"==> {name}")
+                start = time.perf_counter()
+                with tracing.span(f"stage.{name}"):
+                    stage = STAGES[name](session, options)
+                stage.duration = time.perf_counter() - start
+                result.stages.append(stage)
+                print()
+                if not stage.success and not keep_going:
+                    result.skipped = stages[i + 1:]
+                    break
+    finally:
+        metrics.write_textfile()
+        tracing.export()
+    return result
@@ -5,12 +5,15 @@ Refresh 命令
 """
 
 import subprocess
-from dataclasses import dataclass, field
+import time
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from subprocess import TimeoutExpired
-from typing import Optional
+from typing import Callable, Optional
 
+from thera import metrics, tracing
 from thera.git_ops import GitOps, SubmoduleInfo
+from thera.lease import LeaseTimeout, run_exclusive
 
 
 @dataclass
@@ -81,8 +84,34 @@ def _get_submodule_paths(submodule: str) -> list[str]:
     return []
 
 
+def _target_paths(
+    submodule: Optional[str], submodules: Optional[list[SubmoduleInfo]] = None
+) -> list[str]:
+    """
+    本次 refresh 处理的子模块路径
+
+    传入 submodules（调用方已有的 git submodule status 结果）时以它为准，不再使用内置列表。
+    """
+    if submodules is None:
+        return _get_submodule_paths(submodule) if submodule else SUBMODULE_PATHS
+    paths = [info.path for info in submodules]
+    if submodule:
+        paths = [
+            path for path in paths
+            if path == SUBMODULE_NAMES.get(submodule)
+            or path == submodule
+            or path.endswith(f"/{submodule}")
+        ]
+    return paths
+
+
 def refresh(
-    repo_root: Path, dry_run: bool = False, submodule: str = None
+    repo_root: Path,
+    dry_run: bool = False,
+    submodule: str = None,
+    ops: Optional[GitOps] = None,
+    submodules: Optional[list[SubmoduleInfo]] = None,
+    log: Optional[Callable[[str], None]] = None,
 ) -> RefreshResult:
     """
     同步子模块并提交推送主仓库。
@@ -98,8 +127,57 @@ def refresh(
         repo_root: 仓库根目录
         dry_run: 预览模式，不执行实际变更
         submodule: 指定子模块名（如 journal, archive）。不指定则同步所有
+        ops: 复用的 GitOps 实例（thera run 中各阶段共享）
+        submodules: 复用的子模块列表（thera run 会话的 git submodule status 快照）
+        log: 接收等待租约时的提示（命令行传 print）
+
+    运行期间持有仓库租约；参数相同的 refresh 正在运行时等待并返回它的结果。
     """
-    dirty_submodules = _get_dirty_submodules(repo_root)
+    start = time.perf_counter()
+    with tracing.span("refresh", dry_run=dry_run, submodule=submodule):
+        try:
+            result = run_exclusive(
+                repo_root,
+                "refresh",
+                lambda: _refresh(
+                    repo_root, dry_run=dry_run, submodule=submodule, ops=ops, submodules=submodules
+                ),
+                params={"dry_run": dry_run, "submodule": submodule},
+                dump=asdict,
+                load=lambda data: RefreshResult(**data),
+                log=log,
+            )
+        except LeaseTimeout as e:
+            result = RefreshResult(success=False, message="等待其他运行结束超时", error=str(e))
+
+    metrics.REFRESH_DURATION.observe(time.perf_counter() - start)
+    if result.dry_run:
+        outcome = "dry_run"
+    else:
+        outcome = "ok" if result.success else "fail"
+    metrics.REFRESH_RUNS.inc(outcome=outcome)
+    metrics.write_textfile()
+    tracing.export()
+    return result
+
+
+def _refresh(
+    repo_root: Path,
+    dry_run: bool,
+    submodule: Optional[str],
+    ops: Optional[GitOps] = None,
+    submodules: Optional[list[SubmoduleInfo]] = None,
+) -> RefreshResult:
+    """refresh 的主体流程"""
+    if ops is None:
+        ops = GitOps(repo_root)
+    paths = _target_paths(submodule, submodules)
+
+    with tracing.span("refresh.dirty_check"):
+        # 脏检查覆盖所有子模块，不受 submodule 限制
+        dirty_submodules = _get_dirty_submodules(
+            repo_root, None if submodules is None else _target_paths(None, submodules)
+        )
     if dirty_submodules:
         return RefreshResult(
             success=False,
@@ -107,21 +185,25 @@ def refresh(
             error=f"请先在子模块中提交: {', '.join(dirty_submodules)}",
         )
 
-    _fetch_submodules(repo_root, submodule=submodule)
+    with tracing.span("refresh.fetch"):
+        _fetch_submodules(repo_root, submodule=submodule, paths=paths)
 
     updated_submodules = []
-    submodule_status = _get_submodules_behind_remote(repo_root, submodule=submodule)
+    with tracing.span("refresh.behind_check"):
+        submodule_status = _get_submodules_behind_remote(
+            repo_root, submodule=submodule, paths=paths
+        )
 
     for sm in submodule_status:
         if dry_run:
             updated_submodules.append(sm.path)
         else:
-            ops = GitOps(repo_root)
-            result = ops.sync_submodules([sm.path])
+            with tracing.span("refresh.sync", submodule=sm.path), \
+                    metrics.time_submodule(sm.path, "sync"):
+                result = ops.sync_submodules([sm.path])
             if result.success:
                 updated_submodules.append(sm.path)
 
-    ops = GitOps(repo_root)
     status = ops.get_status()
 
     if not status.is_clean:
@@ -134,7 +216,8 @@ def refresh(
             )
 
         commit_message = "chore(submodule): sync submodules"
-        result = ops.commit_and_push(commit_message)
+        with tracing.span("refresh.commit"):
+            result = ops.commit_and_push(commit_message)
 
         if result.success:
             return RefreshResult(
@@ -172,26 +255,69 @@ def refresh(
     )
 
 
-def _fetch_submodules(repo_root: Path, submodule: str = None) -> None:
-    """Fetch 子模块的远程"""
-    paths = _get_submodule_paths(submodule) if submodule else SUBMODULE_PATHS
+def _run_git(cmd: list[str], **kwargs) -> subprocess.CompletedProcess:
+    """执行 git 命令并记录耗时"""
+    start = time.perf_counter()
+    try:
+        with tracing.span(f"git {metrics.git_subcommand(cmd)}", args=cmd):
+            result = subprocess.run(cmd, **kwargs)
+    except TimeoutExpired:
+        metrics.observe_git(cmd, time.perf_counter() - start, -1)
+        raise
+    metrics.observe_git(cmd, time.perf_counter() - start, result.returncode)
+    return result
+
+
+def _fetch_submodules(
+    repo_root: Path, submodule: str = None, paths: Optional[list[str]] = None
+) -> None:
+    """Fetch 子模块的远程（指定 paths 时只处理这些路径）"""
+    if paths is None:
+        paths = _target_paths(submodule)
 
     for path in paths:
         full_path = repo_root / path
         if not full_path.exists():
             continue
+        track_bytes = metrics.enabled()
+        before = _object_bytes(full_path) if track_bytes else 0
         try:
-            subprocess.run(
-                ["git", "-C", str(full_path), "fetch", "origin"],
-                capture_output=True,
-                timeout=10,
-            )
+            with tracing.span("refresh.fetch_submodule", submodule=path), \
+                    metrics.time_submodule(path, "fetch"):
+                _run_git(
+                    ["git", "-C", str(full_path), "fetch", "origin"],
+                    capture_output=True,
+                    timeout=10,
+                )
         except TimeoutExpired:
             pass
+        if track_bytes:
+            metrics.SUBMODULE_BYTES.inc(
+                max(0, _object_bytes(full_path) - before), submodule=path
+            )
+
+
+def _object_bytes(path: Path) -> int:
+    """子模块对象库大小（字节），来自 git count-objects -v"""
+    try:
+        result = _run_git(
+            ["git", "-C", str(path), "count-objects", "-v"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except TimeoutExpired:
+        return 0
+    kib = 0
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition(":")
+        if key in ("size", "size-pack") and value.strip().isdigit():
+            kib += int(value)
+    return kib * 1024
 
 
 def _get_submodules_behind_remote(
-    repo_root: Path, submodule: str = None
+    repo_root: Path, submodule: str = None, paths: Optional[list[str]] = None
 ) -> list[SubmoduleInfo]:
     """
     获取落后于远程的子模块列表。
@@ -200,8 +326,10 @@ def _get_submodules_behind_remote(
 
     Args:
         submodule: 指定子模块名（如 journal）
+        paths: 要检查的子模块路径；为 None 时按 submodule 从内置列表中选取
     """
-    paths = _get_submodule_paths(submodule) if submodule else SUBMODULE_PATHS
+    if paths is None:
+        paths = _target_paths(submodule)
     behind = []
 
     for path in paths:
@@ -210,7 +338,7 @@ def _get_submodules_behind_remote(
             continue
 
         try:
-            result = subprocess.run(
+            result = _run_git(
                 ["git", "-C", str(full_path), "rev-parse", "HEAD"],
                 capture_output=True,
                 text=True,
@@ -218,7 +346,7 @@ def _get_submodules_behind_remote(
             )
             local_head = result.stdout.strip()
 
-            result = subprocess.run(
+            result = _run_git(
                 ["git", "-C", str(full_path), "rev-parse", "origin/main"],
                 capture_output=True,
                 text=True,
@@ -243,33 +371,28 @@ def _get_submodules_behind_remote(
     return behind
 
 
-def _get_dirty_submodules(repo_root: Path) -> list[str]:
+def _get_dirty_submodules(repo_root: Path, paths: Optional[list[str]] = None) -> list[str]:
     """
-    检查所有子模块是否有内部未提交的变更。
+    检查所有子模块是否有内部未提交的变更（含未跟踪文件）。
+
+    在同一进程中读取各子模块的索引比较 stat，只有无法确定时才启动 git status。
+
+    Args:
+        paths: 要检查的子模块路径；为 None 时使用内置列表
 
     Returns:
         有脏状态的子模块路径列表
     """
-    dirty = []
-
-    for path in SUBMODULE_PATHS:
-        full_path = repo_root / path
-        if not full_path.exists():
-            continue
+    if paths is None:
+        paths = SUBMODULE_PATHS
+    paths = [path for path in paths if (repo_root / path).exists()]
+    if not paths:
+        return []
 
-        try:
-            result = subprocess.run(
-                ["git", "-C", str(full_path), "status", "--porcelain"],
-                capture_output=True,
-                text=True,
-                timeout=10,
-            )
-            if result.stdout.strip():
-                dirty.append(path)
-        except TimeoutExpired:
-            pass
+    from thera.index_stat import check_repos
 
-    return dirty
+    results = check_repos(repo_root, paths, untracked=True)
+    return [path for path, result in results.items() if result.dirty]
 
 
 def get_submodule_updates(repo_root: Path) -> list[SubmoduleInfo]:
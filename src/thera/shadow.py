@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+影子验证
+
+对同一仓库快照并发运行旧引擎（doc_check / submodule_sync / auto_commit 脚本）和
+新引擎（GitOps），比较结构化结果而不是输出文本，并对比两者耗时：
+行为不一致和新引擎性能回退在同一次运行中发现。仅报告，不修改仓库。
+
+用法: python -m thera.shadow [--repo .] [--runs 3] [--max-slowdown 1.5] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from thera.git_ops import ConsistencyResult, GitOps
+
+DEFAULT_CONFIG = "meta/profile/submodules.yaml"
+DEFAULT_RUNS = 3
+DEFAULT_MAX_SLOWDOWN = 1.5
+MIN_REGRESSION_MS = 5.0  # 差值低于此值视为噪声，不判定为回退
+
+
+def old_doc_check(repo_root: Path, config_path: str) -> ConsistencyResult:
+    """旧引擎: doc_check 的两项检查，折算为 ConsistencyResult"""
+    from thera.doc_check import check_gitmodules_vs_yaml, check_yaml_paths
+
+    registry_ok, registry_details = check_gitmodules_vs_yaml(repo_root, config_path)
+    paths_ok, paths_details = check_yaml_paths(repo_root, config_path)
+    ok = registry_ok and paths_ok
+    return ConsistencyResult(
+        success=ok,
+        is_consistent=ok,
+        message=registry_details if not registry_ok else paths_details,
+    )
+
+
+def new_doc_check(repo_root: Path, config_path: str) -> ConsistencyResult:
+    """新引擎: GitOps.check_consistency"""
+    return GitOps(repo_root).check_consistency(Path(config_path))
+
+
+def old_submodules(repo_root: Path, config_path: str) -> list[dict]:
+    """旧引擎: submodule_sync.get_submodule_status"""
+    from thera.submodule_sync import get_submodule_status
+
+    return get_submodule_status(repo_root)
+
+
+def new_submodules(repo_root: Path, config_path: str) -> list[dict]:
+    """新引擎: GitOps.get_submodule_status，转换为旧引擎的字段"""
+    return [
+        {"path": info.path, "local": info.local_commit, "has_update": info.is_behind}
+        for info in GitOps(repo_root).get_submodule_status()
+    ]
+
+
+def old_changes(repo_root: Path, config_path: str) -> dict[str, list[dict]]:
+    """旧引擎: auto_commit.detect_all_changes"""
+    from thera.auto_commit import detect_all_changes
+
+    return detect_all_changes(repo_root)
+
+
+def new_changes(repo_root: Path, config_path: str) -> dict[str, list[dict]]:
+    """新引擎: 每个仓库一个 GitOps.get_status，结构与 detect_all_changes 相同"""
+    all_changes = {}
+    paths = [info.path for info in GitOps(repo_root).get_submodule_status()]
+    for path in paths + ["."]:
+        status = GitOps(repo_root / path).get_status()
+        if status.changes:
+            all_changes[path] = [
+                {"path": c.path, "type": c.type_prefix} for c in status.changes
+            ]
+    return all_changes
+
+
+def _consistency_key(result: ConsistencyResult) -> dict:
+    # message 的措辞两个引擎本就不同，只比较判定结果
+    return {"success": result.success, "is_consistent": result.is_consistent}
+
+
+def _submodules_key(submodules: list[dict]) -> list:
+    return sorted((s["path"], s["local"], s["has_update"]) for s in submodules)
+
+
+def _changes_key(all_changes: dict[str, list[dict]]) -> dict:
+    # 旧引擎保留 porcelain 状态码，新引擎归类为 ChangeType，只比较路径和类型前缀
+    return {
+        repo: sorted((c["path"], c["type"]) for c in changes)
+        for repo, changes in sorted(all_changes.items())
+    }
+
+
+Engine = Callable[[Path, str], Any]
+
+# 命令 -> (旧引擎, 新引擎, 结构化比较键)
+COMMANDS: dict[str, tuple[Engine, Engine, Callable[[Any], Any]]] = {
+    "doc-check": (old_doc_check, new_doc_check, _consistency_key),
+    "submodule-sync": (old_submodules, new_submodules, _submodules_key),
+    "auto-commit": (old_changes, new_changes, _changes_key),
+}
+
+
+@dataclass
+class ShadowComparison:
+    """单个命令的比较结果"""
+    command: str
+    match: bool
+    old: Any
+    new: Any
+    old_ms: float
+    new_ms: float
+    stable: bool = True  # 运行期间仓库快照未变化
+    error: Optional[str] = None
+
+    @property
+    def slowdown(self) -> float:
+        """新引擎耗时 / 旧引擎耗时"""
+        return self.new_ms / self.old_ms if self.old_ms > 0 else 1.0
+
+    def regressed(self, max_slowdown: float) -> bool:
+        return self.slowdown > max_slowdown and self.new_ms - self.old_ms > MIN_REGRESSION_MS
+
+
+@dataclass
+class ShadowReport:
+    """影子验证报告"""
+    repo: str
+    max_slowdown: float
+    comparisons: list[ShadowComparison] = field(default_factory=list)
+
+    @property
+    def mismatches(self) -> list[str]:
+        return [c.command for c in self.comparisons if not c.match]
+
+    @property
+    def regressions(self) -> list[str]:
+        return [c.command for c in self.comparisons if c.regressed(self.max_slowdown)]
+
+    @property
+    def success(self) -> bool:
+        return not self.mismatches and not self.regressions
+
+
+def _timed(func: Engine, repo_root: Path, config_path: str) -> tuple[Any, float]:
+    start = time.perf_counter()
+    value = func(repo_root, config_path)
+    return value, (time.perf_counter() - start) * 1000
+
+
+def _snapshot(repo_root: Path) -> tuple[str, ...]:
+    """
+    仓库快照：HEAD、工作区状态和子模块指针。
+
+    用 git 的输出而不是文件 stat：两个引擎的 git status 都会刷新 .git/index，
+    stat 指纹会把引擎自身的副作用误判为快照变化。
+    """
+    ops = GitOps(repo_root)
+    return tuple(
+        ops.run_git(args)[0]
+        for args in (["rev-parse", "HEAD"], ["status", "--porcelain"], ["submodule", "status"])
+    )
+
+
+def compare(
+    command: str,
+    repo_root: Path,
+    config_path: str = DEFAULT_CONFIG,
+    runs: int = DEFAULT_RUNS,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> ShadowComparison:
+    """
+    并发运行新旧引擎 runs 次，比较最后一次的结构化结果，耗时取中位数。
+
+    引擎抛出异常时记为不一致；运行前后快照（HEAD、git status、子模块指针）不同时 stable 为 False（结果可能受并发修改影响）。
+    """
+    old_engine, new_engine, key = COMMANDS[command]
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=2)
+    old_times, new_times = [], []
+    try:
+        before = _snapshot(repo_root)
+        for _ in range(max(1, runs)):
+            old_future = executor.submit(_timed, old_engine, repo_root, config_path)
+            new_future = executor.submit(_timed, new_engine, repo_root, config_path)
+            old_value, old_ms = old_future.result()
+            new_value, new_ms = new_future.result()
+            old_times.append(old_ms)
+            new_times.append(new_ms)
+        stable = _snapshot(repo_root) == before
+    except Exception as e:
+        return ShadowComparison(
+            command, False, None, None,
+            statistics.median(old_times) if old_times else 0.0,
+            statistics.median(new_times) if new_times else 0.0,
+            error=f"{type(e).__name__}: {e}",
+        )
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    old_key, new_key = key(old_value), key(new_value)
+    return ShadowComparison(
+        command=command,
+        match=old_key == new_key,
+        old=old_key,
+        new=new_key,
+        old_ms=statistics.median(old_times),
+        new_ms=statistics.median(new_times),
+        stable=stable,
+    )
+
+
+def run_shadow(
+    repo_root: Path,
+    config_path: str = DEFAULT_CONFIG,
+    commands: Optional[list[str]] = None,
+    runs: int = DEFAULT_RUNS,
+    max_slowdown: float = DEFAULT_MAX_SLOWDOWN,
+) -> ShadowReport:
+    """依次比较各命令（每个命令内新旧引擎并发执行）"""
+    report = ShadowReport(str(repo_root), max_slowdown)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for command in commands or list(COMMANDS):
+            report.comparisons.append(
+                compare(command, repo_root, config_path, runs=runs, executor=executor)
+            )
+    return report
+
+
+def format_report(report: ShadowReport) -> str:
+    """文本报告：每个命令一行行为与耗时对比，不一致时列出两侧结果"""
+    lines = [
+        f"{'命令':16s} {'结果':8s} {'旧(ms)':>9s} {'新(ms)':>9s} {'比值':>6s}",
+    ]
+    for c in report.comparisons:
+        status = "✓ 一致" if c.match else "✗ 不一致"
+        if c.regressed(report.max_slowdown):
+            status += " / 性能回退"
+        if not c.stable:
+            status += " / 快照已变化"
+        lines.append(
+            f"{c.command:16s} {status:8s} {c.old_ms:9.1f} {c.new_ms:9.1f} {c.slowdown:5.2f}x"
+        )
+        if c.error:
+            lines.append(f"  Error: {c.error}")
+        elif not c.match:
+            lines.append(f"  旧: {c.old}")
+            lines.append(f"  新: {c.new}")
+    lines.append("")
+    if report.success:
+        lines.append("✓ 所有验证通过，可以进入下一阶段")
+    else:
+        lines.append("✗ 存在不一致或性能回退，请人工确认后继续")
+    return "\n".join(lines)
+
+
+def main(args=None):
+    if args is None:
+        parser = argparse.ArgumentParser(description="影子验证：对比新旧引擎的结果与耗时")
+        parser.add_argument("--repo", default=".", help="仓库根目录")
+        parser.add_argument("--config", default=DEFAULT_CONFIG, help="YAML 配置文件路径")
+        parser.add_argument(
+            "--commands", default=",".join(COMMANDS), help="逗号分隔的命令（默认全部）"
+        )
+        parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="每个命令运行次数（耗时取中位数）")
+        parser.add_argument(
+            "--max-slowdown", type=float, default=DEFAULT_MAX_SLOWDOWN,
+            help="新引擎耗时超过旧引擎的倍数视为性能回退",
+        )
+        parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+        args = parser.parse_args()
+
+    commands = [c.strip() for c in args.commands.split(",") if c.strip()]
+    unknown = [c for c in commands if c not in COMMANDS]
+    if unknown:
+        print(f"未知命令: {', '.join(unknown)}（可选: {', '.join(COMMANDS)}）", file=sys.stderr)
+        return 2
+
+    report = run_shadow(
+        Path(args.repo).resolve(),
+        args.config,
+        commands=commands,
+        runs=args.runs,
+        max_slowdown=args.max_slowdown,
+    )
+    if getattr(args, "json", False):
+        data = asdict(report)
+        data["mismatches"] = report.mismatches
+        data["regressions"] = report.regressions
+        print(json.dumps(data, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+    return 0 if report.success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
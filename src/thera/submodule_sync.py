@@ -6,21 +6,47 @@
 """
 
 import argparse
+import io
+import json
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from thera import metrics, tracing
+
+DEFAULT_JOBS = 8
+SORT_KEYS = ("path", "ahead", "behind")
+
+# submodule update 会写主仓库的 .git/config 和 .git/modules，并发执行时争抢同一把锁
+_UPDATE_LOCK = threading.Lock()
+
 
 def run_git(args: list[str], repo_root, capture: bool = True) -> str | bool:
     """运行 git 命令"""
     cmd = ["git", "-C", str(repo_root)] + args
-    result = subprocess.run(cmd, capture_output=capture, text=True)
+    start = time.perf_counter()
+    with tracing.span(f"git {metrics.git_subcommand(args)}", args=cmd):
+        result = subprocess.run(cmd, capture_output=capture, text=True)
+    metrics.observe_git(args, time.perf_counter() - start, result.returncode)
     if capture:
         return result.stdout if result.stdout else ""
     else:
         return result.returncode == 0
 
 
+def run_git_output(args: list[str], repo_root) -> tuple[bool, str]:
+    """运行 git 命令，返回 (是否成功, 合并后的 stdout/stderr)"""
+    cmd = ["git", "-C", str(repo_root)] + args
+    start = time.perf_counter()
+    with tracing.span(f"git {metrics.git_subcommand(args)}", args=cmd):
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    metrics.observe_git(args, time.perf_counter() - start, result.returncode)
+    return result.returncode == 0, (result.stdout or "") + (result.stderr or "")
+
+
 def get_submodule_status(repo_root):
     """获取子模块状态"""
     output = run_git(["submodule", "status"], repo_root, True)  # type: ignore
@@ -43,17 +69,214 @@ def get_submodule_status(repo_root):
     return submodules
 
 
-def sync_submodule(path, repo_root, verbose=False):
-    """同步指定子模块"""
-    print(f"同步 {path}...")
-    success = run_git(["submodule", "update", "--remote", "--merge", path], repo_root, capture=False)
+def write_commit_graph(sub_root):
+    """增量写入 commit-graph（split 模式只追加新提交），加速祖先计数"""
+    return run_git(
+        ["commit-graph", "write", "--reachable", "--split", "--no-progress"], sub_root
+    )
+
+
+def _configured_branch(repo_root, path):
+    """
+    submodule.<name>.branch，取法与 git submodule update --remote 相同
+
+    主仓库 .git/config 中的设置优先于 .gitmodules；"." 表示与主仓库当前分支同名。
+    未设置时返回 None。
+    """
+    # -z：子模块名可以包含空格
+    output = run_git(
+        ["config", "-z", "-f", ".gitmodules", "--get-regexp", r"^submodule\..*\.path$"], repo_root
+    )
+    name = None
+    for record in str(output).split("\0"):
+        key, _, value = record.partition("\n")
+        if value == path:
+            name = key[len("submodule."):-len(".path")]
+    if name is None:
+        return None
+
+    key = f"submodule.{name}.branch"
+    branch = (
+        str(run_git(["config", key], repo_root)).strip()
+        or str(run_git(["config", "-f", ".gitmodules", key], repo_root)).strip()
+    )
+    if branch == ".":
+        branch = str(run_git(["symbolic-ref", "--short", "-q", "HEAD"], repo_root)).strip()
+    return branch or None
+
+
+def _resolve_upstream(sub_root, repo_root=None, path=None):
+    """
+    获取子模块比较的远程分支
+
+    .gitmodules 设置了 submodule.<name>.branch 时为 origin/<branch>（git submodule update --remote
+    合并的分支）；否则为跟踪分支，分离头指针时退回 origin/HEAD 或 origin/main。
+    """
+    if repo_root is not None and path is not None:
+        branch = _configured_branch(repo_root, path)
+        if branch and run_git(
+            ["rev-parse", "--verify", "--quiet", f"refs/remotes/origin/{branch}"], sub_root
+        ):
+            return f"origin/{branch}"
+
+    upstream = run_git(
+        ["rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{upstream}"], sub_root
+    ).strip()  # type: ignore
+    if upstream:
+        return upstream
+    upstream = run_git(["rev-parse", "--abbrev-ref", "origin/HEAD"], sub_root).strip()  # type: ignore
+    if upstream and upstream != "origin/HEAD":
+        return upstream
+    if run_git(["rev-parse", "--verify", "--quiet", "origin/main"], sub_root):
+        return "origin/main"
+    return None
+
+
+def get_ahead_behind(path, repo_root, use_commit_graph=True, write_graph=False):
+    """
+    计算子模块相对跟踪分支领先/落后的提交数
+
+    只读：默认只使用已有的 commit-graph（fetch 时由 fetch.writeCommitGraph 更新）；
+    write_graph 为 True 时先增量写入。
+    """
+    info = {"path": path, "upstream": None, "ahead": None, "behind": None}
+    sub_root = Path(repo_root) / path
+    if not (sub_root / ".git").exists():
+        return info
+
+    if use_commit_graph and write_graph:
+        write_commit_graph(sub_root)
+
+    upstream = _resolve_upstream(sub_root, repo_root, path)
+    if upstream is None:
+        return info
+    info["upstream"] = upstream
+
+    output = run_git(
+        [
+            "-c", f"core.commitGraph={'true' if use_commit_graph else 'false'}",
+            "rev-list", "--left-right", "--count", f"HEAD...{upstream}",
+        ],
+        sub_root,
+    )
+    counts = output.split()  # type: ignore
+    if len(counts) == 2:
+        info["ahead"], info["behind"] = int(counts[0]), int(counts[1])
+    return info
+
+
+def collect_ahead_behind(
+    submodules, repo_root, jobs=DEFAULT_JOBS, use_commit_graph=True, write_graph=False
+):
+    """并发计算所有子模块的领先/落后数，结果合并进 submodules"""
+    if not submodules:
+        return submodules
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        infos = list(pool.map(
+            tracing.propagate(
+                lambda s: get_ahead_behind(s["path"], repo_root, use_commit_graph, write_graph)
+            ),
+            submodules,
+        ))
+    for submodule, info in zip(submodules, infos):
+        submodule.update(upstream=info["upstream"], ahead=info["ahead"], behind=info["behind"])
+    return submodules
+
+
+def format_check_table(submodules, sort_key="path"):
+    """格式化 --check 结果：每行 路径 本地提交 上游 领先(+) 落后(-)"""
+    if sort_key == "path":
+        rows = sorted(submodules, key=lambda s: s["path"])
+    else:
+        rows = sorted(
+            submodules,
+            key=lambda s: (s.get(sort_key) is None, -(s.get(sort_key) or 0), s["path"]),
+        )
+
+    def cell(value):
+        return "?" if value is None else str(value)
+
+    path_width = max(len(s["path"]) for s in rows)
+    upstream_width = max(len(cell(s.get("upstream"))) for s in rows)
+    lines = []
+    for s in rows:
+        flag = "[UP]" if s["has_update"] or (s.get("behind") or 0) > 0 else "[OK]"
+        lines.append(
+            f"  {flag} {s['path']:<{path_width}}  {s['local']:<7}  "
+            f"{cell(s.get('upstream')):<{upstream_width}}  "
+            f"+{cell(s.get('ahead'))} -{cell(s.get('behind'))}"
+        )
+    return "\n".join(lines)
+
+
+def sync_submodule(path, repo_root, verbose=False, out=None):
+    """
+    同步指定子模块
+
+    已初始化的子模块先在子模块目录内 fetch（可并发），再串行执行 submodule update --no-fetch
+    合并已拉取的提交，避免并发同步争抢主仓库的 .git/config 和 .git/modules。
+    指定 out 时捕获 git 输出，连同进度信息一起写入 out，不直接打印到终端。
+    """
+    def run(cmd):
+        if out is None:
+            return run_git(cmd, repo_root, capture=False)
+        ok, output = run_git_output(cmd, repo_root)
+        if output:
+            out.write(output if output.endswith("\n") else output + "\n")
+        return ok
+
+    cmd = ["submodule", "update", "--remote", "--merge", path]
+    print(f"同步 {path}...", file=out)
+    success = True
+    if (Path(repo_root) / path / ".git").exists():
+        success = run(["-C", path, "fetch", "--quiet"])
+        cmd.insert(4, "--no-fetch")
+    if success:
+        with _UPDATE_LOCK:
+            success = run(cmd)
     if success:
-        print(f"[OK] {path} 同步成功")
+        print(f"[OK] {path} 同步成功", file=out)
     else:
-        print(f"[FAIL] {path} 同步失败")
+        print(f"[FAIL] {path} 同步失败", file=out)
     return success
 
 
+def _timed_sync(path, repo_root):
+    """同步单个子模块并记录输出与耗时"""
+    buffer = io.StringIO()
+    start = time.monotonic()
+    success = sync_submodule(path, repo_root, out=buffer)
+    return {
+        "path": path,
+        "success": bool(success),
+        "output": buffer.getvalue(),
+        "duration": time.monotonic() - start,
+    }
+
+
+def sync_submodules_parallel(paths, repo_root, jobs=DEFAULT_JOBS):
+    """并发同步多个子模块，结果按输入顺序返回"""
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(paths)))) as pool:
+        return list(pool.map(tracing.propagate(lambda p: _timed_sync(p, repo_root)), paths))
+
+
+def print_sync_results(results):
+    """按输入顺序打印同步结果，返回退出码"""
+    for r in results:
+        print(r["output"].rstrip("\n"))
+        print(f"  耗时 {r['duration']:.2f}s")
+
+    failed = [r["path"] for r in results if not r["success"]]
+    print()
+    if failed:
+        print(f"[FAIL] {len(failed)}/{len(results)} 个子模块同步失败: {', '.join(failed)}")
+        return 1
+    print(f"[OK] {len(results)} 个子模块同步成功")
+    return 0
+
+
 def main(args=None):
     if args is None:
         parser = argparse.ArgumentParser(description="子模块同步工具")
@@ -61,32 +284,54 @@ def main(args=None):
         parser.add_argument("--sync", metavar="PATHS", help="同步指定子模块（逗号分隔）")
         parser.add_argument("--sync-all", action="store_true", help="同步所有子模块")
         parser.add_argument("--repo", default=".", help="仓库根目录")
+        parser.add_argument("--json", action="store_true", help="--check 以 JSON 输出")
+        parser.add_argument("--sort", choices=SORT_KEYS, default="path", help="--check 表格排序列")
+        parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="并发数")
+        parser.add_argument("--no-commit-graph", action="store_true", help="不使用 commit-graph")
+        parser.add_argument(
+            "--write-commit-graph", action="store_true", help="--check 前先增量写入 commit-graph"
+        )
         args = parser.parse_args()
     repo_root = Path(args.repo).resolve()
     
     if args.check:
-        print("检测子模块更新...")
+        as_json = getattr(args, "json", False)
+        if not as_json:
+            print("检测子模块更新...")
         submodules = get_submodule_status(repo_root)
-        has_updates = any(s["has_update"] for s in submodules)
-        
-        if has_updates:
-            print("\n检测到以下子模块有更新：")
-            for s in submodules:
-                if s["has_update"]:
-                    print(f"  [UP] {s['path']} ({s['local']})")
+        collect_ahead_behind(
+            submodules,
+            repo_root,
+            jobs=getattr(args, "jobs", DEFAULT_JOBS),
+            use_commit_graph=not getattr(args, "no_commit_graph", False),
+            write_graph=getattr(args, "write_commit_graph", False),
+        )
+        has_updates = any(s["has_update"] or (s.get("behind") or 0) > 0 for s in submodules)
+
+        if as_json:
+            print(json.dumps(submodules, ensure_ascii=False, indent=2))
+        elif submodules:
+            print(format_check_table(submodules, getattr(args, "sort", "path")))
+            if not has_updates:
+                print("[OK] 所有子模块已是最新")
         else:
             print("[OK] 所有子模块已是最新")
         return 0 if not has_updates else 1
     
     elif args.sync:
-        paths = [p.strip() for p in args.sync.split(",")]
-        for path in paths:
-            sync_submodule(path, repo_root)
+        paths = [p.strip() for p in args.sync.split(",") if p.strip()]
+        results = sync_submodules_parallel(
+            paths, repo_root, jobs=getattr(args, "jobs", DEFAULT_JOBS)
+        )
+        return print_sync_results(results)
     
     elif args.sync_all:
         print("同步所有子模块...")
-        run_git(["submodule", "update", "--remote", "--merge"], repo_root)
-        print("[OK] 所有子模块同步完成")
+        paths = [s["path"] for s in get_submodule_status(repo_root)]
+        results = sync_submodules_parallel(
+            paths, repo_root, jobs=getattr(args, "jobs", DEFAULT_JOBS)
+        )
+        return print_sync_results(results)
     
     else:
         parser = argparse.ArgumentParser(description="子模块同步工具")
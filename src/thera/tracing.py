@@ -0,0 +1,294 @@
+"""
+追踪模块
+
+轻量 span 追踪：用 contextvars 维护当前 span，记录父子关系、线程和 asyncio 任务，
+运行结束时导出为 Chrome trace-event JSON（chrome://tracing、Perfetto 可直接打开），
+或 OTLP-JSON 文件。设置 THERA_TRACE=<path> 时启用。
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+TRACE_ENV = "THERA_TRACE"
+TRACE_FORMAT_ENV = "THERA_TRACE_FORMAT"
+FORMATS = ("chrome", "otlp")
+MAX_SPANS = 100_000
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "thera_span", default=None
+)
+_ids = itertools.count(1)
+
+
+@dataclass
+class Span:
+    """一段计时区间；end_ns 为 None 表示尚未结束，瞬时事件的 start_ns == end_ns"""
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start_ns: int  # 墙钟时间，纳秒
+    thread_id: int
+    thread_name: str
+    task: Optional[str] = None
+    end_ns: Optional[int] = None
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ns(self) -> int:
+        return (self.end_ns or self.start_ns) - self.start_ns
+
+    def set(self, **attrs) -> None:
+        """追加属性"""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """收集已结束的 span"""
+
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self.max_spans = max_spans
+        self.spans: list[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # 墙钟起点 + 单调时钟偏移，避免运行中系统时间调整导致区间为负
+        self._wall0 = time.time_ns()
+        self._mono0 = time.perf_counter_ns()
+
+    def now_ns(self) -> int:
+        return self._wall0 + time.perf_counter_ns() - self._mono0
+
+    def start(self, name: str, attrs: dict) -> Span:
+        """创建 span，父 span 取当前上下文"""
+        parent = _current.get()
+        thread = threading.current_thread()
+        return Span(
+            name=name,
+            span_id=next(_ids),
+            parent_id=parent.span_id if parent is not None else None,
+            start_ns=self.now_ns(),
+            thread_id=thread.ident or 0,
+            thread_name=thread.name,
+            task=_task_name(),
+            attrs=attrs,
+        )
+
+    def finish(self, span: Span, instant: bool = False) -> None:
+        """结束 span 并收集；instant 为 True 时记为零长度的瞬时事件"""
+        span.end_ns = span.start_ns if instant else self.now_ns()
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def discard(self, count: int) -> None:
+        """丢弃最早的 count 个 span（已导出），之后收集的保留"""
+        with self._lock:
+            del self.spans[:count]
+            self.dropped = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+            self.dropped = 0
+
+
+TRACER = Tracer()
+
+
+def _task_name() -> Optional[str]:
+    # 没有导入 asyncio 就不可能处在任务中，避免为此加载 asyncio
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return None
+    return task.get_name() if task is not None else None
+
+
+def enabled() -> bool:
+    """是否设置了 THERA_TRACE"""
+    return bool(os.environ.get(TRACE_ENV))
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[Span]]:
+    """
+    追踪一段代码；未启用时不创建 span，返回 None。
+
+    异常会记录到 span 的 error 属性后继续抛出。
+    """
+    if not enabled():
+        yield None
+        return
+    current = TRACER.start(name, attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        TRACER.finish(current)
+
+
+def event(name: str, **attrs) -> None:
+    """记录瞬时事件（挂在当前 span 下）"""
+    if not enabled():
+        return
+    TRACER.finish(TRACER.start(name, attrs), instant=True)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def propagate(func: Callable) -> Callable:
+    """
+    捕获当前上下文，使提交到线程池的任务以当前 span 为父 span。
+
+    contextvars 不会自动传入 ThreadPoolExecutor 的工作线程。
+    """
+    if not enabled():
+        return func
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # 同一个 Context 不能在多个线程中同时 run，每次调用复制一份
+        return ctx.copy().run(func, *args, **kwargs)
+
+    return run
+
+
+def observe_transition(old_state, event_, new_state, timestamp) -> None:
+    """StateMachine 转移监听器：记录为瞬时事件"""
+    event(
+        "fsm.transition",
+        from_state=old_state.name,
+        event=event_.name,
+        to_state=new_state.name,
+    )
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+def to_chrome(spans: list[Span], pid: Optional[int] = None) -> dict:
+    """转换为 Chrome trace-event JSON（完整事件 ph=X，瞬时事件 ph=i）"""
+    pid = os.getpid() if pid is None else pid
+    events: list[dict] = []
+    threads: dict[int, str] = {}
+    for s in sorted(spans, key=lambda s: s.start_ns):
+        threads.setdefault(s.thread_id, s.thread_name)
+        args = {k: _json_value(v) for k, v in s.attrs.items()}
+        args["span_id"] = s.span_id
+        if s.parent_id is not None:
+            args["parent_id"] = s.parent_id
+        if s.task is not None:
+            args["task"] = s.task
+        entry = {
+            "name": s.name,
+            "cat": "thera",
+            "ts": s.start_ns / 1000,
+            "pid": pid,
+            "tid": s.thread_id,
+            "args": args,
+        }
+        if s.duration_ns:
+            entry.update(ph="X", dur=s.duration_ns / 1000)
+        else:
+            entry.update(ph="i", s="t")
+        events.append(entry)
+    for tid, name in threads.items():
+        events.append(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _otlp_attr(key: str, value: Any) -> dict:
+    value = _json_value(value)
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": "" if value is None else value}
+    return {"key": key, "value": typed}
+
+
+def to_otlp(spans: list[Span], trace_id: Optional[str] = None) -> dict:
+    """转换为 OTLP-JSON（ExportTraceServiceRequest）"""
+    trace_id = trace_id or os.urandom(16).hex()
+    out = []
+    for s in sorted(spans, key=lambda s: s.start_ns):
+        attrs = dict(s.attrs, **{"thread.id": s.thread_id, "thread.name": s.thread_name})
+        if s.task is not None:
+            attrs["task"] = s.task
+        item = {
+            "traceId": trace_id,
+            "spanId": f"{s.span_id:016x}",
+            "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [_otlp_attr(k, v) for k, v in attrs.items()],
+        }
+        if s.parent_id is not None:
+            item["parentSpanId"] = f"{s.parent_id:016x}"
+        if "error" in s.attrs:
+            item["status"] = {"code": 2, "message": str(s.attrs["error"])}
+        out.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attr("service.name", "thera")]},
+            "scopeSpans": [{"scope": {"name": "thera"}, "spans": out}],
+        }]
+    }
+
+
+def export(path: Optional[Path] = None, fmt: Optional[str] = None) -> Optional[Path]:
+    """
+    写出已收集的 span；未指定路径且未设置 THERA_TRACE 时不写。
+    写出后清空已导出的 span，长时间运行的进程多次导出时缓冲区不会一直增长。
+    在某个 span 内调用时不写（例如流水线中的 refresh），由最外层的入口统一导出，
+    否则外层导出时会覆盖掉内层已写出并清空的 span。
+
+    格式由 fmt 或 THERA_TRACE_FORMAT 指定（chrome / otlp），默认 chrome。
+    """
+    target = path or os.environ.get(TRACE_ENV)
+    if not target or _current.get() is not None:
+        return None
+    fmt = fmt or os.environ.get(TRACE_FORMAT_ENV) or "chrome"
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的追踪格式: {fmt}（可选: {', '.join(FORMATS)}）")
+    with TRACER._lock:
+        spans = list(TRACER.spans)
+    data = to_chrome(spans) if fmt == "chrome" else to_otlp(spans)
+
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False))
+    os.replace(tmp, target)
+    TRACER.discard(len(spans))
+    return target
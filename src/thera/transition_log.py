@@ -0,0 +1,339 @@
+"""
+状态转移日志模块
+
+追加写入的二进制转移日志：定长记录 + 稀疏时间索引，批量 fsync。
+支持按时间范围查询（O(log n + k)）和进程重启后快速回放状态机。
+
+追加时在数据文件上持有 fcntl 排他锁，每条记录一次 write，多个进程写同一日志时记录不会交错。
+"""
+
+import fcntl
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+from thera.fsm import (
+    EVENT_CODES,
+    EVENT_INDEX,
+    STATE_CODES,
+    STATE_INDEX,
+    ErrorState,
+    Event,
+    RepoState,
+    StateMachine,
+    TransitionStats,
+)
+from thera.git_ops import get_state_dir
+
+MAGIC = b"THERALOG"
+VERSION = 1
+_HEADER = struct.Struct("<8sI")
+# 时间戳, 起始状态码, 事件码, 目标状态码, 填充
+_RECORD = struct.Struct("<dBBBx")
+# 时间戳, 记录序号
+_INDEX_ENTRY = struct.Struct("<dQ")
+
+DEFAULT_INDEX_INTERVAL = 256
+DEFAULT_FSYNC_BATCH = 64
+DEFAULT_FSYNC_INTERVAL = 1.0
+LOG_FILE = "transitions.log"
+
+_READ_CHUNK_RECORDS = 4096
+
+
+class TransitionRecord(NamedTuple):
+    """转移日志记录"""
+
+    index: int
+    timestamp: float
+    from_state: RepoState | ErrorState
+    event: Event
+    new_state: RepoState | ErrorState
+
+
+class TransitionLogError(Exception):
+    """转移日志异常"""
+    pass
+
+
+class TransitionLog:
+    """
+    持久化转移日志
+
+    数据文件为固定长度记录，每 index_interval 条写一条稀疏索引；
+    时间戳保证单调不减，因此可以对索引二分查找。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        index_interval: int = DEFAULT_INDEX_INTERVAL,
+        fsync_batch: int = DEFAULT_FSYNC_BATCH,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.index_interval = index_interval
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._index_times: list[float] = []
+        self._index_records: list[int] = []
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._last_timestamp = 0.0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._open()
+
+    @classmethod
+    def for_repo(cls, repo_root: Path, **kwargs) -> "TransitionLog":
+        """打开仓库默认位置的转移日志"""
+        return cls(get_state_dir(repo_root) / LOG_FILE, **kwargs)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """在数据文件上持有排他锁（跨进程）"""
+        fcntl.flock(self._data.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._data.fileno(), fcntl.LOCK_UN)
+
+    def _open(self) -> None:
+        """打开数据文件，截掉崩溃留下的不完整记录，并加载稀疏索引"""
+        # 不缓冲：每条记录一次 write，持锁期间写入的内容对其他进程立即可见
+        self._data = open(self.path, "ab", buffering=0)
+        try:
+            self._open_locked()
+        except TransitionLogError:
+            self._data.close()
+            raise
+
+    def _open_locked(self) -> None:
+        with self._file_lock():
+            size = os.fstat(self._data.fileno()).st_size
+            if size == 0:
+                self._data.write(_HEADER.pack(MAGIC, VERSION))
+                os.fsync(self._data.fileno())
+                if self.index_path.exists():
+                    self.index_path.unlink()
+                size = _HEADER.size
+
+            with open(self.path, "rb") as f:
+                magic, version = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise TransitionLogError(f"无法识别的转移日志: {self.path}")
+
+            body = size - _HEADER.size
+            torn = body % _RECORD.size
+            if torn:
+                os.truncate(self.path, size - torn)
+            self.count = body // _RECORD.size
+
+            self._load_index()
+            if self.count:
+                self._last_timestamp = self._read_record(self.count - 1).timestamp
+
+    def _catch_up_locked(self) -> None:
+        """持有文件锁时调用：读入其他进程追加的记录数、索引项和最后时间戳"""
+        count = (os.fstat(self._data.fileno()).st_size - _HEADER.size) // _RECORD.size
+        if count == self.count:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(len(self._index_records) * _INDEX_ENTRY.size)
+            data = f.read()
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        for ts, rec in _INDEX_ENTRY.iter_unpack(data[:usable]):
+            self._index_times.append(ts)
+            self._index_records.append(rec)
+        self.count = count
+        self._last_timestamp = max(self._last_timestamp, self._read_record(count - 1).timestamp)
+
+    def _load_index(self) -> None:
+        """
+        加载稀疏索引；缺失或损坏时从数据文件重建
+
+        指向数据文件末尾之后的索引项（数据文件截掉了不完整记录，或索引先于数据落盘）
+        从索引文件中截掉，之后追加的索引项才能接在有效项后面。
+        """
+        times, records = [], []
+        size = 0
+        if self.index_path.exists():
+            data = self.index_path.read_bytes()
+            size = len(data)
+            usable = len(data) - len(data) % _INDEX_ENTRY.size
+            for ts, rec in _INDEX_ENTRY.iter_unpack(data[:usable]):
+                if rec >= self.count or (records and rec <= records[-1]):
+                    break
+                times.append(ts)
+                records.append(rec)
+
+        expected = (self.count + self.index_interval - 1) // self.index_interval
+        if len(records) == expected and size > len(records) * _INDEX_ENTRY.size:
+            with open(self.index_path, "r+b") as f:
+                f.truncate(len(records) * _INDEX_ENTRY.size)
+        elif len(records) != expected:
+            times, records = [], []
+            for rec in range(0, self.count, self.index_interval):
+                times.append(self._read_record(rec).timestamp)
+                records.append(rec)
+            with open(self.index_path, "wb") as f:
+                for ts, rec in zip(times, records):
+                    f.write(_INDEX_ENTRY.pack(ts, rec))
+
+        self._index_times = times
+        self._index_records = records
+        self._index = open(self.index_path, "ab", buffering=0)
+
+    def _read_record(self, rec: int) -> TransitionRecord:
+        """读取第 rec 条记录"""
+        with open(self.path, "rb") as f:
+            f.seek(_HEADER.size + rec * _RECORD.size)
+            ts, from_code, event_code, new_code = _RECORD.unpack(f.read(_RECORD.size))
+        return TransitionRecord(
+            rec, ts, STATE_CODES[from_code], EVENT_CODES[event_code], STATE_CODES[new_code]
+        )
+
+    def append(
+        self,
+        from_state: RepoState | ErrorState,
+        event: Event,
+        new_state: RepoState | ErrorState,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """追加一条记录，返回记录序号"""
+        with self._lock, self._file_lock():
+            self._catch_up_locked()
+            ts = time.time() if timestamp is None else timestamp
+            # 时钟回拨时保持单调，保证索引可二分
+            ts = max(ts, self._last_timestamp)
+            rec = self.count
+            self._data.write(
+                _RECORD.pack(ts, STATE_INDEX[from_state], EVENT_INDEX[event], STATE_INDEX[new_state])
+            )
+            if rec % self.index_interval == 0:
+                self._index.write(_INDEX_ENTRY.pack(ts, rec))
+                self._index_times.append(ts)
+                self._index_records.append(rec)
+            self.count += 1
+            self._last_timestamp = ts
+            self._pending += 1
+
+            if (
+                self._pending >= self.fsync_batch
+                or time.monotonic() - self._last_sync >= self.fsync_interval
+            ):
+                self._sync_locked()
+            return rec
+
+    def on_transition(self, old_state, event, new_state, timestamp) -> None:
+        """StateMachine 转移监听器"""
+        self.append(old_state, event, new_state, timestamp)
+
+    def _sync_locked(self) -> None:
+        self._data.flush()
+        self._index.flush()
+        os.fsync(self._data.fileno())
+        os.fsync(self._index.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self) -> None:
+        """立即刷盘"""
+        with self._lock:
+            self._sync_locked()
+
+    def close(self) -> None:
+        """刷盘并关闭"""
+        with self._lock:
+            if self._data.closed:
+                return
+            self._sync_locked()
+            self._data.close()
+            self._index.close()
+
+    def __enter__(self) -> "TransitionLog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _iter_from(self, start: int, stop: int) -> Iterator[TransitionRecord]:
+        """顺序读取 [start, stop) 范围的记录"""
+        for rec, (ts, from_code, event_code, new_code) in enumerate(
+            self._iter_raw(start, stop), start
+        ):
+            yield TransitionRecord(
+                rec,
+                ts,
+                STATE_CODES[from_code],
+                EVENT_CODES[event_code],
+                STATE_CODES[new_code],
+            )
+
+    def _iter_raw(self, start: int, stop: int) -> Iterator[tuple[float, int, int, int]]:
+        """顺序读取 [start, stop) 范围的原始记录 (时间戳, 起始状态码, 事件码, 目标状态码)"""
+        with self._lock:
+            self._data.flush()
+        with open(self.path, "rb") as f:
+            f.seek(_HEADER.size + start * _RECORD.size)
+            rec = start
+            while rec < stop:
+                n = min(_READ_CHUNK_RECORDS, stop - rec)
+                chunk = f.read(n * _RECORD.size)
+                yield from _RECORD.iter_unpack(chunk)
+                rec += n
+                if len(chunk) < n * _RECORD.size:
+                    break
+
+    def query(
+        self, since: Optional[float] = None, until: Optional[float] = None
+    ) -> Iterator[TransitionRecord]:
+        """按时间范围 [since, until] 查询记录（Unix 秒）"""
+        stop = self.count
+        start = 0
+        if since is not None and self._index_times:
+            # 最后一个时间戳严格小于 since 的索引项：与 since 相等的记录可能在它之后的任意位置
+            pos = bisect_left(self._index_times, since) - 1
+            start = self._index_records[pos] if pos >= 0 else 0
+
+        for record in self._iter_from(start, stop):
+            if since is not None and record.timestamp < since:
+                continue
+            if until is not None and record.timestamp > until:
+                break
+            yield record
+
+    def tail(self, n: int) -> Iterator[TransitionRecord]:
+        """读取最后 n 条记录"""
+        return self._iter_from(max(0, self.count - n), self.count)
+
+    def replay(self, machine: StateMachine) -> StateMachine:
+        """
+        从日志恢复状态机。
+
+        历史只保留末尾 history_capacity 条记录；聚合计数顺序回放全部记录（只解码状态码和事件码），
+        与进程未重启时的实时计数相同。当前状态不恢复：每次运行都从初始状态开始，
+        上次运行结束时的 CLEAN_AND_CONSISTENT 不接受新一轮的 DOC_CHECK_OK。
+        """
+        if self.count == 0:
+            return machine
+
+        history = machine.history
+        history.clear()
+        for record in self.tail(history.capacity):
+            history.record(record.from_state, record.event, record.timestamp)
+        history.total = self.count
+        codes = ((from_code, event_code) for _, from_code, event_code, _ in self._iter_raw(0, self.count))
+        machine.stats = TransitionStats.replay(codes, capacity=history.capacity)
+        return machine
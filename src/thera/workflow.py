@@ -4,25 +4,45 @@
 基于状态机的工作流编排，支持标准工作流和自定义工作流。
 """
 
+import json
+import os
+import re
+import threading
+import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
+from thera import journal, metrics, tracing
+from thera.dag import DEFAULT_DAG_JOBS, DagExecutor, StepFailed, StepStatus, WorkflowStep
 from thera.fsm import (
+    STATE_CODES,
     ErrorState,
     Event,
     IllegalTransitionError,
     RepoState,
     StateMachine,
+    SubmoduleEvent,
+    SubmoduleMachine,
+    SubmoduleState,
 )
 from thera.git_ops import (
     ConsistencyResult,
     GitOps,
     PushResult,
+    RollbackResult,
+    SubmoduleInfo,
     SyncResult,
+    get_state_dir,
 )
+from thera.journal import JournalEntry
+from thera.lease import LeaseTimeout, run_exclusive
+from thera.memo import StepCache, file_digest, fingerprint, stat_key
+from thera.transition_log import TransitionLog
 
 
 class ConvergenceStrategy(ABC):
@@ -33,6 +53,20 @@ class ConvergenceStrategy(ABC):
         """判断是否应该自动收敛"""
         pass
 
+    def select(self, infos: list[SubmoduleInfo]) -> tuple[list[str], list[str]]:
+        """
+        挑选本次收敛的子模块。
+
+        Returns:
+            (本次收敛的子模块, 推迟到下次运行的子模块)；推迟的子模块不阻塞主仓库状态
+        """
+        selected = [info.path for info in infos if self.should_reconcile(info.path, info.is_behind)]
+        return selected, []
+
+    def record(self, submodule: str, success: bool, duration: float) -> None:
+        """记录一次子模块收敛的结果和耗时"""
+        pass
+
 
 class AutoStrategy(ConvergenceStrategy):
     """自动策略：自动修复"""
@@ -55,6 +89,195 @@ class HybridStrategy(ConvergenceStrategy):
         return not is_behind
 
 
+DEFAULT_SUBMODULE_JOBS = 8
+DEFAULT_BUDGET = 60.0
+DEFAULT_SUBMODULE_COST = 5.0
+DEFAULT_SECONDS_PER_COMMIT = 0.05
+DEFAULT_BYTES_PER_SECOND = 5_000_000
+COST_FILE = "reconcile_costs.json"
+
+
+@dataclass
+class SubmoduleCost:
+    """子模块收敛成本的输入"""
+    path: str
+    behind: int = 0
+    fetch_bytes: int = 0
+
+
+@dataclass
+class ReconcilePlan:
+    """预算内的收敛计划"""
+    selected: list[str]
+    deferred: list[str]
+    estimated: float
+
+
+def probe_submodule_cost(repo_root: Path, path: str) -> SubmoduleCost:
+    """用远程跟踪分支估算子模块落后的提交数和待拉取的对象大小"""
+    from thera.submodule_sync import get_ahead_behind, run_git
+
+    info = get_ahead_behind(path, repo_root)
+    cost = SubmoduleCost(path, behind=info["behind"] or 0)
+    if info["upstream"] and cost.behind:
+        output = run_git(
+            ["rev-list", "--objects", "--disk-usage", f"HEAD..{info['upstream']}"],
+            Path(repo_root) / path,
+        )
+        if str(output).strip().isdigit():
+            cost.fetch_bytes = int(str(output).strip())
+    return cost
+
+
+class BudgetedStrategy(ConvergenceStrategy):
+    """
+    预算策略：按成本模型在时间预算内挑选子模块
+
+    单个子模块的预估耗时 = 固定开销（历史耗时扣除可变部分后的 EWMA）
+    + 落后提交数 × 每提交耗时 + 待拉取字节 / 带宽。
+    优先级 = (1 + 落后提交数) × (1 + 已推迟次数) / 预估耗时，按优先级贪心装入预算，
+    其余推迟到下次运行；推迟次数越多优先级越高，避免饿死。
+    预算按串行耗时累计，并发执行时实际耗时更短。
+    """
+
+    def __init__(
+        self,
+        budget: float = DEFAULT_BUDGET,
+        state_path: Optional[Path] = None,
+        probe: Optional[Callable[[str], SubmoduleCost]] = None,
+        alpha: float = 0.3,
+        seconds_per_commit: float = DEFAULT_SECONDS_PER_COMMIT,
+        bytes_per_second: float = DEFAULT_BYTES_PER_SECOND,
+        jobs: int = DEFAULT_SUBMODULE_JOBS,
+    ):
+        """
+        Args:
+            budget: 单次运行的时间预算（秒）
+            state_path: 历史耗时的持久化文件；为 None 时只保存在内存
+            probe: 获取子模块成本输入的函数；为 None 时不探测（落后数和字节按 0 计）
+            alpha: EWMA 平滑系数
+        """
+        self.budget = budget
+        self.state_path = state_path
+        self.probe = probe
+        self.alpha = alpha
+        self.seconds_per_commit = seconds_per_commit
+        self.bytes_per_second = bytes_per_second
+        self.jobs = jobs
+        self.history: dict[str, dict] = {}
+        self.last_plan: Optional[ReconcilePlan] = None
+        self._costs: dict[str, SubmoduleCost] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_repo(cls, repo_root: Path, **kwargs) -> "BudgetedStrategy":
+        """使用仓库状态目录保存历史，并通过远程跟踪分支探测成本"""
+        kwargs.setdefault("state_path", get_state_dir(repo_root) / COST_FILE)
+        kwargs.setdefault("probe", lambda path: probe_submodule_cost(repo_root, path))
+        return cls(**kwargs)
+
+    def _load(self) -> None:
+        if self.state_path is None:
+            return
+        try:
+            data = json.loads(Path(self.state_path).read_text())
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self.history = {k: v for k, v in data.items() if isinstance(v, dict)}
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        path = Path(self.state_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(self.history, ensure_ascii=False))
+        os.replace(tmp, path)
+
+    def _variable_cost(self, cost: SubmoduleCost) -> float:
+        return cost.behind * self.seconds_per_commit + cost.fetch_bytes / self.bytes_per_second
+
+    def estimate(self, cost: SubmoduleCost) -> float:
+        """预估子模块收敛耗时（秒）"""
+        base = self.history.get(cost.path, {}).get("duration", DEFAULT_SUBMODULE_COST)
+        return base + self._variable_cost(cost)
+
+    def priority(self, cost: SubmoduleCost) -> float:
+        """收敛优先级，越大越先收敛"""
+        deferred = self.history.get(cost.path, {}).get("deferred", 0)
+        return (1 + cost.behind) * (1 + deferred) / max(self.estimate(cost), 1e-3)
+
+    def plan(self, costs: list[SubmoduleCost]) -> ReconcilePlan:
+        """在预算内按优先级贪心挑选子模块；没有任何子模块装得下时至少收敛优先级最高的一个"""
+        ranked = sorted(costs, key=self.priority, reverse=True)
+        selected, deferred = [], []
+        remaining = self.budget
+        estimated = 0.0
+        for cost in ranked:
+            estimate = self.estimate(cost)
+            if estimate <= remaining:
+                selected.append(cost.path)
+                remaining -= estimate
+                estimated += estimate
+            else:
+                deferred.append(cost.path)
+        if not selected and deferred:
+            first = deferred.pop(0)
+            selected.append(first)
+            estimated = self.estimate(next(c for c in ranked if c.path == first))
+
+        with self._lock:
+            changed = False
+            for path in selected:
+                entry = self.history.setdefault(path, {})
+                changed |= entry.get("deferred") != 0
+                entry["deferred"] = 0
+            for path in deferred:
+                entry = self.history.setdefault(path, {})
+                entry["deferred"] = entry.get("deferred", 0) + 1
+                changed = True
+            self._costs = {cost.path: cost for cost in costs}
+            if changed:  # 计划与上次相同且无推迟时不重写状态文件
+                self._save()
+
+        self.last_plan = ReconcilePlan(selected, deferred, estimated)
+        return self.last_plan
+
+    def select(self, infos: list[SubmoduleInfo]) -> tuple[list[str], list[str]]:
+        paths = [info.path for info in infos]
+        if self.probe is None:
+            costs = [SubmoduleCost(path) for path in paths]
+        elif len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.jobs, len(paths))) as executor:
+                costs = list(executor.map(tracing.propagate(self.probe), paths))
+        else:
+            costs = [self.probe(path) for path in paths]
+        plan = self.plan(costs)
+        return plan.selected, plan.deferred
+
+    def should_reconcile(self, submodule: str, is_behind: bool) -> bool:
+        if self.last_plan is None:
+            return True
+        return submodule in self.last_plan.selected
+
+    def record(self, submodule: str, success: bool, duration: float) -> None:
+        """成功收敛后更新固定开销的 EWMA"""
+        if not success:
+            return
+        with self._lock:
+            cost = self._costs.get(submodule, SubmoduleCost(submodule))
+            observed = max(0.0, duration - self._variable_cost(cost))
+            entry = self.history.setdefault(submodule, {})
+            previous = entry.get("duration")
+            entry["duration"] = (
+                observed if previous is None
+                else self.alpha * observed + (1 - self.alpha) * previous
+            )
+            self._save()
+
+
 @dataclass
 class WorkflowResult:
     """工作流执行结果"""
@@ -64,6 +287,210 @@ class WorkflowResult:
     error: Optional[ErrorState] = None
 
 
+def _dump_result(result: WorkflowResult) -> dict:
+    """工作流结果的 JSON 形式（租约内运行完成后供等待方读取）"""
+    return {
+        "success": result.success,
+        "message": result.message,
+        "new_state": result.new_state.name if result.new_state else None,
+        "error": result.error.name if result.error else None,
+    }
+
+
+def _load_result(data: dict) -> WorkflowResult:
+    states = {state.name: state for state in STATE_CODES}
+    return WorkflowResult(
+        success=data["success"],
+        message=data["message"],
+        new_state=states.get(data["new_state"]),
+        error=ErrorState[data["error"]] if data["error"] else None,
+    )
+
+
+DEFAULT_PUSH_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+CHECKPOINT_FILE = "workflow_checkpoint.json"
+
+
+@dataclass
+class WorkflowCheckpoint:
+    """工作流检查点（持久化到状态目录）"""
+    checkpoints: list[str]
+    state: str
+    commit_sha: Optional[str] = None
+
+
+@dataclass
+class ReconcileResult:
+    """子模块并发收敛结果"""
+    synced: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    pending: list[str] = field(default_factory=list)
+
+    @property
+    def success(self) -> bool:
+        return not self.failed and not self.pending
+
+
+class SubmoduleScheduler:
+    """
+    子模块调度器
+
+    每个子模块一个 SubmoduleMachine，在线程池中并发同步；
+    按状态增量维护计数，主仓库是否收敛只需 O(1) 查询聚合结果。
+    """
+
+    def __init__(
+        self,
+        sync_one: Callable[[str, Optional[float]], SyncResult],
+        on_result: Optional[Callable[[str, bool, float], None]] = None,
+    ):
+        """
+        Args:
+            sync_one: 同步单个子模块的函数 (path, timeout)，超时后须终止自己启动的子进程
+            on_result: 每个子模块同步结束后的回调 (path, success, duration)
+        """
+        self.sync_one = sync_one
+        self.on_result = on_result
+        self.machines: dict[str, SubmoduleMachine] = {}
+        self.counts: dict[SubmoduleState, int] = {state: 0 for state in SubmoduleState}
+        self._lock = threading.Lock()
+
+    def _on_change(self, path: str, old_state: SubmoduleState, new_state: SubmoduleState) -> None:
+        with self._lock:
+            self.counts[old_state] -= 1
+            self.counts[new_state] += 1
+
+    def track(self, path: str, state: SubmoduleState = SubmoduleState.BEHIND) -> SubmoduleMachine:
+        """获取子模块状态机，不存在时创建"""
+        with self._lock:
+            machine = self.machines.get(path)
+            if machine is None:
+                machine = SubmoduleMachine(path, state, self._on_change)
+                self.machines[path] = machine
+                self.counts[state] += 1
+        return machine
+
+    def untrack(self, path: str) -> None:
+        """移除子模块状态机（子模块已从仓库删除）"""
+        with self._lock:
+            machine = self.machines.pop(path, None)
+            if machine is not None:
+                self.counts[machine.state] -= 1
+
+    def refresh(self, infos: list[SubmoduleInfo]) -> None:
+        """按 git submodule status 的结果更新状态机"""
+        present = {info.path for info in infos}
+        for path in [p for p in self.machines if p not in present]:
+            self.untrack(path)
+
+        for info in infos:
+            initial = SubmoduleState.DETACHED if info.is_detached else SubmoduleState.BEHIND
+            machine = self.track(info.path, initial)
+            if machine.state == SubmoduleState.DETACHED and not info.is_detached:
+                machine.transition(SubmoduleEvent.REATTACH)
+            elif machine.state == SubmoduleState.UP_TO_DATE and info.is_behind:
+                machine.transition(SubmoduleEvent.REMOTE_UPDATED)
+
+    def converged(self, paths: Optional[list[str]] = None) -> bool:
+        """
+        paths 中的子模块都已同步；paths 为 None 时检查所有已跟踪的子模块（按计数，O(1)）
+
+        未跟踪的路径不计入。
+        """
+        if paths is None:
+            return self.counts[SubmoduleState.UP_TO_DATE] == len(self.machines)
+        with self._lock:
+            return all(
+                self.machines[path].state == SubmoduleState.UP_TO_DATE
+                for path in paths if path in self.machines
+            )
+
+    def summary(self) -> dict[str, int]:
+        """各状态的子模块数量"""
+        return {state.name: n for state, n in self.counts.items()}
+
+    def _reconcile_one(
+        self,
+        machine: SubmoduleMachine,
+        deadline: Optional[float],
+        sync_one: Callable[[str, Optional[float]], SyncResult],
+    ) -> bool:
+        """同步单个子模块；超过 deadline 时不转移状态（保持 BEHIND），返回 False"""
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return False
+        start = time.perf_counter()
+        try:
+            with tracing.span("submodule.sync", submodule=machine.path):
+                result = sync_one(machine.path, timeout)
+        except Exception as e:
+            machine.transition(SubmoduleEvent.SYNC_FAIL, str(e))
+        else:
+            if not result.success and deadline is not None and time.monotonic() >= deadline:
+                return False
+            if result.success:
+                machine.transition(SubmoduleEvent.SYNC_OK)
+            else:
+                machine.transition(SubmoduleEvent.SYNC_FAIL, result.error or result.message)
+        if self.on_result is not None:
+            self.on_result(
+                machine.path,
+                machine.state == SubmoduleState.UP_TO_DATE,
+                time.perf_counter() - start,
+            )
+        return True
+
+    def run(
+        self,
+        paths: list[str],
+        jobs: int = DEFAULT_SUBMODULE_JOBS,
+        timeout: Optional[float] = None,
+        sync_one: Optional[Callable[[str, Optional[float]], SyncResult]] = None,
+    ) -> ReconcileResult:
+        """
+        并发同步指定子模块（sync_one 覆盖构造时传入的同步函数，只对本次运行生效）。
+
+        已同步的子模块先标记为 BEHIND 再重新同步；处于 DETACHED 的子模块直接记为失败。
+        超过 timeout 仍未完成的子模块记为 pending，保持 BEHIND：进行中的同步由 sync_one
+        按剩余时间终止，尚未开始的不再启动，返回时不留下仍在运行的 git 进程。
+        """
+        result = ReconcileResult()
+        machines = []
+        for path in paths:
+            machine = self.track(path)
+            if machine.state == SubmoduleState.UP_TO_DATE:
+                machine.transition(SubmoduleEvent.REMOTE_UPDATED)
+            if machine.state == SubmoduleState.DETACHED:
+                result.failed[path] = machine.error or "分离头指针"
+            else:
+                machines.append(machine)
+
+        if not machines:
+            return result
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, len(machines))),
+            thread_name_prefix="thera-submodule",
+        )
+        deadline = None if timeout is None else time.monotonic() + timeout
+        reconcile_one = tracing.propagate(self._reconcile_one)
+        sync_one = sync_one or self.sync_one
+        futures = {executor.submit(reconcile_one, m, deadline, sync_one): m for m in machines}
+        executor.shutdown(wait=True)
+
+        for future, machine in futures.items():
+            if not future.result():
+                result.pending.append(machine.path)
+            elif machine.state == SubmoduleState.UP_TO_DATE:
+                result.synced.append(machine.path)
+            else:
+                result.failed[machine.path] = machine.error or "同步失败"
+        return result
+
+
 class WorkflowEngine:
     """工作流引擎"""
 
@@ -71,11 +498,23 @@ class WorkflowEngine:
         self,
         repo_root: Path,
         strategy: Optional[ConvergenceStrategy] = None,
+        transition_log: Optional[TransitionLog] = None,
+        step_cache: Optional[StepCache] = None,
     ):
         self.repo_root = repo_root
+        self.step_cache = step_cache
         self.git_ops = GitOps(repo_root)
         self.machine = StateMachine()
         self.strategy = strategy or AutoStrategy()
+        self.transition_log = transition_log
+        self.submodules = SubmoduleScheduler(self._sync_one_submodule, self._record_submodule)
+        self.snapshot_paths: list[str] = []
+        self.last_rollback: Optional[RollbackResult] = None
+        self.machine.add_listener(metrics.observe_transition)
+        self.machine.add_listener(tracing.observe_transition)
+        if transition_log is not None:
+            transition_log.replay(self.machine)
+            self.machine.add_listener(transition_log.on_transition)
 
     def set_strategy(self, strategy_name: str) -> ConvergenceStrategy:
         """设置收敛策略"""
@@ -83,6 +522,7 @@ class WorkflowEngine:
             "auto": AutoStrategy,
             "manual": ManualStrategy,
             "hybrid": HybridStrategy,
+            "budgeted": lambda: BudgetedStrategy.for_repo(self.repo_root),
         }
         
         if strategy_name not in strategies:
@@ -97,12 +537,52 @@ class WorkflowEngine:
             AutoStrategy: "auto",
             ManualStrategy: "manual",
             HybridStrategy: "hybrid",
+            BudgetedStrategy: "budgeted",
         }
         return strategy_map.get(type(self.strategy), "unknown")
 
+    def _doc_check_fingerprint(self, yaml_path: Path) -> str:
+        """一致性检查的输入：事实源、.gitmodules 及各子模块路径是否存在"""
+        gitmodules = self.repo_root / ".gitmodules"
+        try:
+            paths = re.findall(r"^\s*path\s*=\s*(.+?)\s*$", gitmodules.read_text(), re.M)
+        except OSError:
+            paths = []
+        existing = [path for path in paths if (self.repo_root / path).exists()]
+        return fingerprint(
+            file_digest(self.repo_root / yaml_path),
+            file_digest(gitmodules),
+            "\n".join(existing),
+        )
+
+    def _sync_fingerprint(self) -> Optional[str]:
+        """
+        同步的输入：.gitmodules、索引（gitlink）及各子模块 HEAD 和远程分支 SHA
+
+        有子模块的远程分支无法解析时返回 None（不缓存）。
+        """
+        refs = self.git_ops.get_submodule_refs()
+        if refs is None:
+            return None
+        return fingerprint(
+            file_digest(self.repo_root / ".gitmodules"),
+            stat_key(get_state_dir(self.repo_root).parent / "index"),
+            refs,
+        )
+
     def doc_check(self, yaml_path: Path) -> ConsistencyResult:
-        """执行一致性检查"""
-        result = self.git_ops.check_consistency(yaml_path)
+        """执行一致性检查（启用 step_cache 时输入未变化则复用上次结果）"""
+        result = None
+        if self.step_cache is not None:
+            key = self._doc_check_fingerprint(yaml_path)
+            cached = self.step_cache.get("doc_check", key)
+            if cached is not None:
+                result = ConsistencyResult(**cached)
+
+        if result is None:
+            result = self.git_ops.check_consistency(yaml_path)
+            if self.step_cache is not None and result.is_consistent:
+                self.step_cache.put("doc_check", key, asdict(result))
 
         if result.is_consistent:
             self.machine.transition(Event.DOC_CHECK_OK)
@@ -112,9 +592,9 @@ class WorkflowEngine:
         return result
 
     def sync_submodules(
-        self, paths: Optional[list[str]] = None
+        self, paths: Optional[list[str]] = None, no_fetch: bool = False
     ) -> SyncResult:
-        """同步子模块"""
+        """同步子模块（no_fetch 为 True 时使用已拉取的远程跟踪分支）"""
         if not self.machine.can_transition(Event.SUBMODULE_SYNC):
             return SyncResult(
                 success=False,
@@ -122,13 +602,164 @@ class WorkflowEngine:
                 error="illegal state transition",
             )
 
-        result = self.git_ops.sync_submodules(paths)
+        if self.step_cache is not None and paths is None:
+            result = self._sync_memoized(
+                no_fetch, lambda: self.git_ops.sync_submodules(None, no_fetch=True)
+            )
+        else:
+            result = self.git_ops.sync_submodules(paths, no_fetch=no_fetch)
 
         if result.success:
             self.machine.transition(Event.SUBMODULE_SYNC)
 
         return result
 
+    def _sync_memoized(
+        self,
+        no_fetch: bool,
+        merge: Callable[[], SyncResult],
+        complete: Callable[[], bool] = lambda: True,
+    ) -> SyncResult:
+        """
+        拆成 fetch + 合并：fetch 总是执行，合并的输入（子模块 HEAD 与跟踪分支）
+        与上次同步后的状态相同时跳过合并。
+
+        Args:
+            merge: 使用已拉取的远程跟踪分支合并所有子模块
+            complete: 合并后所有子模块是否都已同步；有子模块被推迟时不缓存，下次运行仍会合并
+        """
+        if not no_fetch:
+            fetched = self.git_ops.fetch_submodules()
+            if not fetched.success:
+                return SyncResult(success=False, message=fetched.message, error=fetched.error)
+
+        key = self._sync_fingerprint()
+        if key is not None:
+            cached = self.step_cache.get("sync", key)  # type: ignore
+            if cached is not None:
+                return SyncResult(**cached)
+
+        result = merge()
+        if result.success and complete():
+            # 记录同步后的状态：下次运行若远程没有新提交，指纹与之相同
+            key = self._sync_fingerprint()
+            if key is not None:
+                self.step_cache.put("sync", key, asdict(result))  # type: ignore
+        return result
+
+    def _sync_one_submodule(
+        self, path: str, timeout: Optional[float] = None, no_fetch: bool = False
+    ) -> SyncResult:
+        """
+        同步单个子模块
+
+        fetch 在子模块目录内执行，各子模块并发；随后的 submodule update 只合并已拉取的对象，
+        由 GitOps 串行执行，并发的同步不会争抢主仓库的 .git/config 和 .git/modules。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not no_fetch:
+            fetched = self.git_ops.fetch_submodule(path, timeout=timeout)
+            if not fetched.success:
+                return fetched
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return self.git_ops.sync_submodules([path], no_fetch=True, timeout=remaining)
+
+    def _record_submodule(self, path: str, success: bool, duration: float) -> None:
+        self.strategy.record(path, success, duration)
+        metrics.SUBMODULE_DURATION.observe(duration, submodule=path, operation="sync")
+
+    def reconcile_submodules(
+        self,
+        paths: Optional[list[str]] = None,
+        jobs: int = DEFAULT_SUBMODULE_JOBS,
+        timeout: Optional[float] = None,
+        no_fetch: bool = False,
+    ) -> SyncResult:
+        """
+        按子模块并发收敛。
+
+        每个子模块由独立的状态机跟踪，收敛策略决定哪些子模块参与本次同步；
+        当本次选中的子模块都处于 UP_TO_DATE 时，主仓库转移到 SYNCED。
+        单个子模块失败或超时只影响它自己，其余子模块照常同步。
+        启用 step_cache 且同步全部子模块时，与 sync_submodules 一样跳过输入未变化的合并。
+        """
+        if not self.machine.can_transition(Event.SUBMODULE_SYNC):
+            return SyncResult(
+                success=False,
+                message=f"当前状态 {self.machine.state.name} 不允许同步",
+                error="illegal state transition",
+            )
+
+        if self.step_cache is not None and paths is None:
+            result = self._sync_memoized(
+                no_fetch,
+                lambda: self._reconcile(None, jobs, timeout, no_fetch=True),
+                complete=self.submodules.converged,
+            )
+        else:
+            result = self._reconcile(paths, jobs, timeout, no_fetch)
+
+        if result.success:
+            self.machine.transition(Event.SUBMODULE_SYNC)
+
+        return result
+
+    def _reconcile(
+        self,
+        paths: Optional[list[str]],
+        jobs: int,
+        timeout: Optional[float],
+        no_fetch: bool,
+    ) -> SyncResult:
+        infos = self.git_ops.get_submodule_status()
+        if paths is not None:
+            wanted = set(paths)
+            infos = [info for info in infos if info.path in wanted]
+        self.submodules.refresh(infos)
+
+        selected, deferred = self.strategy.select(infos)
+        result = self.submodules.run(
+            selected,
+            jobs=jobs,
+            timeout=timeout,
+            sync_one=lambda path, remaining: self._sync_one_submodule(path, remaining, no_fetch),
+        )
+
+        # 只看本次选中的子模块：策略未选中或推迟的子模块不阻塞主仓库状态
+        if result.success and self.submodules.converged(selected):
+            chosen = set(selected) | set(deferred)
+            skipped = [info.path for info in infos if info.path not in chosen]
+            if selected:
+                message = f"同步完成: {len(result.synced)} 个子模块"
+            else:
+                message = "未同步任何子模块"
+            if deferred:
+                message += f"，推迟 {len(deferred)} 个"
+            if skipped:
+                message += f"，策略跳过 {len(skipped)} 个"
+            return SyncResult(
+                success=True,
+                message=message,
+                synced_paths=result.synced,
+                skipped_paths=list(deferred) + skipped,
+            )
+
+        errors = [f"{path}: {error}" for path, error in result.failed.items()]
+        errors += [f"{path}: 超时" for path in result.pending]
+        waiting = [
+            path for path in selected
+            if self.submodules.machines[path].state != SubmoduleState.UP_TO_DATE
+        ]
+        return SyncResult(
+            success=False,
+            message=(
+                f"同步未收敛: 成功 {len(result.synced)}，失败 {len(result.failed)}，"
+                f"超时 {len(result.pending)}，未同步 {len(waiting)}"
+            ),
+            error="\n".join(errors) or None,
+            synced_paths=result.synced,
+        )
+
     def commit_and_push(self, message: str) -> PushResult:
         """提交并推送"""
         if self.machine.state == RepoState.SYNCED:
@@ -151,14 +782,147 @@ class WorkflowEngine:
 
         return result
 
+    @property
+    def checkpoint_path(self) -> Path:
+        """检查点文件路径"""
+        return get_state_dir(self.repo_root) / CHECKPOINT_FILE
+
+    def save_checkpoint(self, checkpoints: list[str], commit_sha: Optional[str] = None) -> None:
+        """保存检查点（先写临时文件再替换，避免半写）"""
+        path = self.checkpoint_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint = WorkflowCheckpoint(list(checkpoints), self.machine.state.name, commit_sha)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(asdict(checkpoint), ensure_ascii=False))
+        os.replace(tmp, path)
+
+    def load_checkpoint(self) -> Optional[WorkflowCheckpoint]:
+        """读取检查点；不存在或损坏时返回 None"""
+        try:
+            data = json.loads(self.checkpoint_path.read_text())
+            return WorkflowCheckpoint(**data)
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def clear_checkpoint(self) -> None:
+        """删除检查点"""
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def retry_push(
+        self,
+        max_retries: int = DEFAULT_PUSH_RETRIES,
+        backoff: float = DEFAULT_RETRY_BACKOFF,
+    ) -> PushResult:
+        """
+        从 NETWORK_ERROR 重试推送已存在的本地提交。
+
+        第 n 次重试前（包括第一次）等待 backoff * 2^(n-1) 秒，最多重试 max_retries 次。
+        """
+        result = PushResult(
+            success=False,
+            message=f"当前状态 {self.machine.state.name} 不允许重试",
+            error="illegal state transition",
+        )
+        for attempt in range(1, max_retries + 1):
+            if not self.machine.can_transition(Event.RETRY):
+                break
+            time.sleep(backoff * 2 ** (attempt - 1))
+            self.machine.transition(Event.RETRY)
+            with tracing.span("push.retry", attempt=attempt):
+                result = self.git_ops.push()
+            if result.success:
+                self.machine.transition(Event.PUSH_OK)
+                break
+            self.machine.transition(Event.PUSH_FAIL)
+        return result
+
+    def _resume_push(self, max_retries: int, backoff: float) -> Optional[WorkflowResult]:
+        """
+        检查点停在推送步骤且本地提交仍是 HEAD 时，只重试推送。
+
+        其余情况删除检查点并返回 None，由调用方从头运行。
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None:
+            return None
+
+        resumable = (
+            "commit" in checkpoint.checkpoints
+            and checkpoint.commit_sha
+            and checkpoint.state == ErrorState.NETWORK_ERROR.name
+        )
+        if resumable:
+            stdout, _, code = self.git_ops.run_git(["rev-parse", "HEAD"])
+            resumable = code == 0 and stdout.strip().startswith(checkpoint.commit_sha)
+        if not resumable:
+            self.clear_checkpoint()
+            return None
+
+        if self.machine.state != ErrorState.NETWORK_ERROR:
+            # 新进程且没有转移日志时，从检查点恢复状态
+            self.machine.state = ErrorState.NETWORK_ERROR
+            self.machine.error = ErrorState.NETWORK_ERROR
+
+        push_result = self.retry_push(max_retries, backoff)
+        if not push_result.success:
+            return WorkflowResult(
+                success=False,
+                message=f"提交推送失败: {push_result.message}",
+                new_state=self.machine.state,
+                error=self.machine.error,
+            )
+
+        self.clear_checkpoint()
+        return WorkflowResult(
+            success=True,
+            message=f"工作流执行成功（从推送步骤恢复 {checkpoint.commit_sha}）",
+            new_state=self.machine.state,
+        )
+
     def run_standard_workflow(
-        self, yaml_path: Path, commit_message: Optional[str] = None
+        self,
+        yaml_path: Path,
+        commit_message: Optional[str] = None,
+        max_retries: int = DEFAULT_PUSH_RETRIES,
+        backoff: float = DEFAULT_RETRY_BACKOFF,
     ) -> WorkflowResult:
-        """运行标准工作流：doc-check → sync → commit（带事务性语义）"""
+        """
+        运行标准工作流：doc-check → sync → commit（带事务性语义）
+
+        每完成一步保存检查点。推送失败但本地提交已生成时按退避重试；
+        仍失败则保留检查点，下次运行直接从推送步骤恢复。
+        设置了 THERA_METRICS_PATH / THERA_TRACE 时，结束后写出指标和追踪文件。
+        """
+        try:
+            with tracing.span("workflow.standard"):
+                return self._run_exclusive(
+                    "standard",
+                    lambda: self._run_standard_workflow(
+                        yaml_path, commit_message, max_retries, backoff
+                    ),
+                    yaml_path,
+                    commit_message,
+                )
+        finally:
+            metrics.write_textfile()
+            tracing.export()
+
+    def _run_standard_workflow(
+        self,
+        yaml_path: Path,
+        commit_message: Optional[str],
+        max_retries: int,
+        backoff: float,
+    ) -> WorkflowResult:
+        resumed = self._resume_push(max_retries, backoff)
+        if resumed is not None:
+            return resumed
+
         checkpoints: list[str] = []
-        
+
         try:
-            doc_result = self.doc_check(yaml_path)
+            with tracing.span("step.doc_check"):
+                doc_result = self.doc_check(yaml_path)
             if not doc_result.is_consistent:
                 return WorkflowResult(
                     success=False,
@@ -166,8 +930,14 @@ class WorkflowEngine:
                     new_state=self.machine.state,
                 )
             checkpoints.append("doc_check")
+            self.save_checkpoint(checkpoints)
 
-            sync_result = self.sync_submodules()
+            with tracing.span("step.snapshot"):
+                self.snapshot_submodules()
+            checkpoints.append("snapshot")
+
+            with tracing.span("step.sync"):
+                sync_result = self.reconcile_submodules()
             if not sync_result.success:
                 self._rollback_sync(checkpoints)
                 return WorkflowResult(
@@ -176,11 +946,17 @@ class WorkflowEngine:
                     new_state=self.machine.state,
                 )
             checkpoints.append("sync")
+            self.save_checkpoint(checkpoints)
 
             if commit_message is None:
                 commit_message = "[sync] auto commit from workflow"
 
-            push_result = self.commit_and_push(commit_message)
+            with tracing.span("step.push"):
+                push_result = self.commit_and_push(commit_message)
+            if not push_result.success and push_result.commit_sha:
+                checkpoints.append("commit")
+                self.save_checkpoint(checkpoints, push_result.commit_sha)
+                push_result = self.retry_push(max_retries, backoff)
             if not push_result.success:
                 return WorkflowResult(
                     success=False,
@@ -189,6 +965,7 @@ class WorkflowEngine:
                     error=self.machine.error,
                 )
             checkpoints.append("push")
+            self.clear_checkpoint()
 
             return WorkflowResult(
                 success=True,
@@ -204,31 +981,172 @@ class WorkflowEngine:
                 new_state=self.machine.state,
             )
 
-    def _rollback_sync(self, checkpoints: list[str]) -> None:
-        """回滚同步操作"""
-        if "sync" in checkpoints:
-            pass
+    def standard_steps(
+        self, yaml_path: Path, commit_message: Optional[str] = None
+    ) -> list[WorkflowStep]:
+        """
+        标准工作流的步骤图。
 
-    def _emergency_rollback(self, checkpoints: list[str]) -> None:
-        """紧急回滚"""
-        pass
+        fetch 只更新子模块的远程跟踪分支，与 doc_check 并发预执行；
+        sync 前为子模块建立引用快照，按子模块并发合并已拉取的对象，不再重复 fetch。
+        """
+        if commit_message is None:
+            commit_message = "[sync] auto commit from workflow"
+
+        def doc_check_step() -> ConsistencyResult:
+            result = self.doc_check(yaml_path)
+            if not result.is_consistent:
+                raise StepFailed(result.message, result)
+            return result
+
+        return [
+            WorkflowStep("doc_check", doc_check_step),
+            WorkflowStep(
+                "fetch", lambda: self.git_ops.fetch_submodules(),
+                deps=("doc_check",), speculative=True,
+            ),
+            WorkflowStep("snapshot", self.snapshot_submodules, deps=("doc_check",)),
+            WorkflowStep(
+                "sync", lambda: self.reconcile_submodules(no_fetch=True),
+                deps=("doc_check", "fetch", "snapshot"),
+            ),
+            WorkflowStep("push", lambda: self.commit_and_push(commit_message), deps=("sync",)),
+        ]
+
+    def run_dag_workflow(
+        self,
+        yaml_path: Path,
+        commit_message: Optional[str] = None,
+        jobs: int = DEFAULT_DAG_JOBS,
+    ) -> WorkflowResult:
+        """以 DAG 方式运行标准工作流：拉取与一致性检查并发，其余步骤按依赖执行"""
+        try:
+            with tracing.span("workflow.dag", jobs=jobs):
+                return self._run_exclusive(
+                    "dag",
+                    lambda: self._run_dag_workflow(yaml_path, commit_message, jobs),
+                    yaml_path,
+                    commit_message,
+                )
+        finally:
+            metrics.write_textfile()
+            tracing.export()
+
+    def _run_exclusive(
+        self,
+        mode: str,
+        func: Callable[[], WorkflowResult],
+        yaml_path: Path,
+        commit_message: Optional[str],
+    ) -> WorkflowResult:
+        """
+        持有仓库租约运行工作流
+
+        相同的工作流正在运行时等待并返回它的结果；返回的 new_state 是那次运行结束时的状态，
+        本引擎的状态机不随之变化。
+        """
+        try:
+            return run_exclusive(
+                self.repo_root,
+                "workflow",
+                func,
+                params={"mode": mode, "yaml": str(yaml_path), "message": commit_message},
+                dump=_dump_result,
+                load=_load_result,
+            )
+        except LeaseTimeout as e:
+            return WorkflowResult(
+                success=False,
+                message=f"等待其他运行结束超时: {e}",
+                new_state=self.machine.state,
+            )
+
+    def _run_dag_workflow(
+        self, yaml_path: Path, commit_message: Optional[str], jobs: int
+    ) -> WorkflowResult:
+        dag = DagExecutor(self.standard_steps(yaml_path, commit_message), jobs=jobs).run()
+        checkpoints = [
+            name for name in dag.order
+            if dag.status[name] == StepStatus.SUCCESS and name != "fetch"
+        ]
+
+        failed = dag.failed_step
+        if failed is None:
+            return WorkflowResult(
+                success=True,
+                message="工作流执行成功",
+                new_state=self.machine.state,
+            )
+
+        error = dag.errors.get(failed)
+        if isinstance(error, IllegalTransitionError):
+            self._emergency_rollback(checkpoints)
+            return WorkflowResult(
+                success=False,
+                message=str(error),
+                new_state=self.machine.state,
+            )
+        if error is not None and not isinstance(error, StepFailed):
+            raise error
+
+        labels = {
+            "doc_check": "一致性检查失败",
+            "fetch": "子模块拉取失败",
+            "sync": "子模块同步失败",
+            "push": "提交推送失败",
+        }
+        detail = str(error) if error is not None else dag.results[failed].message
+        if failed == "sync":
+            self._rollback_sync(checkpoints)
+        return WorkflowResult(
+            success=False,
+            message=f"{labels[failed]}: {detail}",
+            new_state=self.machine.state,
+            error=self.machine.error if failed == "push" else None,
+        )
+
+    def snapshot_submodules(self) -> list[str]:
+        """同步前把各子模块的 HEAD 记录到检查点引用"""
+        self.snapshot_paths = self.git_ops.snapshot_submodules()
+        return self.snapshot_paths
+
+    def _rollback_sync(self, checkpoints: list[str]) -> Optional[RollbackResult]:
+        """回滚同步操作：并发恢复 HEAD 已移动的子模块"""
+        if "snapshot" not in checkpoints:
+            return None
+        self.last_rollback = self.git_ops.restore_submodules(self.snapshot_paths)
+        return self.last_rollback
+
+    def _emergency_rollback(self, checkpoints: list[str]) -> Optional[RollbackResult]:
+        """紧急回滚：尚未提交时撤销同步"""
+        if "commit" in checkpoints or "push" in checkpoints:
+            return None
+        return self._rollback_sync(checkpoints)
 
     def append_journal(self, results: list[dict]) -> None:
-        """追加日志到 meta/journal/YYYY-MM-DD.md"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        journal_path = self.repo_root / "meta" / "journal" / f"{today}.md"
-        now = datetime.now().strftime("%H:%M")
-
-        lines = []
-        for result in results:
-            status = "OK" if result.get("success") else "FAIL"
-            repo = result.get("repo", "main")
-            types_str = result.get("types", "")
-            lines.append(f"- {now} {status} {repo}: {types_str}")
-
-        if lines:
-            with open(journal_path, "a") as f:
-                f.write("\n" + "\n".join(lines))
+        """追加日志到 meta/journal/YYYY-MM-DD.md（结构化副本写入同名 .jsonl）"""
+        entries = [
+            JournalEntry(
+                status="OK" if result.get("success") else "FAIL",
+                repo=result.get("repo", "main"),
+                types=result.get("types", ""),
+            )
+            for result in results
+        ]
+        if entries:
+            writer = journal.writer_for(self.repo_root)
+            writer.extend(entries)
+            writer.flush()
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """执行完状态机的后台钩子并停止其工作线程；超时返回 False"""
+        return self.machine.close(timeout)
+
+    def __enter__(self) -> "WorkflowEngine":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
     def get_state(self) -> RepoState | ErrorState:
         """获取当前状态"""
@@ -246,7 +1164,14 @@ class WorkflowEngine:
             "is_error": self.machine.is_error_state(),
             "allowed_events": self.get_allowed_events(),
             "history_count": len(self.machine.history),
+            "error_count": self.machine.stats.error_count,
         }
+
+        if self.submodules.machines:
+            status_info["submodules"] = self.submodules.summary()
+
+        if self.step_cache is not None:
+            status_info["step_cache"] = self.step_cache.summary()
         
         if hasattr(state, "value"):
             status_info["state_name"] = state.name
@@ -282,41 +1207,93 @@ class WorkflowEngine:
 
     def get_history(self, limit: int = 10) -> list[dict]:
         """获取状态历史"""
-        history = []
-        for i, (from_state, event) in enumerate(self.machine.history[-limit:], 1):
-            history.append({
-                "index": len(self.machine.history) - limit + i,
+        history = self.machine.history
+        count = len(history)
+        entries = []
+        for pos in range(max(0, count - limit), count):
+            from_state = history.state_at(pos)
+            event = history.event_at(pos)
+            entries.append({
+                "index": history.dropped + pos + 1,
                 "from_state": from_state,
                 "event": event,
                 "event_name": event.name,
-                "from_state_name": from_state.name if hasattr(from_state, "name") else str(from_state),
+                "from_state_name": from_state.name,
+                "timestamp": datetime.fromtimestamp(history.timestamp_at(pos)),
             })
-        return history
+        return entries
 
     def audit(self, since: datetime | None = None, until: datetime | None = None) -> dict:
-        """生成审计报告"""
-        total_transitions = len(self.machine.history)
-        error_count = sum(1 for s, _ in self.machine.history 
-                         if isinstance(s, ErrorState) or 
-                         (hasattr(s, "name") and "ERROR" in s.name))
-        
-        state_distribution = {}
-        for from_state, _ in self.machine.history:
-            state_name = from_state.name if hasattr(from_state, "name") else str(from_state)
-            state_distribution[state_name] = state_distribution.get(state_name, 0) + 1
-        
+        """生成审计报告（指定 since/until 时只统计该时间范围内的转移）"""
+        if since is not None or until is not None:
+            return self._audit_range(since, until)
+
+        stats = self.machine.stats
+        state_distribution = {
+            STATE_CODES[code].name: n for code, n in enumerate(stats.state_counts) if n
+        }
+        errors = [
+            {"index": index, "error": error, "event": event}
+            for index, error, event in stats.iter_errors()
+        ]
+
+        return {
+            "total_transitions": stats.offset + stats.total,
+            "dropped_transitions": self.machine.history.dropped,
+            "error_count": stats.error_count,
+            "state_distribution": state_distribution,
+            "errors": errors,
+        }
+
+    def _audit_range(self, since: datetime | None, until: datetime | None) -> dict:
+        """按时间范围审计：有持久化日志时查日志，否则查内存历史"""
+        since_ts = since.timestamp() if since is not None else None
+        until_ts = until.timestamp() if until is not None else None
+
+        if self.transition_log is not None:
+            records = (
+                (r.index, r.from_state, r.event)
+                for r in self.transition_log.query(since_ts, until_ts)
+            )
+        else:
+            records = self._history_range(since_ts, until_ts)
+
+        total = 0
+        state_distribution: dict[str, int] = {}
         errors = []
-        for i, (state, event) in enumerate(self.machine.history):
-            if isinstance(state, ErrorState) or (hasattr(state, "name") and "ERROR" in state.name):
-                errors.append({
-                    "index": i,
-                    "error": state,
-                    "event": event,
-                })
-        
+        for index, from_state, event in records:
+            total += 1
+            state_distribution[from_state.name] = state_distribution.get(from_state.name, 0) + 1
+            if isinstance(from_state, ErrorState):
+                errors.append({"index": index, "error": from_state, "event": event})
+
         return {
-            "total_transitions": total_transitions,
-            "error_count": error_count,
+            "total_transitions": total,
+            "dropped_transitions": 0,
+            "error_count": len(errors),
             "state_distribution": state_distribution,
             "errors": errors,
         }
+
+    def _history_range(self, since_ts: float | None, until_ts: float | None):
+        """在内存历史中二分定位时间范围（时间戳单调不减）"""
+        history = self.machine.history
+        count = len(history)
+        times = _TimestampView(history)
+        start = bisect_left(times, since_ts, 0, count) if since_ts is not None else 0
+        stop = bisect_right(times, until_ts, 0, count) if until_ts is not None else count
+        for pos in range(start, stop):
+            yield history.dropped + pos, history.state_at(pos), history.event_at(pos)
+
+
+class _TimestampView:
+    """把转移历史的时间戳暴露为可二分的序列"""
+
+    def __init__(self, history):
+        self.history = history
+
+    def __len__(self) -> int:
+        return len(self.history)
+
+    def __getitem__(self, pos: int) -> float:
+        return self.history.timestamp_at(pos)
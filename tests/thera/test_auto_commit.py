@@ -1,6 +1,7 @@
 """测试自动提交推送功能"""
 
 import argparse
+import json
 import pytest
 import subprocess
 from pathlib import Path
@@ -169,6 +170,18 @@ class TestDetectAllChanges:
                 result = auto_commit.detect_all_changes(tmp_path)
                 assert result == {}
 
+    def test_known_submodules(self, tmp_path):
+        """测试传入子模块路径时不再查询 submodule status"""
+        with patch("thera.auto_commit.get_submodule_status") as mock_sub:
+            with patch("thera.auto_commit.get_repo_status") as mock_status:
+                mock_status.side_effect = lambda root: (
+                    [{"path": "a.md", "type": "root", "status": "M"}]
+                    if root == tmp_path / "docs/a" else []
+                )
+                result = auto_commit.detect_all_changes(tmp_path, submodules=["docs/a"])
+                mock_sub.assert_not_called()
+                assert list(result) == ["docs/a"]
+
     def test_main_repo_changes(self, tmp_path):
         """测试主仓库变更"""
         with patch("thera.auto_commit.get_submodule_status") as mock_sub:
@@ -432,6 +445,21 @@ class TestAppendJournal:
             assert "OK" in content
             assert "main" in content
 
+    def test_structured_sidecar(self, tmp_path):
+        """测试结构化副本"""
+        with patch("builtins.print"):
+            auto_commit.append_journal(tmp_path, [
+                (True, "docs/paper", [{"path": "a.md", "type": "docs"}]),
+                (False, "main", []),
+            ])
+        journal_file = tmp_path / "meta" / "journal" / f"{datetime.now().strftime('%Y-%m-%d')}.md"
+        records = [json.loads(line) for line in journal_file.with_suffix(".jsonl").read_text().splitlines()]
+        assert [(r["status"], r["repo"], r["changes"]) for r in records] == [
+            ("OK", "docs/paper", {"docs": ["a.md"]}),
+            ("FAIL", "main", {}),
+        ]
+        assert journal_file.read_text().endswith(" OK docs/paper: [docs] a.md\n- " + records[1]["time"][11:16] + " FAIL main: ")
+
     def test_failed_status(self, tmp_path):
         """测试失败状态"""
         journal_dir = tmp_path / "meta" / "journal"
@@ -453,6 +481,53 @@ class TestAppendJournal:
             ])
 
 
+class TestCommitExclusive:
+    """测试 commit_exclusive 函数"""
+
+    def test_commit_in_lease(self, git_repo):
+        """租约内提交并写日志，租约随后释放"""
+        from thera.lease import RepoLease
+
+        lease = RepoLease(git_repo)
+        all_changes = {".": [{"path": "README.md", "type": "root", "status": "M"}]}
+        with patch("thera.auto_commit.commit_all_changes") as mock_commit:
+            with patch("thera.auto_commit.append_journal") as mock_journal:
+                mock_commit.side_effect = lambda *args: [(lease.holder().operation == "auto-commit", "main", [])]
+                results = auto_commit.commit_exclusive(git_repo, all_changes)
+        assert results == [(True, "main", [])]
+        mock_journal.assert_called_once_with(git_repo, results)
+        assert lease.holder() is None
+
+    def test_redetects_in_lease(self, git_repo):
+        """获得租约后按当前状态提交：排队期间已提交的文件不再提交，未确认的仓库不处理"""
+        confirmed = {
+            ".": [{"path": "README.md", "type": "root", "status": "M"}],
+            "docs/gone": [{"path": "x.md", "type": "root", "status": "M"}],
+        }
+        (git_repo / "notes.md").write_text("new\n")
+        with patch("thera.auto_commit.commit_all_changes", return_value=[]) as mock_commit:
+            with patch("thera.auto_commit.append_journal"), \
+                    patch("thera.auto_commit.get_submodule_status") as mock_status:
+                auto_commit.commit_exclusive(git_repo, confirmed)
+        mock_status.assert_not_called()
+        mock_commit.assert_called_once_with(
+            git_repo, {".": [{"status": "??", "path": "notes.md", "type": "root"}]}
+        )
+
+    def test_lease_timeout(self, git_repo):
+        """等待租约超时时 main 返回 1"""
+        from thera.lease import LeaseTimeout
+
+        with patch("thera.auto_commit.detect_all_changes") as mock_detect:
+            with patch("thera.auto_commit.commit_exclusive", side_effect=LeaseTimeout("等待超时")):
+                with patch("builtins.print"), patch("builtins.input", return_value="y"):
+                    mock_detect.return_value = {
+                        ".": [{"path": "README.md", "type": "root", "status": "M"}]
+                    }
+                    args = argparse.Namespace(repo=str(git_repo), dry_run=False)
+                    assert auto_commit.main(args) == 1
+
+
 class TestMain:
     """测试 main 函数"""
 
@@ -0,0 +1,223 @@
+"""
+守护进程测试
+"""
+
+import socket
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from typer.testing import CliRunner
+
+from thera.cli import app
+from thera.daemon import (
+    MAX_SOCKET_PATH,
+    NO_DAEMON_ENV,
+    DaemonError,
+    TheraDaemon,
+    collect_status,
+    format_status,
+    request,
+    socket_path,
+    tree_fingerprint,
+)
+from thera.pipeline import RepoSession, RunOptions, run_doc_check
+from thera.refresh import RefreshResult
+
+
+@pytest.fixture(autouse=True)
+def _allow_daemon(monkeypatch):
+    monkeypatch.delenv(NO_DAEMON_ENV, raising=False)
+
+
+@pytest.fixture
+def daemon(git_repo):
+    """在后台线程中运行的守护进程"""
+    d = TheraDaemon(git_repo, interval=0.05)
+    d.start()
+    yield d
+    d.shutdown()
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestSocketPath:
+    """socket 路径测试"""
+
+    def test_in_state_dir(self, git_repo):
+        path = socket_path(git_repo)
+        if len(str(git_repo / ".git" / "thera" / "daemon.sock")) <= MAX_SOCKET_PATH:
+            assert path == git_repo.resolve() / ".git" / "thera" / "daemon.sock"
+
+    def test_long_path_fallback(self, tmp_path):
+        deep = tmp_path / ("x" * 120)
+        deep.mkdir()
+        path = socket_path(deep)
+        assert len(str(path)) <= MAX_SOCKET_PATH
+        assert path.name.startswith("thera-")
+        assert socket_path(deep) == path
+
+
+class TestRequest:
+    """客户端回退测试"""
+
+    def test_no_daemon(self, git_repo):
+        assert request(git_repo, "ping") is None
+
+    def test_disabled_by_env(self, daemon, git_repo, monkeypatch):
+        monkeypatch.setenv(NO_DAEMON_ENV, "1")
+        assert request(git_repo, "ping") is None
+
+    def test_stale_socket(self, git_repo):
+        path = socket_path(git_repo)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        assert request(git_repo, "ping") is None
+
+    def test_unknown_command(self, daemon, git_repo):
+        with pytest.raises(DaemonError, match="未知命令"):
+            request(git_repo, "lint")
+
+    @pytest.mark.parametrize("reply", [b'{"ok": tr', b"\xff\xfe\n", b"[1, 2]\n"])
+    def test_malformed_reply(self, git_repo, reply):
+        """截断或损坏的应答以 DaemonError 报告"""
+        path = socket_path(git_repo)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(path))
+        server.listen(1)
+
+        def reply_once():
+            conn, _ = server.accept()
+            with conn:
+                conn.makefile("rb").readline()
+                conn.sendall(reply)
+
+        thread = threading.Thread(target=reply_once)
+        thread.start()
+        try:
+            with pytest.raises(DaemonError, match="无法解析"):
+                request(git_repo, "ping")
+        finally:
+            thread.join(5)
+            server.close()
+            path.unlink()
+
+
+class TestDaemon:
+    """守护进程命令测试"""
+
+    def test_ping(self, daemon, git_repo):
+        response = request(git_repo, "ping")
+        assert response["ok"] is True
+        assert response["generation"] == 0
+
+    def test_already_running(self, daemon, git_repo):
+        with pytest.raises(RuntimeError, match="已在运行"):
+            TheraDaemon(git_repo).start()
+
+    def test_status_cached(self, daemon, git_repo):
+        with patch.object(daemon.state.session.git_ops, "get_status",
+                          wraps=daemon.state.session.git_ops.get_status) as get_status:
+            first = request(git_repo, "status")
+            second = request(git_repo, "status")
+        assert get_status.call_count == 1
+        assert first["data"] == second["data"]
+        assert first["generation"] == second["generation"]
+        assert first["output"] == format_status(collect_status(RepoSession(git_repo.resolve())))
+
+    def test_file_change_invalidates(self, daemon, git_repo):
+        first = request(git_repo, "status")
+        assert first["data"]["clean"] is True
+        time.sleep(0.1)  # 轮询不因 status 自身的 .git/index 更新而失效
+        assert request(git_repo, "status")["generation"] == first["generation"]
+
+        (git_repo / "notes.md").write_text("new\n")
+        assert wait_for(lambda: daemon.state.generation > first["generation"])
+        data = request(git_repo, "status")["data"]
+        assert data["clean"] is False
+        assert data["changes"][0]["path"] == "notes.md"
+
+    def test_status_refresh(self, daemon, git_repo):
+        first = request(git_repo, "status")
+        assert request(git_repo, "status", refresh=True)["generation"] > first["generation"]
+
+    def test_doc_check_matches_in_process(self, daemon, git_repo, capsys):
+        response = request(git_repo, "doc-check")
+        result = run_doc_check(RepoSession(git_repo.resolve()), RunOptions())
+        assert response["output"] == capsys.readouterr().out
+        assert response["exit_code"] == (0 if result.success else 1)
+
+    def test_refresh(self, daemon, git_repo):
+        result = RefreshResult(True, "子模块已更新", updated_submodules=["docs/a"])
+        with patch("thera.refresh.refresh", return_value=result) as do_refresh:
+            response = request(git_repo, "refresh", submodule="docs/a")
+        assert do_refresh.call_args.kwargs["submodule"] == "docs/a"
+        assert do_refresh.call_args.kwargs["ops"] is not None
+        assert RefreshResult(**response["data"]) == result
+        assert response["exit_code"] == 0
+
+    def test_shutdown(self, git_repo):
+        d = TheraDaemon(git_repo)
+        d.start()
+        assert request(git_repo, "shutdown")["exit_code"] == 0
+        d._thread.join(timeout=5)
+        d._cleanup()
+        assert not d.path.exists()
+        assert request(git_repo, "ping") is None
+
+
+def test_fingerprint_ignores_git_objects(git_repo):
+    before = tree_fingerprint(git_repo, [], "meta/profile/submodules.yaml")
+    (git_repo / ".git" / "objects" / "scratch").write_text("x")
+    assert tree_fingerprint(git_repo, [], "meta/profile/submodules.yaml") == before
+    (git_repo / "README.md").write_text("# Changed\n")
+    assert tree_fingerprint(git_repo, [], "meta/profile/submodules.yaml") != before
+
+
+class TestCli:
+    """CLI 转发与回退测试"""
+
+    def test_status_in_process(self, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        result = CliRunner().invoke(app, ["status"])
+        assert result.exit_code == 0, result.output
+        assert "工作区: 干净" in result.output
+
+    def test_status_forwarded(self, daemon, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        request(git_repo, "status")  # 预热缓存
+        with patch("thera.daemon.collect_status") as in_process:
+            in_process.side_effect = AssertionError("不应在进程内执行")
+            result = CliRunner().invoke(app, ["status"])
+        assert result.exit_code == 0, result.output
+        assert "工作区: 干净" in result.output
+
+    def test_refresh_forwarded(self, daemon, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        reply = RefreshResult(True, "主仓库无需更新")
+        with patch("thera.refresh.refresh", return_value=reply) as do_refresh:
+            result = CliRunner().invoke(app, ["refresh", "--dry-run"])
+        assert result.exit_code == 0, result.output
+        assert "✓ 主仓库无需更新" in result.output
+        assert do_refresh.call_args.kwargs["ops"] is daemon.state.session.git_ops
+
+    def test_doc_check_fallback(self, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        result = CliRunner().invoke(app, ["doc-check"])
+        assert result.exit_code == 1
+        assert "YAML vs .gitmodules" in result.output
+
+    def test_serve_stop_without_daemon(self, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        result = CliRunner().invoke(app, ["serve", "--stop"])
+        assert result.exit_code == 1
+        assert "守护进程未运行" in result.output
@@ -0,0 +1,110 @@
+"""测试 DAG 工作流执行"""
+
+import threading
+import time
+
+import pytest
+
+from thera.dag import DagExecutor, StepFailed, StepStatus, WorkflowStep
+from thera.git_ops import SyncResult
+
+
+class TestDagExecutor:
+    """DagExecutor 测试"""
+
+    def test_runs_in_dependency_order(self):
+        calls = []
+        steps = [
+            WorkflowStep("c", lambda: calls.append("c"), deps=("b",)),
+            WorkflowStep("a", lambda: calls.append("a")),
+            WorkflowStep("b", lambda: calls.append("b"), deps=("a",)),
+        ]
+        result = DagExecutor(steps).run()
+        assert result.success is True
+        assert calls == ["a", "b", "c"]
+
+    def test_independent_steps_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        steps = [
+            WorkflowStep("a", barrier.wait),
+            WorkflowStep("b", barrier.wait),
+        ]
+        result = DagExecutor(steps, jobs=2).run()
+        assert result.success is True
+
+    def test_failure_skips_dependents(self):
+        def gate():
+            raise StepFailed("不一致")
+
+        steps = [
+            WorkflowStep("gate", gate),
+            WorkflowStep("next", lambda: None, deps=("gate",)),
+            WorkflowStep("last", lambda: None, deps=("next",)),
+        ]
+        result = DagExecutor(steps).run()
+        assert result.status == {
+            "gate": StepStatus.FAILED,
+            "next": StepStatus.SKIPPED,
+            "last": StepStatus.SKIPPED,
+        }
+        assert result.failed_step == "gate"
+        assert str(result.errors["gate"]) == "不一致"
+
+    def test_unsuccessful_result_fails(self):
+        steps = [WorkflowStep("sync", lambda: SyncResult(False, "同步失败"))]
+        result = DagExecutor(steps).run()
+        assert result.status["sync"] == StepStatus.FAILED
+        assert result.results["sync"].message == "同步失败"
+
+    def test_speculative_starts_before_deps(self):
+        gate_started = threading.Event()
+        fetched = threading.Event()
+
+        def gate():
+            gate_started.set()
+            assert fetched.wait(5)
+
+        steps = [
+            WorkflowStep("gate", gate),
+            WorkflowStep("fetch", fetched.set, deps=("gate",), speculative=True),
+        ]
+        result = DagExecutor(steps, jobs=2).run()
+        assert result.success is True
+        assert result.order == ["gate", "fetch"]
+
+    def test_speculative_discarded_when_gate_fails(self):
+        """门控失败时丢弃预执行结果，但返回前等待预执行步骤结束"""
+        fetched = threading.Event()
+
+        def gate():
+            raise StepFailed("不一致")
+
+        def fetch():
+            time.sleep(0.2)
+            fetched.set()
+
+        steps = [
+            WorkflowStep("gate", gate),
+            WorkflowStep("fetch", fetch, deps=("gate",), speculative=True),
+            WorkflowStep("sync", lambda: None, deps=("fetch",)),
+        ]
+        result = DagExecutor(steps, jobs=2).run()
+        assert fetched.is_set()
+        assert result.status["fetch"] == StepStatus.DISCARDED
+        assert result.status["sync"] == StepStatus.SKIPPED
+        assert "fetch" not in result.results
+
+    def test_rejects_unknown_dependency(self):
+        with pytest.raises(ValueError):
+            DagExecutor([WorkflowStep("a", lambda: None, deps=("missing",))])
+
+    def test_rejects_cycle(self):
+        with pytest.raises(ValueError):
+            DagExecutor([
+                WorkflowStep("a", lambda: None, deps=("b",)),
+                WorkflowStep("b", lambda: None, deps=("a",)),
+            ])
+
+    def test_rejects_duplicate_names(self):
+        with pytest.raises(ValueError):
+            DagExecutor([WorkflowStep("a", lambda: None), WorkflowStep("a", lambda: None)])
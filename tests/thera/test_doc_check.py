@@ -100,6 +100,17 @@ submodules:
         assert result[0] is True
         assert "1 个子模块" in result[1]
 
+    def test_preparsed_registry(self, tmp_path):
+        """测试传入已解析的注册表时不读取文件"""
+        result = doc_check.check_gitmodules_vs_yaml(
+            tmp_path,
+            "not_exist.yaml",
+            yaml_modules=[{"name": "archive", "path": "docs/archive"}],
+            git_modules={"archive": "docs/other"},
+        )
+        assert result[0] is False
+        assert "路径不一致: archive: docs/other vs docs/archive" in result[1]
+
     def test_missing_in_yaml(self, tmp_path, git_repo):
         """测试 YAML 缺少子模块"""
         gitmodules_content = '''
@@ -1,16 +1,28 @@
 """测试 FSM 模块"""
 
+from array import array
+
 import pytest
 
 from thera.fsm import (
     ALLOWED_EVENTS,
+    EVENT_CODES,
+    EVENT_INDEX,
+    N_EVENTS,
+    STATE_CODES,
+    TRANSITION_MATRIX,
+    STATE_INDEX,
     TRANSITIONS,
     ErrorState,
     Event,
     IllegalTransitionError,
     RepoState,
     StateMachine,
+    SubmoduleEvent,
+    SubmoduleMachine,
     SubmoduleState,
+    TransitionHistory,
+    TransitionStats,
 )
 
 
@@ -207,6 +219,34 @@ class TestStateMachine:
         assert machine.is_error_state() is True
 
 
+class TestRetryTransition:
+    """测试推送重试转移"""
+
+    def test_retry_from_network_error(self):
+        machine = StateMachine()
+        machine.transition_many([Event.DOC_CHECK_OK, Event.SUBMODULE_SYNC, Event.AUTO_COMMIT])
+        machine.transition(Event.PUSH_FAIL)
+        assert machine.get_allowed_events() == [Event.RETRY]
+
+        assert machine.transition(Event.RETRY) == RepoState.COMMITTED
+        assert machine.error is None
+        assert machine.transition(Event.PUSH_OK) == RepoState.CLEAN_AND_CONSISTENT
+
+    def test_retry_clears_error_in_batch(self):
+        machine = StateMachine()
+        machine.transition_many(
+            [Event.DOC_CHECK_OK, Event.SUBMODULE_SYNC, Event.AUTO_COMMIT,
+             Event.PUSH_FAIL, Event.RETRY]
+        )
+        assert machine.state == RepoState.COMMITTED
+        assert machine.error is None
+
+    def test_retry_illegal_elsewhere(self):
+        machine = StateMachine()
+        with pytest.raises(IllegalTransitionError):
+            machine.transition(Event.RETRY)
+
+
 class TestTransitionsTable:
     """测试转移表"""
 
@@ -275,3 +315,271 @@ class TestStateMachineHooks:
         assert len(calls) == 2
         assert "callback1" in calls
         assert "callback2" in calls
+
+
+class TestTransitionHistory:
+    """测试转移历史环形缓冲区"""
+
+    def test_records_and_reads(self):
+        history = TransitionHistory(capacity=4)
+        history.record(RepoState.DIRTY, Event.DOC_CHECK_OK, timestamp=1.0)
+        assert len(history) == 1
+        assert history[0] == (RepoState.DIRTY, Event.DOC_CHECK_OK)
+        assert history.timestamp_at(0) == 1.0
+
+    def test_wraps_at_capacity(self):
+        history = TransitionHistory(capacity=3)
+        events = [Event.EDIT, Event.FIX, Event.AUTO_COMMIT, Event.PUSH_OK, Event.PUSH_FAIL]
+        for i, event in enumerate(events):
+            history.record(RepoState.DIRTY, event, timestamp=float(i))
+
+        assert len(history) == 3
+        assert history.total == 5
+        assert history.dropped == 2
+        assert [e for _, e in history] == events[2:]
+        assert history.timestamp_at(0) == 2.0
+        assert history[-1] == (RepoState.DIRTY, Event.PUSH_FAIL)
+
+    def test_slice(self):
+        history = TransitionHistory.from_entries([
+            (RepoState.DIRTY, Event.DOC_CHECK_OK),
+            (RepoState.CLEAN_AND_CONSISTENT, Event.SUBMODULE_SYNC),
+            (RepoState.SYNCED, Event.AUTO_COMMIT),
+        ])
+        assert history[-2:] == [
+            (RepoState.CLEAN_AND_CONSISTENT, Event.SUBMODULE_SYNC),
+            (RepoState.SYNCED, Event.AUTO_COMMIT),
+        ]
+
+    def test_index_out_of_range(self):
+        history = TransitionHistory(capacity=2)
+        with pytest.raises(IndexError):
+            history[0]
+
+    def test_invalid_capacity(self):
+        with pytest.raises(ValueError):
+            TransitionHistory(capacity=0)
+
+    def test_state_counts_and_positions(self):
+        history = TransitionHistory(capacity=3)
+        history.record(RepoState.DIRTY, Event.DOC_CHECK_OK)
+        history.record(ErrorState.NETWORK_ERROR, Event.PUSH_FAIL)
+        history.record(RepoState.DIRTY, Event.DOC_CHECK_OK)
+        history.record(ErrorState.NETWORK_ERROR, Event.PUSH_FAIL)
+
+        counts = history.state_counts()
+        assert sum(counts) == 3
+        assert history.positions_of([STATE_INDEX[ErrorState.NETWORK_ERROR]]) == [0, 2]
+
+    def test_machine_history_capacity(self):
+        machine = StateMachine(history_capacity=2)
+        machine.transition(Event.DOC_CHECK_OK)
+        machine.transition(Event.EDIT)
+        machine.transition(Event.DOC_CHECK_OK)
+        assert len(machine.history) == 2
+        assert machine.history.total == 3
+        assert machine.history[0] == (RepoState.CLEAN_AND_CONSISTENT, Event.EDIT)
+
+    def test_load_history(self):
+        machine = StateMachine()
+        machine.load_history([(RepoState.DIRTY, Event.DOC_CHECK_OK)])
+        assert isinstance(machine.history, TransitionHistory)
+        assert machine.history == [(RepoState.DIRTY, Event.DOC_CHECK_OK)]
+
+
+class TestTransitionStats:
+    """测试转移聚合计数"""
+
+    def test_updates_on_transition(self):
+        machine = StateMachine()
+        machine.transition(Event.DOC_CHECK_OK)
+        machine.transition(Event.EDIT)
+        assert machine.stats.total == 2
+        assert machine.stats.state_counts[STATE_INDEX[RepoState.DIRTY]] == 1
+        assert machine.stats.error_count == 0
+
+    def test_counts_survive_eviction(self):
+        machine = StateMachine(history_capacity=2)
+        for _ in range(3):
+            machine.transition(Event.DOC_CHECK_OK)
+            machine.transition(Event.EDIT)
+        assert len(machine.history) == 2
+        assert machine.stats.total == 6
+        assert machine.stats.state_counts[STATE_INDEX[RepoState.DIRTY]] == 3
+
+    def test_error_index(self):
+        stats = TransitionStats()
+        stats.record_codes(STATE_INDEX[RepoState.COMMITTED], 0)
+        stats.record_codes(STATE_INDEX[ErrorState.NETWORK_ERROR], 1)
+        assert stats.error_count == 1
+        assert list(stats.iter_errors()) == [(1, ErrorState.NETWORK_ERROR, Event.DOC_CHECK_OK)]
+
+    def test_error_index_bounded(self):
+        """错误记录只保留最近 capacity 条，error_count 仍是总数"""
+        error = STATE_INDEX[ErrorState.NETWORK_ERROR]
+        ok = STATE_INDEX[RepoState.COMMITTED]
+        stats = TransitionStats(capacity=3)
+        for _ in range(3):
+            stats.record_codes(ok, 0)
+            stats.record_codes(error, 1)
+        stats.extend_codes(array("B", [error, ok, error]), array("B", [2, 0, 3]))
+        assert stats.error_count == 5
+        assert [pos for pos, _, _ in stats.iter_errors()] == [5, 6, 8]
+        assert [event for _, _, event in stats.iter_errors()] == [
+            EVENT_CODES[1], EVENT_CODES[2], EVENT_CODES[3],
+        ]
+        assert StateMachine(history_capacity=2).stats.capacity == 2
+
+    def test_from_history_matches_live(self):
+        live = StateMachine(history_capacity=4)
+        for event in CYCLE * 2:
+            live.transition(event)
+        rebuilt = TransitionStats.from_history(live.history)
+        assert rebuilt.total == len(live.history) == sum(rebuilt.state_counts)
+        assert rebuilt.offset == live.history.dropped
+
+        fresh = StateMachine()
+        for event in CYCLE * 2:
+            fresh.transition(event)
+        assert TransitionStats.from_history(fresh.history).state_counts == fresh.stats.state_counts
+
+    def test_rebuilt_on_load_history(self):
+        machine = StateMachine()
+        machine.transition(Event.DOC_CHECK_OK)
+        machine.load_history([(ErrorState.NETWORK_ERROR, Event.PUSH_OK)])
+        assert machine.stats.total == 1
+        assert machine.stats.error_count == 1
+
+
+CYCLE = [Event.DOC_CHECK_OK, Event.SUBMODULE_SYNC, Event.AUTO_COMMIT, Event.PUSH_OK, Event.EDIT]
+
+
+class TestTransitionMatrix:
+    """测试编译后的转移矩阵"""
+
+    def test_matches_tables(self):
+        for state in STATE_CODES:
+            for event in Event:
+                target = TRANSITION_MATRIX[STATE_INDEX[state] * N_EVENTS + EVENT_INDEX[event]]
+                if event in ALLOWED_EVENTS.get(state, []):
+                    assert STATE_CODES[target] == TRANSITIONS[state][event]
+                else:
+                    assert target == -1
+
+
+class TestTransitionMany:
+    """测试批量转移与序列校验"""
+
+    def test_matches_sequential(self):
+        events = CYCLE * 7 + [Event.DOC_CHECK_OK]
+        batch = StateMachine(history_capacity=8)
+        batch.transition_many(events)
+
+        single = StateMachine(history_capacity=8)
+        for event in events:
+            single.transition(event)
+
+        assert batch.state == single.state
+        assert batch.history == single.history
+        assert batch.history.total == single.history.total
+        assert batch.stats.state_counts == single.stats.state_counts
+
+    def test_long_stream_with_errors(self):
+        """跨多个扫描块、重复的块命中缓存后，结果仍与逐个转移一致"""
+        retry = [Event.DOC_CHECK_OK, Event.SUBMODULE_SYNC, Event.AUTO_COMMIT, Event.PUSH_FAIL,
+                 Event.RETRY, Event.PUSH_OK, Event.EDIT]
+        events = (CYCLE * 3 + retry) * 40 + CYCLE[:3] + [Event.PUSH_FAIL]
+        batch = StateMachine(history_capacity=50)
+        batch.transition_many(events)
+
+        single = StateMachine(history_capacity=50)
+        for event in events:
+            single.transition(event)
+
+        assert (batch.state, batch.error) == (single.state, single.error)
+        assert batch.history == single.history
+        assert batch.stats.state_counts == single.stats.state_counts
+        assert batch.stats.error_count == single.stats.error_count == 40
+        assert list(batch.stats.iter_errors()) == list(single.stats.iter_errors())
+
+    def test_illegal_after_cached_chunks(self):
+        events = CYCLE * 20 + [Event.FIX] + CYCLE
+        machine = StateMachine()
+        assert machine.validate_sequence(events) == 100
+        with pytest.raises(IllegalTransitionError) as exc:
+            machine.transition_many(events)
+        assert exc.value.event == Event.FIX
+        assert machine.stats.total == 100
+        assert machine.state == RepoState.DIRTY
+
+    def test_rejects_foreign_events(self):
+        with pytest.raises(AttributeError):
+            StateMachine().transition_many([SubmoduleEvent.SYNC_OK])
+
+    def test_batches_wrap_ring_buffer(self):
+        machine = StateMachine(history_capacity=4)
+        machine.transition_many(CYCLE[:3])
+        machine.transition_many(CYCLE[3:] + CYCLE[:1])
+        assert machine.history == [
+            (RepoState.SYNCED, Event.AUTO_COMMIT),
+            (RepoState.COMMITTED, Event.PUSH_OK),
+            (RepoState.CLEAN_AND_CONSISTENT, Event.EDIT),
+            (RepoState.DIRTY, Event.DOC_CHECK_OK),
+        ]
+
+    def test_push_fail_sets_error(self):
+        machine = StateMachine()
+        machine.transition_many(CYCLE[:3] + [Event.PUSH_FAIL])
+        assert machine.state == ErrorState.NETWORK_ERROR
+        assert machine.error == ErrorState.NETWORK_ERROR
+
+    def test_illegal_keeps_prefix(self):
+        machine = StateMachine()
+        with pytest.raises(IllegalTransitionError):
+            machine.transition_many([Event.DOC_CHECK_OK, Event.AUTO_COMMIT, Event.EDIT])
+        assert machine.state == RepoState.CLEAN_AND_CONSISTENT
+        assert len(machine.history) == 1
+
+    def test_runs_hooks_when_registered(self):
+        machine = StateMachine()
+        called = []
+        machine.add_enter_hook(RepoState.SYNCED, lambda old, event: called.append(event))
+        machine.transition_many(CYCLE * 2)
+        assert called == [Event.SUBMODULE_SYNC, Event.SUBMODULE_SYNC]
+
+    def test_validate_sequence(self):
+        machine = StateMachine()
+        assert machine.validate_sequence(CYCLE * 3) is None
+        assert machine.validate_sequence([Event.DOC_CHECK_OK, Event.FIX]) == 1
+        assert machine.validate_sequence([Event.FIX], start=RepoState.INCONSISTENT) is None
+        assert machine.state == RepoState.DIRTY
+        assert len(machine.history) == 0
+
+
+class TestSubmoduleMachine:
+    """SubmoduleMachine 测试"""
+
+    def test_sync_ok(self):
+        machine = SubmoduleMachine("lib")
+        assert machine.transition(SubmoduleEvent.SYNC_OK) == SubmoduleState.UP_TO_DATE
+
+    def test_sync_fail_keeps_error(self):
+        machine = SubmoduleMachine("lib")
+        machine.transition(SubmoduleEvent.SYNC_FAIL, "merge conflict")
+        assert machine.state == SubmoduleState.DETACHED
+        assert machine.error == "merge conflict"
+        machine.transition(SubmoduleEvent.REATTACH)
+        assert machine.state == SubmoduleState.BEHIND
+        assert machine.error is None
+
+    def test_illegal_transition(self):
+        machine = SubmoduleMachine("lib", SubmoduleState.UP_TO_DATE)
+        assert machine.can_transition(SubmoduleEvent.SYNC_OK) is False
+        with pytest.raises(IllegalTransitionError):
+            machine.transition(SubmoduleEvent.SYNC_OK)
+
+    def test_on_change(self):
+        changes = []
+        machine = SubmoduleMachine("lib", on_change=lambda *args: changes.append(args))
+        machine.transition(SubmoduleEvent.SYNC_OK)
+        assert changes == [("lib", SubmoduleState.BEHIND, SubmoduleState.UP_TO_DATE)]
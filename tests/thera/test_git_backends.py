@@ -0,0 +1,223 @@
+"""
+Git 后端测试
+
+一致性矩阵：每个进程内后端在每种仓库形态下的结果必须与 git 子进程一致；
+后端可以拒绝（BackendUnsupported，由子进程兜底），但不能给出不同的答案。
+"""
+
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from thera import metrics
+from thera.git_backends import (
+    BACKENDS,
+    BackendUnsupported,
+    PythonBackend,
+    SubprocessBackend,
+    default_backends,
+    parse_config,
+    read_index,
+)
+from thera.git_ops import GitOps
+
+
+def git(cwd, *args):
+    result = subprocess.run(
+        ["git", "-c", "protocol.file.allow=always",
+         "-c", "user.email=test@example.com", "-c", "user.name=Test User", *args],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+def init_repo(path: Path) -> Path:
+    path.mkdir(parents=True)
+    git(path, "init", "-q", "-b", "main")
+    (path / "README.md").write_text("# Test\n")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "init")
+    return path
+
+
+@pytest.fixture
+def superproject(tmp_path):
+    """两个子模块的仓库：docs/a 已初始化，docs/b 已初始化后领先于索引记录"""
+    upstream = init_repo(tmp_path / "upstream")
+    repo = init_repo(tmp_path / "repo")
+    for path in ("docs/a", "docs/b"):
+        git(repo, "submodule", "add", "-q", str(upstream), path)
+    git(repo, "commit", "-q", "-m", "add submodules")
+    (repo / "docs" / "b" / "new.md").write_text("x\n")
+    git(repo / "docs" / "b", "add", ".")
+    git(repo / "docs" / "b", "commit", "-q", "-m", "ahead")
+    return repo
+
+
+def scenario(name, repo):
+    """在 superproject 上构造各种仓库形态"""
+    if name == "packed-refs":
+        git(repo, "pack-refs", "--all")
+    elif name == "detached":
+        git(repo, "checkout", "-q", "--detach", "HEAD")
+    elif name == "uninitialized":
+        git(repo, "submodule", "deinit", "-q", "-f", "docs/a")
+    elif name == "merge-head":
+        (repo / ".git" / "MERGE_HEAD").write_text(git(repo, "rev-parse", "HEAD") + "\n")
+    elif name == "quoted-config":
+        with open(repo / ".git" / "config", "a") as f:
+            f.write('[thera "Odd \\"Name\\""]\n\tpath = "spaced  value " ; comment\n\tflag\n')
+    elif name == "inactive":
+        git(repo, "config", "submodule.docs/a.active", "false")
+    elif name == "worktree":
+        git(repo, "worktree", "add", "-q", "-b", "wt", str(repo.parent / "wt"))
+        return repo.parent / "wt"
+    return repo
+
+
+SCENARIOS = [
+    "plain", "packed-refs", "detached", "uninitialized", "merge-head", "quoted-config", "inactive",
+    "worktree",
+]
+QUERIES = [
+    ("rev_parse", (["HEAD"],)),
+    ("rev_parse", (["refs/heads/main", "HEAD"],)),
+    ("rev_parse", (["MERGE_HEAD"],)),
+    ("rev_parse", (["refs/heads/missing"],)),
+    ("config_get_regexp", (r"^submodule\..*\.path$",)),
+    ("config_get_regexp", (r"^thera\.",)),
+    ("submodule_status", ()),
+]
+
+
+def backend(name):
+    if name != "python":
+        pytest.importorskip(name)
+    return BACKENDS[name]()
+
+
+@pytest.mark.parametrize("name", list(BACKENDS))
+@pytest.mark.parametrize("shape", SCENARIOS)
+def test_parity_matrix(name, shape, superproject):
+    repo = scenario(shape, superproject)
+    candidate = backend(name)
+    reference = SubprocessBackend(GitOps(repo).run_git, repo)
+    answered = 0
+    for operation, args in QUERIES:
+        expected = getattr(reference, operation)(repo, *args)
+        try:
+            actual = getattr(candidate, operation)(repo, *args)
+        except BackendUnsupported:
+            continue
+        answered += 1
+        assert actual == expected, (operation, args)
+    if name == "python":
+        assert answered == len(QUERIES)  # 常见形态必须走快速路径
+
+
+@pytest.mark.parametrize("name", list(BACKENDS))
+def test_parity_submodule_repo(name, superproject):
+    """子模块自身（.git 为 gitdir 文件）的引用解析"""
+    candidate = backend(name)
+    sub = superproject / "docs" / "b"
+    expected = SubprocessBackend(GitOps(sub).run_git, sub).rev_parse(sub, ["HEAD"])
+    try:
+        assert candidate.rev_parse(sub, ["HEAD"]) == expected
+    except BackendUnsupported:
+        pass
+
+
+class TestPythonBackend:
+    """纯 Python 读取器的拒绝条件"""
+
+    def test_not_repo_root(self, superproject):
+        with pytest.raises(BackendUnsupported):
+            PythonBackend().rev_parse(superproject / "docs", ["HEAD"])
+
+    def test_revision_expression(self, superproject):
+        with pytest.raises(BackendUnsupported):
+            PythonBackend().rev_parse(superproject, ["HEAD~1"])
+
+    def test_include(self, superproject):
+        with open(superproject / ".git" / "config", "a") as f:
+            f.write("[include]\n\tpath = extra\n")
+        with pytest.raises(BackendUnsupported):
+            PythonBackend().config_get_regexp(superproject, "core")
+
+    def test_env_config(self, superproject, monkeypatch):
+        monkeypatch.setenv("GIT_CONFIG_COUNT", "0")
+        with pytest.raises(BackendUnsupported):
+            PythonBackend().config_get_regexp(superproject, "core")
+
+    def test_submodule_active_pathspec(self, superproject):
+        for path in ("docs/a", "docs/b"):  # submodule add 已写入 submodule.<name>.active
+            git(superproject, "config", "--unset", f"submodule.{path}.active")
+        git(superproject, "config", "submodule.active", "docs/a")
+        with pytest.raises(BackendUnsupported, match="pathspec"):
+            PythonBackend().submodule_status(superproject)
+        # 每个子模块都有 submodule.<name>.active 时不需要 pathspec 匹配
+        git(superproject, "config", "submodule.docs/a.active", "true")
+        git(superproject, "config", "submodule.docs/b.active", "false")
+        reference = SubprocessBackend(GitOps(superproject).run_git, superproject)
+        status = PythonBackend().submodule_status(superproject)
+        assert status == reference.submodule_status(superproject)
+        assert status[1].startswith("-")
+
+    def test_index_version(self, superproject):
+        git(superproject, "update-index", "--index-version", "4")
+        with pytest.raises(BackendUnsupported, match="索引版本"):
+            read_index(superproject / ".git" / "index")
+
+    def test_index_entries(self, superproject):
+        entries = read_index(superproject / ".git" / "index")
+        assert [e[0] for e in entries] == [".gitmodules", "README.md", "docs/a", "docs/b"]
+        assert entries[2][1] == 0o160000
+
+
+def test_parse_config():
+    text = '[Core]\n\tBare = false\n[submodule "Docs A"] # c\n\tpath = docs/a\n[old.Style]\n\tKey\n'
+    assert parse_config(text) == [
+        ("core.bare", "false"),
+        ("submodule.Docs A.path", "docs/a"),
+        ("old.style.key", None),
+    ]
+
+
+class TestGitOpsFallback:
+    """GitOps 的逐操作回退"""
+
+    def test_in_process_first(self, superproject):
+        ops = GitOps(superproject)
+        with patch.object(GitOps, "run_git") as run_git:
+            infos = ops.get_submodule_status()
+        run_git.assert_not_called()
+        assert [(i.path, i.is_behind) for i in infos] == [("docs/a", False), ("docs/b", True)]
+
+    def test_fallback_to_subprocess(self, superproject):
+        class Refuses(PythonBackend):
+            def submodule_status(self, repo):
+                raise BackendUnsupported("test")
+
+        before = metrics.GIT_BACKEND_QUERIES.value(backend="subprocess", operation="submodule_status")
+        infos = GitOps(superproject, backends=[Refuses()]).get_submodule_status()
+        assert [i.path for i in infos] == ["docs/a", "docs/b"]
+        after = metrics.GIT_BACKEND_QUERIES.value(backend="subprocess", operation="submodule_status")
+        assert after == before + 1
+
+    def test_subprocess_only(self, superproject):
+        assert [b.name for b in GitOps(superproject, backends=[]).backends] == ["subprocess"]
+
+    def test_env_selection(self, monkeypatch):
+        monkeypatch.setenv("THERA_GIT_BACKEND", "subprocess")
+        assert default_backends() == []
+        monkeypatch.setenv("THERA_GIT_BACKEND", "python")
+        assert [b.name for b in default_backends()] == ["python"]
+
+    def test_results_match(self, superproject):
+        fast = GitOps(superproject)
+        slow = GitOps(superproject, backends=[])
+        assert fast.get_submodule_status() == slow.get_submodule_status()
+        assert fast._get_gitmodules_paths() == slow._get_gitmodules_paths()
@@ -5,6 +5,9 @@ GitOps 层测试
 """
 
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -339,7 +342,7 @@ class TestGitOpsCheckConsistency:
 
         def config_side_effect(args):
             if "config" in args[0]:
-                return "submodule.vendor/lib1.path vendor/lib1\n", "", 0
+                return "submodule.vendor/lib1.path\nvendor/lib1\0", "", 0
             return "", "", 0
 
         mock_run_git.side_effect = config_side_effect
@@ -359,7 +362,7 @@ class TestGitOpsCheckConsistency:
         def config_side_effect(args):
             if "config" in args[0]:
                 return (
-                    "submodule.vendor/lib1.path vendor/lib1\nsubmodule.vendor/lib2.path vendor/lib2\n",
+                    "submodule.vendor/lib1.path\nvendor/lib1\0submodule.vendor/lib2.path\nvendor/lib2\0",
                     "",
                     0,
                 )
@@ -404,6 +407,73 @@ class TestGitOpsSyncSubmodules:
         assert result.success is False
         assert result.error == "error: fetch failed"
 
+    @patch.object(GitOps, "run_git")
+    def test_sync_no_fetch(self, mock_run_git, git_ops):
+        mock_run_git.return_value = ("", "", 0)
+
+        git_ops.sync_submodules(["vendor/lib1"], no_fetch=True)
+
+        mock_run_git.assert_called_once_with(
+            ["submodule", "update", "--remote", "--merge", "--no-fetch", "vendor/lib1"]
+        )
+
+    def test_sync_serialized(self, git_ops):
+        """并发调用时主仓库级的 submodule update 逐个执行"""
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def run_git(args, timeout=None):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return "", "", 0
+
+        with patch.object(git_ops, "run_git", side_effect=run_git):
+            with ThreadPoolExecutor(4) as pool:
+                results = list(pool.map(lambda p: git_ops.sync_submodules([p]), "abcd"))
+        assert all(r.success for r in results)
+        assert peak[0] == 1
+
+    @patch.object(GitOps, "run_git")
+    def test_sync_lock_wait_counts_toward_timeout(self, mock_run_git, git_ops):
+        with git_ops._update_lock:
+            result = git_ops.sync_submodules(["vendor/lib1"], timeout=0.05)
+        assert result.success is False
+        assert "等待其他子模块更新超时" in result.error
+        mock_run_git.assert_not_called()
+
+    @patch.object(GitOps, "run_git")
+    def test_fetch_submodule(self, mock_run_git, git_repo):
+        mock_run_git.return_value = ("", "", 0)
+        (git_repo / "vendor" / "a").mkdir(parents=True)
+        (git_repo / "vendor" / "a" / ".git").write_text("gitdir: ../../.git/modules/a\n")
+        git_ops = GitOps(git_repo)
+
+        assert git_ops.fetch_submodule("vendor/a", timeout=5).success is True
+        mock_run_git.assert_called_once_with(
+            ["-C", "vendor/a", "-c", "fetch.writeCommitGraph=true", "fetch", "--quiet"], timeout=5
+        )
+        # 未初始化的子模块不落到主仓库上拉取
+        assert git_ops.fetch_submodule("vendor/missing").success is True
+        assert mock_run_git.call_count == 1
+
+    def test_get_submodule_refs(self, git_ops, git_repo):
+        assert git_ops.get_submodule_refs() is None  # 不是 git 仓库：无法解析
+        assert GitOps(git_repo).get_submodule_refs() == ""
+
+    @patch.object(GitOps, "run_git")
+    def test_fetch_submodules(self, mock_run_git, git_ops):
+        mock_run_git.return_value = ("", "", 0)
+        assert git_ops.fetch_submodules().success is True
+
+        mock_run_git.return_value = ("", "could not resolve host", 1)
+        result = git_ops.fetch_submodules()
+        assert result.success is False
+        assert result.error == "could not resolve host"
+
 
 class TestGitOpsCommitAndPush:
     """GitOps.commit_and_push() 测试"""
@@ -515,3 +585,159 @@ class TestGitOpsRunGit:
 
             assert code == 1
             assert stderr == "error"
+
+    def test_run_git_timeout_kills_children(self, git_repo):
+        """超时后 git 派生的子进程一并终止"""
+        marker = git_repo / "marker"
+        ops = GitOps(git_repo)
+        start = time.perf_counter()
+        _, stderr, code = ops.run_git(
+            ["-c", f"alias.hang=!sleep 1 && touch {marker}", "hang"], timeout=0.2
+        )
+        assert time.perf_counter() - start < 1
+        assert code != 0
+        assert "超时" in stderr
+        time.sleep(1.5)
+        assert not marker.exists()
+
+    @patch.object(GitOps, "run_git")
+    def test_sync_timeout_forwarded(self, mock_run_git, git_ops):
+        mock_run_git.return_value = ("", "", 0)
+        git_ops.sync_submodules(["vendor/lib1"], timeout=3.0)
+        assert mock_run_git.call_args.kwargs["timeout"] == pytest.approx(3.0, abs=0.5)
+
+
+class TestGitOpsPush:
+    """GitOps.push() 测试"""
+
+    @patch.object(GitOps, "run_git")
+    def test_push_success(self, mock_run_git, git_ops):
+        mock_run_git.side_effect = [("abc1234def\n", "", 0), ("", "", 0)]
+
+        result = git_ops.push()
+
+        assert result.success is True
+        assert result.commit_sha == "abc1234"
+
+    @patch.object(GitOps, "run_git")
+    def test_push_failure(self, mock_run_git, git_ops):
+        mock_run_git.side_effect = [("abc1234def\n", "", 0), ("", "timed out", 128)]
+
+        result = git_ops.push()
+
+        assert result.success is False
+        assert result.error == "timed out"
+        assert result.commit_sha == "abc1234"
+
+
+class TestGitOpsSnapshotRestore:
+    """GitOps.snapshot_submodules() / restore_submodules() 测试"""
+
+    @pytest.fixture
+    def nested(self, git_repo):
+        """在仓库中克隆两个嵌套仓库充当子模块"""
+        for name in ("a", "b"):
+            subprocess.run(
+                ["git", "clone", "-q", str(git_repo), str(git_repo / "vendor" / name)],
+                check=True, capture_output=True,
+            )
+        return git_repo
+
+    def _commit(self, repo, text):
+        (repo / "README.md").write_text(text)
+        subprocess.run(
+            ["git", "-c", "user.name=T", "-c", "user.email=t@e", "commit", "-qam", text],
+            cwd=repo, check=True,
+        )
+
+    def _head(self, repo):
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo, capture_output=True, text=True
+        ).stdout.strip()
+
+    def test_restores_only_moved(self, nested):
+        git_ops = GitOps(nested)
+        paths = ["vendor/a", "vendor/b"]
+        before = self._head(nested / "vendor" / "a")
+        assert git_ops.snapshot_submodules(paths=paths) == paths
+
+        self._commit(nested / "vendor" / "a", "moved\n")
+        assert self._head(nested / "vendor" / "a") != before
+
+        result = git_ops.restore_submodules(paths)
+
+        assert result.success is True
+        assert result.restored_paths == ["vendor/a"]
+        assert self._head(nested / "vendor" / "a") == before
+        assert (nested / "vendor" / "a" / "README.md").read_text() == "# Test\n"
+
+    def test_restores_dirty_merge(self, nested):
+        git_ops = GitOps(nested)
+        sub = nested / "vendor" / "b"
+        git_ops.snapshot_submodules(paths=["vendor/b"])
+        (sub / "MERGE_HEAD_MARKER").write_text("x")
+        subprocess.run(["git", "update-ref", "MERGE_HEAD", "HEAD"], cwd=sub, check=True)
+
+        result = git_ops.restore_submodules(["vendor/b"])
+
+        assert result.restored_paths == ["vendor/b"]
+        code = subprocess.run(
+            ["git", "rev-parse", "-q", "--verify", "MERGE_HEAD"], cwd=sub
+        ).returncode
+        assert code != 0
+
+    def test_keeps_uncommitted_changes(self, nested):
+        """快照前已有的未提交修改在回滚后保留"""
+        git_ops = GitOps(nested)
+        sub = nested / "vendor" / "a"
+        (sub / "notes.md").write_text("tracked\n")
+        subprocess.run(["git", "add", "notes.md"], cwd=sub, check=True)
+        subprocess.run(
+            ["git", "-c", "user.name=T", "-c", "user.email=t@e", "commit", "-qm", "notes"],
+            cwd=sub, check=True,
+        )
+        before = self._head(sub)
+        (sub / "notes.md").write_text("local edit\n")
+        git_ops.snapshot_submodules(paths=["vendor/a"])
+        (sub / "README.md").write_text("moved\n")
+        subprocess.run(
+            ["git", "-c", "user.name=T", "-c", "user.email=t@e", "commit", "-qm", "moved",
+             "README.md"],
+            cwd=sub, check=True,
+        )
+
+        result = git_ops.restore_submodules(["vendor/a"])
+
+        assert result.restored_paths == ["vendor/a"]
+        assert self._head(sub) == before
+        assert (sub / "README.md").read_text() == "# Test\n"
+        assert (sub / "notes.md").read_text() == "local edit\n"
+
+    def test_conflicting_changes_not_discarded(self, nested):
+        """未提交的修改与回滚冲突时该子模块回滚失败，修改不被覆盖"""
+        git_ops = GitOps(nested)
+        sub = nested / "vendor" / "a"
+        git_ops.snapshot_submodules(paths=["vendor/a"])
+        self._commit(sub, "moved\n")
+        (sub / "README.md").write_text("local edit\n")
+
+        result = git_ops.restore_submodules(["vendor/a"])
+
+        assert result.success is False
+        assert "vendor/a" in result.error
+        assert (sub / "README.md").read_text() == "local edit\n"
+
+    def test_missing_snapshot(self, nested):
+        result = GitOps(nested).restore_submodules(["vendor/a"], name="none")
+        assert result.success is False
+        assert "vendor/a" in result.error
+
+    def test_skips_uninitialized(self, nested):
+        git_ops = GitOps(nested)
+        (nested / "vendor" / "empty").mkdir()
+        paths = ["vendor/a", "vendor/missing", "vendor/empty"]
+        assert git_ops.snapshot_submodules(paths=paths) == ["vendor/a"]
+        code = subprocess.run(
+            ["git", "rev-parse", "-q", "--verify", "refs/thera/checkpoint/sync"], cwd=nested
+        ).returncode
+        assert code != 0
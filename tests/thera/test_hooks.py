@@ -0,0 +1,219 @@
+"""测试后台钩子调度"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from thera.fsm import HOOK_EXIT_TIMEOUT, Event, RepoState, StateMachine
+from thera.hooks import HookDispatcher, HookMode, HookQueueFull
+from thera.workflow import WorkflowEngine
+
+
+class TestHookDispatcher:
+    """HookDispatcher 测试"""
+
+    def test_runs_in_background(self):
+        dispatcher = HookDispatcher(workers=1)
+        threads = []
+        dispatcher.submit("k", lambda: threads.append(threading.current_thread().name))
+        assert dispatcher.drain(timeout=5)
+        assert threads == ["thera-hook-0"]
+        dispatcher.close()
+
+    def test_same_key_keeps_order(self):
+        dispatcher = HookDispatcher(workers=4)
+        seen = []
+        for i in range(200):
+            dispatcher.submit("state", seen.append, i)
+        assert dispatcher.drain(timeout=5)
+        assert seen == list(range(200))
+        dispatcher.close()
+
+    def test_captures_errors(self):
+        dispatcher = HookDispatcher(workers=1)
+
+        def boom():
+            raise RuntimeError("hook failed")
+
+        dispatcher.submit("k", boom)
+        dispatcher.drain(timeout=5)
+        errors = dispatcher.pop_errors()
+        assert len(errors) == 1
+        assert errors[0].key == "k"
+        assert isinstance(errors[0].error, RuntimeError)
+        assert dispatcher.pop_errors() == []
+        dispatcher.close()
+
+    def test_bounded_queue_non_blocking(self):
+        dispatcher = HookDispatcher(workers=1, maxsize=1, block=False)
+        release = threading.Event()
+        dispatcher.submit("k", release.wait)
+        time.sleep(0.05)
+        dispatcher.submit("k", lambda: None)
+        with pytest.raises(HookQueueFull):
+            dispatcher.submit("k", lambda: None)
+        release.set()
+        assert dispatcher.drain(timeout=5)
+        dispatcher.close()
+
+    def test_drain_timeout(self):
+        dispatcher = HookDispatcher(workers=1)
+        release = threading.Event()
+        dispatcher.submit("k", release.wait)
+        assert dispatcher.drain(timeout=0.05) is False
+        assert dispatcher.pending() == 1
+        release.set()
+        assert dispatcher.drain(timeout=5)
+        dispatcher.close()
+
+    def test_close_rejects_submit(self):
+        dispatcher = HookDispatcher(workers=1)
+        assert dispatcher.close(timeout=5)
+        with pytest.raises(RuntimeError):
+            dispatcher.submit("k", lambda: None)
+
+    def test_close_timeout_with_full_queue(self):
+        """队列已满、钩子很慢时 close 仍在 timeout 内返回，工作线程随后自行退出"""
+        dispatcher = HookDispatcher(workers=1, maxsize=1)
+        release = threading.Event()
+        seen = []
+        dispatcher.submit("k", release.wait)
+        time.sleep(0.05)
+        dispatcher.submit("k", seen.append, "queued")
+
+        start = time.perf_counter()
+        assert dispatcher.close(timeout=0.1) is False
+        assert time.perf_counter() - start < 1
+
+        release.set()
+        dispatcher._threads[0].join(5)
+        assert not dispatcher._threads[0].is_alive()
+        assert seen == ["queued"]
+        assert dispatcher.pending() == 0
+
+
+class TestStateMachineBackgroundHooks:
+    """StateMachine 后台钩子测试"""
+
+    def test_slow_hook_does_not_block_transition(self):
+        machine = StateMachine()
+        done = []
+
+        def slow(old, event):
+            time.sleep(0.2)
+            done.append(event)
+
+        machine.add_enter_hook(RepoState.CLEAN_AND_CONSISTENT, slow, mode=HookMode.EXECUTOR)
+        start = time.perf_counter()
+        machine.transition(Event.DOC_CHECK_OK)
+        assert time.perf_counter() - start < 0.1
+        assert done == []
+
+        assert machine.drain_hooks(timeout=5)
+        assert done == [Event.DOC_CHECK_OK]
+
+    def test_exit_and_enter_order_per_state(self):
+        machine = StateMachine()
+        calls = []
+        machine.add_enter_hook(
+            RepoState.CLEAN_AND_CONSISTENT,
+            lambda old, event: calls.append(("enter", event)),
+            mode=HookMode.EXECUTOR,
+        )
+        machine.add_exit_hook(
+            RepoState.CLEAN_AND_CONSISTENT,
+            lambda old, event: calls.append(("exit", event)),
+            mode=HookMode.EXECUTOR,
+        )
+        for _ in range(3):
+            machine.transition(Event.DOC_CHECK_OK)
+            machine.transition(Event.EDIT)
+        machine.drain_hooks(timeout=5)
+        assert calls == [("enter", Event.DOC_CHECK_OK), ("exit", Event.EDIT)] * 3
+
+    def test_async_hook(self):
+        machine = StateMachine()
+        seen = []
+
+        async def notify(old, event):
+            await asyncio.sleep(0)
+            seen.append(old)
+
+        machine.add_enter_hook(RepoState.CLEAN_AND_CONSISTENT, notify, mode=HookMode.ASYNC)
+        machine.transition(Event.DOC_CHECK_OK)
+        machine.drain_hooks(timeout=5)
+        assert seen == [RepoState.DIRTY]
+
+    def test_hook_errors_captured(self):
+        machine = StateMachine()
+
+        def boom(old, event):
+            raise ValueError("journal unavailable")
+
+        machine.add_enter_hook(RepoState.CLEAN_AND_CONSISTENT, boom, mode=HookMode.EXECUTOR)
+        assert machine.transition(Event.DOC_CHECK_OK) == RepoState.CLEAN_AND_CONSISTENT
+        machine.drain_hooks(timeout=5)
+        errors = machine.pop_hook_errors()
+        assert len(errors) == 1
+        assert errors[0].key == RepoState.CLEAN_AND_CONSISTENT
+
+    def test_mode_validation(self):
+        machine = StateMachine()
+
+        async def coro(old, event):
+            pass
+
+        with pytest.raises(ValueError):
+            machine.add_enter_hook(RepoState.DIRTY, coro)
+        with pytest.raises(ValueError):
+            machine.add_enter_hook(RepoState.DIRTY, lambda o, e: None, mode=HookMode.ASYNC)
+
+    def test_inline_machine_has_no_dispatcher(self):
+        machine = StateMachine()
+        machine.add_enter_hook(RepoState.CLEAN_AND_CONSISTENT, lambda o, e: None)
+        assert machine.hook_dispatcher is None
+        assert machine.drain_hooks() is True
+        assert machine.pop_hook_errors() == []
+
+    def test_close_joins_workers(self):
+        machine = StateMachine()
+        done = []
+
+        def slow(old, event):
+            time.sleep(0.1)
+            done.append(event)
+
+        machine.add_enter_hook(RepoState.CLEAN_AND_CONSISTENT, slow, mode=HookMode.EXECUTOR)
+        machine.transition(Event.DOC_CHECK_OK)
+        threads = machine.hook_dispatcher._threads
+        assert machine.close(timeout=5) is True
+        assert done == [Event.DOC_CHECK_OK]
+        assert not any(thread.is_alive() for thread in threads)
+        assert machine.close() is True  # 重复关闭无副作用
+
+    def test_close_registers_exit_drain(self):
+        with patch("thera.fsm.atexit") as mock_atexit:
+            machine = StateMachine()
+            machine.add_enter_hook(RepoState.DIRTY, lambda o, e: None, mode=HookMode.EXECUTOR)
+            dispatcher = machine.hook_dispatcher
+            mock_atexit.register.assert_called_once_with(dispatcher.close, HOOK_EXIT_TIMEOUT)
+            machine.close(timeout=5)
+            mock_atexit.unregister.assert_called_once_with(dispatcher.close)
+
+    def test_close_keeps_external_dispatcher(self):
+        dispatcher = HookDispatcher()
+        machine = StateMachine(hook_dispatcher=dispatcher)
+        assert machine.close(timeout=5) is True
+        dispatcher.submit("key", lambda: None)  # 外部调度器仍可使用
+        assert dispatcher.close(timeout=5)
+
+    def test_engine_closes_machine(self, tmp_path):
+        with WorkflowEngine(tmp_path) as engine:
+            engine.machine.add_enter_hook(
+                RepoState.CLEAN_AND_CONSISTENT, lambda o, e: None, mode=HookMode.EXECUTOR
+            )
+            threads = engine.machine.hook_dispatcher._threads
+        assert not any(thread.is_alive() for thread in threads)
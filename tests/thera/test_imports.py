@@ -0,0 +1,66 @@
+"""测试导入图：命令只加载所需模块（预算见 benchmarks/import_budget.json）"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BUDGET_FILE = Path(__file__).parents[2] / "benchmarks" / "import_budget.json"
+
+RUNNER = """
+import json, sys
+sys.argv = {argv!r}
+try:
+    {body}
+finally:
+    sys.stderr.write("\\n" + json.dumps(sorted(sys.modules)))
+"""
+
+
+def loaded_modules(body: str, argv: list[str], cwd: Path) -> set[str]:
+    """在新进程中执行 body，返回结束时已加载的模块"""
+    result = subprocess.run(
+        [sys.executable, "-c", RUNNER.format(argv=argv, body=body)],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    return set(json.loads(result.stderr.strip().splitlines()[-1]))
+
+
+BUDGETS = json.loads(BUDGET_FILE.read_text())
+
+
+@pytest.mark.parametrize("command", sorted(BUDGETS))
+def test_command_import_graph(command, tmp_path):
+    argv = ["thera"] + command.split()[1:]
+    modules = loaded_modules("from thera.cli import main; main()", argv, tmp_path)
+    assert "thera.cli" in modules
+    assert modules.isdisjoint(BUDGETS[command]["forbid"])
+
+
+@pytest.mark.parametrize(
+    "module, forbid",
+    [
+        ("thera", {"typer", "thera.cli"}),
+        ("thera.git_ops", {"yaml", "concurrent.futures", "thera.fsm"}),
+        ("thera.metrics", {"thera.fsm", "asyncio"}),
+        ("thera.tracing", {"asyncio"}),
+        ("thera.fsm", {"asyncio"}),
+    ],
+)
+def test_module_import_graph(module, forbid, tmp_path):
+    modules = loaded_modules(f"import {module}", ["python"], tmp_path)
+    assert module in modules
+    assert modules.isdisjoint(forbid)
+
+
+def test_lazy_main():
+    import thera
+    from thera.cli import main
+
+    assert thera.main is main
+    with pytest.raises(AttributeError):
+        thera.missing
@@ -0,0 +1,277 @@
+"""
+索引 stat 脏检查测试
+
+一致性：进程内的判定必须与 git status --porcelain 相同；无法确定时回退到 git，
+但不能给出不同的答案。
+"""
+
+import os
+import signal
+import subprocess
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from thera import metrics
+from thera.git_backends import BackendUnsupported
+from thera.index_stat import GIT_STATUS_TIMEOUT, check_repo, check_repos, compile_pattern, parse_index
+
+
+def git(cwd, *args):
+    result = subprocess.run(
+        ["git", "-c", "protocol.file.allow=always",
+         "-c", "user.email=test@example.com", "-c", "user.name=Test User", *args],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def settle(repo: Path) -> None:
+    """把索引 mtime 推后，使刚写入的条目不再是 racy 条目"""
+    index = repo / ".git" / "index"
+    if not index.exists():
+        index = Path(git(repo, "rev-parse", "--git-path", "index").strip())
+        index = index if index.is_absolute() else repo / index
+    future = time.time_ns() + 2 * 10**9
+    os.utime(index, ns=(future, future))
+
+
+def porcelain(repo: Path, untracked: bool) -> tuple[bool, set, set]:
+    out = git(repo, "status", "--porcelain", f"--untracked-files={'normal' if untracked else 'no'}")
+    lines = out.splitlines()
+    return (
+        bool(lines),
+        {line[3:] for line in lines if line[:2] != "??" and line[1] != " "},
+        {line[3:] for line in lines if line[:2] == "??"},
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / "repo"
+    path.mkdir()
+    git(path, "init", "-q", "-b", "main")
+    (path / "README.md").write_text("# Test\n")
+    (path / "docs").mkdir()
+    (path / "docs" / "a.md").write_text("a\n")
+    (path / "run.sh").write_text("#!/bin/sh\n")
+    (path / ".gitignore").write_text("*.log\nbuild/\n!keep.log\n")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "init")
+    settle(path)
+    return path
+
+
+def scenario(name, repo):
+    if name == "modified":
+        (repo / "README.md").write_text("# Changed\n")
+    elif name == "same-size":
+        # 换到另一秒：git 默认只比较 mtime 的秒数，同一秒内的同长度修改它也看不到
+        mtime = os.stat(repo / "README.md").st_mtime_ns - 5 * 10**9
+        (repo / "README.md").write_text("# Tes!\n")
+        os.utime(repo / "README.md", ns=(mtime, mtime))
+    elif name == "rewritten":
+        (repo / "README.md").write_text("# Test\n")  # stat 变化、内容不变
+    elif name == "deleted":
+        (repo / "docs" / "a.md").unlink()
+    elif name == "chmod":
+        (repo / "run.sh").chmod(0o755)
+    elif name == "typechange":
+        (repo / "README.md").unlink()
+        (repo / "README.md").symlink_to("docs/a.md")
+    elif name == "untracked":
+        (repo / "notes.md").write_text("n\n")
+        (repo / "new" / "deep").mkdir(parents=True)
+        (repo / "new" / "deep" / "x.md").write_text("x\n")
+        (repo / "docs" / "b.md").write_text("b\n")
+    elif name == "ignored":
+        (repo / "debug.log").write_text("log\n")
+        (repo / "build").mkdir()
+        (repo / "build" / "out.md").write_text("o\n")
+        (repo / "logs").mkdir()
+        (repo / "logs" / "a.log").write_text("l\n")
+        (repo / "empty").mkdir()
+    elif name == "negated":
+        (repo / "keep.log").write_text("k\n")
+    elif name == "nested-repo":
+        git(repo, "init", "-q", "vendor")
+    elif name == "packed":
+        git(repo, "gc", "-q")
+        settle(repo)
+
+
+SCENARIOS = ["clean", "modified", "same-size", "rewritten", "deleted", "chmod", "typechange",
+             "untracked", "ignored", "negated", "nested-repo", "packed"]
+
+
+@pytest.mark.parametrize("untracked", [False, True])
+@pytest.mark.parametrize("shape", SCENARIOS)
+def test_parity_matrix(shape, untracked, repo):
+    scenario(shape, repo)
+    result = check_repo(repo, untracked=untracked)
+    assert result.fallback is None  # 常见形态必须在进程内完成
+    dirty, modified, found = porcelain(repo, untracked)
+    assert result.dirty == dirty
+    assert set(result.modified) == modified
+    assert set(result.untracked) == found
+
+
+class TestFallback:
+    """回退到 git 的条件"""
+
+    def test_racy_entry(self, repo):
+        (repo / "README.md").write_text("# Racy entry\n")
+        git(repo, "add", "README.md")
+        index = repo / ".git" / "index"
+        mtime = os.stat(repo / "README.md").st_mtime_ns
+        os.utime(index, ns=(mtime, mtime))  # 与条目同一时刻写入的索引
+        result = check_repo(repo)
+        assert result.fallback == "racy 条目: README.md"
+        assert result.staged is True and result.modified == []
+
+    def test_staged_change(self, repo):
+        (repo / "README.md").write_text("# Staged\n")
+        git(repo, "add", "README.md")
+        settle(repo)
+        result = check_repo(repo)
+        assert result.fallback == "cache-tree 失效"
+        assert result.staged is True and result.modified == []
+
+    def test_content_filter(self, repo):
+        (repo / ".gitattributes").write_text("*.md text eol=crlf\n")
+        git(repo, "add", ".gitattributes")
+        git(repo, "commit", "-q", "-m", "attrs")
+        settle(repo)
+        assert check_repo(repo).fallback is None  # stat 一致时无需过滤
+        os.utime(repo / "README.md")
+        result = check_repo(repo)
+        assert result.fallback.startswith("需要内容过滤")
+
+    def test_not_a_repo(self, tmp_path):
+        result = check_repo(tmp_path)
+        assert result.fallback is not None
+
+    def test_git_status_timeout(self, tmp_path):
+        """回退的 git status 带超时，超时的仓库不视为脏"""
+        with patch("thera.index_stat.GitOps.run_git", return_value=("", "", -signal.SIGKILL)) as run:
+            result = check_repo(tmp_path)
+        assert run.call_args.kwargs["timeout"] == GIT_STATUS_TIMEOUT
+        assert result.dirty is False
+        assert result.fallback.endswith("git status 超时")
+
+    def test_conflict(self, repo):
+        git(repo, "checkout", "-q", "-b", "other")
+        (repo / "README.md").write_text("other\n")
+        git(repo, "commit", "-q", "-am", "other")
+        git(repo, "checkout", "-q", "main")
+        (repo / "README.md").write_text("main\n")
+        git(repo, "commit", "-q", "-am", "main")
+        subprocess.run(
+            ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test User",
+             "merge", "-q", "other"],
+            cwd=repo, capture_output=True,
+        )
+        settle(repo)
+        result = check_repo(repo)
+        assert result.fallback is None
+        assert result.dirty and result.staged and result.modified == ["README.md"]
+
+    def test_metrics(self, repo):
+        before = metrics.DIRTY_CHECKS.value(method="index")
+        check_repo(repo)
+        assert metrics.DIRTY_CHECKS.value(method="index") == before + 1
+
+
+@pytest.fixture
+def superproject(repo, tmp_path):
+    upstream = tmp_path / "upstream"
+    upstream.mkdir()
+    git(upstream, "init", "-q", "-b", "main")
+    (upstream / "page.md").write_text("p\n")
+    git(upstream, "add", ".")
+    git(upstream, "commit", "-q", "-m", "init")
+    for path in ("docs/s1", "docs/s2"):
+        git(repo, "submodule", "add", "-q", str(upstream), path)
+    git(repo, "commit", "-q", "-m", "subs")
+    for path in (".", "docs/s1", "docs/s2"):
+        settle(repo / path)
+    return repo
+
+
+class TestSubmodules:
+    """子模块"""
+
+    def test_all_submodules_without_forks(self, superproject):
+        (superproject / "docs" / "s2" / "page.md").write_text("changed\n")
+        with patch("subprocess.run", side_effect=AssertionError("不应启动进程")):
+            results = check_repos(superproject, ["docs/s1", "docs/s2"], untracked=True)
+        assert {path: r.dirty for path, r in results.items()} == {"docs/s1": False, "docs/s2": True}
+        assert results["docs/s2"].modified == ["page.md"]
+
+    def test_gitlink_in_superproject(self, superproject):
+        assert check_repo(superproject).dirty is False
+        (superproject / "docs" / "s1" / "extra.md").write_text("e\n")
+        assert check_repo(superproject, untracked=False).dirty is False  # -uno 不看子模块的未跟踪文件
+        result = check_repo(superproject, untracked=True)
+        assert result.modified == ["docs/s1"]
+        assert porcelain(superproject, True)[1] == {"docs/s1"}
+
+    def test_submodule_new_commit(self, superproject):
+        sub = superproject / "docs" / "s1"
+        (sub / "page.md").write_text("next\n")
+        git(sub, "commit", "-q", "-am", "next")
+        assert check_repo(superproject).modified == ["docs/s1"]
+
+
+class TestParseIndex:
+    """索引读取"""
+
+    def test_entries(self, repo):
+        index = parse_index(repo / ".git" / "index")
+        assert [e.path for e in index.entries] == [".gitignore", "README.md", "docs/a.md", "run.sh"]
+        assert index.tree == git(repo, "rev-parse", "HEAD^{tree}").strip()
+        readme = index.entries[1]
+        assert readme.size == 7
+        assert readme.mtime_ns == os.stat(repo / "README.md").st_mtime_ns
+
+    def test_extended_flags(self, repo):
+        (repo / "todo.md").write_text("t\n")
+        git(repo, "add", "-N", "todo.md")
+        index = parse_index(repo / ".git" / "index")
+        assert index.version == 3
+        assert any(e.path == "todo.md" and e.extended for e in index.entries)
+
+    def test_empty_file(self, tmp_path):
+        (tmp_path / "index").write_bytes(b"")
+        with pytest.raises(BackendUnsupported):
+            parse_index(tmp_path / "index")
+
+
+@pytest.mark.parametrize("pattern,path,matches", [
+    ("*.log", "a/b/c.log", True),
+    ("/top.md", "top.md", True),
+    ("/top.md", "sub/top.md", False),
+    ("doc/*.md", "doc/a.md", True),
+    ("doc/*.md", "doc/x/a.md", False),
+    ("**/cache", "a/b/cache", True),
+    ("a/**/z", "a/z", True),
+    ("a/**/z", "a/b/c/z", True),
+    ("out/**", "out/x/y", True),
+    ("file[0-9].txt", "file7.txt", True),
+    ("file[!0-9].txt", "file7.txt", False),
+    ("\\#hash", "#hash", True),
+    ("trailing\\ ", "trailing ", True),
+])
+def test_compile_pattern(pattern, path, matches):
+    regex, _, _ = compile_pattern(pattern)
+    assert bool(regex.match(path)) is matches
+
+
+def test_compile_pattern_flags():
+    assert compile_pattern("# comment") is None
+    assert compile_pattern("   ") is None
+    _, negate, dir_only = compile_pattern("!build/")
+    assert negate is True and dir_only is True
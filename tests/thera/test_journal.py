@@ -0,0 +1,154 @@
+"""
+工作日志写入器测试
+"""
+
+import json
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+from thera.journal import JournalEntry, JournalWriter, writer_for
+
+NOON = datetime(2026, 3, 20, 12, 5).timestamp()
+
+
+def read_lines(path):
+    return [line for line in path.read_text().split("\n") if line]
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.with_suffix(".jsonl").read_text().splitlines()]
+
+
+class TestJournalEntry:
+    """记录格式测试"""
+
+    def test_from_changes(self):
+        entry = JournalEntry.from_changes("OK", "docs/paper", [
+            {"path": "b.md", "type": "docs"},
+            {"path": ".gitmodules", "type": "config"},
+            {"path": "a.md", "type": "docs"},
+        ], timestamp=NOON)
+        assert entry.line() == "- 12:05 OK docs/paper: [config] .gitmodules, [docs] b.md, a.md"
+        assert entry.date == "2026-03-20"
+        assert entry.record() == {
+            "time": "2026-03-20T12:05:00",
+            "status": "OK",
+            "repo": "docs/paper",
+            "types": "[config] .gitmodules, [docs] b.md, a.md",
+            "changes": {"config": [".gitmodules"], "docs": ["b.md", "a.md"]},
+        }
+
+    def test_plain_types(self):
+        entry = JournalEntry("FAIL", "main", "push", timestamp=NOON)
+        assert entry.line() == "- 12:05 FAIL main: push"
+
+
+class TestJournalWriter:
+    """写入器测试"""
+
+    def test_batched(self, tmp_path):
+        writer = JournalWriter(tmp_path, flush_batch=3, flush_interval=60)
+        path = writer.path_for("2026-03-20")
+        writer.append(JournalEntry("OK", "a", timestamp=NOON))
+        writer.append(JournalEntry("OK", "b", timestamp=NOON))
+        assert not path.exists()
+        writer.append(JournalEntry("OK", "c", timestamp=NOON))
+        assert read_lines(path) == ["- 12:05 OK a: ", "- 12:05 OK b: ", "- 12:05 OK c: "]
+
+    def test_flush_format(self, tmp_path):
+        """与旧实现相同：每批以换行开头、不带结尾换行"""
+        path = tmp_path / "2026-03-20.md"
+        path.write_text("# Journal\n")
+        writer = JournalWriter(tmp_path, flush_interval=60)
+        writer.extend([JournalEntry("OK", "main", "x", timestamp=NOON)])
+        assert writer.flush() == [path]
+        assert path.read_text() == "# Journal\n\n- 12:05 OK main: x"
+        assert writer.flush() == []
+
+    def test_sidecar_matches(self, tmp_path):
+        with JournalWriter(tmp_path) as writer:
+            writer.extend([JournalEntry("OK", f"repo{i}", timestamp=NOON) for i in range(5)])
+        path = tmp_path / "2026-03-20.md"
+        assert [r["repo"] for r in read_records(path)] == [f"repo{i}" for i in range(5)]
+        assert len(read_lines(path)) == 5
+
+    def test_split_by_date(self, tmp_path):
+        next_day = datetime(2026, 3, 21, 0, 1).timestamp()
+        with JournalWriter(tmp_path) as writer:
+            writer.extend([
+                JournalEntry("OK", "a", timestamp=NOON),
+                JournalEntry("OK", "b", timestamp=next_day),
+            ])
+        assert read_lines(tmp_path / "2026-03-20.md") == ["- 12:05 OK a: "]
+        assert read_lines(tmp_path / "2026-03-21.md") == ["- 00:01 OK b: "]
+
+    def test_reopens_replaced_file(self, tmp_path):
+        writer = JournalWriter(tmp_path, flush_interval=60)
+        writer.append(JournalEntry("OK", "a", timestamp=NOON))
+        path = writer.flush()[0]
+        path.unlink()
+        path.write_text("# Replaced\n")  # 例如 git checkout 重写了文件
+        writer.append(JournalEntry("OK", "b", timestamp=NOON))
+        writer.flush()
+        writer.close()
+        assert path.read_text() == "# Replaced\n\n- 12:05 OK b: "
+
+    def test_threads(self, tmp_path):
+        writer = JournalWriter(tmp_path, flush_batch=7, flush_interval=60)
+
+        def worker(n):
+            for i in range(50):
+                writer.append(JournalEntry("OK", f"w{n}", str(i), timestamp=NOON))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        writer.close()
+        path = tmp_path / "2026-03-20.md"
+        lines = read_lines(path)
+        assert len(lines) == 400
+        assert sorted(lines) == sorted(
+            f"- 12:05 OK w{n}: {i}" for n in range(8) for i in range(50)
+        )
+        assert len(read_records(path)) == 400
+
+    def test_processes(self, tmp_path):
+        """多个进程并发写入同一个日志：每个批次完整，不交错"""
+        script = (
+            "import sys\n"
+            "from thera.journal import JournalEntry, JournalWriter\n"
+            "writer = JournalWriter(sys.argv[1], flush_batch=10, flush_interval=60)\n"
+            "for i in range(200):\n"
+            "    writer.append(JournalEntry('OK', 'p' + sys.argv[2], 'x' * 200 + str(i), timestamp=%r))\n"
+        ) % NOON
+        procs = [
+            subprocess.Popen([sys.executable, "-c", script, str(tmp_path), str(n)])
+            for n in range(4)
+        ]
+        assert all(p.wait(timeout=30) == 0 for p in procs)
+        path = tmp_path / "2026-03-20.md"
+        lines = read_lines(path)
+        assert len(lines) == 800
+        for n in range(4):
+            mine = [line for line in lines if line.startswith(f"- 12:05 OK p{n}: ")]
+            assert [line.rsplit("x", 1)[1] for line in mine] == [str(i) for i in range(200)]
+        assert len(read_records(path)) == 800
+
+    def test_flush_at_exit(self, tmp_path):
+        script = (
+            "import sys\n"
+            "from thera.journal import JournalEntry, JournalWriter\n"
+            "writer = JournalWriter(sys.argv[1], flush_interval=60)\n"
+            "writer.append(JournalEntry('OK', 'late', timestamp=%r))\n"
+        ) % NOON
+        subprocess.run([sys.executable, "-c", script, str(tmp_path)], check=True)
+        assert read_lines(tmp_path / "2026-03-20.md") == ["- 12:05 OK late: "]
+
+
+def test_writer_shared(tmp_path):
+    assert writer_for(tmp_path) is writer_for(tmp_path / ".")
+    assert writer_for(tmp_path).journal_dir == (tmp_path / "meta" / "journal").resolve()
@@ -0,0 +1,206 @@
+"""
+工作日志索引测试
+"""
+
+import json
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+from thera.cli import app
+from thera.journal_index import JournalIndex, format_result, parse_types
+
+DAY1 = """# 2026-03-20
+
+- 09:00 OK main: [docs] a.md, b.md, [config] .gitmodules
+- 10:30 FAIL docs/paper: push
+- 11:00 OK docs/paper: [docs] paper.md"""
+
+DAY2 = """
+- 08:15 OK main: [code] x.py
+- 09:45 SKIP docs/paper: sync"""
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal_dir = tmp_path / "meta" / "journal"
+    journal_dir.mkdir(parents=True)
+    (journal_dir / "2026-03-20.md").write_text(DAY1)
+    (journal_dir / "2026-04-02.md").write_text(DAY2)
+    (journal_dir / "README.md").write_text("不是日志文件\n")
+    return journal_dir
+
+
+@pytest.fixture
+def index(journal, tmp_path):
+    with JournalIndex(tmp_path / "state" / "journal.sqlite", journal) as index:
+        index.update()
+        yield index
+
+
+def bump(path):
+    """保证 mtime 变化（同一纳秒内的两次写入在部分文件系统上 mtime 相同）"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+@pytest.mark.parametrize("types,expected", [
+    ("[docs] a.md, b.md, [config] .gitmodules", {"docs": 2, "config": 1}),
+    ("[docs] a.md, [docs] b.md", {"docs": 2}),
+    ("sync", {"sync": 0}),
+    ("", {}),
+])
+def test_parse_types(types, expected):
+    assert parse_types(types) == expected
+
+
+class TestUpdate:
+    """增量索引"""
+
+    def test_initial(self, journal, tmp_path):
+        with JournalIndex(tmp_path / "journal.sqlite", journal) as index:
+            stats = index.update()
+            assert (stats.files, stats.parsed, stats.entries) == (2, 2, 5)
+            assert index.count() == 5
+
+    def test_unchanged_skipped(self, index):
+        stats = index.update()
+        assert (stats.parsed, stats.entries) == (0, 0)
+        assert index.count() == 5
+
+    def test_append(self, index, journal):
+        path = journal / "2026-04-02.md"
+        with open(path, "a") as f:
+            f.write("\n- 12:00 OK main: [docs] c.md")
+        bump(path)
+        stats = index.update()
+        assert stats.parsed == 1
+        assert stats.entries == 2  # 只重新解析上次的最后一行和新增的一行
+        assert index.count(since="2026-04-02") == 3
+
+    def test_append_continues_last_line(self, index, journal):
+        """上次的最后一行没有换行结尾，被续写后以新内容为准"""
+        path = journal / "2026-04-02.md"
+        with open(path, "a") as f:
+            f.write(", [docs] d.md")
+        bump(path)
+        index.update()
+        assert index.count(change_type="docs") == 3
+        assert index.count() == 5
+
+    def test_edit(self, index, journal):
+        path = journal / "2026-03-20.md"
+        path.write_text(DAY1.replace("FAIL", "OK").replace("- 09:00 OK main: [docs] a.md, b.md, ", "- 09:00 OK main: "))
+        bump(path)
+        stats = index.update()
+        assert stats.entries == 3
+        assert index.count(status="FAIL") == 0
+        assert index.count(change_type="docs") == 1
+
+    def test_delete(self, index, journal):
+        (journal / "2026-03-20.md").unlink()
+        stats = index.update()
+        assert stats.removed == 1
+        assert index.count() == 2
+        assert index.conn.execute("SELECT COUNT(*) FROM entry_types").fetchone()[0] == 2
+
+    def test_rebuild(self, index):
+        stats = index.rebuild()
+        assert stats.entries == 5
+        assert index.count() == 5
+
+    def test_missing_dir(self, tmp_path):
+        with JournalIndex(tmp_path / "journal.sqlite", tmp_path / "missing") as index:
+            assert index.update().files == 0
+            assert index.count() == 0
+
+
+class TestQuery:
+    """查询"""
+
+    def test_records_newest_first(self, index):
+        result = index.query(limit=2)
+        assert result.rows == [
+            ("2026-04-02", "09:45", "SKIP", "docs/paper", "sync"),
+            ("2026-04-02", "08:15", "OK", "main", "[code] x.py"),
+        ]
+
+    def test_filters(self, index):
+        assert index.count(repo="docs/paper", status="ok") == 1
+        assert index.count(since="2026-04") == 2
+        assert index.count(until="2026-03") == 3
+        assert index.count(since="2026-03-20", until="2026-03-20", status="FAIL") == 1
+        assert index.count(change_type="docs") == 2
+
+    def test_type_filter_without_duplicates(self, index):
+        result = index.query(change_type="docs")
+        assert [row[1] for row in result.rows] == ["11:00", "09:00"]
+
+    def test_group_by(self, index):
+        result = index.query(group_by=["month", "status"])
+        assert result.columns == ["month", "status", "count"]
+        assert result.rows == [
+            ("2026-03", "OK", 2),
+            ("2026-03", "FAIL", 1),
+            ("2026-04", "OK", 1),
+            ("2026-04", "SKIP", 1),
+        ]
+
+    def test_group_by_type(self, index):
+        result = index.query(group_by=["type"], repo="main")
+        assert result.rows == [("code", 1), ("config", 1), ("docs", 1)]
+
+    def test_invalid(self, index):
+        with pytest.raises(ValueError, match="未知分组键"):
+            index.query(group_by=["weekday"])
+        with pytest.raises(ValueError, match="日期格式"):
+            index.query(since="March")
+
+    def test_format(self, index):
+        assert format_result(index.query(group_by=["status"])).splitlines() == [
+            "status  count",
+            "OK      3",
+            "FAIL    1",
+            "SKIP    1",
+        ]
+
+
+class TestCli:
+    """thera journal query"""
+
+    @pytest.fixture
+    def repo(self, git_repo, monkeypatch):
+        journal_dir = git_repo / "meta" / "journal"
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        (journal_dir / "2026-03-20.md").write_text(DAY1)
+        monkeypatch.chdir(git_repo)
+        return git_repo
+
+    def test_query(self, repo):
+        result = CliRunner().invoke(app, ["journal", "query", "--repo", "docs/paper", "--status", "OK"])
+        assert result.exit_code == 0, result.output
+        assert result.output == "2026-03-20 11:00 OK docs/paper: [docs] paper.md\n"
+        assert (repo / ".git" / "thera" / "journal.sqlite").exists()
+
+    def test_count_json(self, repo):
+        result = CliRunner().invoke(app, ["journal", "query", "--status", "FAIL", "--count", "--json"])
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output) == {"count": 1}
+
+    def test_group_by_json(self, repo):
+        result = CliRunner().invoke(app, ["journal", "query", "--group-by", "repo", "--json"])
+        assert json.loads(result.output) == [
+            {"repo": "docs/paper", "count": 2},
+            {"repo": "main", "count": 1},
+        ]
+
+    def test_no_match(self, repo):
+        result = CliRunner().invoke(app, ["journal", "query", "--repo", "nope"])
+        assert result.exit_code == 0
+        assert "无匹配记录" in result.output
+
+    def test_bad_date(self, repo):
+        result = CliRunner().invoke(app, ["journal", "query", "--since", "yesterday"])
+        assert result.exit_code == 2
+        assert "[FAIL] 日期格式" in result.output
@@ -0,0 +1,263 @@
+"""
+仓库运行租约测试
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict
+from unittest.mock import patch
+
+import pytest
+
+from thera import metrics
+from thera.lease import LeaseHolder, LeaseTimeout, RepoLease
+from thera.refresh import RefreshResult, refresh
+
+
+def make_lease(repo, **kwargs):
+    kwargs.setdefault("poll_interval", 0.01)
+    return RepoLease(repo, **kwargs)
+
+
+def write_holder(lease, key="other", pid=None, heartbeat=None):
+    now = time.time()
+    holder = LeaseHolder("old", "refresh", key, pid or os.getpid(), lease.host, now, heartbeat or now)
+    lease.directory.mkdir(parents=True, exist_ok=True)
+    lease.path.write_text(json.dumps(asdict(holder)))
+    return holder
+
+
+def wait_for_holder(lease):
+    deadline = time.monotonic() + 5
+    while lease.holder() is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return lease.holder()
+
+
+class Blocking:
+    """在另一个线程中持有租约，直到 release()"""
+
+    def __init__(self, lease, operation="refresh", params=None, result="first"):
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.result = result
+
+        def func():
+            self.started.set()
+            assert self.gate.wait(5)
+            return self.result
+
+        self.thread = threading.Thread(target=lease.run, args=(operation, func, params))
+        self.thread.start()
+        assert self.started.wait(5)
+
+    def release(self):
+        self.gate.set()
+        self.thread.join(5)
+
+
+class TestRun:
+    """获取与释放"""
+
+    def test_run(self, tmp_path):
+        lease = make_lease(tmp_path)
+        before = metrics.LEASE_RUNS.value(operation="refresh", outcome="run")
+        assert lease.run("refresh", lambda: {"ok": True}) == {"ok": True}
+        assert lease.holder() is None
+        assert not lease.path.exists()
+        assert metrics.LEASE_RUNS.value(operation="refresh", outcome="run") == before + 1
+
+    def test_state_dir(self, git_repo):
+        assert make_lease(git_repo).directory == git_repo / ".git" / "thera" / "lease"
+
+    def test_released_on_error(self, tmp_path):
+        lease = make_lease(tmp_path)
+        with pytest.raises(RuntimeError):
+            lease.run("refresh", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+        assert lease.holder() is None
+
+    def test_reentrant(self, tmp_path):
+        lease = make_lease(tmp_path, timeout=0.5)
+        assert lease.run("workflow", lambda: lease.run("refresh", lambda: 42)) == 42
+
+    def test_heartbeat(self, tmp_path):
+        lease = make_lease(tmp_path, heartbeat_interval=0.02)
+        seen = []
+
+        def func():
+            first = lease.holder().heartbeat
+            time.sleep(0.2)
+            seen.append(lease.holder().heartbeat - first)
+
+        lease.run("refresh", func)
+        assert seen[0] > 0
+
+
+class TestCoalesce:
+    """相同运行复用结果，不同运行排队"""
+
+    def test_same_params_coalesced(self, tmp_path):
+        lease = make_lease(tmp_path)
+        first = Blocking(lease, params={"dry_run": False})
+        before = metrics.LEASE_RUNS.value(operation="refresh", outcome="coalesced")
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            lease.run("refresh", lambda: "second", params={"dry_run": False})
+        ))
+        waiter.start()
+        time.sleep(0.1)
+        first.release()
+        waiter.join(5)
+        assert results == ["first"]
+        assert metrics.LEASE_RUNS.value(operation="refresh", outcome="coalesced") == before + 1
+
+    def test_different_params_queued(self, tmp_path):
+        lease = make_lease(tmp_path)
+        first = Blocking(lease, params={"submodule": "paper"})
+        order = []
+        waiter = threading.Thread(target=lambda: lease.run(
+            "refresh", lambda: order.append("second"), params={"submodule": "journal"}
+        ))
+        waiter.start()
+        time.sleep(0.1)
+        assert order == []  # 仍在排队
+        order.append("first")
+        first.release()
+        waiter.join(5)
+        assert order == ["first", "second"]
+
+    def test_failed_run_not_shared(self, tmp_path):
+        """等待的运行失败、没有结果时，等待方自己执行"""
+        lease = make_lease(tmp_path)
+        started, gate = threading.Event(), threading.Event()
+
+        def failing():
+            started.set()
+            gate.wait(5)
+            raise RuntimeError("boom")
+
+        holder = threading.Thread(target=lambda: pytest.raises(RuntimeError, lease.run, "refresh", failing))
+        holder.start()
+        started.wait(5)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(lease.run("refresh", lambda: "own")))
+        waiter.start()
+        time.sleep(0.1)
+        gate.set()
+        holder.join(5)
+        waiter.join(5)
+        assert results == ["own"]
+
+    def test_timeout(self, tmp_path):
+        lease = make_lease(tmp_path, timeout=0.1)
+        write_holder(lease)
+        with pytest.raises(LeaseTimeout, match="refresh"):
+            lease.run("auto-commit", lambda: None)
+        assert lease.holder().id == "old"
+
+    def test_processes(self, tmp_path):
+        """多个进程同时执行相同的运行：只执行一次，都拿到同一个结果"""
+        script = (
+            "import json, sys, time\n"
+            "from thera.lease import RepoLease\n"
+            "def func():\n"
+            "    with open(sys.argv[2], 'a') as f:\n"
+            "        f.write('run\\n')\n"
+            "    time.sleep(0.5)\n"
+            "    return {'pid': __import__('os').getpid()}\n"
+            "print(json.dumps(RepoLease(sys.argv[1], poll_interval=0.01).run('refresh', func)))\n"
+        )
+        runs = tmp_path / "runs.txt"
+        procs = [
+            subprocess.Popen([sys.executable, "-c", script, str(tmp_path), str(runs)],
+                             stdout=subprocess.PIPE, text=True)
+            for _ in range(3)
+        ]
+        outputs = [p.communicate(timeout=30)[0] for p in procs]
+        assert all(p.returncode == 0 for p in procs)
+        results = {out.strip().splitlines()[-1] for out in outputs}
+        assert len(results) == 1
+        assert runs.read_text() == "run\n"
+
+
+class TestStale:
+    """失效租约的回收"""
+
+    def test_dead_pid(self, tmp_path):
+        proc = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                              capture_output=True, text=True)
+        lease = make_lease(tmp_path, timeout=1)
+        write_holder(lease, pid=int(proc.stdout))
+        before = metrics.LEASE_RECLAIMS.value(operation="refresh")
+        assert lease.run("refresh", lambda: "ok") == "ok"
+        assert metrics.LEASE_RECLAIMS.value(operation="refresh") == before + 1
+
+    def test_old_heartbeat(self, tmp_path):
+        lease = make_lease(tmp_path, stale_after=5, timeout=1)
+        write_holder(lease, heartbeat=time.time() - 10)
+        assert lease.is_stale(lease.holder())
+        assert lease.run("refresh", lambda: "ok") == "ok"
+
+    def test_silent_without_log(self, tmp_path, capsys):
+        """未传 log 时不输出（守护进程、流水线）"""
+        lease = make_lease(tmp_path, timeout=1)
+        write_holder(lease, heartbeat=time.time() - 120)
+        assert lease.run("refresh", lambda: "ok") == "ok"
+        assert capsys.readouterr().out == ""
+
+    def test_other_host_uses_heartbeat(self, tmp_path):
+        lease = make_lease(tmp_path)
+        holder = write_holder(lease, pid=999999999)
+        holder.host = "elsewhere"
+        assert not lease.is_stale(holder)
+
+    def test_coalesced_holder_reclaimed(self, tmp_path):
+        """等待的同键运行心跳停止后被回收，等待方自己执行"""
+        messages = []
+        lease = make_lease(tmp_path, stale_after=0.2, timeout=2, log=messages.append)
+        write_holder(lease, key="same")
+        with patch("thera.lease._key", return_value="same"):
+            assert lease.run("refresh", lambda: "own") == "own"
+        assert messages[0].startswith("[LEASE] 相同的 refresh")
+        assert messages[1].startswith("[LEASE] 回收失效租约")
+
+
+class TestIntegration:
+    """refresh 的租约"""
+
+    def test_refresh_coalesced(self, git_repo):
+        started, gate = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_refresh(*args, **kwargs):
+            calls.append(kwargs)
+            started.set()
+            gate.wait(5)
+            return RefreshResult(True, "已提交并推送", updated_submodules=["docs/paper"], commit_sha="abc123")
+
+        results = []
+        with patch("thera.refresh._refresh", side_effect=slow_refresh):
+            first = threading.Thread(target=lambda: results.append(refresh(git_repo)))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=lambda: results.append(refresh(git_repo)))
+            second.start()
+            wait_for_holder(make_lease(git_repo))
+            time.sleep(0.1)
+            gate.set()
+            first.join(5)
+            second.join(5)
+        assert len(calls) == 1
+        assert results[0] == results[1]
+        assert results[1].commit_sha == "abc123"
+
+    def test_refresh_timeout(self, git_repo):
+        with patch("thera.refresh.run_exclusive", side_effect=LeaseTimeout("等待 refresh 超过 600 秒")):
+            result = refresh(git_repo)
+        assert result.success is False
+        assert result.error == "等待 refresh 超过 600 秒"
@@ -0,0 +1,157 @@
+"""测试 Markdown 链接检查"""
+
+import argparse
+from unittest.mock import patch
+
+import pytest
+
+from thera import doc_check, link_check
+from thera.link_check import check_links, parse_markdown, slugify
+
+
+@pytest.fixture
+def docs_repo(tmp_path):
+    """创建包含两个 docs 子模块的仓库"""
+    handbook = tmp_path / "docs" / "handbook"
+    library = tmp_path / "docs" / "library"
+    (handbook / "guide").mkdir(parents=True)
+    library.mkdir(parents=True)
+
+    (handbook / "README.md").write_text(
+        "# 手册\n\n"
+        "## Getting Started\n\n"
+        "见 [指南](guide/intro.md) 和 [书目](../library/books.md#经典著作)。\n"
+        "[外部](https://example.com) [本页](#getting-started)\n"
+    )
+    (handbook / "guide" / "intro.md").write_text("# Intro\n\n[返回](../README.md)\n")
+    (library / "books.md").write_text("# 书目\n\n## 经典著作\n\n[自身](/books.md#书目)\n")
+    return tmp_path
+
+
+class TestSlugify:
+    """测试 slugify 函数"""
+
+    def test_ascii(self):
+        assert slugify("Getting Started") == "getting-started"
+
+    def test_punctuation_removed(self):
+        assert slugify("What's new?") == "whats-new"
+
+    def test_chinese_kept(self):
+        assert slugify("经典 著作") == "经典-著作"
+
+    def test_inline_code(self):
+        assert slugify("`git_ops` 模块") == "git_ops-模块"
+
+
+class TestParseMarkdown:
+    """测试 parse_markdown 函数"""
+
+    def test_links_and_anchors(self):
+        links, anchors = parse_markdown("# Title\n[a](b.md) ![img](c.png \"t\")\n")
+        assert links == [[2, "b.md"], [2, "c.png"]]
+        assert anchors == ["title"]
+
+    def test_skips_external(self):
+        links, _ = parse_markdown("[a](https://x.com) [b](mailto:a@b.c) [c](//cdn)\n")
+        assert links == []
+
+    def test_skips_fenced_code(self):
+        links, anchors = parse_markdown("```\n# not heading\n[a](b.md)\n```\n")
+        assert links == []
+        assert anchors == []
+
+    def test_skips_inline_code(self):
+        links, _ = parse_markdown("`[a](b.md)`\n")
+        assert links == []
+
+    def test_duplicate_headings(self):
+        _, anchors = parse_markdown("## FAQ\n## FAQ\n## FAQ\n")
+        assert anchors == ["faq", "faq-1", "faq-2"]
+
+    def test_reference_definition(self):
+        links, _ = parse_markdown("[ref]: ../other.md\n")
+        assert links == [[1, "../other.md"]]
+
+    def test_html_anchor(self):
+        _, anchors = parse_markdown('<a name="custom"></a>\n')
+        assert anchors == ["custom"]
+
+
+class TestCheckLinks:
+    """测试 check_links 函数"""
+
+    def test_all_valid(self, docs_repo):
+        result = check_links(docs_repo)
+        assert result.success is True
+        assert result.files_checked == 3
+        assert result.broken_links == []
+
+    def test_broken_path(self, docs_repo):
+        (docs_repo / "docs" / "library" / "new.md").write_text("[x](missing.md)\n")
+        result = check_links(docs_repo)
+        assert result.success is False
+        assert len(result.broken_links) == 1
+        broken = result.broken_links[0]
+        assert broken.source == "docs/library/new.md"
+        assert broken.line == 1
+        assert broken.reason == "路径不存在"
+
+    def test_broken_anchor(self, docs_repo):
+        (docs_repo / "docs" / "library" / "new.md").write_text(
+            "[x](../handbook/README.md#nope)\n"
+        )
+        result = check_links(docs_repo)
+        assert [b.reason for b in result.broken_links] == ["锚点不存在"]
+
+    def test_cache_skips_unchanged(self, docs_repo):
+        first = check_links(docs_repo)
+        assert first.files_parsed == 3
+
+        second = check_links(docs_repo)
+        assert second.files_parsed == 0
+        assert second.success is True
+
+        (docs_repo / "docs" / "handbook" / "guide" / "intro.md").write_text(
+            "# Intro\n\n[坏链](nowhere.md)\n"
+        )
+        third = check_links(docs_repo)
+        assert third.files_parsed == 1
+        assert third.success is False
+
+    def test_no_cache(self, docs_repo):
+        check_links(docs_repo)
+        result = check_links(docs_repo, use_cache=False)
+        assert result.files_parsed == 3
+
+    def test_parallel_parse(self, docs_repo):
+        with patch.object(link_check, "PARALLEL_THRESHOLD", 1):
+            result = check_links(docs_repo, jobs=2, use_cache=False)
+        assert result.success is True
+        assert result.files_parsed == 3
+
+    def test_missing_roots(self, tmp_path):
+        result = check_links(tmp_path)
+        assert result.success is True
+        assert result.files_checked == 0
+
+
+class TestMain:
+    """测试 main 函数"""
+
+    def test_main_ok(self, docs_repo):
+        args = argparse.Namespace(repo=str(docs_repo), root=None, jobs=1, no_cache=False)
+        with patch("builtins.print"):
+            assert link_check.main(args) == 0
+
+    def test_main_broken(self, docs_repo):
+        (docs_repo / "docs" / "handbook" / "bad.md").write_text("[x](gone.md)\n")
+        args = argparse.Namespace(repo=str(docs_repo), root=None, jobs=1, no_cache=True)
+        with patch("builtins.print"):
+            assert link_check.main(args) == 1
+
+    def test_doc_check_links_option(self, docs_repo):
+        (docs_repo / "docs" / "handbook" / "bad.md").write_text("[x](gone.md)\n")
+        ok, details = doc_check.check_markdown_links(docs_repo)
+        assert ok is False
+        assert "docs/handbook/bad.md:1 gone.md" in details
@@ -0,0 +1,64 @@
+"""测试步骤结果缓存"""
+
+from thera.memo import StepCache, file_digest, fingerprint, stat_key
+
+
+class TestFingerprint:
+    """指纹函数测试"""
+
+    def test_file_digest(self, tmp_path):
+        path = tmp_path / "a.yaml"
+        assert file_digest(path) == "missing"
+        path.write_text("x")
+        first = file_digest(path)
+        path.write_text("y")
+        assert file_digest(path) != first
+
+    def test_stat_key(self, tmp_path):
+        path = tmp_path / "index"
+        assert stat_key(path) == "missing"
+        path.write_bytes(b"1")
+        assert stat_key(path) == stat_key(path)
+
+    def test_parts_are_separated(self):
+        assert fingerprint("ab", "c") != fingerprint("a", "bc")
+
+
+class TestStepCache:
+    """StepCache 测试"""
+
+    def test_hit_and_miss(self):
+        cache = StepCache()
+        assert cache.get("doc_check", "k1") is None
+        cache.put("doc_check", "k1", {"ok": True})
+        assert cache.get("doc_check", "k1") == {"ok": True}
+        assert cache.get("doc_check", "k2") is None
+        assert cache.summary() == {
+            "hits": 1,
+            "misses": 2,
+            "steps": {"doc_check": {"hits": 1, "misses": 2}},
+        }
+
+    def test_persists(self, tmp_path):
+        path = tmp_path / "cache.json"
+        StepCache(path).put("sync", "k", {"success": True})
+        assert StepCache(path).get("sync", "k") == {"success": True}
+
+    def test_invalidate(self):
+        cache = StepCache()
+        cache.put("a", "k", {})
+        cache.put("b", "k", {})
+        cache.invalidate("a")
+        assert cache.get("a", "k") is None
+        assert cache.get("b", "k") == {}
+        cache.invalidate()
+        assert cache.entries == {}
+
+    def test_corrupt_file_ignored(self, tmp_path):
+        path = tmp_path / "cache.json"
+        path.write_text("[broken")
+        assert StepCache(path).entries == {}
+
+    def test_for_repo(self, git_repo):
+        cache = StepCache.for_repo(git_repo)
+        assert cache.path == git_repo / ".git" / "thera" / "step_cache.json"
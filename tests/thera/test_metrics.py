@@ -0,0 +1,132 @@
+"""测试指标导出"""
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from thera import metrics
+from thera.fsm import ErrorState, Event, RepoState, StateMachine
+from thera.metrics import MetricsRegistry, git_subcommand, observe_transition
+from thera.refresh import refresh
+
+
+class TestMetricsRegistry:
+    """MetricsRegistry 测试"""
+
+    def test_counter_render(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("thera_demo", "示例", ("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind="b")
+        text = registry.render()
+        assert "# HELP thera_demo 示例" in text
+        assert "# TYPE thera_demo counter" in text
+        assert 'thera_demo_total{kind="a"} 3' in text
+        assert 'thera_demo_total{kind="b"} 1' in text
+        assert text.endswith("# EOF\n")
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        hist = registry.histogram("thera_latency_seconds", "耗时", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            hist.observe(value)
+        lines = registry.render().splitlines()
+        assert 'thera_latency_seconds_bucket{le="0.1"} 1' in lines
+        assert 'thera_latency_seconds_bucket{le="1.0"} 3' in lines
+        assert 'thera_latency_seconds_bucket{le="+Inf"} 4' in lines
+        assert "thera_latency_seconds_sum 4.05" in lines
+        assert "thera_latency_seconds_count 4" in lines
+        assert hist.count() == 4
+
+    def test_label_escaping(self):
+        registry = MetricsRegistry()
+        registry.counter("thera_paths", "路径", ("path",)).inc(path='a"b\\c')
+        assert 'thera_paths_total{path="a\\"b\\\\c"} 1' in registry.render()
+
+    def test_register_is_idempotent(self):
+        registry = MetricsRegistry()
+        first = registry.counter("thera_x", "x", ("a",))
+        assert registry.counter("thera_x", "x", ("a",)) is first
+        with pytest.raises(ValueError):
+            registry.histogram("thera_x", "x", ("a",))
+
+    def test_write_is_atomic(self, tmp_path):
+        registry = MetricsRegistry()
+        registry.counter("thera_x", "x").inc()
+        path = registry.write(tmp_path / "out" / "thera.prom")
+        assert path.read_text().startswith("# HELP thera_x x")
+        assert list(path.parent.iterdir()) == [path]
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["git", "status", "--porcelain"], "status"),
+        (["git", "-C", "vendor/a", "fetch", "--quiet"], "fetch"),
+        (["-c", "core.quotepath=off", "diff"], "diff"),
+        (["git", "--no-pager", "log"], "log"),
+        (["git"], "unknown"),
+    ],
+)
+def test_git_subcommand(args, expected):
+    assert git_subcommand(args) == expected
+
+
+def test_observe_git_counts_failures():
+    before = metrics.GIT_FAILURES.value(subcommand="push")
+    count = metrics.GIT_DURATION.count(subcommand="push")
+    metrics.observe_git(["git", "push"], 0.2, returncode=1)
+    metrics.observe_git(["git", "push"], 0.1, returncode=0)
+    assert metrics.GIT_FAILURES.value(subcommand="push") == before + 1
+    assert metrics.GIT_DURATION.count(subcommand="push") == count + 2
+
+
+def test_time_submodule():
+    count = metrics.SUBMODULE_DURATION.count(submodule="vendor/t", operation="fetch")
+    with pytest.raises(RuntimeError):
+        with metrics.time_submodule("vendor/t", "fetch"):
+            raise RuntimeError("fetch failed")
+    assert metrics.SUBMODULE_DURATION.count(submodule="vendor/t", operation="fetch") == count + 1
+
+
+def test_observe_transition_counts_errors():
+    machine = StateMachine()
+    machine.add_listener(observe_transition)
+    labels = dict(from_state="SYNCED", event="AUTO_COMMIT", to_state="COMMITTED")
+    before = metrics.TRANSITIONS.value(**labels)
+    errors = metrics.ERRORS.value(error="NETWORK_ERROR")
+    machine.transition(Event.DOC_CHECK_OK)
+    machine.transition(Event.SUBMODULE_SYNC)
+    machine.transition(Event.AUTO_COMMIT)
+    machine.transition(Event.PUSH_FAIL)
+    assert machine.state == ErrorState.NETWORK_ERROR
+    assert metrics.TRANSITIONS.value(**labels) == before + 1
+    assert metrics.ERRORS.value(error="NETWORK_ERROR") == errors + 1
+
+
+class TestWriteTextfile:
+    """write_textfile 测试"""
+
+    def test_disabled_without_env(self, monkeypatch):
+        monkeypatch.delenv(metrics.METRICS_ENV, raising=False)
+        assert metrics.enabled() is False
+        assert metrics.write_textfile() is None
+
+    def test_refresh_writes_outcome(self, monkeypatch, tmp_path):
+        target = tmp_path / "thera.prom"
+        monkeypatch.setenv(metrics.METRICS_ENV, str(target))
+        before = metrics.REFRESH_RUNS.value(outcome="ok")
+        with patch("thera.refresh._get_dirty_submodules", return_value=[]), \
+                patch("thera.refresh._fetch_submodules"), \
+                patch("thera.refresh._get_submodules_behind_remote", return_value=[]), \
+                patch("thera.refresh.GitOps") as mock_ops_class:
+            mock_ops_class.return_value.get_status.return_value = MagicMock(is_clean=True)
+            result = refresh(Path("."))
+
+        assert result.success is True
+        assert metrics.REFRESH_RUNS.value(outcome="ok") == before + 1
+        text = target.read_text()
+        assert "thera_refresh_runs_total{outcome=\"ok\"}" in text
+        assert "# TYPE thera_refresh_duration_seconds histogram" in text
@@ -0,0 +1,224 @@
+"""
+thera run 流水线测试
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+from typer.testing import CliRunner
+
+from thera.cli import app
+from thera.git_ops import PushResult, SubmoduleInfo
+from thera.pipeline import (
+    STAGES,
+    RepoSession,
+    RunOptions,
+    StageResult,
+    parse_stages,
+    run_auto_commit,
+    run_doc_check,
+    run_pipeline,
+    run_refresh,
+    run_submodule_check,
+)
+from thera.refresh import RefreshResult
+
+GITMODULES = '''
+[submodule "archive"]
+\tpath = docs/archive
+\turl = https://example.com/archive.git
+'''
+
+REGISTRY = """
+submodules:
+  - name: "archive"
+    path: "docs/archive"
+"""
+
+
+@pytest.fixture
+def registry_repo(git_repo):
+    """带 .gitmodules 和 YAML 事实源的仓库"""
+    (git_repo / ".gitmodules").write_text(GITMODULES)
+    (git_repo / "docs" / "archive").mkdir(parents=True)
+    yaml_path = git_repo / "meta" / "profile" / "submodules.yaml"
+    yaml_path.parent.mkdir(parents=True)
+    yaml_path.write_text(REGISTRY)
+    return git_repo
+
+
+class TestRepoSession:
+    """RepoSession 测试"""
+
+    def test_registry_parsed_once(self, registry_repo):
+        session = RepoSession(registry_repo)
+        with patch("thera.doc_check.yaml.safe_load", wraps=yaml.safe_load) as load:
+            assert session.registry == [{"name": "archive", "path": "docs/archive"}]
+            assert session.registry is session.registry
+            assert load.call_count == 1
+        assert session.gitmodules == {"archive": "docs/archive"}
+
+    def test_missing_files(self, tmp_path):
+        session = RepoSession(tmp_path)
+        assert session.registry is None
+        assert session.gitmodules is None
+
+    def test_submodule_snapshot_and_invalidate(self, tmp_path):
+        session = RepoSession(tmp_path)
+        session.git_ops = MagicMock()
+        session.git_ops.get_submodule_status.return_value = [
+            SubmoduleInfo("docs/a", "abc1234", False, False)
+        ]
+        assert session.submodule_paths == ["docs/a"]
+        assert session.submodule_paths == ["docs/a"]
+        assert session.git_ops.get_submodule_status.call_count == 1
+
+        session.invalidate()
+        session.submodules
+        assert session.git_ops.get_submodule_status.call_count == 2
+
+
+def test_parse_stages():
+    assert parse_stages("doc-check, refresh,,auto-commit") == ["doc-check", "refresh", "auto-commit"]
+    with pytest.raises(ValueError, match="未知阶段: lint"):
+        parse_stages("doc-check,lint")
+    with pytest.raises(ValueError):
+        parse_stages(" , ")
+
+
+class TestStages:
+    """各阶段测试"""
+
+    def test_doc_check_uses_session(self, registry_repo, capsys):
+        session = RepoSession(registry_repo)
+        session.__dict__["registry"] = [{"name": "archive", "path": "docs/archive"}]
+        with patch("thera.doc_check.load_yaml_registry") as load:
+            result = run_doc_check(session, RunOptions())
+        load.assert_not_called()
+        assert result.success is True
+        assert "[OK] YAML vs .gitmodules" in capsys.readouterr().out
+
+    def test_doc_check_failure(self, git_repo):
+        result = run_doc_check(RepoSession(git_repo), RunOptions())
+        assert result.success is False
+        assert "YAML vs .gitmodules" in result.message
+
+    def test_submodule_check(self, tmp_path):
+        session = RepoSession(tmp_path)
+        session.__dict__["submodules"] = [SubmoduleInfo("docs/a", "abc1234", True, False)]
+        with patch("thera.submodule_sync.collect_ahead_behind") as collect:
+            result = run_submodule_check(session, RunOptions())
+        submodules = collect.call_args[0][0]
+        assert submodules == [{"path": "docs/a", "local": "abc1234", "has_update": True}]
+        assert result.success is True
+        assert result.message == "1 个子模块有更新"
+
+    def test_refresh_shares_git_ops(self, tmp_path):
+        session = RepoSession(tmp_path)
+        session.__dict__["submodules"] = []
+        with patch(
+            "thera.refresh.refresh",
+            return_value=RefreshResult(True, "子模块已更新", updated_submodules=["docs/a"]),
+        ) as do_refresh:
+            result = run_refresh(session, RunOptions())
+        do_refresh.assert_called_once_with(
+            tmp_path, dry_run=False, ops=session.git_ops, submodules=[]
+        )
+        assert result.success is True
+        assert "submodules" not in session.__dict__
+
+    def test_auto_commit_uses_snapshot_paths(self, tmp_path):
+        session = RepoSession(tmp_path)
+        session.__dict__["submodules"] = [SubmoduleInfo("docs/a", "abc1234", False, False)]
+        changes = {"docs/a": [{"path": "x.md", "type": "docs", "status": "M"}]}
+        with patch("thera.auto_commit.detect_all_changes", return_value=changes) as detect, \
+                patch("thera.auto_commit.get_submodule_status") as status:
+            result = run_auto_commit(session, RunOptions(dry_run=True))
+        detect.assert_called_once_with(tmp_path, submodules=["docs/a"])
+        status.assert_not_called()
+        assert result.success is True
+        assert result.message == "预览: 1 个仓库有变更"
+
+    def test_auto_commit_yes_commits(self, tmp_path):
+        session = RepoSession(tmp_path)
+        session.__dict__["submodules"] = []
+        changes = {".": [{"path": "README.md", "type": "root", "status": "M"}]}
+        with patch("thera.auto_commit.detect_all_changes", return_value=changes), \
+                patch("thera.auto_commit.confirm_commit") as confirm, \
+                patch("thera.auto_commit.GitOps") as ops_class, \
+                patch("thera.auto_commit.append_journal") as journal:
+            ops_class.return_value.commit_and_push.return_value = PushResult(True, "推送成功")
+            result = run_auto_commit(session, RunOptions(yes=True))
+        confirm.assert_not_called()
+        journal.assert_called_once()
+        assert result.success is True
+
+
+class TestRunPipeline:
+    """run_pipeline 测试"""
+
+    def _stages(self, outcomes):
+        calls = []
+
+        def make(name, ok):
+            def stage(session, options):
+                calls.append(name)
+                return StageResult(name, ok, "done")
+            return stage
+
+        fakes = {name: make(name, ok) for name, ok in outcomes.items()}
+        return calls, patch.dict(STAGES, fakes)
+
+    def test_stops_on_failure(self, tmp_path):
+        calls, stages = self._stages({"doc-check": False, "refresh": True})
+        with stages:
+            result = run_pipeline(RepoSession(tmp_path), ["doc-check", "refresh"])
+        assert calls == ["doc-check"]
+        assert result.success is False
+        assert result.skipped == ["refresh"]
+
+    def test_keep_going(self, tmp_path):
+        calls, stages = self._stages({"doc-check": False, "refresh": True})
+        with stages:
+            result = run_pipeline(
+                RepoSession(tmp_path), ["doc-check", "refresh"], keep_going=True
+            )
+        assert calls == ["doc-check", "refresh"]
+        assert [s.success for s in result.stages] == [False, True]
+        assert result.skipped == []
+
+    def test_session_shared(self, tmp_path):
+        sessions = []
+
+        def stage(session, options):
+            sessions.append(session)
+            return StageResult("x", True, "")
+
+        with patch.dict(STAGES, {"doc-check": stage, "auto-commit": stage}):
+            run_pipeline(RepoSession(tmp_path), ["doc-check", "auto-commit"])
+        assert sessions[0] is sessions[1]
+
+
+class TestRunCommand:
+    """thera run 命令测试"""
+
+    def test_run(self, registry_repo, monkeypatch):
+        monkeypatch.chdir(registry_repo)
+        result = CliRunner().invoke(app, ["run", "doc-check,auto-commit", "--dry-run"])
+        assert result.exit_code == 0, result.output
+        assert "==> doc-check" in result.output
+        assert "✓ doc-check" in result.output
+        assert "✓ auto-commit" in result.output
+
+    def test_failure_skips(self, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        result = CliRunner().invoke(app, ["run", "doc-check,auto-commit"])
+        assert result.exit_code == 1
+        assert "[FAIL] doc-check" in result.output
+        assert "- auto-commit" in result.output
+
+    def test_unknown_stage(self):
+        result = CliRunner().invoke(app, ["run", "lint"])
+        assert result.exit_code == 2
+        assert "未知阶段: lint" in result.output
@@ -146,6 +146,24 @@ class TestRefresh:
         assert result.error is not None
         assert "docs/journal" in result.error
 
+    def test_refresh_uses_given_submodules(self):
+        """传入子模块列表时不再使用内置路径"""
+        submodules = [
+            SubmoduleInfo("vendor/journal", "abc1234", False, False),
+            SubmoduleInfo("vendor/paper", "def5678", False, False),
+        ]
+        with patch("thera.refresh._get_dirty_submodules", return_value=[]) as dirty, \
+                patch("thera.refresh._fetch_submodules") as fetch, \
+                patch("thera.refresh._get_submodules_behind_remote", return_value=[]) as behind:
+            ops = MagicMock()
+            ops.get_status.return_value = MagicMock(is_clean=True)
+            result = refresh(Path("."), submodule="journal", ops=ops, submodules=submodules)
+
+        assert result.success is True
+        dirty.assert_called_once_with(Path("."), ["vendor/journal", "vendor/paper"])
+        assert fetch.call_args.kwargs["paths"] == ["vendor/journal"]
+        assert behind.call_args.kwargs["paths"] == ["vendor/journal"]
+
 
 class TestFetchSubmodules:
     """_fetch_submodules 测试"""
@@ -166,3 +184,31 @@ class TestGetSubmodulesBehindRemote:
             result = _get_submodules_behind_remote(tmp_path)
             assert result == []
             mock_run.assert_not_called()
+
+
+class TestGetDirtySubmodules:
+    """_get_dirty_submodules 测试"""
+
+    def test_skips_nonexistent(self, tmp_path):
+        """测试跳过不存在的子模块"""
+        with patch("thera.refresh.subprocess.run") as mock_run:
+            assert _get_dirty_submodules(tmp_path) == []
+            mock_run.assert_not_called()
+
+    def test_in_process(self, git_repo, tmp_path):
+        """测试在进程内判定子模块的脏状态（含未跟踪文件）"""
+        import os
+        import subprocess
+        import time
+
+        journal = git_repo / "docs" / "journal"
+        journal.parent.mkdir()
+        subprocess.run(["git", "clone", "-q", str(git_repo), str(journal)], capture_output=True)
+        future = time.time_ns() + 2 * 10**9
+        os.utime(journal / ".git" / "index", ns=(future, future))
+
+        with patch("thera.index_stat.GitOps.run_git") as run_git:
+            assert _get_dirty_submodules(git_repo) == []
+            (journal / "draft.md").write_text("draft\n")
+            assert _get_dirty_submodules(git_repo) == ["docs/journal"]
+            run_git.assert_not_called()
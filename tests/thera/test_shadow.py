@@ -0,0 +1,144 @@
+"""
+影子验证测试
+"""
+
+import json
+import subprocess
+from argparse import Namespace
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from thera import shadow
+from thera.shadow import (
+    COMMANDS,
+    ShadowComparison,
+    ShadowReport,
+    compare,
+    format_report,
+    run_shadow,
+)
+
+
+def args(repo, **overrides):
+    values = {
+        "repo": str(repo),
+        "config": shadow.DEFAULT_CONFIG,
+        "commands": ",".join(COMMANDS),
+        "runs": 1,
+        "max_slowdown": shadow.DEFAULT_MAX_SLOWDOWN,
+        "json": False,
+    }
+    values.update(overrides)
+    return Namespace(**values)
+
+
+class TestCompare:
+    """compare 测试"""
+
+    def test_engines_agree_on_changes(self, git_repo):
+        (git_repo / "README.md").write_text("# Changed\n")
+        (git_repo / "docs").mkdir()
+        (git_repo / "docs" / "new.md").write_text("new\n")
+        result = compare("auto-commit", git_repo, runs=2)
+        assert result.match is True, (result.old, result.new)
+        assert result.old == {".": [("README.md", "root"), ("docs/", "docs")]}
+        assert result.stable is True
+        assert result.old_ms > 0 and result.new_ms > 0
+
+    @pytest.mark.parametrize("command", ["doc-check", "submodule-sync"])
+    def test_engines_agree(self, git_repo, command):
+        assert compare(command, git_repo, runs=1).match is True
+
+    def test_mismatch(self, git_repo):
+        with patch.dict(COMMANDS, {"submodule-sync": (
+            lambda root, config: [{"path": "docs/a", "local": "abc1234", "has_update": False}],
+            lambda root, config: [{"path": "docs/a", "local": "abc1234", "has_update": True}],
+            shadow._submodules_key,
+        )}):
+            result = compare("submodule-sync", git_repo, runs=1)
+        assert result.match is False
+        assert result.old == [("docs/a", "abc1234", False)]
+
+    def test_engine_error(self, git_repo):
+        def broken(root, config):
+            raise OSError("boom")
+
+        with patch.dict(COMMANDS, {"doc-check": (broken, broken, shadow._consistency_key)}):
+            result = compare("doc-check", git_repo, runs=1)
+        assert result.match is False
+        assert result.error == "OSError: boom"
+
+    def test_engines_run_concurrently(self, git_repo):
+        import threading
+
+        barrier = threading.Barrier(2, timeout=5)
+
+        def engine(root, config):
+            barrier.wait()  # 串行执行时会超时
+            return []
+
+        with patch.dict(COMMANDS, {"submodule-sync": (engine, engine, shadow._submodules_key)}):
+            assert compare("submodule-sync", git_repo, runs=1).match is True
+
+
+class TestRegression:
+    """性能回退判定测试"""
+
+    def test_slowdown(self):
+        comparison = ShadowComparison("doc-check", True, {}, {}, old_ms=20.0, new_ms=50.0)
+        assert comparison.slowdown == 2.5
+        assert comparison.regressed(1.5) is True
+        assert comparison.regressed(3.0) is False
+
+    def test_noise_ignored(self):
+        comparison = ShadowComparison("doc-check", True, {}, {}, old_ms=0.5, new_ms=2.0)
+        assert comparison.regressed(1.5) is False
+
+    def test_report(self):
+        report = ShadowReport(".", 1.5, [
+            ShadowComparison("doc-check", True, {}, {}, 10.0, 10.0),
+            ShadowComparison("auto-commit", True, {}, {}, 10.0, 40.0),
+        ])
+        assert report.mismatches == []
+        assert report.regressions == ["auto-commit"]
+        assert report.success is False
+        assert "性能回退" in format_report(report)
+
+
+def test_run_shadow(git_repo):
+    report = run_shadow(git_repo, runs=1)
+    assert [c.command for c in report.comparisons] == list(COMMANDS)
+    assert report.mismatches == []
+
+
+class TestMain:
+    """命令行入口测试"""
+
+    def test_text(self, git_repo, capsys):
+        with patch.object(ShadowComparison, "regressed", return_value=False):
+            assert shadow.main(args(git_repo)) == 0
+        out = capsys.readouterr().out
+        assert "doc-check" in out and "auto-commit" in out
+        assert "✓ 所有验证通过" in out
+
+    def test_json(self, git_repo, capsys):
+        with patch.object(ShadowComparison, "regressed", return_value=False):
+            assert shadow.main(args(git_repo, json=True, commands="submodule-sync")) == 0
+        data = json.loads(capsys.readouterr().out)
+        assert data["comparisons"][0]["command"] == "submodule-sync"
+        assert data["mismatches"] == []
+
+    def test_unknown_command(self, git_repo):
+        assert shadow.main(args(git_repo, commands="lint")) == 2
+
+    def test_script(self, git_repo):
+        script = Path(__file__).parents[2] / "scripts" / "shadow_verify.sh"
+        result = subprocess.run(
+            ["bash", str(script), str(git_repo), "--runs", "1", "--max-slowdown", "1000"],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert "✓ 所有验证通过" in result.stdout
@@ -1,8 +1,12 @@
 """测试子模块同步功能"""
 
 import argparse
+import io
+import json
 import pytest
 import subprocess
+import threading
+import time
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
@@ -106,6 +110,26 @@ class TestSyncSubmodule:
                 result = submodule_sync.sync_submodule("docs/archive", tmp_path)
                 assert result is False
 
+    def test_initialized_fetches_in_submodule(self, tmp_path):
+        """已初始化的子模块在子模块目录内 fetch，update 不再重复拉取"""
+        (tmp_path / "docs/archive/.git").mkdir(parents=True)
+        with patch("thera.submodule_sync.run_git", return_value=True) as mock:
+            with patch("builtins.print"):
+                assert submodule_sync.sync_submodule("docs/archive", tmp_path) is True
+        calls = [c.args[0] for c in mock.call_args_list]
+        assert calls == [
+            ["-C", "docs/archive", "fetch", "--quiet"],
+            ["submodule", "update", "--remote", "--merge", "--no-fetch", "docs/archive"],
+        ]
+
+    def test_fetch_failure_skips_update(self, tmp_path):
+        """fetch 失败时不再执行 update"""
+        (tmp_path / "docs/archive/.git").mkdir(parents=True)
+        with patch("thera.submodule_sync.run_git", return_value=False) as mock:
+            with patch("builtins.print"):
+                assert submodule_sync.sync_submodule("docs/archive", tmp_path) is False
+        mock.assert_called_once()
+
 
 class TestMain:
     """测试 main 函数"""
@@ -162,14 +186,36 @@ class TestMain:
 
     def test_main_sync_all(self, tmp_path, git_repo):
         """测试同步所有子模块"""
-        with patch("thera.submodule_sync.run_git") as mock:
-            mock.return_value = True
-            with patch("builtins.print"):
+        with patch("thera.submodule_sync.get_submodule_status") as mock_status:
+            mock_status.return_value = [
+                {"path": "docs/archive", "local": "abc1234", "has_update": False},
+                {"path": "docs/tutorial", "local": "def5678", "has_update": False},
+            ]
+            with patch("thera.submodule_sync.sync_submodule") as mock:
+                mock.return_value = True
+                with patch("builtins.print"):
+                    args = argparse.Namespace(
+                        check=False, sync=None, sync_all=True, repo=str(git_repo)
+                    )
+                    result = submodule_sync.main(args)
+                    assert result == 0
+                    assert mock.call_count == 2
+
+    def test_main_sync_all_reports_failure(self, tmp_path, git_repo, capsys):
+        """测试同步所有子模块时报告真实的失败路径"""
+        with patch("thera.submodule_sync.get_submodule_status") as mock_status:
+            mock_status.return_value = [
+                {"path": "docs/archive", "local": "abc1234", "has_update": False},
+                {"path": "docs/tutorial", "local": "def5678", "has_update": False},
+            ]
+            with patch("thera.submodule_sync.sync_submodule") as mock:
+                mock.side_effect = lambda path, root, out=None: path != "docs/tutorial"
                 args = argparse.Namespace(
                     check=False, sync=None, sync_all=True, repo=str(git_repo)
                 )
                 result = submodule_sync.main(args)
-                assert result == 0
+        assert result == 1
+        assert "[FAIL] 1/2 个子模块同步失败: docs/tutorial" in capsys.readouterr().out
 
     def test_main_no_args_shows_help(self, tmp_path, git_repo):
         """测试无参数时显示帮助"""
@@ -187,3 +233,216 @@ class TestMain:
             with patch("sys.argv", ["submodule_sync.py"]):
                 result = submodule_sync.main()
                 assert result == 1  # 显示帮助后退出
+
+
+@pytest.fixture
+def repo_with_clone(tmp_path, git_repo):
+    """在 git_repo/docs/archive 下克隆一个上游仓库，并让上游领先 2 个提交"""
+    upstream = tmp_path / "upstream"
+    subprocess.run(["git", "clone", "-q", str(git_repo), str(upstream)], capture_output=True)
+    clone = git_repo / "docs" / "archive"
+    subprocess.run(["git", "clone", "-q", str(upstream), str(clone)], capture_output=True)
+
+    for i in range(2):
+        subprocess.run(
+            ["git", "-c", "user.name=T", "-c", "user.email=t@t", "commit",
+             "--allow-empty", "-m", f"upstream {i}"],
+            cwd=upstream, capture_output=True,
+        )
+    subprocess.run(
+        ["git", "-c", "user.name=T", "-c", "user.email=t@t", "commit",
+         "--allow-empty", "-m", "local"],
+        cwd=clone, capture_output=True,
+    )
+    subprocess.run(["git", "fetch", "-q", "origin"], cwd=clone, capture_output=True)
+    return git_repo
+
+
+class TestAheadBehind:
+    """测试领先/落后计数"""
+
+    def test_missing_submodule(self, tmp_path):
+        info = submodule_sync.get_ahead_behind("docs/none", tmp_path)
+        assert info["ahead"] is None
+        assert info["behind"] is None
+
+    def test_counts_against_upstream(self, repo_with_clone):
+        info = submodule_sync.get_ahead_behind("docs/archive", repo_with_clone)
+        assert info["upstream"].startswith("origin/")
+        assert info["ahead"] == 1
+        assert info["behind"] == 2
+
+    def test_configured_branch(self, repo_with_clone, tmp_path):
+        """.gitmodules 中的 submodule.<name>.branch 优先于跟踪分支"""
+        upstream = tmp_path / "upstream"
+        subprocess.run(["git", "branch", "stable", "HEAD~2"], cwd=upstream, capture_output=True)
+        clone = repo_with_clone / "docs" / "archive"
+        subprocess.run(["git", "fetch", "-q", "origin"], cwd=clone, capture_output=True)
+        (repo_with_clone / ".gitmodules").write_text(
+            '[submodule "archive docs"]\n\tpath = docs/archive\n\tbranch = stable\n'
+        )
+        info = submodule_sync.get_ahead_behind("docs/archive", repo_with_clone)
+        assert info["upstream"] == "origin/stable"
+        assert (info["ahead"], info["behind"]) == (1, 0)
+
+        # 主仓库 .git/config 中的设置覆盖 .gitmodules
+        subprocess.run(
+            ["git", "config", "submodule.archive docs.branch", "missing"],
+            cwd=repo_with_clone, capture_output=True,
+        )
+        info = submodule_sync.get_ahead_behind("docs/archive", repo_with_clone)
+        assert info["upstream"] != "origin/stable"  # 远程没有该分支，退回跟踪分支
+        assert info["behind"] == 2
+
+    def test_writes_commit_graph(self, repo_with_clone):
+        submodule_sync.get_ahead_behind("docs/archive", repo_with_clone, write_graph=True)
+        info_dir = repo_with_clone / "docs" / "archive" / ".git" / "objects" / "info"
+        assert (info_dir / "commit-graphs").exists() or (info_dir / "commit-graph").exists()
+
+    def test_read_only_by_default(self, repo_with_clone):
+        info = submodule_sync.get_ahead_behind("docs/archive", repo_with_clone)
+        assert info["behind"] == 2
+        info_dir = repo_with_clone / "docs" / "archive" / ".git" / "objects" / "info"
+        assert not (info_dir / "commit-graphs").exists()
+        assert not (info_dir / "commit-graph").exists()
+
+    def test_without_commit_graph(self, repo_with_clone):
+        info = submodule_sync.get_ahead_behind(
+            "docs/archive", repo_with_clone, use_commit_graph=False
+        )
+        assert info["behind"] == 2
+        info_dir = repo_with_clone / "docs" / "archive" / ".git" / "objects" / "info"
+        assert not (info_dir / "commit-graphs").exists()
+
+    def test_collect_preserves_order(self, tmp_path):
+        submodules = [
+            {"path": "docs/b", "local": "1", "has_update": False},
+            {"path": "docs/a", "local": "2", "has_update": False},
+        ]
+        with patch("thera.submodule_sync.get_ahead_behind") as mock:
+            mock.side_effect = lambda path, root, graph, write: {
+                "path": path, "upstream": "origin/main",
+                "ahead": 0, "behind": 1 if path == "docs/a" else 0,
+            }
+            submodule_sync.collect_ahead_behind(submodules, tmp_path, jobs=2)
+        assert [s["path"] for s in submodules] == ["docs/b", "docs/a"]
+        assert submodules[1]["behind"] == 1
+
+    def test_format_table_sort_by_behind(self):
+        submodules = [
+            {"path": "docs/a", "local": "abc1234", "has_update": False,
+             "upstream": "origin/main", "ahead": 0, "behind": 1},
+            {"path": "docs/b", "local": "def5678", "has_update": False,
+             "upstream": "origin/main", "ahead": 0, "behind": 5},
+            {"path": "docs/c", "local": "0000000", "has_update": False,
+             "upstream": None, "ahead": None, "behind": None},
+        ]
+        lines = submodule_sync.format_check_table(submodules, "behind").split("\n")
+        assert "docs/b" in lines[0]
+        assert "docs/a" in lines[1]
+        assert "docs/c" in lines[2]
+        assert "+0 -5" in lines[0]
+        assert "+? -?" in lines[2]
+
+    def test_main_check_json(self, repo_with_clone, capsys):
+        with patch("thera.submodule_sync.get_submodule_status") as mock:
+            mock.return_value = [
+                {"path": "docs/archive", "local": "abc1234", "has_update": False}
+            ]
+            args = argparse.Namespace(
+                check=True, sync=None, sync_all=False, repo=str(repo_with_clone),
+                json=True, sort="path", jobs=2, no_commit_graph=False,
+            )
+            result = submodule_sync.main(args)
+        data = json.loads(capsys.readouterr().out)
+        assert result == 1
+        assert data[0]["behind"] == 2
+        assert data[0]["ahead"] == 1
+
+
+class TestParallelSync:
+    """测试并发同步"""
+
+    def test_sync_captures_output(self, tmp_path):
+        """指定 out 时捕获 git 输出"""
+        buffer = io.StringIO()
+        with patch("thera.submodule_sync.run_git_output") as mock:
+            mock.return_value = (True, "Submodule path 'docs/archive': merged\n")
+            result = submodule_sync.sync_submodule("docs/archive", tmp_path, out=buffer)
+        assert result is True
+        output = buffer.getvalue()
+        assert output.startswith("同步 docs/archive...")
+        assert "merged" in output
+        assert "[OK] docs/archive 同步成功" in output
+
+    def test_updates_serialized(self, tmp_path):
+        """并发同步时 submodule update 串行执行，fetch 仍可并发"""
+        active = {"fetch": 0, "update": 0}
+        peak = {"fetch": 0, "update": 0}
+        lock = threading.Lock()
+
+        def fake_output(args, root):
+            kind = "fetch" if "fetch" in args else "update"
+            with lock:
+                active[kind] += 1
+                peak[kind] = max(peak[kind], active[kind])
+            time.sleep(0.05)
+            with lock:
+                active[kind] -= 1
+            return True, ""
+
+        paths = ["docs/a", "docs/b", "docs/c"]
+        for path in paths:
+            (tmp_path / path / ".git").mkdir(parents=True)
+        with patch("thera.submodule_sync.run_git_output", side_effect=fake_output):
+            results = submodule_sync.sync_submodules_parallel(paths, tmp_path, jobs=3)
+        assert all(r["success"] for r in results)
+        assert peak["update"] == 1
+        assert peak["fetch"] > 1
+
+    def test_results_in_input_order(self, tmp_path):
+        """结果按输入顺序返回，与完成顺序无关"""
+        def slow_first(path, root, out=None):
+            if path == "docs/a":
+                time.sleep(0.05)
+            print(f"synced {path}", file=out)
+            return True
+
+        with patch("thera.submodule_sync.sync_submodule", side_effect=slow_first):
+            results = submodule_sync.sync_submodules_parallel(
+                ["docs/a", "docs/b", "docs/c"], tmp_path, jobs=3
+            )
+        assert [r["path"] for r in results] == ["docs/a", "docs/b", "docs/c"]
+        assert results[0]["output"] == "synced docs/a\n"
+        assert results[0]["duration"] >= 0.05
+
+    def test_runs_concurrently(self, tmp_path):
+        """多个子模块同时同步"""
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait_all(path, root, out=None):
+            barrier.wait()
+            return True
+
+        with patch("thera.submodule_sync.sync_submodule", side_effect=wait_all):
+            results = submodule_sync.sync_submodules_parallel(
+                ["a", "b", "c"], tmp_path, jobs=3
+            )
+        assert all(r["success"] for r in results)
+
+    def test_print_results(self, capsys):
+        results = [
+            {"path": "docs/a", "success": True, "output": "同步 docs/a...\n", "duration": 1.5},
+            {"path": "docs/b", "success": False, "output": "同步 docs/b...\n", "duration": 0.25},
+        ]
+        assert submodule_sync.print_sync_results(results) == 1
+        out = capsys.readouterr().out
+        assert out.index("docs/a") < out.index("docs/b")
+        assert "耗时 1.50s" in out
+        assert "docs/b" in out.splitlines()[-1]
+
+    def test_real_sync_failure(self, git_repo):
+        """非子模块路径同步失败"""
+        results = submodule_sync.sync_submodules_parallel(["docs/none"], git_repo)
+        assert results[0]["success"] is False
+        assert "[FAIL] docs/none 同步失败" in results[0]["output"]
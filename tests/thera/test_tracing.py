@@ -0,0 +1,199 @@
+"""测试 span 追踪"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from thera import tracing
+from thera.fsm import Event, StateMachine
+from thera.git_ops import ConsistencyResult, GitOps, PushResult, SyncResult
+from thera.workflow import WorkflowEngine
+
+
+@pytest.fixture
+def trace_path(tmp_path, monkeypatch):
+    """启用追踪并清空已收集的 span"""
+    path = tmp_path / "trace.json"
+    monkeypatch.setenv(tracing.TRACE_ENV, str(path))
+    monkeypatch.delenv(tracing.TRACE_FORMAT_ENV, raising=False)
+    tracing.TRACER.clear()
+    yield path
+    tracing.TRACER.clear()
+
+
+def _by_name(name):
+    return [s for s in tracing.TRACER.spans if s.name == name]
+
+
+class TestSpan:
+    """span 测试"""
+
+    def test_disabled_is_noop(self, monkeypatch):
+        monkeypatch.delenv(tracing.TRACE_ENV, raising=False)
+        tracing.TRACER.clear()
+        with tracing.span("outer") as span:
+            assert span is None
+        tracing.event("tick")
+        assert tracing.TRACER.spans == []
+        assert tracing.export() is None
+
+    def test_parent_child(self, trace_path):
+        with tracing.span("outer") as outer:
+            with tracing.span("inner", k=1) as inner:
+                assert tracing.current_span() is inner
+            tracing.event("tick")
+        assert tracing.current_span() is None
+
+        assert outer.parent_id is None
+        assert inner.parent_id == outer.span_id
+        assert inner.attrs == {"k": 1}
+        tick = _by_name("tick")[0]
+        assert tick.parent_id == outer.span_id
+        assert tick.duration_ns == 0
+        assert outer.start_ns <= inner.start_ns <= inner.end_ns <= outer.end_ns
+
+    def test_error_recorded(self, trace_path):
+        with pytest.raises(ValueError):
+            with tracing.span("boom"):
+                raise ValueError("bad")
+        assert _by_name("boom")[0].attrs["error"] == "ValueError: bad"
+
+    def test_propagate_to_threads(self, trace_path):
+        def work(i):
+            with tracing.span("work", i=i) as span:
+                return span.thread_id
+
+        with tracing.span("parent") as parent:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                tids = list(pool.map(tracing.propagate(work), range(4)))
+
+        spans = _by_name("work")
+        assert len(spans) == 4
+        assert all(s.parent_id == parent.span_id for s in spans)
+        assert threading.get_ident() not in tids
+
+    def test_max_spans(self, trace_path):
+        tracer = tracing.Tracer(max_spans=2)
+        for _ in range(3):
+            tracer.finish(tracer.start("x", {}))
+        assert len(tracer.spans) == 2
+        assert tracer.dropped == 1
+
+    def test_transition_listener(self, trace_path):
+        machine = StateMachine()
+        machine.add_listener(tracing.observe_transition)
+        machine.transition(Event.DOC_CHECK_OK)
+        event = _by_name("fsm.transition")[0]
+        assert event.attrs == {
+            "from_state": "DIRTY",
+            "event": "DOC_CHECK_OK",
+            "to_state": "CLEAN_AND_CONSISTENT",
+        }
+
+
+class TestExport:
+    """导出格式测试"""
+
+    def test_chrome(self, trace_path):
+        with tracing.span("outer", args=["git", "status"]):
+            tracing.event("tick")
+        path = tracing.export()
+        assert path == trace_path
+
+        data = json.loads(trace_path.read_text())
+        events = {e["name"]: e for e in data["traceEvents"]}
+        assert events["outer"]["ph"] == "X"
+        assert events["outer"]["dur"] >= 0
+        assert events["outer"]["args"]["args"] == "git status"
+        assert events["tick"]["ph"] == "i"
+        assert events["tick"]["args"]["parent_id"] == events["outer"]["args"]["span_id"]
+        assert events["thread_name"]["ph"] == "M"
+
+    def test_otlp(self, trace_path, monkeypatch):
+        monkeypatch.setenv(tracing.TRACE_FORMAT_ENV, "otlp")
+        with pytest.raises(RuntimeError):
+            with tracing.span("outer", n=2):
+                with tracing.span("inner"):
+                    raise RuntimeError("x")
+        tracing.export()
+
+        data = json.loads(trace_path.read_text())
+        spans = data["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        outer, inner = spans
+        assert inner["parentSpanId"] == outer["spanId"]
+        assert len(outer["traceId"]) == 32 and outer["traceId"] == inner["traceId"]
+        assert {"key": "n", "value": {"intValue": "2"}} in outer["attributes"]
+        assert inner["status"]["code"] == 2
+        assert int(outer["endTimeUnixNano"]) >= int(outer["startTimeUnixNano"])
+
+    def test_clears_exported(self, trace_path):
+        with tracing.span("first"):
+            pass
+        tracing.export()
+        assert tracing.TRACER.spans == []
+
+        with tracing.span("second"):
+            pass
+        tracing.export()
+        names = {e["name"] for e in json.loads(trace_path.read_text())["traceEvents"]}
+        assert "second" in names
+        assert "first" not in names
+
+    def test_nested_export_deferred(self, trace_path):
+        """span 内的导出由最外层统一写出"""
+        with tracing.span("outer"):
+            with tracing.span("inner"):
+                pass
+            assert tracing.export() is None
+        assert not trace_path.exists()
+        tracing.export()
+        names = {e["name"] for e in json.loads(trace_path.read_text())["traceEvents"]}
+        assert {"outer", "inner"} <= names
+
+    def test_pipeline_refresh(self, trace_path, git_repo):
+        """流水线中 refresh 的 span 和 git 调用都保留在最终的追踪文件中"""
+        from thera.pipeline import RepoSession, RunOptions, run_pipeline
+
+        run_pipeline(RepoSession(git_repo), ["refresh"], RunOptions(dry_run=True))
+        events = [e for e in json.loads(trace_path.read_text())["traceEvents"] if e["ph"] != "M"]
+        names = {e["name"] for e in events}
+        assert {"pipeline", "stage.refresh"} <= names
+        assert any(name.startswith("refresh.") for name in names)
+        assert any(name.startswith("git ") for name in names)
+
+    def test_unknown_format(self, trace_path):
+        with pytest.raises(ValueError):
+            tracing.export(fmt="zipkin")
+
+
+def test_run_git_span(trace_path, git_repo):
+    GitOps(git_repo).run_git(["status", "--porcelain"])
+    span = _by_name("git status")[0]
+    assert span.attrs["args"][-2:] == ["status", "--porcelain"]
+
+
+def test_dag_workflow_trace(trace_path, tmp_path):
+    engine = WorkflowEngine(tmp_path)
+    engine.git_ops = MagicMock()
+    engine.git_ops.check_consistency.return_value = ConsistencyResult(
+        success=True, is_consistent=True, message="一致"
+    )
+    engine.git_ops.fetch_submodules.return_value = SyncResult(True, "拉取完成")
+    engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+    engine.git_ops.commit_and_push.return_value = PushResult(True, "推送完成")
+
+    assert engine.run_dag_workflow(Path("submodules.yaml")).success
+
+    # 运行结束时已导出并清空缓冲区，从导出文件检查
+    assert tracing.TRACER.spans == []
+    events = [e for e in json.loads(trace_path.read_text())["traceEvents"] if e["ph"] != "M"]
+    root = next(e for e in events if e["name"] == "workflow.dag")
+    steps = {e["name"]: e for e in events if e["name"].startswith("step.")}
+    assert set(steps) == {"step.doc_check", "step.fetch", "step.snapshot", "step.sync", "step.push"}
+    assert all(e["args"]["parent_id"] == root["args"]["span_id"] for e in steps.values())
+    assert steps["step.fetch"]["args"]["speculative"] is True
+    assert len([e for e in events if e["name"] == "fsm.transition"]) == 4
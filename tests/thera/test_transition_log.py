@@ -0,0 +1,238 @@
+"""测试持久化转移日志"""
+
+import subprocess
+import sys
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from thera.fsm import ErrorState, Event, RepoState, StateMachine
+from thera.transition_log import TransitionLog, TransitionLogError
+from thera.workflow import WorkflowEngine
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return tmp_path / "transitions.log"
+
+
+def _fill(log, n, start=1000.0):
+    """写入 n 条时间戳间隔 1 秒的记录"""
+    for i in range(n):
+        log.append(RepoState.DIRTY, Event.DOC_CHECK_OK, RepoState.CLEAN_AND_CONSISTENT, start + i)
+
+
+class TestTransitionLog:
+    """TransitionLog 测试"""
+
+    def test_append_and_tail(self, log_path):
+        with TransitionLog(log_path) as log:
+            log.append(RepoState.COMMITTED, Event.PUSH_FAIL, ErrorState.NETWORK_ERROR, 5.0)
+            records = list(log.tail(1))
+        assert len(records) == 1
+        assert records[0].from_state == RepoState.COMMITTED
+        assert records[0].event == Event.PUSH_FAIL
+        assert records[0].new_state == ErrorState.NETWORK_ERROR
+        assert records[0].timestamp == 5.0
+
+    def test_reopen_keeps_records(self, log_path):
+        with TransitionLog(log_path) as log:
+            _fill(log, 10)
+        with TransitionLog(log_path) as log:
+            assert len(log) == 10
+            assert [r.index for r in log.tail(2)] == [8, 9]
+
+    def test_query_range(self, log_path):
+        with TransitionLog(log_path, index_interval=8) as log:
+            _fill(log, 100)
+            records = list(log.query(1020.0, 1029.0))
+        assert [r.index for r in records] == list(range(20, 30))
+
+    def test_query_open_ended(self, log_path):
+        with TransitionLog(log_path, index_interval=8) as log:
+            _fill(log, 20)
+            assert len(list(log.query(since=1015.0))) == 5
+            assert len(list(log.query(until=1004.0))) == 5
+            assert len(list(log.query())) == 20
+
+    def test_query_reads_from_sparse_index(self, log_path):
+        """查询从索引定位起点，不从头扫描"""
+        with TransitionLog(log_path, index_interval=16) as log:
+            _fill(log, 200)
+            with patch.object(log, "_iter_from", wraps=log._iter_from) as mock_iter:
+                list(log.query(1150.0, 1151.0))
+        start = mock_iter.call_args[0][0]
+        assert 134 <= start <= 150
+
+    def test_query_equal_timestamps(self, log_path):
+        """大量同一时间戳的记录跨越多个索引项时全部返回"""
+        with TransitionLog(log_path, index_interval=4) as log:
+            _fill(log, 3)
+            for _ in range(10):
+                log.append(RepoState.DIRTY, Event.EDIT, RepoState.DIRTY, 2000.0)
+            _fill(log, 3, start=3000.0)
+            assert [r.index for r in log.query(2000.0, 2000.0)] == list(range(3, 13))
+            assert len(list(log.query(since=2000.0))) == 13
+
+    def test_timestamps_monotonic(self, log_path):
+        with TransitionLog(log_path) as log:
+            log.append(RepoState.DIRTY, Event.EDIT, RepoState.DIRTY, 10.0)
+            log.append(RepoState.DIRTY, Event.EDIT, RepoState.DIRTY, 5.0)
+            assert [r.timestamp for r in log.query()] == [10.0, 10.0]
+
+    def test_batched_fsync(self, log_path):
+        log = TransitionLog(log_path, fsync_batch=10, fsync_interval=3600)
+        with patch("thera.transition_log.os.fsync") as mock_fsync:
+            _fill(log, 25)
+            # 25 条记录只触发 2 次批量刷盘（数据 + 索引各一次）
+            assert mock_fsync.call_count == 4
+        log.close()
+
+    def test_truncates_torn_record(self, log_path):
+        with TransitionLog(log_path) as log:
+            _fill(log, 3)
+        with open(log_path, "ab") as f:
+            f.write(b"\x00\x01\x02")
+        with TransitionLog(log_path) as log:
+            assert len(log) == 3
+            log.append(RepoState.DIRTY, Event.EDIT, RepoState.DIRTY, 2000.0)
+            assert list(log.tail(1))[0].timestamp == 2000.0
+
+    def test_truncates_index_past_data(self, log_path):
+        """索引项指向数据文件末尾之后时截掉，后续索引项接在有效项后面"""
+        index_path = log_path.with_name(log_path.name + ".idx")
+        with TransitionLog(log_path, index_interval=4) as log:
+            _fill(log, 8)
+        with open(log_path, "r+b") as f:
+            f.truncate(log_path.stat().st_size - 4 * 12)  # 丢掉后 4 条记录
+        with TransitionLog(log_path, index_interval=4) as log:
+            assert len(log) == 4
+            assert index_path.stat().st_size == 16
+            _fill(log, 4, start=2000.0)
+        with TransitionLog(log_path, index_interval=4) as log:
+            assert log._index_times == [1000.0, 2000.0]
+            assert [r.index for r in log.query(since=2000.0)] == [4, 5, 6, 7]
+
+    def test_rebuilds_missing_index(self, log_path):
+        with TransitionLog(log_path, index_interval=4) as log:
+            _fill(log, 10)
+        log_path.with_name(log_path.name + ".idx").unlink()
+        with TransitionLog(log_path, index_interval=4) as log:
+            assert [r.index for r in log.query(1005.0, 1006.0)] == [5, 6]
+
+    def test_rejects_foreign_file(self, log_path):
+        log_path.write_bytes(b"not a transition log")
+        with pytest.raises(TransitionLogError):
+            TransitionLog(log_path)
+
+    def test_replay(self, log_path):
+        machine = StateMachine()
+        with TransitionLog(log_path) as log:
+            machine.add_listener(log.on_transition)
+            machine.transition(Event.DOC_CHECK_OK)
+            machine.transition(Event.SUBMODULE_SYNC)
+            machine.transition(Event.AUTO_COMMIT)
+            machine.transition(Event.PUSH_FAIL)
+
+        restored = StateMachine(history_capacity=2)
+        with TransitionLog(log_path) as log:
+            log.replay(restored)
+        assert restored.state == RepoState.DIRTY  # 新的运行从初始状态开始
+        assert restored.error is None
+        assert len(restored.history) == 2
+        assert restored.history.total == 4
+        assert restored.history[-1] == (RepoState.COMMITTED, Event.PUSH_FAIL)
+
+    def test_concurrent_processes(self, log_path):
+        """多个进程同时追加同一日志：记录不交错，索引与数据一致"""
+        script = (
+            "import sys\n"
+            "from thera.fsm import Event, RepoState\n"
+            "from thera.transition_log import TransitionLog\n"
+            "with TransitionLog(sys.argv[1], index_interval=16, fsync_batch=1000) as log:\n"
+            "    for _ in range(500):\n"
+            "        log.append(RepoState.DIRTY, Event.DOC_CHECK_OK, RepoState.CLEAN_AND_CONSISTENT)\n"
+        )
+        TransitionLog(log_path, index_interval=16).close()
+        procs = [
+            subprocess.Popen([sys.executable, "-c", script, str(log_path)]) for _ in range(4)
+        ]
+        assert all(p.wait(timeout=60) == 0 for p in procs)
+
+        with TransitionLog(log_path, index_interval=16) as log:
+            assert len(log) == 2000
+            records = list(log.tail(2000))
+            assert all(r.event == Event.DOC_CHECK_OK for r in records)
+            timestamps = [r.timestamp for r in records]
+            assert timestamps == sorted(timestamps)
+            assert log._index_records == list(range(0, 2000, 16))
+
+    def test_replayed_stats_equal_live(self, log_path):
+        """历史容量小于日志长度时，回放的聚合计数仍与实时计数一致"""
+        live = StateMachine(history_capacity=3)
+        with TransitionLog(log_path) as log:
+            live.add_listener(log.on_transition)
+            for _ in range(3):
+                for event in (Event.DOC_CHECK_OK, Event.SUBMODULE_SYNC, Event.AUTO_COMMIT,
+                              Event.PUSH_FAIL, Event.RETRY, Event.PUSH_OK, Event.EDIT):
+                    live.transition(event)
+
+        restored = StateMachine(history_capacity=3)
+        with TransitionLog(log_path) as log:
+            log.replay(restored)
+        assert restored.stats.total == live.stats.total == 21
+        assert restored.stats.state_counts == live.stats.state_counts
+        assert sum(restored.stats.state_counts) == restored.stats.total
+        assert list(restored.stats.iter_errors()) == list(live.stats.iter_errors())
+
+
+class TestWorkflowEngineTransitionLog:
+    """WorkflowEngine 与转移日志集成测试"""
+
+    def test_engine_restores_history(self, tmp_path):
+        """上次运行成功结束后，新进程恢复历史并能开始新一轮运行"""
+        log = TransitionLog.for_repo(tmp_path)
+        engine = WorkflowEngine(tmp_path, transition_log=log)
+        for event in (Event.DOC_CHECK_OK, Event.SUBMODULE_SYNC, Event.AUTO_COMMIT, Event.PUSH_OK):
+            engine.machine.transition(event)
+        log.close()
+
+        log = TransitionLog.for_repo(tmp_path)
+        engine = WorkflowEngine(tmp_path, transition_log=log)
+        assert engine.get_state() == RepoState.DIRTY
+        assert engine.get_status()["history_count"] == 4
+        assert engine.machine.can_transition(Event.DOC_CHECK_OK)
+        engine.machine.transition(Event.DOC_CHECK_OK)
+        log.close()
+        assert len(TransitionLog.for_repo(tmp_path)) == 5
+
+    def test_audit_time_range_from_log(self, tmp_path):
+        log = TransitionLog.for_repo(tmp_path)
+        log.append(RepoState.DIRTY, Event.DOC_CHECK_OK, RepoState.CLEAN_AND_CONSISTENT, 100.0)
+        log.append(RepoState.COMMITTED, Event.PUSH_FAIL, ErrorState.NETWORK_ERROR, 200.0)
+        log.append(ErrorState.NETWORK_ERROR, Event.PUSH_OK, RepoState.CLEAN_AND_CONSISTENT, 300.0)
+        engine = WorkflowEngine(tmp_path, transition_log=log)
+
+        report = engine.audit(
+            since=datetime.fromtimestamp(150.0), until=datetime.fromtimestamp(350.0)
+        )
+        assert report["total_transitions"] == 2
+        assert report["state_distribution"] == {"COMMITTED": 1, "NETWORK_ERROR": 1}
+        assert report["error_count"] == 1
+        assert report["errors"][0]["index"] == 2
+        log.close()
+
+    def test_audit_time_range_in_memory(self, tmp_path):
+        engine = WorkflowEngine(tmp_path)
+        history = engine.machine.history
+        history.record(RepoState.DIRTY, Event.DOC_CHECK_OK, 100.0)
+        history.record(RepoState.CLEAN_AND_CONSISTENT, Event.SUBMODULE_SYNC, 200.0)
+        history.record(RepoState.SYNCED, Event.AUTO_COMMIT, 300.0)
+
+        report = engine.audit(since=datetime.fromtimestamp(200.0))
+        assert report["total_transitions"] == 2
+        assert "DIRTY" not in report["state_distribution"]
+
+        report = engine.audit(until=datetime.fromtimestamp(100.0))
+        assert report["state_distribution"] == {"DIRTY": 1}
@@ -5,11 +5,11 @@
 """
 
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from thera.fsm import ErrorState, Event, RepoState
+from thera.fsm import ErrorState, Event, RepoState, StateMachine
 from thera.workflow import (
     AutoStrategy,
     HybridStrategy,
@@ -81,17 +81,29 @@ class TestWorkflowHistory:
 
     def test_get_history_limit(self, engine):
         """测试历史条数限制"""
-        engine.machine.history = [
+        engine.machine.load_history([
             (RepoState.DIRTY, Event.DOC_CHECK_OK),
             (RepoState.CLEAN_AND_CONSISTENT, Event.SUBMODULE_SYNC),
             (RepoState.SYNCED, Event.AUTO_COMMIT),
-        ]
+        ])
         
         history = engine.get_history(limit=2)
         assert len(history) == 2
         assert history[0]["from_state"] == RepoState.CLEAN_AND_CONSISTENT
         assert history[1]["from_state"] == RepoState.SYNCED
 
+    def test_get_history_bounded(self, tmp_path):
+        """测试历史超出容量后的序号"""
+        engine = WorkflowEngine(tmp_path)
+        engine.machine = StateMachine(history_capacity=2)
+        engine.machine.transition(Event.DOC_CHECK_OK)
+        engine.machine.transition(Event.EDIT)
+        engine.machine.transition(Event.DOC_CHECK_OK)
+
+        history = engine.get_history()
+        assert [h["index"] for h in history] == [2, 3]
+        assert history[0]["event"] == Event.EDIT
+
 
 class TestWorkflowAudit:
     """workflow audit 测试"""
@@ -115,6 +127,35 @@ class TestWorkflowAudit:
         assert "DIRTY" in report["state_distribution"]
         assert "CLEAN_AND_CONSISTENT" in report["state_distribution"]
 
+    def test_audit_errors(self, engine):
+        """测试错误记录"""
+        engine.machine.load_history([
+            (RepoState.COMMITTED, Event.PUSH_FAIL),
+            (ErrorState.NETWORK_ERROR, Event.PUSH_OK),
+        ])
+
+        report = engine.audit()
+
+        assert report["error_count"] == 1
+        assert report["errors"][0]["index"] == 1
+        assert report["errors"][0]["error"] == ErrorState.NETWORK_ERROR
+
+    def test_audit_does_not_scan_history(self, engine):
+        """审计直接读取增量计数，不遍历历史"""
+        for _ in range(100):
+            engine.machine.transition(Event.DOC_CHECK_OK)
+            engine.machine.transition(Event.EDIT)
+
+        history = engine.machine.history
+        with patch.object(type(history), "state_at", side_effect=AssertionError), \
+                patch.object(type(history), "state_counts", side_effect=AssertionError):
+            report = engine.audit()
+            status = engine.get_status()
+
+        assert report["total_transitions"] == 200
+        assert report["state_distribution"] == {"DIRTY": 100, "CLEAN_AND_CONSISTENT": 100}
+        assert status["error_count"] == 0
+
 
 class TestConvergenceStrategy:
     """收敛策略测试"""
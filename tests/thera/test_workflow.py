@@ -4,20 +4,34 @@ Workflow 层测试
 测试 workflow.py 中定义的工作流引擎。
 """
 
+import subprocess
+import threading
+import time
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from thera.fsm import ErrorState, Event, RepoState
-from thera.git_ops import ConsistencyResult, PushResult, SyncResult
+from thera.fsm import ErrorState, Event, RepoState, SubmoduleState
+from thera.git_ops import (
+    ConsistencyResult,
+    PushResult,
+    RollbackResult,
+    SubmoduleInfo,
+    SyncResult,
+)
+from thera.memo import StepCache
 from thera.workflow import (
     AutoStrategy,
+    BudgetedStrategy,
     ConvergenceStrategy,
     HybridStrategy,
     ManualStrategy,
+    SubmoduleCost,
+    SubmoduleScheduler,
     WorkflowEngine,
     WorkflowResult,
+    probe_submodule_cost,
 )
 
 
@@ -32,6 +46,7 @@ def workflow_engine_with_mock(tmp_path):
     """创建带有 mock GitOps 的 WorkflowEngine"""
     engine = WorkflowEngine(tmp_path)
     engine.git_ops = MagicMock()
+    engine.git_ops.get_submodule_status.return_value = _submodules("vendor/lib1")
     return engine
 
 
@@ -54,6 +69,101 @@ class TestConvergenceStrategy:
         assert strategy.should_reconcile("lib1", False) is True
 
 
+class TestBudgetedStrategy:
+    """BudgetedStrategy 测试"""
+
+    def test_estimate_uses_cost_model(self):
+        strategy = BudgetedStrategy(seconds_per_commit=0.5, bytes_per_second=1000)
+        strategy.history["a"] = {"duration": 2.0}
+        assert strategy.estimate(SubmoduleCost("a", behind=4, fetch_bytes=3000)) == 7.0
+        assert strategy.estimate(SubmoduleCost("new")) == 5.0
+
+    def test_plan_within_budget(self):
+        strategy = BudgetedStrategy(budget=10.0, seconds_per_commit=1.0)
+        for path in ("a", "b", "c"):
+            strategy.history[path] = {"duration": 1.0}
+        costs = [
+            SubmoduleCost("a", behind=1),  # 2 秒
+            SubmoduleCost("b", behind=7),  # 8 秒
+            SubmoduleCost("c", behind=3),  # 4 秒
+        ]
+        plan = strategy.plan(costs)
+        assert plan.estimated <= 10.0
+        assert sorted(plan.selected + plan.deferred) == ["a", "b", "c"]
+        assert plan.deferred
+
+    def test_highest_priority_first(self):
+        strategy = BudgetedStrategy(budget=6.0)
+        plan = strategy.plan([SubmoduleCost("quiet"), SubmoduleCost("stale", behind=10)])
+        assert plan.selected == ["stale"]
+        assert plan.deferred == ["quiet"]
+        assert strategy.history["quiet"]["deferred"] == 1
+
+    def test_deferral_raises_priority(self):
+        strategy = BudgetedStrategy(budget=6.0)
+        costs = [SubmoduleCost("a", behind=1), SubmoduleCost("b")]
+        assert strategy.plan(costs).selected == ["a"]
+        assert strategy.plan(costs).selected == ["b"]
+        assert strategy.history["a"]["deferred"] == 1
+
+    def test_oversized_still_progresses(self):
+        strategy = BudgetedStrategy(budget=1.0)
+        plan = strategy.plan([SubmoduleCost("huge", behind=1000)])
+        assert plan.selected == ["huge"]
+
+    def test_record_updates_ewma(self):
+        strategy = BudgetedStrategy(alpha=0.5)
+        strategy.record("a", True, 4.0)
+        strategy.record("a", True, 2.0)
+        strategy.record("a", False, 100.0)
+        assert strategy.history["a"]["duration"] == 3.0
+
+    def test_persists_history(self, tmp_path):
+        path = tmp_path / "costs.json"
+        strategy = BudgetedStrategy(state_path=path)
+        strategy.record("a", True, 1.5)
+        assert BudgetedStrategy(state_path=path).history["a"]["duration"] == 1.5
+
+    def test_plan_saves_only_on_change(self, tmp_path):
+        strategy = BudgetedStrategy(state_path=tmp_path / "costs.json")
+        with patch.object(strategy, "_save", wraps=strategy._save) as save:
+            strategy.plan([SubmoduleCost("a")])
+            strategy.plan([SubmoduleCost("a")])
+            assert save.call_count == 1
+            strategy.plan([SubmoduleCost("a"), SubmoduleCost("b", behind=1000)])
+            assert save.call_count == 2
+
+    def test_select_uses_probe(self):
+        strategy = BudgetedStrategy(
+            budget=6.0, probe=lambda path: SubmoduleCost(path, behind=10 if path == "b" else 0)
+        )
+        infos = [SubmoduleInfo(p, "abc", False, False) for p in ("a", "b")]
+        assert strategy.select(infos) == (["b"], ["a"])
+        assert strategy.should_reconcile("b", False) is True
+        assert strategy.should_reconcile("a", False) is False
+
+
+def test_probe_submodule_cost(git_repo):
+    import subprocess
+
+    sub = git_repo / "vendor" / "a"
+    subprocess.run(["git", "clone", "-q", str(git_repo), str(sub)], check=True)
+    (git_repo / "README.md").write_text("# Changed\n")
+    subprocess.run(
+        ["git", "-c", "user.name=T", "-c", "user.email=t@e", "commit", "-qam", "change"],
+        cwd=git_repo, check=True,
+    )
+    subprocess.run(["git", "fetch", "-q"], cwd=sub, check=True)
+
+    cost = probe_submodule_cost(git_repo, "vendor/a")
+
+    assert cost.behind == 1
+    assert cost.fetch_bytes > 0
+    info_dir = sub / ".git" / "objects" / "info"
+    assert not (info_dir / "commit-graphs").exists()  # 探测不写入
+    assert not (info_dir / "commit-graph").exists()
+
+
 class TestWorkflowResult:
     """WorkflowResult 测试"""
 
@@ -161,6 +271,209 @@ class TestWorkflowEngineSyncSubmodules:
         assert result.success is False
 
 
+def _submodules(*paths, detached=()):
+    return [SubmoduleInfo(p, "abc123", False, p in detached) for p in paths]
+
+
+class TestSubmoduleScheduler:
+    """SubmoduleScheduler 测试"""
+
+    def test_counts_follow_transitions(self):
+        scheduler = SubmoduleScheduler(lambda path, timeout: SyncResult(True, "ok"))
+        scheduler.refresh(_submodules("a", "b", detached=("b",)))
+        assert scheduler.counts[SubmoduleState.BEHIND] == 1
+        assert scheduler.counts[SubmoduleState.DETACHED] == 1
+
+        result = scheduler.run(["a", "b"])
+        assert result.synced == ["a"]
+        assert "b" in result.failed
+        assert scheduler.converged() is False
+
+        assert scheduler.converged(["a"]) is True
+        scheduler.refresh(_submodules("a"))
+        assert scheduler.converged() is True
+        assert scheduler.summary() == {"BEHIND": 0, "UP_TO_DATE": 1, "DETACHED": 0}
+
+    def test_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def sync_one(path, timeout):
+            barrier.wait()
+            return SyncResult(True, "ok")
+
+        scheduler = SubmoduleScheduler(sync_one)
+        result = scheduler.run(["a", "b", "c"], jobs=3)
+        assert sorted(result.synced) == ["a", "b", "c"]
+
+    def test_stuck_submodule_does_not_block_others(self):
+        finished = []
+
+        def sync_one(path, timeout):
+            if path == "slow":
+                time.sleep(timeout)  # 模拟 git 在剩余时间耗尽时被终止
+                finished.append(path)
+                return SyncResult(False, "同步失败", error="超时")
+            return SyncResult(True, "ok")
+
+        scheduler = SubmoduleScheduler(sync_one)
+        start = time.perf_counter()
+        result = scheduler.run(["fast1", "slow", "fast2"], jobs=3, timeout=0.2)
+        assert time.perf_counter() - start < 2
+        assert finished == ["slow"]  # 返回前超时的同步已结束
+        assert sorted(result.synced) == ["fast1", "fast2"]
+        assert result.pending == ["slow"]
+        assert result.success is False
+        assert scheduler.machines["slow"].state == SubmoduleState.BEHIND
+
+    def test_queued_not_started_after_timeout(self):
+        started = []
+
+        def sync_one(path, timeout):
+            started.append(path)
+            time.sleep(timeout)
+            return SyncResult(False, "同步失败")
+
+        scheduler = SubmoduleScheduler(sync_one)
+        result = scheduler.run(["a", "b"], jobs=1, timeout=0.1)
+        assert started == ["a"]
+        assert result.pending == ["a", "b"]
+
+    def test_exception_marks_failed(self):
+        def sync_one(path, timeout):
+            raise OSError("network down")
+
+        scheduler = SubmoduleScheduler(sync_one)
+        result = scheduler.run(["a"])
+        assert result.failed == {"a": "network down"}
+        assert scheduler.machines["a"].state == SubmoduleState.DETACHED
+
+
+class TestWorkflowEngineReconcileSubmodules:
+    """WorkflowEngine.reconcile_submodules() 测试"""
+
+    def test_requires_consistent_state(self, workflow_engine):
+        result = workflow_engine.reconcile_submodules()
+        assert result.success is False
+        assert "不允许同步" in result.message
+
+    def test_all_synced(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a", "b")
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+
+        result = engine.reconcile_submodules()
+
+        assert result.success is True
+        assert sorted(result.synced_paths) == ["a", "b"]
+        assert engine.get_state() == RepoState.SYNCED
+        synced = sorted(c.args[0] for c in engine.git_ops.sync_submodules.call_args_list)
+        assert synced == [["a"], ["b"]]
+        assert engine.get_status()["submodules"]["UP_TO_DATE"] == 2
+
+    def test_partial_failure_keeps_state(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a", "b")
+        engine.git_ops.sync_submodules.side_effect = lambda paths, **kwargs: SyncResult(
+            paths == ["a"], "同步完成" if paths == ["a"] else "同步失败", error="conflict"
+        )
+
+        result = engine.reconcile_submodules()
+
+        assert result.success is False
+        assert result.synced_paths == ["a"]
+        assert "b: conflict" in result.error
+        assert engine.get_state() == RepoState.CLEAN_AND_CONSISTENT
+        assert engine.submodules.machines["a"].state == SubmoduleState.UP_TO_DATE
+
+    def test_retry_after_failure(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a")
+        engine.git_ops.sync_submodules.return_value = SyncResult(False, "同步失败")
+        assert engine.reconcile_submodules().success is False
+
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+        assert engine.reconcile_submodules().success is True
+        assert engine.get_state() == RepoState.SYNCED
+
+    def test_budget_defers_without_blocking(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.strategy = BudgetedStrategy(
+            budget=6.0, probe=lambda path: SubmoduleCost(path, behind=5 if path == "a" else 0)
+        )
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a", "b")
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+
+        result = engine.reconcile_submodules()
+
+        assert result.success is True
+        assert result.synced_paths == ["a"]
+        assert "推迟 1 个" in result.message
+        assert result.skipped_paths == ["b"]
+        assert engine.get_state() == RepoState.SYNCED
+        assert "duration" in engine.strategy.history["a"]
+
+    def test_fetch_then_serialized_update(self, workflow_engine_with_mock):
+        """先在子模块内 fetch，再以 no_fetch 交给 GitOps 串行合并"""
+        engine = workflow_engine_with_mock
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a")
+        engine.git_ops.fetch_submodule.return_value = SyncResult(True, "拉取完成")
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+
+        assert engine.reconcile_submodules().success is True
+        engine.git_ops.fetch_submodule.assert_called_once_with("a", timeout=None)
+        engine.git_ops.sync_submodules.assert_called_once_with(["a"], no_fetch=True, timeout=None)
+
+    def test_fetch_failure_skips_update(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a")
+        engine.git_ops.fetch_submodule.return_value = SyncResult(False, "拉取失败", error="offline")
+
+        result = engine.reconcile_submodules()
+
+        assert result.success is False
+        assert "a: offline" in result.error
+        engine.git_ops.sync_submodules.assert_not_called()
+
+    def test_manual_strategy_skips(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.set_strategy("manual")
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = _submodules("a")
+
+        result = engine.reconcile_submodules()
+
+        engine.git_ops.sync_submodules.assert_not_called()
+        assert result.success is True
+        assert "未同步任何子模块" in result.message
+        assert "策略跳过 1 个" in result.message
+        assert result.skipped_paths == ["a"]
+        assert engine.get_state() == RepoState.SYNCED
+
+    def test_hybrid_counts_selected_only(self, workflow_engine_with_mock):
+        """混合策略不同步落后的子模块，它们不影响本次收敛结果"""
+        engine = workflow_engine_with_mock
+        engine.set_strategy("hybrid")
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.get_submodule_status.return_value = [
+            SubmoduleInfo("a", "abc123", False, False),
+            SubmoduleInfo("b", "abc123", True, False),
+        ]
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+
+        result = engine.reconcile_submodules()
+
+        assert result.success is True
+        assert result.synced_paths == ["a"]
+        assert engine.submodules.machines["b"].state == SubmoduleState.BEHIND
+        assert engine.get_state() == RepoState.SYNCED
+
+
 class TestWorkflowEngineCommitAndPush:
     """WorkflowEngine.commit_and_push() 测试"""
 
@@ -252,6 +565,421 @@ class TestWorkflowEngineStandardWorkflow:
         assert result.success is False
         assert "提交推送失败" in result.message
 
+    def test_standard_workflow_reconciles_per_submodule(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=True, is_consistent=True, message="一致"
+        )
+        engine.git_ops.get_submodule_status.return_value = _submodules("a", "b")
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+        engine.git_ops.commit_and_push.return_value = PushResult(True, "推送完成")
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"))
+
+        assert result.success is True
+        synced = sorted(c.args[0] for c in engine.git_ops.sync_submodules.call_args_list)
+        assert synced == [["a"], ["b"]]
+        assert engine.submodules.summary()["UP_TO_DATE"] == 2
+
+
+class TestWorkflowEngineRollback:
+    """同步失败回滚测试"""
+
+    def test_sync_failure_restores_snapshot(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=True, is_consistent=True, message="一致"
+        )
+        engine.git_ops.snapshot_submodules.return_value = ["a", "b"]
+        engine.git_ops.sync_submodules.return_value = SyncResult(False, "同步失败", error="conflict")
+        engine.git_ops.restore_submodules.return_value = RollbackResult(
+            True, "已回滚 1 个子模块", restored_paths=["a"]
+        )
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"))
+
+        assert result.success is False
+        engine.git_ops.restore_submodules.assert_called_once_with(["a", "b"])
+        assert engine.last_rollback.restored_paths == ["a"]
+
+    def test_no_rollback_before_snapshot(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=False, is_consistent=False, message="不一致"
+        )
+
+        engine.run_standard_workflow(Path("submodules.yaml"))
+
+        engine.git_ops.snapshot_submodules.assert_not_called()
+        engine.git_ops.restore_submodules.assert_not_called()
+
+    def test_no_rollback_after_commit(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        assert engine._emergency_rollback(["doc_check", "snapshot", "sync", "commit"]) is None
+        engine.git_ops.restore_submodules.assert_not_called()
+
+    def test_dag_sync_failure_restores_snapshot(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=True, is_consistent=True, message="一致"
+        )
+        engine.git_ops.fetch_submodules.return_value = SyncResult(True, "拉取完成")
+        engine.git_ops.snapshot_submodules.return_value = ["a"]
+        engine.git_ops.sync_submodules.return_value = SyncResult(False, "同步失败")
+
+        result = engine.run_dag_workflow(Path("submodules.yaml"))
+
+        assert "子模块同步失败" in result.message
+        engine.git_ops.restore_submodules.assert_called_once_with(["a"])
+
+
+class TestWorkflowEngineDagWorkflow:
+    """WorkflowEngine.run_dag_workflow() 测试"""
+
+    def _consistent(self, engine):
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=True, is_consistent=True, message="一致"
+        )
+        engine.git_ops.fetch_submodules.return_value = SyncResult(True, "拉取完成")
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+
+    def test_success(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._consistent(engine)
+        engine.git_ops.commit_and_push.return_value = PushResult(True, "推送完成")
+
+        result = engine.run_dag_workflow(Path("submodules.yaml"))
+
+        assert result.success is True
+        assert result.new_state == RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.fetch_submodules.assert_called_once()
+        engine.git_ops.sync_submodules.assert_called_once_with(
+            ["vendor/lib1"], no_fetch=True, timeout=None
+        )
+
+    def test_consistency_fail_discards_fetch(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=False, is_consistent=False, message="不一致"
+        )
+
+        result = engine.run_dag_workflow(Path("submodules.yaml"))
+
+        assert result.success is False
+        assert result.message == "一致性检查失败: 不一致"
+        assert result.new_state == RepoState.INCONSISTENT
+        engine.git_ops.sync_submodules.assert_not_called()
+
+    def test_fetch_fail(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._consistent(engine)
+        engine.git_ops.fetch_submodules.return_value = SyncResult(False, "拉取失败")
+
+        result = engine.run_dag_workflow(Path("submodules.yaml"))
+
+        assert result.success is False
+        assert "子模块拉取失败" in result.message
+        assert result.new_state == RepoState.CLEAN_AND_CONSISTENT
+
+    def test_commit_fail(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._consistent(engine)
+        engine.git_ops.commit_and_push.return_value = PushResult(
+            success=False, message="推送失败", error="network"
+        )
+
+        result = engine.run_dag_workflow(Path("submodules.yaml"))
+
+        assert result.success is False
+        assert "提交推送失败" in result.message
+        assert result.error == ErrorState.NETWORK_ERROR
+
+
+class TestWorkflowEngineResume:
+    """工作流检查点与推送重试测试"""
+
+    def _ready(self, engine):
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=True, is_consistent=True, message="一致"
+        )
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+        engine.git_ops.commit_and_push.return_value = PushResult(
+            success=False, message="git push 失败", error="network", commit_sha="abc1234"
+        )
+        engine.git_ops.push.return_value = PushResult(
+            success=False, message="git push 失败", error="network", commit_sha="abc1234"
+        )
+
+    @patch("thera.workflow.time.sleep")
+    def test_push_retried_with_backoff(self, mock_sleep, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._ready(engine)
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"), max_retries=3, backoff=0.5)
+
+        assert result.success is False
+        assert result.error == ErrorState.NETWORK_ERROR
+        assert engine.git_ops.push.call_count == 3
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1.0, 2.0]
+        checkpoint = engine.load_checkpoint()
+        assert checkpoint.checkpoints == ["doc_check", "snapshot", "sync", "commit"]
+        assert checkpoint.state == "NETWORK_ERROR"
+        assert checkpoint.commit_sha == "abc1234"
+
+    @patch("thera.workflow.time.sleep")
+    def test_retry_recovers(self, mock_sleep, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._ready(engine)
+        engine.git_ops.push.side_effect = [
+            PushResult(False, "git push 失败", commit_sha="abc1234"),
+            PushResult(True, "推送成功", commit_sha="abc1234"),
+        ]
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"), backoff=0.5)
+
+        assert result.success is True
+        assert engine.get_state() == RepoState.CLEAN_AND_CONSISTENT
+        assert engine.machine.error is None
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1.0]
+        assert engine.load_checkpoint() is None
+
+    @patch("thera.workflow.time.sleep")
+    def test_rerun_resumes_at_push(self, mock_sleep, tmp_path):
+        engine = WorkflowEngine(tmp_path)
+        engine.git_ops = MagicMock()
+        self._ready(engine)
+        engine.run_standard_workflow(Path("submodules.yaml"), max_retries=1)
+
+        # 新进程：只需要一次推送
+        engine = WorkflowEngine(tmp_path)
+        engine.git_ops = MagicMock()
+        engine.git_ops.run_git.return_value = ("abc1234def\n", "", 0)
+        engine.git_ops.push.return_value = PushResult(True, "推送成功", commit_sha="abc1234")
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"))
+
+        assert result.success is True
+        assert "abc1234" in result.message
+        engine.git_ops.check_consistency.assert_not_called()
+        engine.git_ops.sync_submodules.assert_not_called()
+        engine.git_ops.push.assert_called_once()
+        assert engine.get_state() == RepoState.CLEAN_AND_CONSISTENT
+        assert engine.load_checkpoint() is None
+
+    @patch("thera.workflow.time.sleep")
+    def test_stale_checkpoint_runs_full_workflow(self, mock_sleep, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._ready(engine)
+        engine.run_standard_workflow(Path("submodules.yaml"), max_retries=1)
+
+        engine.machine.state = RepoState.DIRTY
+        engine.machine.error = None
+        engine.git_ops.run_git.return_value = ("fffffff\n", "", 0)
+        engine.git_ops.commit_and_push.return_value = PushResult(True, "推送成功")
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"))
+
+        assert result.success is True
+        assert engine.git_ops.sync_submodules.call_count == 2
+        assert engine.load_checkpoint() is None
+
+    def test_no_retry_without_commit(self, workflow_engine_with_mock):
+        engine = workflow_engine_with_mock
+        self._ready(engine)
+        engine.git_ops.commit_and_push.return_value = PushResult(False, "git commit 失败")
+
+        result = engine.run_standard_workflow(Path("submodules.yaml"))
+
+        assert result.success is False
+        engine.git_ops.push.assert_not_called()
+
+    def test_corrupt_checkpoint_ignored(self, workflow_engine):
+        workflow_engine.checkpoint_path.parent.mkdir(parents=True)
+        workflow_engine.checkpoint_path.write_text("{not json")
+        assert workflow_engine.load_checkpoint() is None
+
+
+class TestWorkflowEngineStepCache:
+    """步骤结果缓存测试"""
+
+    @pytest.fixture
+    def engine(self, tmp_path):
+        (tmp_path / ".gitmodules").write_text('[submodule "a"]\n\tpath = vendor/a\n')
+        (tmp_path / "vendor" / "a").mkdir(parents=True)
+        (tmp_path / "submodules.yaml").write_text("submodules:\n  - path: vendor/a\n")
+        engine = WorkflowEngine(tmp_path, step_cache=StepCache.for_repo(tmp_path))
+        engine.git_ops = MagicMock()
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=True, is_consistent=True, message="1 个路径"
+        )
+        engine.git_ops.fetch_submodules.return_value = SyncResult(True, "拉取完成")
+        engine.git_ops.sync_submodules.return_value = SyncResult(True, "同步完成")
+        engine.git_ops.get_submodule_refs.return_value = "vendor/a\nabc\nabc\n"
+        return engine
+
+    def test_doc_check_cached(self, engine):
+        engine.doc_check(Path("submodules.yaml"))
+        engine.machine.state = RepoState.DIRTY
+        result = engine.doc_check(Path("submodules.yaml"))
+
+        assert result.is_consistent is True
+        assert result.message == "1 个路径"
+        assert engine.git_ops.check_consistency.call_count == 1
+        assert engine.get_state() == RepoState.CLEAN_AND_CONSISTENT
+        assert engine.step_cache.stats["doc_check"].hits == 1
+
+    def test_doc_check_invalidated_by_input(self, engine, tmp_path):
+        engine.doc_check(Path("submodules.yaml"))
+        (tmp_path / "vendor" / "a").rmdir()
+        engine.machine.state = RepoState.DIRTY
+        engine.doc_check(Path("submodules.yaml"))
+        assert engine.git_ops.check_consistency.call_count == 2
+
+    def test_inconsistent_not_cached(self, engine):
+        engine.git_ops.check_consistency.return_value = ConsistencyResult(
+            success=False, is_consistent=False, message="不一致"
+        )
+        engine.doc_check(Path("submodules.yaml"))
+        engine.machine.state = RepoState.DIRTY
+        engine.doc_check(Path("submodules.yaml"))
+        assert engine.git_ops.check_consistency.call_count == 2
+
+    def test_sync_skips_merge_when_refs_unchanged(self, engine):
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        assert engine.sync_submodules().success is True
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        assert engine.sync_submodules().success is True
+
+        engine.git_ops.sync_submodules.assert_called_once_with(None, no_fetch=True)
+        assert engine.git_ops.fetch_submodules.call_count == 2
+        assert engine.get_state() == RepoState.SYNCED
+
+        engine.git_ops.get_submodule_refs.return_value = "vendor/a\nabc\ndef\n"
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.sync_submodules()
+        assert engine.git_ops.sync_submodules.call_count == 2
+
+    def test_sync_unresolved_refs_not_cached(self, engine):
+        engine.git_ops.get_submodule_refs.return_value = None
+        for _ in range(2):
+            engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+            assert engine.sync_submodules().success is True
+        assert engine.git_ops.sync_submodules.call_count == 2
+        assert "sync" not in engine.step_cache.stats
+
+    def test_reconcile_skips_merge_when_refs_unchanged(self, engine):
+        engine.git_ops.get_submodule_status.return_value = _submodules("vendor/a")
+        for _ in range(2):
+            engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+            assert engine.reconcile_submodules().success is True
+            assert engine.get_state() == RepoState.SYNCED
+
+        engine.git_ops.sync_submodules.assert_called_once_with(
+            ["vendor/a"], no_fetch=True, timeout=None
+        )
+        assert engine.git_ops.fetch_submodules.call_count == 2
+        assert engine.step_cache.stats["sync"].hits == 1
+
+    def test_reconcile_deferred_not_cached(self, engine):
+        """有子模块被推迟时不缓存：下次运行仍要合并它"""
+        engine.strategy = BudgetedStrategy(
+            budget=6.0, probe=lambda path: SubmoduleCost(path, behind=5)
+        )
+        engine.git_ops.get_submodule_status.return_value = _submodules("vendor/a", "vendor/b")
+        for _ in range(2):
+            engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+            assert engine.reconcile_submodules().success is True
+            assert engine.git_ops.sync_submodules.called
+            engine.git_ops.sync_submodules.reset_mock()
+        assert engine.step_cache.stats["sync"].hits == 0
+
+    def test_sync_fetch_failure(self, engine):
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        engine.git_ops.fetch_submodules.return_value = SyncResult(False, "拉取失败", error="dns")
+        result = engine.sync_submodules()
+        assert result.success is False
+        assert result.error == "dns"
+        engine.git_ops.sync_submodules.assert_not_called()
+
+    def test_status_reports_hits(self, engine):
+        engine.doc_check(Path("submodules.yaml"))
+        status = engine.get_status()
+        assert status["step_cache"]["misses"] == 1
+
+    def test_cache_persists_across_engines(self, engine, tmp_path):
+        engine.doc_check(Path("submodules.yaml"))
+        other = WorkflowEngine(tmp_path, step_cache=StepCache.for_repo(tmp_path))
+        other.git_ops = MagicMock()
+        other.doc_check(Path("submodules.yaml"))
+        other.git_ops.check_consistency.assert_not_called()
+
+
+def git(cwd, *args):
+    result = subprocess.run(
+        ["git", "-c", "user.email=test@example.com", "-c", "user.name=Test User", *args],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+class TestSyncMemoDetachedSubmodule:
+    """分离头指针的子模块：远程前进后不能命中缓存"""
+
+    @pytest.fixture
+    def superproject(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("GIT_CONFIG_COUNT", "1")
+        monkeypatch.setenv("GIT_CONFIG_KEY_0", "protocol.file.allow")
+        monkeypatch.setenv("GIT_CONFIG_VALUE_0", "always")
+        upstream = tmp_path / "upstream"
+        upstream.mkdir()
+        git(upstream, "init", "-q", "-b", "main")
+        (upstream / "page.md").write_text("v1\n")
+        git(upstream, "add", ".")
+        git(upstream, "commit", "-q", "-m", "v1")
+
+        repo = tmp_path / "repo"
+        repo.mkdir()
+        git(repo, "init", "-q", "-b", "main")
+        git(repo, "submodule", "add", "-q", str(upstream), "docs/sub")
+        git(repo, "commit", "-q", "-m", "add sub")
+        git(repo / "docs" / "sub", "checkout", "-q", "--detach")
+        return repo, upstream
+
+    def test_upstream_advances(self, superproject):
+        repo, upstream = superproject
+        sub = repo / "docs" / "sub"
+        engine = WorkflowEngine(repo, step_cache=StepCache.for_repo(repo))
+
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        assert engine.sync_submodules().success is True
+        assert git(sub, "rev-parse", "--abbrev-ref", "HEAD") == "HEAD"  # 仍是分离头指针
+
+        (upstream / "page.md").write_text("v2\n")
+        git(upstream, "commit", "-q", "-am", "v2")
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        assert engine.sync_submodules().success is True
+
+        assert git(sub, "rev-parse", "HEAD") == git(upstream, "rev-parse", "HEAD")
+        assert engine.step_cache.stats["sync"].hits == 0
+
+    def test_tracked_branch(self, superproject):
+        """submodule.<name>.branch 指定的分支前进后同样重新合并"""
+        repo, upstream = superproject
+        git(upstream, "branch", "stable")
+        git(repo, "config", "-f", ".gitmodules", "submodule.docs/sub.branch", "stable")
+        sub = repo / "docs" / "sub"
+        engine = WorkflowEngine(repo, step_cache=StepCache.for_repo(repo))
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        assert engine.sync_submodules().success is True
+
+        git(upstream, "checkout", "-q", "stable")
+        (upstream / "page.md").write_text("stable\n")
+        git(upstream, "commit", "-q", "-am", "stable")
+        engine.machine.state = RepoState.CLEAN_AND_CONSISTENT
+        assert engine.sync_submodules().success is True
+        assert (sub / "page.md").read_text() == "stable\n"
+
 
 class TestWorkflowEngineAppendJournal:
     """WorkflowEngine.append_journal() 测试"""